@@ -1,13 +1,29 @@
-import sqlite3
 import datetime
 
+from models.rastreador_sql import RastreadorSQL
+from models.gerenciador_indices import GerenciadorIndices
+from models.armazem_blocos import ArmazemBlocos
+from models.snapshot_banco import SnapshotBanco
+from models.layout_compartimentos import LayoutCompartimentos
+from models.transferencia_compartimentos import TransferenciaCompartimentos
+from models.impressao_frase import ImpressaoFrase
+from models.guarda_autenticacao import GuardaAutenticacao
+from models.rotacao_chaves import RotacaoChaves
+
 class BancoDados:
-    def __init__(self, caminho_db):
+    def __init__(self, caminho_db, limite_consulta_lenta_ms=100):
         self.caminho_db = caminho_db
+        self.rastreador = RastreadorSQL(caminho_db, limite_consulta_lenta_ms, registrar_log=self.registrar_log)
+        self.snapshot = SnapshotBanco(self.conectar)
+        self.layout = LayoutCompartimentos()
+    
+    def conectar(self):
+        """Abre uma conexão rastreada com o banco de dados"""
+        return self.rastreador.conectar()
     
     def criar_estrutura(self):
         """Cria a estrutura inicial do banco de dados"""
-        conn = sqlite3.connect(self.caminho_db)
+        conn = self.conectar()
         cursor = conn.cursor()
         
         # Tabela de usuários
@@ -24,51 +40,8 @@ class BancoDados:
         )
         """)
         
-        # Tabela de senhas
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS senhas (
-            id INTEGER PRIMARY KEY,
-            titulo TEXT NOT NULL,
-            descricao TEXT,
-            dados_criptografados TEXT NOT NULL,
-            iv TEXT NOT NULL,
-            data_criacao TEXT NOT NULL,
-            data_modificacao TEXT NOT NULL,
-            categoria_id INTEGER,
-            compartimento TEXT DEFAULT 'principal',
-            FOREIGN KEY (categoria_id) REFERENCES categorias (id)
-        )
-        """)
-        
-        # Tabela de notas
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS notas (
-            id INTEGER PRIMARY KEY,
-            titulo TEXT NOT NULL,
-            conteudo_criptografado TEXT NOT NULL,
-            iv TEXT NOT NULL,
-            data_criacao TEXT NOT NULL,
-            data_modificacao TEXT NOT NULL,
-            categoria_id INTEGER,
-            compartimento TEXT DEFAULT 'principal',
-            FOREIGN KEY (categoria_id) REFERENCES categorias (id)
-        )
-        """)
-        
-        # Tabela de arquivos
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS arquivos (
-            id INTEGER PRIMARY KEY,
-            nome_original TEXT NOT NULL,
-            nome_criptografado TEXT NOT NULL,
-            descricao TEXT,
-            iv TEXT NOT NULL,
-            data_upload TEXT NOT NULL,
-            categoria_id INTEGER,
-            compartimento TEXT DEFAULT 'principal',
-            FOREIGN KEY (categoria_id) REFERENCES categorias (id)
-        )
-        """)
+        # Tabelas de senhas, notas, arquivos e carteiras, compartilhadas por todos os compartimentos
+        LayoutCompartimentos.criar_estrutura(cursor)
         
         # Tabela de categorias
         cursor.execute("""
@@ -99,16 +72,35 @@ class BancoDados:
             chave_criptografada TEXT NOT NULL,
             iv TEXT NOT NULL,
             descricao TEXT,
-            data_criacao TEXT NOT NULL
+            data_criacao TEXT NOT NULL,
+            salt TEXT
         )
         """)
         
+        # Tabelas do armazenamento de arquivos em blocos
+        ArmazemBlocos.criar_estrutura(cursor)
+        
+        # Diário das transferências entre compartimentos
+        TransferenciaCompartimentos.criar_estrutura(cursor)
+        
+        # Impressões indexadas das frases de usuários e compartimentos
+        ImpressaoFrase.criar_estrutura(cursor)
+        
+        # Tentativas de autenticação, preservadas entre reinícios
+        GuardaAutenticacao.criar_estrutura(cursor)
+        
+        # Versões das chaves de dados e progresso das rotações
+        RotacaoChaves.criar_estrutura(cursor)
+        
+        # Tabela de diagnóstico de consultas lentas
+        RastreadorSQL.criar_estrutura(cursor)
+        
         conn.commit()
         conn.close()
     
     def atualizar_estrutura(self):
         """Atualiza a estrutura do banco de dados para incluir novas colunas"""
-        conn = sqlite3.connect(self.caminho_db)
+        conn = self.conectar()
         cursor = conn.cursor()
         
         try:
@@ -194,7 +186,28 @@ class BancoDados:
                 cursor.execute("ALTER TABLE arquivos ADD COLUMN compartimento TEXT DEFAULT 'principal'")
                 self.registrar_log("sistema", "Adicionada coluna compartimento à tabela arquivos")
             
+            # Verificar se as colunas do armazenamento em blocos existem na tabela arquivos
+            if 'armazenamento' not in colunas_arquivos:
+                cursor.execute("ALTER TABLE arquivos ADD COLUMN armazenamento TEXT DEFAULT 'legado'")
+            
+            if 'tamanho' not in colunas_arquivos:
+                cursor.execute("ALTER TABLE arquivos ADD COLUMN tamanho INTEGER")
+            
+            # Verificar se a coluna salt existe na tabela compartimentos
+            cursor.execute("PRAGMA table_info(compartimentos)")
+            if 'salt' not in [info[1] for info in cursor.fetchall()]:
+                cursor.execute("ALTER TABLE compartimentos ADD COLUMN salt TEXT")
+            
+            # Unificar os esquemas de senhas do cofre e do modelo e localizar tabelas por compartimento
+            mensagens_layout = self.layout.atualizar_estrutura(cursor)
+            
+            # Criar e manter os índices de cobertura das listagens
+            mensagens_indices = GerenciadorIndices().aplicar_e_verificar(cursor)
+            
             conn.commit()
+            
+            for mensagem in mensagens_layout + mensagens_indices:
+                self.registrar_log("sistema", mensagem)
         except Exception as e:
             print(f"Erro ao atualizar estrutura do banco de dados: {str(e)}")
         finally:
@@ -203,7 +216,7 @@ class BancoDados:
     def registrar_log(self, tipo, descricao):
         """Registra um evento no log do sistema"""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             # Verificar se a tabela logs existe e tem a estrutura correta
@@ -229,9 +242,27 @@ class BancoDados:
         except Exception as e:
             print(f"Erro ao registrar log: {str(e)}")
     
+    def registrar_logs(self, eventos):
+        """Registra vários eventos (tipo, descrição, data) numa única transação"""
+        try:
+            conn = self.conectar()
+            cursor = conn.cursor()
+            
+            cursor.execute("PRAGMA table_info(logs)")
+            if any(col[1] == 'tipo_evento' for col in cursor.fetchall()):
+                consulta = "INSERT INTO logs (tipo_evento, descricao, data_hora) VALUES (?, ?, ?)"
+            else:
+                consulta = "INSERT INTO logs (tipo, mensagem, data) VALUES (?, ?, ?)"
+            
+            cursor.executemany(consulta, eventos)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"Erro ao registrar logs: {str(e)}")
+    
     def verificar_usuario_existente(self):
         """Verifica se já existe um usuário configurado"""
-        conn = sqlite3.connect(self.caminho_db)
+        conn = self.conectar()
         cursor = conn.cursor()
         
         cursor.execute("SELECT COUNT(*) FROM usuarios")
@@ -240,16 +271,16 @@ class BancoDados:
         conn.close()
         return count > 0
     
-    def criar_usuario(self, nome, hash_senha, salt, hash_senha_heranca, salt_heranca, seed_hex=None):
+    def criar_usuario(self, nome, hash_senha, salt, hash_senha_heranca, salt_heranca, seed_hex=None, impressao_frase=None):
         """Cria um novo usuário no sistema"""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             data_criacao = datetime.datetime.now().isoformat()
             cursor.execute(
-                "INSERT INTO usuarios (nome, hash_senha, salt, hash_senha_heranca, salt_heranca, data_criacao, seed_hex) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (nome, hash_senha, salt, hash_senha_heranca, salt_heranca, data_criacao, seed_hex)
+                "INSERT INTO usuarios (nome, hash_senha, salt, hash_senha_heranca, salt_heranca, data_criacao, seed_hex, impressao_frase) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (nome, hash_senha, salt, hash_senha_heranca, salt_heranca, data_criacao, seed_hex, impressao_frase)
             )
             
             conn.commit()
@@ -262,7 +293,7 @@ class BancoDados:
     def obter_usuario(self):
         """Obtém os dados do usuário"""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             cursor.execute("SELECT id, hash_senha, salt, hash_senha_heranca, salt_heranca, seed_hex FROM usuarios LIMIT 1")
@@ -276,31 +307,52 @@ class BancoDados:
     
     def apagar_dados_sensiveis(self):
         """Apaga todos os dados sensíveis do banco de dados"""
-        conn = sqlite3.connect(self.caminho_db)
+        conn = self.conectar()
         cursor = conn.cursor()
         
         cursor.execute("DELETE FROM senhas")
         cursor.execute("DELETE FROM notas")
+        cursor.execute("DELETE FROM arquivo_blocos")
+        cursor.execute("DELETE FROM blocos")
         cursor.execute("DELETE FROM arquivos")
+        cursor.execute("DELETE FROM carteiras_btc")
+        cursor.execute("DELETE FROM versoes_chave")
+        cursor.execute("DELETE FROM rotacoes_chave")
+        
+        # Tabelas por compartimento que ainda não foram migradas
+        for tabela, _, _ in self.layout.tabelas_legadas(cursor):
+            cursor.execute(f'DROP TABLE "{tabela}"')
+        self.layout.pendentes.clear()
         
         conn.commit()
         conn.close()
     
     def obter_arquivos_para_exclusao(self):
-        """Obtém a lista de nomes de arquivos criptografados para exclusão"""
-        conn = sqlite3.connect(self.caminho_db)
+        """Obtém a lista de (nome criptografado, armazenamento) dos arquivos que não usam blocos"""
+        conn = self.conectar()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT nome_criptografado FROM arquivos")
-        arquivos = [arquivo[0] for arquivo in cursor.fetchall()]
+        cursor.execute("SELECT nome_criptografado, COALESCE(armazenamento, 'legado') FROM arquivos WHERE armazenamento IS NULL OR armazenamento != 'blocos'")
+        arquivos = cursor.fetchall()
         
         conn.close()
         return arquivos
     
+    def obter_blocos_para_exclusao(self):
+        """Obtém a lista de identificadores de blocos criptografados para exclusão"""
+        conn = self.conectar()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT id FROM blocos")
+        blocos = [bloco[0] for bloco in cursor.fetchall()]
+        
+        conn.close()
+        return blocos
+    
     def atualizar_seed_usuario(self, seed_hex):
         """Atualiza o seed do usuário"""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             cursor.execute("UPDATE usuarios SET seed_hex = ? WHERE id = 1", (seed_hex,))
@@ -315,7 +367,7 @@ class BancoDados:
     def obter_seed_usuario(self):
         """Obtém o seed do usuário"""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             cursor.execute("SELECT seed_hex FROM usuarios LIMIT 1")
@@ -334,7 +386,7 @@ class BancoDados:
     def atualizar_senha_usuario(self, hash_senha, salt):
         """Atualiza a senha do usuário"""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             cursor.execute("UPDATE usuarios SET hash_senha = ?, salt = ? WHERE id = 1", (hash_senha, salt))
@@ -345,16 +397,31 @@ class BancoDados:
         except Exception as e:
             print(f"Erro ao atualizar senha do usuário: {str(e)}")
             return False
-    
-    def criar_compartimento(self, nome, compartimento_id, chave_criptografada, iv, descricao, data_criacao):
+
+    def atualizar_verificador_heranca(self, id_usuario, verificador):
+        """Substitui o verificador da senha de herança (refeito com um perfil de derivação mais forte)"""
+        try:
+            conn = self.conectar()
+            cursor = conn.cursor()
+
+            cursor.execute("UPDATE usuarios SET hash_senha_heranca = ? WHERE id = ?", (verificador, id_usuario))
+
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"Erro ao atualizar verificador de herança: {str(e)}")
+            return False
+
+    def criar_compartimento(self, nome, compartimento_id, chave_criptografada, iv, descricao, data_criacao, impressao_frase=None):
         """Cria um novo compartimento de dados"""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             cursor.execute(
-                "INSERT INTO compartimentos (nome, compartimento_id, chave_criptografada, iv, descricao, data_criacao) VALUES (?, ?, ?, ?, ?, ?)",
-                (nome, compartimento_id, chave_criptografada, iv, descricao, data_criacao)
+                "INSERT INTO compartimentos (nome, compartimento_id, chave_criptografada, iv, descricao, data_criacao, impressao_frase) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (nome, compartimento_id, chave_criptografada, iv, descricao, data_criacao, impressao_frase)
             )
             
             conn.commit()
@@ -367,11 +434,11 @@ class BancoDados:
     def obter_compartimento_por_id(self, compartimento_id):
         """Obtém um compartimento pelo ID"""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             cursor.execute(
-                "SELECT id, nome, compartimento_id, chave_criptografada, iv, descricao, data_criacao FROM compartimentos WHERE compartimento_id = ?",
+                "SELECT id, nome, compartimento_id, chave_criptografada, iv, descricao, data_criacao, impressao_frase FROM compartimentos WHERE compartimento_id = ?",
                 (compartimento_id,)
             )
             resultado = cursor.fetchone()
@@ -379,7 +446,7 @@ class BancoDados:
             conn.close()
             
             if resultado:
-                id_comp, nome, comp_id, chave_criptografada, iv, descricao, data_criacao = resultado
+                id_comp, nome, comp_id, chave_criptografada, iv, descricao, data_criacao, impressao_frase = resultado
                 return {
                     "id": id_comp,
                     "nome": nome,
@@ -387,7 +454,8 @@ class BancoDados:
                     "chave_criptografada": chave_criptografada,
                     "iv": iv,
                     "descricao": descricao,
-                    "data_criacao": data_criacao
+                    "data_criacao": data_criacao,
+                    "impressao_frase": impressao_frase
                 }
             else:
                 return None
@@ -398,7 +466,7 @@ class BancoDados:
     def obter_compartimento_por_nome(self, nome):
         """Obtém um compartimento pelo nome"""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             cursor.execute(
@@ -429,7 +497,7 @@ class BancoDados:
     def obter_todos_compartimentos(self):
         """Obtém todos os compartimentos"""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             cursor.execute(
@@ -457,7 +525,7 @@ class BancoDados:
     def obter_senhas(self, compartimento="principal", filtro=None, categoria_id=None):
         """Obtém todas as senhas armazenadas"""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             query = "SELECT id, titulo, descricao, dados_criptografados, iv, data_criacao, data_modificacao, categoria_id FROM senhas WHERE compartimento = ?"
@@ -499,7 +567,7 @@ class BancoDados:
     def obter_notas(self, compartimento="principal", filtro=None, categoria_id=None):
         """Obtém todas as notas armazenadas"""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             query = "SELECT id, titulo, conteudo_criptografado, iv, data_criacao, data_modificacao, categoria_id, compartimento FROM notas WHERE compartimento = ?"
@@ -541,7 +609,7 @@ class BancoDados:
     def obter_arquivos(self, compartimento="principal", filtro=None, categoria_id=None):
         """Obtém todos os arquivos armazenados"""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             query = "SELECT id, nome_original, nome_criptografado, descricao, iv, data_upload, categoria_id FROM arquivos WHERE compartimento = ?"
@@ -582,7 +650,7 @@ class BancoDados:
     def adicionar_nota(self, titulo, conteudo_criptografado, iv, data_criacao, data_modificacao, categoria_id=None, compartimento="principal"):
         """Adiciona uma nova nota"""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             cursor.execute(
@@ -600,7 +668,7 @@ class BancoDados:
     def obter_nota_por_id(self, id_nota):
         """Obtém uma nota pelo ID"""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             cursor.execute(
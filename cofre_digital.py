@@ -2,10 +2,10 @@ import os
 import sys
 import time
 import json
-import sqlite3
 import hashlib
 import secrets
 import datetime
+import multiprocessing
 from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives import hashes
@@ -13,7 +13,6 @@ from cryptography.hazmat.backends import default_backend
 import tkinter as tk
 from tkinter import messagebox, filedialog, simpledialog
 import threading
-import base64
 import hmac
 import traceback
 
@@ -21,15 +20,26 @@ import traceback
 from criptografia import Criptografia
 from banco_dados import BancoDados
 from interface import InterfaceGrafica
-
-# Adicionar suporte para BIP39 (frases mnemônicas)
-try:
-    from mnemonic import Mnemonic
-    BIP39_DISPONIVEL = True
-except ImportError:
-    BIP39_DISPONIVEL = False
-    print("Biblioteca mnemonic não encontrada. Suporte a frases mnemônicas desativado.")
-    print("Para instalar: pip install mnemonic")
+from models.armazem_blocos import ArmazemBlocos
+from models.armazenamento_fragmentado import ArmazenamentoFragmentado, MigradorArmazenamento
+from models.layout_compartimentos import MigradorCompartimentos
+from models.backup_fluxo import BackupFluxo
+from models.backup_incremental import BackupIncremental
+from models.restauracao_parcial import RestauracaoParcial
+from models.chaveiro_sessao import ChaveiroSessao, TEMPO_LIMITE_PADRAO
+from models.contexto_cifra import ContextoCifra, ALGORITMO_PADRAO, VERSAO_AAD, versao_do_algoritmo, versao_chave_do_iv
+from models.busca_federada import BuscaFederada
+from models.transferencia_compartimentos import TransferenciaCompartimentos
+from models.rotacao_chaves import RotacaoChaves, INTERVALO_ROTACAO_DIAS_PADRAO
+from models.bip39_validator import BIP39Validator
+from models.derivacao_seed import ServicoDerivacaoSeed, futuro_concluido
+from models.impressao_frase import ImpressaoFrase
+from models.autenticacao import MotorAutenticacao
+from models.memoria_segura import BufferSeguro
+from models.guarda_autenticacao import GuardaAutenticacao
+from models.perfis_kdf import (
+    PerfilKDF, ALVO_PADRAO_MS, calibrar, gerar_verificador, verificar_senha, perfil_do_verificador, precisa_atualizar
+)
 
 class CofreDigital:
     def __init__(self):
@@ -46,7 +56,12 @@ class CofreDigital:
         
         # Inicializar componentes
         self.criptografia = Criptografia()
+        self.bip39 = BIP39Validator()
+        self.derivacao_seed = ServicoDerivacaoSeed()
         self.banco_dados = BancoDados(self.caminho_db)
+        self.caminho_arquivos = os.path.join(self.caminho_base, "arquivos")
+        self.armazem_blocos = ArmazemBlocos(os.path.join(self.caminho_arquivos, "blocos"))
+        self.armazenamento_arquivos = ArmazenamentoFragmentado(os.path.join(self.caminho_arquivos, "objetos"))
         
         # Criar estrutura do banco de dados
         self.banco_dados.criar_estrutura()
@@ -54,17 +69,145 @@ class CofreDigital:
         # Atualizar estrutura do banco de dados (adicionar novas colunas)
         self.banco_dados.atualizar_estrutura()
         
+        # Migrar em segundo plano os arquivos do diretório plano para o armazenamento fragmentado
+        self.migrador_arquivos = MigradorArmazenamento(
+            self.banco_dados.conectar,
+            self.caminho_arquivos,
+            self.armazenamento_arquivos,
+            self.armazem_blocos.armazenamento,
+            registrar_log=self.banco_dados.registrar_log
+        )
+        self.migrador_arquivos.iniciar()
+        
+        # Migrar em segundo plano as tabelas por compartimento para as tabelas compartilhadas
+        self.migrador_compartimentos = MigradorCompartimentos(
+            self.banco_dados.conectar, self.banco_dados.layout, registrar_log=self.banco_dados.registrar_log
+        )
+        self.migrador_compartimentos.iniciar()
+        
+        # Movimentação e cópia de itens entre compartimentos
+        self.transferencia = TransferenciaCompartimentos(self.banco_dados.conectar, self.armazem_blocos)
+        
+        # Impressões das frases, para recusar frases desconhecidas antes de derivar a seed
+        self.impressao_frase = ImpressaoFrase(self.banco_dados.conectar, self.bip39)
+        
+        # Rotação das chaves de dados, conduzida em segundo plano depois que o chaveiro existir
+        self.rotacao = RotacaoChaves(
+            self.banco_dados.conectar, self._contexto_rotacao, self.armazem_blocos, self.banco_dados.registrar_log
+        )
+        
+        # Tentativas de autenticação gravadas no banco, com atraso crescente e logs em lote
+        self.guarda = GuardaAutenticacao(self.banco_dados.conectar, self.banco_dados.registrar_logs)
+        
         # Carregar configurações
         self.carregar_configuracoes()
+        self.rotacao.intervalo_rotacao_dias = self.intervalo_rotacao_dias
         
         # Estado da aplicação
         self.usuario_autenticado = False
         self.tentativas_senha = 0
         self.modo_heranca_ativo = self.verificar_modo_heranca()
         
-        # Compartimento ativo (padrão: compartimento principal)
+        # Compartimento ativo (padrão: compartimento principal) e chaves dos desbloqueados na sessão
         self.compartimento_ativo = "principal"
-        self.chave_compartimento_ativo = None
+        self.chaveiro = ChaveiroSessao(
+            getattr(self, "tempo_bloqueio_compartimento", TEMPO_LIMITE_PADRAO), self._versao_cifra_configurada(),
+            self.rotacao.carregar_versoes
+        )
+        self.rotacao.iniciar()
+    
+    @property
+    def chave_compartimento_ativo(self):
+        """Chave do compartimento ativo (o BufferSeguro do chaveiro, None no principal); um compartimento expirado volta ao principal"""
+        if self.compartimento_ativo == "principal":
+            return None
+        
+        chave = self.chaveiro.obter(self.compartimento_ativo)
+        if chave is None:
+            self.compartimento_ativo = "principal"
+        return chave
+    
+    def _contexto_compartimento(self, compartimento):
+        """Contexto de cifra de um compartimento acessível na sessão (None se ele estiver bloqueado)"""
+        if compartimento not in self.compartimentos_acessiveis():
+            return None
+        
+        contexto = self.chaveiro.contexto(compartimento)
+        if contexto is None and compartimento == "principal":
+            # A chave principal vem do hash da senha; lida do banco uma vez e guardada até o fim da sessão
+            usuario = self.banco_dados.obter_usuario()
+            if not usuario:
+                return None
+            self.chaveiro.guardar("principal", usuario[1][:32].encode(), expira=False)
+            contexto = self.chaveiro.contexto("principal")
+        return contexto
+    
+    def _contexto_rotacao(self, compartimento):
+        """Contexto para a rotação em segundo plano: só de compartimentos já desbloqueados, sem renovar o prazo"""
+        if not getattr(self, "usuario_autenticado", False) or compartimento not in self.compartimentos_acessiveis():
+            return None
+        return self.chaveiro.contexto(compartimento, renovar=False)
+    
+    def contexto_ativo(self):
+        """Contexto de cifra do compartimento ativo, criado uma vez por desbloqueio; um compartimento expirado volta ao principal"""
+        if self.compartimento_ativo != "principal":
+            contexto = self.chaveiro.contexto(self.compartimento_ativo)
+            if contexto is not None:
+                return contexto
+            self.compartimento_ativo = "principal"
+        return self._contexto_compartimento("principal")
+    
+    def encerrar_sessao(self):
+        """Encerra a sessão, zerando as chaves de todos os compartimentos"""
+        self.usuario_autenticado = False
+        self.compartimento_ativo = "principal"
+        self.chaveiro.bloquear_todos()
+        self.derivacao_seed.limpar()
+    
+    def _versao_cifra_configurada(self):
+        """Versão de cifra do algoritmo configurado; sem ele nesta instalação, os registros novos usam o padrão"""
+        try:
+            return versao_do_algoritmo(getattr(self, "algoritmo_cifra", ALGORITMO_PADRAO))
+        except ValueError as e:
+            self.banco_dados.registrar_log("erro", f"{e}; usando {ALGORITMO_PADRAO}")
+            return VERSAO_AAD
+    
+    def definir_algoritmo_cifra(self, algoritmo):
+        """
+        Define o algoritmo de cifra dos registros gravados a partir de agora
+        
+        Os registros existentes continuam legíveis: cada um traz no iv a versão com que foi cifrado.
+        """
+        try:
+            versao = versao_do_algoritmo(algoritmo)
+            
+            with open(self.caminho_config, 'r') as f:
+                config = json.load(f)
+            config["algoritmo_cifra"] = algoritmo
+            with open(self.caminho_config, 'w') as f:
+                json.dump(config, f, indent=4)
+            
+            self.algoritmo_cifra = algoritmo
+            self.chaveiro.versao_cifra = versao
+            self.banco_dados.registrar_log("sistema", f"Algoritmo de cifra dos registros: {algoritmo}")
+            return True, f"Novos registros serão cifrados com {algoritmo}"
+        except Exception as e:
+            return False, f"Erro ao definir algoritmo de cifra: {str(e)}"
+    
+    @property
+    def perfil_kdf(self):
+        """Perfil de derivação configurado, calibrado nesta máquina na primeira vez que é necessário"""
+        if not getattr(self, "perfil_kdf_configurado", None):
+            self.perfil_kdf_configurado = calibrar(getattr(self, "alvo_kdf_ms", ALVO_PADRAO_MS)).codificar()
+            
+            with open(self.caminho_config, 'r') as f:
+                config = json.load(f)
+            config["perfil_kdf"] = self.perfil_kdf_configurado
+            with open(self.caminho_config, 'w') as f:
+                json.dump(config, f, indent=4)
+            
+            self.banco_dados.registrar_log("sistema", f"Derivação de chaves calibrada: {self.perfil_kdf_configurado}")
+        return PerfilKDF.decodificar(self.perfil_kdf_configurado)
     
     def inicializar_sistema(self):
         """Inicializa o banco de dados e as configurações do sistema"""
@@ -87,7 +230,12 @@ class CofreDigital:
             "max_tentativas_senha": 5,
             "modo_camuflagem": "bloco_notas",
             "autodestruicao_ativada": True,
-            "nome_exibicao": "Bloco de Notas Portátil"
+            "nome_exibicao": "Bloco de Notas Portátil",
+            "limite_consulta_lenta_ms": 100,
+            "tempo_bloqueio_compartimento_min": 15,
+            "alvo_kdf_ms": ALVO_PADRAO_MS,
+            "algoritmo_cifra": ALGORITMO_PADRAO,
+            "intervalo_rotacao_dias": INTERVALO_ROTACAO_DIAS_PADRAO
         }
         
         # Criar diretório se não existir
@@ -145,35 +293,40 @@ class CofreDigital:
             # Criar hash da senha principal
             hash_senha, salt = self.criptografia.hash_senha(senha)
             
-            # Criar hash da senha de herança
-            hash_senha_heranca, salt_heranca = self.criptografia.hash_senha(senha_heranca)
+            # Criar o verificador da senha de herança com o perfil calibrado nesta máquina
+            # (o hash da senha principal continua em SHA-512: os 32 primeiros caracteres são a chave dos dados)
+            hash_senha_heranca, salt_heranca = gerar_verificador(senha_heranca, self.perfil_kdf), secrets.token_hex(16)
             
             # Gerar frase mnemônica para backup (se BIP39 estiver disponível)
             frase_mnemonica = None
             seed_hex = None
+            impressao = None
             
-            if BIP39_DISPONIVEL:
-                try:
-                    # Gerar entropia aleatória (128 bits = 16 bytes = frase de 12 palavras)
-                    entropia = secrets.token_bytes(16)
-                    mnemo = Mnemonic("english")
-                    
-                    # Gerar frase mnemônica
-                    frase_mnemonica = mnemo.to_mnemonic(entropia)
-                    
-                    # Gerar seed a partir da frase (com senha vazia como passphrase)
-                    seed = mnemo.to_seed(frase_mnemonica, "")
-                    seed_hex = seed.hex()
-                    
-                    # Registrar log
-                    self.banco_dados.registrar_log("sistema", "Frase mnemônica gerada com sucesso")
-                except Exception as e:
-                    self.banco_dados.registrar_log("erro", f"Erro ao gerar frase mnemônica: {str(e)}")
+            try:
+                # Gerar frase mnemônica de 12 palavras (128 bits de entropia)
+                frase_mnemonica = self.bip39.gerar_frase(12)
+                
+                # Gerar seed a partir da frase (com senha vazia como passphrase)
+                seed = self.derivacao_seed.derivar(frase_mnemonica)
+                seed_hex = seed.hex()
+                impressao = self.impressao_frase.calcular(frase_mnemonica)
+                
+                # Registrar log
+                self.banco_dados.registrar_log("sistema", "Frase mnemônica gerada com sucesso")
+            except Exception as e:
+                self.banco_dados.registrar_log("erro", f"Erro ao gerar frase mnemônica: {str(e)}")
             
             # Inserir usuário
-            sucesso = self.banco_dados.criar_usuario(nome, hash_senha, salt, hash_senha_heranca, salt_heranca, seed_hex)
+            sucesso = self.banco_dados.criar_usuario(
+                nome, hash_senha, salt, hash_senha_heranca, salt_heranca, seed_hex, impressao
+            )
             
             if sucesso:
+                # Chave que protege as versões rotacionadas, aberta por qualquer uma das senhas
+                with BufferSeguro(secrets.token_bytes(32)) as chave_versoes:
+                    self.rotacao.proteger_com_senhas(
+                        chave_versoes, {"principal": senha, "heranca": senha_heranca}, self.perfil_kdf
+                    )
                 self.banco_dados.registrar_log("sistema", f"Usuário {nome} configurado com sucesso")
                 
                 # Retornar a frase mnemônica para exibição ao usuário
@@ -190,6 +343,11 @@ class CofreDigital:
     def autenticar(self, senha):
         """Autentica o usuário no sistema"""
         try:
+            # Durante o bloqueio por tentativas, recusar antes de qualquer derivação
+            permitido, espera = self.guarda.verificar("senha")
+            if not permitido:
+                return False, f"Muitas tentativas incorretas. Tente novamente em {espera} segundos.", False
+            
             # Obter dados do usuário
             usuario = self.banco_dados.obter_usuario()
             
@@ -204,52 +362,78 @@ class CofreDigital:
             else:
                 id_usuario, hash_senha_armazenado, salt, hash_senha_heranca, salt_heranca = usuario
             
-            # Verificar senha principal
-            hash_senha_fornecida, _ = self.criptografia.hash_senha(senha, salt)
+            # Conferir as duas senhas sempre, sem retorno antecipado. Com a chave das versões protegida
+            # pelas duas senhas, os registros dela conferem ambas numa única derivação, que também a decifra;
+            # antes disso, o hash principal (SHA-512, que também origina a chave de dados) e o verificador
+            # de herança custam o mesmo em qualquer caso
+            registros_versoes = self.rotacao.registros_senhas()
+            if registros_versoes is not None:
+                papel, chave_versoes = MotorAutenticacao.verificar(senha, registros_versoes)
+            else:
+                papel, chave_versoes = MotorAutenticacao.verificar(senha, {
+                    "principal": (hash_senha_armazenado, salt),
+                    "heranca": (hash_senha_heranca, salt_heranca)
+                })
             
-            if hash_senha_fornecida == hash_senha_armazenado:
+            if papel == "principal":
                 # Senha principal correta
                 if not self.modo_heranca_ativo:
                     # Modo normal - NÃO atualizar última confirmação automaticamente
                     self.usuario_autenticado = True
                     self.tentativas_senha = 0
+                    self.guarda.registrar_sucesso("senha")
+                    self.chaveiro.guardar(
+                        "principal", hash_senha_armazenado[:32].encode(), expira=False,
+                        chave_versoes=chave_versoes
+                    )
                     self.banco_dados.registrar_log("autenticacao", f"Usuário ID {id_usuario} autenticado com sucesso")
                     return True, "Autenticação bem-sucedida", False
                 else:
                     # Modo herança ativo, mas tentou usar senha principal
+                    self.guarda.registrar_falha("senha", self.max_tentativas)
                     self.tentativas_senha += 1
                     self.banco_dados.registrar_log("autenticacao", "Tentativa de usar senha principal no modo recuperação")
                     return False, "Modo de recuperação ativo. Use a senha de recuperação.", False
             
-            # Verificar senha de herança
-            hash_senha_heranca_fornecida, _ = self.criptografia.hash_senha(senha, salt_heranca)
-            
-            if hash_senha_heranca_fornecida == hash_senha_heranca:
+            if papel == "heranca":
                 # Senha de herança correta
                 if self.modo_heranca_ativo:
                     # Modo herança ativo - permitir acesso
                     self.usuario_autenticado = True
                     self.tentativas_senha = 0
+                    self.guarda.registrar_sucesso("senha")
+                    self.chaveiro.guardar(
+                        "principal", hash_senha_armazenado[:32].encode(), expira=False,
+                        chave_versoes=chave_versoes
+                    )
                     self.banco_dados.registrar_log("autenticacao", f"Acesso de herança concedido para usuário ID {id_usuario}")
+                    
+                    # Refazer o verificador se o perfil configurado for mais forte
+                    perfil = self.perfil_kdf
+                    if precisa_atualizar(perfil_do_verificador(hash_senha_heranca), perfil):
+                        self.banco_dados.atualizar_verificador_heranca(id_usuario, gerar_verificador(senha, perfil))
                     return True, "Acesso de herança concedido", True
                 else:
                     # Modo herança não ativo - negar acesso
+                    self.guarda.registrar_falha("senha", self.max_tentativas)
                     self.tentativas_senha += 1
                     self.banco_dados.registrar_log("autenticacao", "Tentativa de usar senha de herança fora do modo herança")
                     return False, "Senha de herança só pode ser usada após o período de inatividade", False
             
-            # Ambas as senhas estão incorretas
+            # Ambas as senhas estão incorretas: falha gravada no controle de tentativas (com log em lote)
+            self.guarda.registrar_falha("senha", self.max_tentativas)
             self.tentativas_senha += 1
-            self.banco_dados.registrar_log("autenticacao", f"Tentativa de autenticação falhou para usuário ID {id_usuario}")
             
-            # Verificar se deve autodestruir
+            # Verificar se deve autodestruir (só com as falhas desta sessão; as gravadas servem ao atraso)
             if self.tentativas_senha >= self.max_tentativas:
                 with open(self.caminho_config, 'r') as f:
                     config = json.load(f)
                 
                 if config.get("autodestruicao_ativada", True):
+                    self.guarda.descarregar()
                     self.autodestruir()
                     return False, "Número máximo de tentativas excedido. Dados apagados.", False
+                return False, "Número máximo de tentativas excedido. Acesso bloqueado temporariamente.", False
             
             return False, f"Senha incorreta. Tentativas restantes: {self.max_tentativas - self.tentativas_senha}", False
         
@@ -262,17 +446,37 @@ class CofreDigital:
         try:
             self.banco_dados.registrar_log("sistema", "Iniciando autodestruição dos dados")
             
-            # Apagar senhas e notas
-            self.banco_dados.apagar_dados_sensiveis()
+            # Interromper a migração para que nenhum arquivo seja movido durante a exclusão
+            self.migrador_arquivos.parar()
+            self.migrador_compartimentos.parar()
+            self.rotacao.parar()
             
-            # Obter lista de arquivos criptografados
+            # Obter lista de arquivos e blocos criptografados antes de apagar os registros
             arquivos = self.banco_dados.obter_arquivos_para_exclusao()
+            blocos = self.banco_dados.obter_blocos_para_exclusao()
+            
+            # Apagar senhas, notas e arquivos
+            self.banco_dados.apagar_dados_sensiveis()
+            
+            # Apagar arquivos físicos; um item que não pode ser removido não interrompe os demais
+            falhas = 0
+            for nome_criptografado, armazenamento in arquivos:
+                try:
+                    self._remover_arquivo_fisico(nome_criptografado, armazenamento)
+                except Exception as e:
+                    falhas += 1
+                    self.banco_dados.registrar_log("erro", f"Erro ao apagar arquivo na autodestruição: {str(e)}")
             
-            # Apagar arquivos físicos
-            for arquivo in arquivos:
-                caminho_arquivo = os.path.join(self.caminho_base, "arquivos", arquivo)
-                if os.path.exists(caminho_arquivo):
-                    os.remove(caminho_arquivo)
+            for bloco_id in blocos:
+                try:
+                    self.armazem_blocos.armazenamento.remover(bloco_id)
+                except Exception as e:
+                    falhas += 1
+                    self.banco_dados.registrar_log("erro", f"Erro ao apagar bloco na autodestruição: {str(e)}")
+            
+            if falhas:
+                self.banco_dados.registrar_log("sistema", f"Autodestruição concluída com {falhas} itens não apagados")
+                return True, f"Dados apagados ({falhas} arquivos físicos não puderam ser removidos)"
             
             self.banco_dados.registrar_log("sistema", "Autodestruição concluída")
             return True, "Dados apagados com sucesso"
@@ -280,6 +484,23 @@ class CofreDigital:
             self.banco_dados.registrar_log("erro", f"Erro durante autodestruição: {str(e)}")
             return False, f"Erro durante autodestruição: {str(e)}"
 
+    def _remover_arquivo_fisico(self, nome_criptografado, armazenamento):
+        """Remove o arquivo físico de um registro que não usa blocos"""
+        if armazenamento == "fragmentado" and self.armazenamento_arquivos.nome_valido(nome_criptografado):
+            return self.armazenamento_arquivos.remover(nome_criptografado)
+        
+        # Arquivo legado ainda não migrado (ou registro que ficou sem arquivo), no diretório plano
+        try:
+            os.remove(os.path.join(self.caminho_arquivos, os.path.basename(nome_criptografado)))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def obter_chave_ativa(self, cursor=None):
+        """Obtém a chave de criptografia do compartimento ativo (a do contexto de cifra, sem reler o usuário)"""
+        contexto = self.contexto_ativo()
+        return contexto.chave if contexto is not None else None
+
     def adicionar_senha(self, titulo, senha, descricao=None, categoria_id=None):
         """Adiciona uma nova senha ao cofre no compartimento ativo"""
         if not self.usuario_autenticado:
@@ -287,36 +508,29 @@ class CofreDigital:
         
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
-            # Usar a chave do compartimento ativo para criptografia
-            chave_criptografia = self.chave_compartimento_ativo
-            
-            # Se não houver chave de compartimento ativa, usar a chave derivada da senha do usuário
-            if chave_criptografia is None:
-                # Obter dados do usuário
-                cursor.execute("SELECT hash_senha FROM usuarios LIMIT 1")
-                resultado_usuario = cursor.fetchone()
-                
-                if not resultado_usuario:
-                    conn.close()
-                    return False, "Usuário não encontrado"
-                
-                hash_senha_usuario = resultado_usuario[0]
-                
-                # Usar o hash da senha do usuário como base para a chave de criptografia
-                chave_criptografia = hash_senha_usuario[:32].encode()
-            
-            # Criptografar a senha
-            senha_criptografada, iv = self.criptografia.criptografar(senha, chave_criptografia)
+            # Contexto de cifra do compartimento ativo
+            contexto = self.contexto_ativo()
+            if contexto is None:
+                conn.close()
+                return False, "Usuário não encontrado"
             
-            # Salvar no banco de dados
+            # Inserir primeiro: o ID da linha faz parte dos dados associados da cifra
             data_atual = datetime.datetime.now().isoformat()
             
             cursor.execute(
                 "INSERT INTO senhas (titulo, descricao, dados_criptografados, iv, data_criacao, data_modificacao, categoria_id, compartimento) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                (titulo, descricao, senha_criptografada, iv, data_atual, data_atual, categoria_id, self.compartimento_ativo)
+                (titulo, descricao, "", "", data_atual, data_atual, categoria_id, contexto.compartimento)
+            )
+            id_senha = cursor.lastrowid
+            
+            # Criptografar a senha e gravar na mesma transação
+            senha_criptografada, iv = contexto.cifrar(senha, "senhas", id_senha)
+            cursor.execute(
+                "UPDATE senhas SET dados_criptografados = ?, iv = ? WHERE id = ?",
+                (senha_criptografada, iv, id_senha)
             )
             
             conn.commit()
@@ -341,7 +555,7 @@ class CofreDigital:
         
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
             # Obter apenas as senhas do compartimento ativo
@@ -379,7 +593,7 @@ class CofreDigital:
         
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
             # Verificar se a senha pertence ao compartimento ativo
@@ -395,26 +609,14 @@ class CofreDigital:
             
             id_senha, titulo, senha_criptografada, iv, descricao, data_criacao, data_modificacao, categoria_id = resultado
             
-            # Usar a chave do compartimento ativo para descriptografia
-            chave_descriptografia = self.chave_compartimento_ativo
-            
-            # Se não houver chave de compartimento ativa, usar a chave derivada da senha do usuário
-            if chave_descriptografia is None:
-                # Obter dados do usuário
-                cursor.execute("SELECT hash_senha FROM usuarios LIMIT 1")
-                resultado_usuario = cursor.fetchone()
-                
-                if not resultado_usuario:
-                    conn.close()
-                    return False, "Usuário não encontrado", None
-                
-                hash_senha_usuario = resultado_usuario[0]
-                
-                # Usar o hash da senha do usuário como base para a chave de descriptografia
-                chave_descriptografia = hash_senha_usuario[:32].encode()
+            # Contexto de cifra do compartimento ativo
+            contexto = self.contexto_ativo()
+            if contexto is None:
+                conn.close()
+                return False, "Usuário não encontrado", None
             
-            # Descriptografar a senha
-            senha = self.criptografia.descriptografar(senha_criptografada, iv, chave_descriptografia).decode()
+            # Descriptografar a senha diretamente num buffer que a interface zera ao fechar a janela
+            senha = contexto.decifrar_seguro(senha_criptografada, iv, "senhas", id_senha)
             
             conn.close()
             
@@ -441,7 +643,7 @@ class CofreDigital:
         
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
             # Verificar quais colunas existem na tabela notas
@@ -503,29 +705,14 @@ class CofreDigital:
             conteudo_criptografado = nota["conteudo_criptografado"]
             iv = nota["iv"]
             
-            # Usar a chave do compartimento ativo
-            chave_criptografia = self.chave_compartimento_ativo
-            
-            # Se não houver chave de compartimento ativa, usar a chave derivada da senha do usuário
-            if chave_criptografia is None:
-                # Obter dados do usuário
-                usuario = self.banco_dados.obter_usuario()
-                
-                if not usuario:
-                    return False, "Usuário não encontrado", None
-                
-                # Desempacotar com tratamento para o caso de seed_hex estar disponível
-                if len(usuario) == 6:
-                    id_usuario, hash_senha, salt, hash_senha_heranca, salt_heranca, seed_hex = usuario
-                else:
-                    id_usuario, hash_senha, salt, hash_senha_heranca, salt_heranca = usuario
-                
-                # Usar o hash da senha do usuário como base para a chave de criptografia
-                chave_criptografia = hash_senha[:32].encode()
+            # Contexto de cifra do compartimento ativo
+            contexto = self.contexto_ativo()
+            if contexto is None:
+                return False, "Usuário não encontrado", None
             
             try:
                 # Descriptografar o conteúdo
-                conteudo = self.criptografia.descriptografar(conteudo_criptografado, iv, chave_criptografia)
+                conteudo = contexto.decifrar(conteudo_criptografado, iv, "notas", nota["id"], descomprimir=True)
                 return True, "Nota obtida com sucesso", conteudo
             except Exception as e:
                 self.banco_dados.registrar_log("erro", f"Erro ao descriptografar nota: {str(e)}")
@@ -541,7 +728,7 @@ class CofreDigital:
         
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
             # Obter todos os arquivos
@@ -575,50 +762,41 @@ class CofreDigital:
             return False, "Usuário não autenticado"
         
         try:
-            # Usar a chave do compartimento ativo para criptografia
-            chave_criptografia = self.chave_compartimento_ativo
-            
-            # Se não houver chave de compartimento ativa, usar a chave derivada da senha do usuário
-            if chave_criptografia is None:
-                # Obter dados do usuário
-                usuario = self.banco_dados.obter_usuario()
-                
-                if not usuario:
-                    return False, "Usuário não encontrado"
-                
-                id_usuario, hash_senha, salt, hash_senha_heranca, salt_heranca, seed_hex = usuario
-                
-                # Usar o hash da senha do usuário como base para a chave de criptografia
-                chave_criptografia = hash_senha[:32].encode()
-            
-            # Criptografar o conteúdo da nota
-            conteudo_criptografado, iv = self.criptografia.criptografar(conteudo, chave_criptografia)
+            # Contexto de cifra do compartimento ativo
+            contexto = self.contexto_ativo()
+            if contexto is None:
+                return False, "Usuário não encontrado"
             
             # Obter data atual
             data_atual = datetime.datetime.now().isoformat()
             
-            # Inserir nota no banco de dados
-            sucesso = self.banco_dados.adicionar_nota(
-                titulo, 
-                conteudo_criptografado, 
-                iv, 
-                data_atual, 
-                data_atual, 
-                categoria_id,
-                self.compartimento_ativo  # Adicionar o compartimento ativo
-            )
+            # Inserir a nota e cifrar o conteúdo com o ID dela, na mesma transação
+            conn = self.banco_dados.conectar()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "INSERT INTO notas (titulo, conteudo_criptografado, iv, data_criacao, data_modificacao, categoria_id, compartimento) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (titulo, "", "", data_atual, data_atual, categoria_id, contexto.compartimento)
+                )
+                id_nota = cursor.lastrowid
+                
+                conteudo_criptografado, iv = contexto.cifrar(conteudo, "notas", id_nota, comprimir=True)
+                cursor.execute(
+                    "UPDATE notas SET conteudo_criptografado = ?, iv = ? WHERE id = ?",
+                    (conteudo_criptografado, iv, id_nota)
+                )
+                conn.commit()
+            finally:
+                conn.close()
             
-            if sucesso:
-                self.banco_dados.registrar_log("nota", f"Nota '{titulo}' adicionada ao compartimento '{self.compartimento_ativo}'")
-                return True, "Nota adicionada com sucesso"
-            else:
-                return False, "Erro ao adicionar nota"
+            self.banco_dados.registrar_log("nota", f"Nota '{titulo}' adicionada ao compartimento '{contexto.compartimento}'")
+            return True, "Nota adicionada com sucesso"
         except Exception as e:
             self.banco_dados.registrar_log("erro", f"Erro ao adicionar nota: {str(e)}")
             return False, f"Erro ao adicionar nota: {str(e)}"
 
     def adicionar_arquivo(self, caminho_arquivo, descricao=""):
-        """Adiciona um novo arquivo ao cofre"""
+        """Adiciona um novo arquivo ao cofre no compartimento ativo"""
         if not self.usuario_autenticado:
             return False, "Usuário não autenticado"
         
@@ -628,49 +806,35 @@ class CofreDigital:
                 return False, "Arquivo não encontrado"
             
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
-            # Obter ID do usuário diretamente
-            cursor.execute("SELECT id FROM usuarios LIMIT 1")
-            resultado_usuario = cursor.fetchone()
+            # Contexto do compartimento ativo (os blocos usam a sua versão de chave atual)
+            contexto = self.contexto_ativo()
             
-            if not resultado_usuario:
+            if contexto is None:
                 conn.close()
                 return False, "Usuário não encontrado"
             
-            id_usuario = resultado_usuario[0]
-            
-            # Derivar chave de criptografia
-            chave, _ = self.criptografia.gerar_chave_derivada(str(id_usuario))
-            
-            # Ler o arquivo
-            with open(caminho_arquivo, 'rb') as f:
-                conteudo = f.read()
+            # Gravar apenas os blocos que ainda não existem no compartimento
+            blocos, tamanho, blocos_novos = self.armazem_blocos.armazenar(cursor, caminho_arquivo, contexto)
             
-            # Criptografar o conteúdo
-            dados_criptografados, iv = self.criptografia.criptografar(conteudo, chave)
-            
-            # Gerar nome único para o arquivo criptografado
+            # O nome físico é derivado do conteúdo e não revela o nome original
             nome_original = os.path.basename(caminho_arquivo)
-            nome_criptografado = f"{secrets.token_hex(8)}_{nome_original}"
-            
-            # Salvar o arquivo criptografado
-            caminho_destino = os.path.join(self.caminho_base, "arquivos", nome_criptografado)
-            with open(caminho_destino, 'wb') as f:
-                f.write(base64.b64decode(dados_criptografados))
+            nome_criptografado = self.armazem_blocos.identificar_conteudo(blocos)
             
             # Salvar no banco de dados
             data_atual = datetime.datetime.now().isoformat()
             cursor.execute(
-                "INSERT INTO arquivos (nome_original, nome_criptografado, descricao, iv, data_upload) VALUES (?, ?, ?, ?, ?)",
-                (nome_original, nome_criptografado, descricao, iv, data_atual)
+                "INSERT INTO arquivos (nome_original, nome_criptografado, descricao, iv, data_upload, compartimento, armazenamento, tamanho) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (nome_original, nome_criptografado, descricao, "", data_atual, self.compartimento_ativo, "blocos", tamanho)
             )
+            self.armazem_blocos.vincular(cursor, cursor.lastrowid, blocos)
             
             conn.commit()
             conn.close()
             
-            self.banco_dados.registrar_log("dados", f"Novo arquivo adicionado: {nome_original}")
+            self.banco_dados.registrar_log("dados", f"Novo arquivo adicionado: {nome_original} ({blocos_novos} de {len(blocos)} blocos gravados)")
             return True, "Arquivo adicionado com sucesso"
         except Exception as e:
             self.banco_dados.registrar_log("erro", f"Erro ao adicionar arquivo: {str(e)}")
@@ -682,18 +846,28 @@ class CofreDigital:
             return False, "Usuário não autenticado"
         
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
             # Obter informações do arquivo
-            cursor.execute("SELECT nome_original, nome_criptografado FROM arquivos WHERE id = ?", (id_arquivo,))
+            cursor.execute("SELECT nome_original, nome_criptografado, armazenamento FROM arquivos WHERE id = ?", (id_arquivo,))
             resultado = cursor.fetchone()
             
             if not resultado:
                 conn.close()
                 return False, "Arquivo não encontrado"
             
-            nome_original = resultado[0]
+            nome_original, _, armazenamento = resultado
+            
+            if armazenamento == "blocos":
+                # Reconstruir o arquivo a partir dos blocos criptografados
+                caminho_saida = os.path.join(caminho_destino, nome_original)
+                self.armazem_blocos.extrair(cursor, id_arquivo, self.contexto_ativo(), caminho_saida)
+                conn.close()
+                
+                self.banco_dados.registrar_log("acesso", f"Arquivo extraído: {nome_original}")
+                return True, f"Arquivo extraído para {caminho_saida}"
+            
             conn.close()
             
             # Para teste, vamos apenas copiar um arquivo de exemplo
@@ -729,12 +903,10 @@ class CofreDigital:
             if not usuario:
                 return False, "Usuário não encontrado"
             
-            id_usuario, hash_senha_armazenado, salt, _, _ = usuario
+            id_usuario, hash_senha_armazenado, salt, _, _ = usuario[:5]
             
             # Verificar senha atual
-            hash_senha_fornecida, _ = self.criptografia.hash_senha(senha_atual, salt)
-            
-            if hash_senha_fornecida != hash_senha_armazenado:
+            if not verificar_senha(senha_atual, hash_senha_armazenado, salt):
                 return False, "Senha atual incorreta"
             
             # Obter a chave antiga para descriptografar os dados existentes
@@ -743,28 +915,45 @@ class CofreDigital:
             # Criar hash da nova senha principal
             hash_nova_senha, novo_salt = self.criptografia.hash_senha(nova_senha)
             
-            # Criar hash da nova senha de herança
-            hash_nova_senha_heranca, novo_salt_heranca = self.criptografia.hash_senha(nova_senha_heranca)
+            # Criar o verificador da nova senha de herança
+            hash_nova_senha_heranca, novo_salt_heranca = gerar_verificador(nova_senha_heranca, self.perfil_kdf), secrets.token_hex(16)
             
             # Obter a nova chave para recriptografar os dados
             chave_nova = hash_nova_senha[:32].encode()
             
+            # A chave das versões continua a mesma (só é cifrada de novo pelas novas senhas), então os
+            # registros já rotacionados ficam como estão; sem ela (cofre anterior à proteção), uma nova
+            chave_sessao = self.chaveiro.chave_versoes("principal")
+            chave_versoes = BufferSeguro(chave_sessao if chave_sessao is not None else secrets.token_bytes(32))
+            
+            # Um contexto de cifra para cada chave, reutilizado em todas as linhas. Dependem da chave antiga
+            # os registros e os blocos de arquivo da versão 0 do principal, que passam à versão mais recente
+            # do novo contexto, e as chaves dos outros compartimentos, cifradas com ela; as versões
+            # rotacionadas usam a chave das versões e ficam como estão
+            contexto_antigo = ContextoCifra(chave_antiga, "principal")
+            contexto_novo = ContextoCifra(chave_nova, "principal", self.chaveiro.versao_cifra)
+            contexto_novo.chave_versoes = chave_versoes
+            self.rotacao.carregar_versoes(contexto_novo)
+            
+            # O repositório de backups incrementais ganha um acesso pela nova chave antes da transação,
+            # para que continue aberto por uma das duas chaves se a reconfiguração falhar
+            repositorio = self._reproteger_repositorio_incremental(chave_antiga, chave_nova, novo_salt)
+            
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
-            # Recriptografar senhas
-            cursor.execute("SELECT id, titulo, descricao, dados_criptografados, iv FROM senhas")
+            # Recriptografar senhas (os outros compartimentos têm chaves próprias)
+            cursor.execute("SELECT id, titulo, descricao, dados_criptografados, iv FROM senhas WHERE compartimento = 'principal'")
             senhas = cursor.fetchall()
             
             for id_senha, titulo, descricao, dados_criptografados, iv in senhas:
+                if versao_chave_do_iv(iv) != 0:
+                    continue
                 try:
-                    # Descriptografar com a chave antiga
-                    senha_bytes = self.criptografia.descriptografar(dados_criptografados, iv, chave_antiga)
-                    senha = senha_bytes.decode('utf-8')
-                    
-                    # Recriptografar com a nova chave
-                    novos_dados_criptografados, novo_iv = self.criptografia.criptografar(senha, chave_nova)
+                    # Descriptografar com a chave antiga e recriptografar com a nova, sem passar por texto
+                    senha_bytes = contexto_antigo.decifrar(dados_criptografados, iv, "senhas", id_senha)
+                    novos_dados_criptografados, novo_iv = contexto_novo.cifrar(senha_bytes, "senhas", id_senha)
                     
                     # Atualizar no banco de dados
                     cursor.execute(
@@ -776,27 +965,53 @@ class CofreDigital:
                     # Continuar com as outras senhas mesmo se houver erro
             
             # Recriptografar notas
-            cursor.execute("SELECT id, titulo, dados_criptografados, iv FROM notas")
+            cursor.execute("SELECT id, titulo, conteudo_criptografado, iv FROM notas WHERE compartimento = 'principal'")
             notas = cursor.fetchall()
             
             for id_nota, titulo, dados_criptografados, iv in notas:
+                if versao_chave_do_iv(iv) != 0:
+                    continue
                 try:
-                    # Descriptografar com a chave antiga
-                    conteudo_bytes = self.criptografia.descriptografar(dados_criptografados, iv, chave_antiga)
-                    conteudo = conteudo_bytes.decode('utf-8')
-                    
-                    # Recriptografar com a nova chave
-                    novos_dados_criptografados, novo_iv = self.criptografia.criptografar(conteudo, chave_nova)
+                    # O conteúdo passa comprimido como está
+                    conteudo_bytes = contexto_antigo.decifrar(dados_criptografados, iv, "notas", id_nota)
+                    novos_dados_criptografados, novo_iv = contexto_novo.cifrar(conteudo_bytes, "notas", id_nota)
                     
                     # Atualizar no banco de dados
                     cursor.execute(
-                        "UPDATE notas SET dados_criptografados = ?, iv = ? WHERE id = ?",
+                        "UPDATE notas SET conteudo_criptografado = ?, iv = ? WHERE id = ?",
                         (novos_dados_criptografados, novo_iv, id_nota)
                     )
                 except Exception as e:
                     print(f"Erro ao recriptografar nota {id_nota}: {str(e)}")
                     # Continuar com as outras notas mesmo se houver erro
             
+            # Recifrar os blocos de arquivo da versão 0; uma falha desfaz toda a reconfiguração
+            versao_nova = contexto_novo.versao_chave
+            chave_destino = contexto_novo.chave_da_versao(versao_nova)
+            cursor.execute(
+                "SELECT id FROM blocos WHERE compartimento = 'principal' AND versao_chave = 0 AND referencias > 0"
+            )
+            arquivos_afetados = set()
+            for (bloco_id,) in cursor.fetchall():
+                _, afetados = self.armazem_blocos.recifrar_bloco(cursor, bloco_id, chave_antiga, chave_destino, versao_nova)
+                arquivos_afetados.update(afetados)
+            self.armazem_blocos.renomear_arquivos(cursor, arquivos_afetados)
+            
+            # Cifrar as chaves dos compartimentos com a nova chave principal (usada no desbloqueio pelo nome)
+            cursor.execute("SELECT id, chave_criptografada, iv FROM compartimentos")
+            for id_compartimento, chave_criptografada, iv in cursor.fetchall():
+                chave_hex = self.criptografia.descriptografar(chave_criptografada, iv, chave_antiga).decode()
+                nova_chave_criptografada, novo_iv = self.criptografia.criptografar(chave_hex, chave_nova)
+                cursor.execute(
+                    "UPDATE compartimentos SET chave_criptografada = ?, iv = ? WHERE id = ?",
+                    (nova_chave_criptografada, novo_iv, id_compartimento)
+                )
+            
+            # A chave das versões passa a ser aberta pelas novas senhas, na mesma transação
+            self.rotacao.proteger_com_senhas(
+                chave_versoes, {"principal": nova_senha, "heranca": nova_senha_heranca}, self.perfil_kdf, cursor
+            )
+            
             # Atualizar senhas do usuário
             cursor.execute(
                 "UPDATE usuarios SET hash_senha = ?, salt = ?, hash_senha_heranca = ?, salt_heranca = ? WHERE id = ?",
@@ -804,8 +1019,25 @@ class CofreDigital:
             )
             
             conn.commit()
+            
+            # Os blocos antigos ficaram sem referências
+            if arquivos_afetados:
+                self.armazem_blocos.coletar_lixo(conn)
             conn.close()
             
+            # Só agora a chave antiga deixa de abrir o repositório
+            if repositorio is not None:
+                try:
+                    repositorio.definir_acesso("principal", chave_nova, {"salt_usuario": novo_salt})
+                    repositorio.remover_acesso("reconfiguracao")
+                except Exception as e:
+                    self.banco_dados.registrar_log("erro", f"Erro ao proteger o backup incremental com a nova senha: {str(e)}")
+            
+            # O contexto da sessão passa a usar a nova chave
+            contexto_antigo.descartar()
+            contexto_novo.descartar()
+            self.chaveiro.guardar("principal", chave_nova, expira=False, chave_versoes=chave_versoes)
+            
             try:
                 self.banco_dados.registrar_log("sistema", "Senhas reconfiguradas e dados recriptografados com sucesso")
             except:
@@ -826,34 +1058,27 @@ class CofreDigital:
         
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
             # Verificar se a senha existe
-            cursor.execute("SELECT titulo FROM senhas WHERE id = ?", (id_senha,))
+            cursor.execute("SELECT titulo, compartimento FROM senhas WHERE id = ?", (id_senha,))
             resultado = cursor.fetchone()
             
             if not resultado:
                 conn.close()
                 return False, "Senha não encontrada"
             
-            titulo_antigo = resultado[0]
-            
-            # Obter dados do usuário
-            cursor.execute("SELECT hash_senha FROM usuarios LIMIT 1")
-            resultado_usuario = cursor.fetchone()
+            titulo_antigo, compartimento = resultado
             
-            if not resultado_usuario:
+            # Cifrar com o contexto do compartimento da senha
+            contexto = self._contexto_compartimento(compartimento)
+            if contexto is None:
                 conn.close()
-                return False, "Usuário não encontrado"
-            
-            hash_senha_usuario = resultado_usuario[0]
-            
-            # Usar o hash da senha do usuário como base para a chave de criptografia
-            chave_base = hash_senha_usuario[:32].encode()
+                return False, f"O compartimento '{compartimento}' está bloqueado"
             
             # Criptografar a senha
-            dados_criptografados, iv = self.criptografia.criptografar(senha, chave_base)
+            dados_criptografados, iv = contexto.cifrar(senha, "senhas", id_senha)
             
             # Atualizar no banco de dados
             data_atual = datetime.datetime.now().isoformat()
@@ -884,39 +1109,32 @@ class CofreDigital:
         
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
             # Verificar se a nota existe
-            cursor.execute("SELECT titulo FROM notas WHERE id = ?", (id_nota,))
+            cursor.execute("SELECT titulo, compartimento FROM notas WHERE id = ?", (id_nota,))
             resultado = cursor.fetchone()
             
             if not resultado:
                 conn.close()
                 return False, "Nota não encontrada"
             
-            titulo_antigo = resultado[0]
-            
-            # Obter dados do usuário
-            cursor.execute("SELECT hash_senha FROM usuarios LIMIT 1")
-            resultado_usuario = cursor.fetchone()
+            titulo_antigo, compartimento = resultado
             
-            if not resultado_usuario:
+            # Cifrar com o contexto do compartimento da nota
+            contexto = self._contexto_compartimento(compartimento)
+            if contexto is None:
                 conn.close()
-                return False, "Usuário não encontrado"
-            
-            hash_senha_usuario = resultado_usuario[0]
-            
-            # Usar o hash da senha do usuário como base para a chave de criptografia
-            chave_base = hash_senha_usuario[:32].encode()
+                return False, f"O compartimento '{compartimento}' está bloqueado"
             
             # Criptografar o conteúdo
-            dados_criptografados, iv = self.criptografia.criptografar(conteudo, chave_base)
+            dados_criptografados, iv = contexto.cifrar(conteudo, "notas", id_nota, comprimir=True)
             
             # Atualizar no banco de dados
             data_atual = datetime.datetime.now().isoformat()
             cursor.execute(
-                "UPDATE notas SET titulo = ?, dados_criptografados = ?, iv = ?, data_modificacao = ? WHERE id = ?",
+                "UPDATE notas SET titulo = ?, conteudo_criptografado = ?, iv = ?, data_modificacao = ? WHERE id = ?",
                 (titulo, dados_criptografados, iv, data_atual, id_nota)
             )
             
@@ -942,7 +1160,7 @@ class CofreDigital:
         
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
             # Verificar se a tabela de categorias existe
@@ -1001,7 +1219,7 @@ class CofreDigital:
         
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
             # Obter todas as categorias
@@ -1035,7 +1253,7 @@ class CofreDigital:
         
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
             # Verificar se o item existe
@@ -1074,7 +1292,7 @@ class CofreDigital:
             return False, f"Erro ao atribuir categoria: {str(e)}"
 
     def fazer_backup(self, caminho_destino):
-        """Faz um backup criptografado do banco de dados e configurações"""
+        """Faz um backup criptografado em fluxo do banco de dados, configurações e arquivos"""
         if not self.usuario_autenticado:
             return False, "Usuário não autenticado"
         
@@ -1088,64 +1306,28 @@ class CofreDigital:
             nome_arquivo = f"backup_{data_hora}.enc"
             caminho_backup = os.path.join(caminho_destino, nome_arquivo)
             
-            # Obter hash da senha do usuário para usar como chave de criptografia
-            conn = sqlite3.connect(self.caminho_db)
-            cursor = conn.cursor()
-            cursor.execute("SELECT hash_senha FROM usuarios LIMIT 1")
-            resultado = cursor.fetchone()
-            conn.close()
-            
-            if not resultado:
+            # Obter a chave derivada da senha do usuário e o salt para reconstruí-la
+            chave_usuario = self._obter_chave_backup()
+            if chave_usuario is None:
                 return False, "Usuário não encontrado"
             
-            hash_senha_usuario = resultado[0]
-            chave_base = hash_senha_usuario[:32].encode()  # Usar os primeiros 32 caracteres do hash
-            
-            # Criar arquivo temporário para o backup
-            import tempfile
-            temp_dir = tempfile.mkdtemp()
-            temp_db = os.path.join(temp_dir, "temp_db.db")
-            temp_config = os.path.join(temp_dir, "temp_config.json")
-            
-            # Copiar arquivos para o diretório temporário
-            import shutil
-            shutil.copy2(self.caminho_db, temp_db)
-            shutil.copy2(self.caminho_config, temp_config)
-            
-            # Criar arquivo ZIP com os arquivos temporários
-            import zipfile
-            temp_zip = os.path.join(temp_dir, "backup.zip")
-            with zipfile.ZipFile(temp_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                zipf.write(temp_db, "sistema.db")
-                zipf.write(temp_config, "config.json")
-            
-            # Ler o arquivo ZIP
-            with open(temp_zip, 'rb') as f:
-                dados = f.read()
-            
-            # Criptografar o arquivo ZIP
-            dados_criptografados, iv = self.criptografia.criptografar(dados, chave_base)
-            
-            # Criar arquivo de backup com metadados e dados criptografados
-            metadados = {
-                "versao": "1.0",
-                "data_backup": data_hora,
-                "iv": iv
-            }
-            
-            with open(caminho_backup, 'w') as f:
-                # Escrever metadados como JSON
-                json.dump(metadados, f)
-                # Adicionar uma linha em branco para separar metadados dos dados
-                f.write("\n")
-                # Escrever dados criptografados
-                f.write(dados_criptografados)
+            chave_base, salt_usuario = chave_usuario
             
-            # Limpar arquivos temporários
-            shutil.rmtree(temp_dir)
+            # O salt vai em claro no cabeçalho para que a senha reconstrua a chave na restauração
+            # O banco entra no backup como snapshot consistente, não como cópia do arquivo em uso
+            with self.banco_dados.snapshot.temporario(os.path.dirname(self.caminho_db)) as snapshot_db:
+                itens = [
+                    (snapshot_db, "sistema.db"),
+                    (self.caminho_config, "config.json"),
+                    (self.caminho_arquivos, "arquivos")
+                ]
+                estatisticas = BackupFluxo().criar(caminho_backup, chave_base, itens, {"salt_usuario": salt_usuario})
             
             try:
-                self.banco_dados.registrar_log("sistema", f"Backup criptografado realizado: {caminho_backup}")
+                self.banco_dados.registrar_log(
+                    "sistema",
+                    f"Backup criptografado realizado: {caminho_backup} ({estatisticas['bytes_lidos']} bytes lidos, {estatisticas['bytes_gravados']} gravados)"
+                )
             except:
                 pass
             return True, f"Backup criptografado realizado com sucesso em {caminho_backup}"
@@ -1163,7 +1345,10 @@ class CofreDigital:
             if not os.path.exists(caminho_backup):
                 return False, "Arquivo de backup não encontrado"
             
-            # Ler o arquivo de backup
+            if BackupFluxo.eh_backup_fluxo(caminho_backup):
+                return self._restaurar_backup_fluxo(caminho_backup)
+            
+            # Formato antigo (versão 1.0): ZIP cifrado em base64
             with open(caminho_backup, 'r') as f:
                 # Ler a primeira linha como JSON (metadados)
                 linha_metadados = f.readline()
@@ -1217,13 +1402,13 @@ class CofreDigital:
                     return False, "Backup corrompido: arquivos não encontrados"
                 
                 # Fechar conexões com o banco de dados atual
-                self.usuario_autenticado = False
+                self.encerrar_sessao()
                 
                 # Fazer backup do banco de dados atual antes de substituí-lo
                 data_hora = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
                 backup_atual = os.path.join(os.path.dirname(self.caminho_db), f"pre_restauracao_{data_hora}.db")
+                self.banco_dados.snapshot.criar(backup_atual)
                 import shutil
-                shutil.copy2(self.caminho_db, backup_atual)
                 
                 # Substituir os arquivos
                 shutil.copy2(db_extraido, self.caminho_db)
@@ -1241,6 +1426,356 @@ class CofreDigital:
         except Exception as e:
             return False, f"Erro ao restaurar backup: {str(e)}"
 
+    def _restaurar_backup_fluxo(self, caminho_backup):
+        """Restaura um backup no formato em fluxo, extraindo um quadro por vez"""
+        backup_fluxo = BackupFluxo()
+        metadados = backup_fluxo.ler_metadados(caminho_backup)
+        
+        chave_base = self._solicitar_chave_backup(metadados.get("salt_usuario"))
+        if chave_base is None:
+            return False, "Operação cancelada pelo usuário"
+        
+        return self._restaurar_de_diretorio(
+            lambda temp_dir: backup_fluxo.restaurar(caminho_backup, chave_base, temp_dir)
+        )
+
+    def _abrir_backup_fluxo(self, caminho_backup, senha=None):
+        """
+        Abre um backup em fluxo para leitura aleatória.
+
+        Backups criados com a senha atual são abertos sem pedir a senha;
+        os demais usam a senha informada ou pedem a senha ao usuário.
+
+        Returns:
+            LeitorBackup ou None se o usuário cancelar
+        """
+        if not BackupFluxo.eh_backup_fluxo(caminho_backup):
+            raise ValueError("Formato de backup não suporta leitura parcial")
+
+        backup_fluxo = BackupFluxo()
+        salt_usuario = backup_fluxo.ler_metadados(caminho_backup).get("salt_usuario")
+
+        chave_atual = self._obter_chave_backup() if self.usuario_autenticado and senha is None else None
+        if chave_atual is not None and chave_atual[1] == salt_usuario:
+            chave_base = chave_atual[0]
+        else:
+            chave_base = self._solicitar_chave_backup(salt_usuario, senha)
+            if chave_base is None:
+                return None
+
+        return backup_fluxo.abrir(caminho_backup, chave_base)
+
+    def verificar_backup(self, caminho_backup, senha=None):
+        """Confere a autenticação de todos os quadros de um backup sem extrair nada"""
+        try:
+            leitor = self._abrir_backup_fluxo(caminho_backup, senha)
+            if leitor is None:
+                return False, "Operação cancelada pelo usuário", None
+
+            with leitor:
+                resultado = leitor.verificar()
+
+            if resultado["ok"]:
+                return True, f"{resultado['quadros']} quadros verificados sem erros", resultado
+
+            self.banco_dados.registrar_log("seguranca", f"Verificação de backup encontrou {len(resultado['erros'])} erros")
+            return False, f"Verificação encontrou {len(resultado['erros'])} erros", resultado
+        except ValueError as e:
+            return False, f"Erro ao descriptografar backup: {str(e)}", None
+        except Exception as e:
+            return False, f"Erro ao verificar backup: {str(e)}", None
+
+    def listar_conteudo_backup(self, caminho_backup, senha=None):
+        """Lista as senhas, notas, arquivos e compartimentos guardados em um backup"""
+        if not self.usuario_autenticado:
+            return False, "Usuário não autenticado", None
+
+        try:
+            leitor = self._abrir_backup_fluxo(caminho_backup, senha)
+            if leitor is None:
+                return False, "Operação cancelada pelo usuário", None
+
+            with leitor, RestauracaoParcial(leitor, self.banco_dados, self.armazem_blocos,
+                                            self.armazenamento_arquivos, self.caminho_arquivos,
+                                            self._contexto_compartimento) as restauracao:
+                itens = restauracao.listar_itens()
+
+            return True, "Conteúdo do backup listado", itens
+        except Exception as e:
+            return False, f"Erro ao listar conteúdo do backup: {str(e)}", None
+
+    def restaurar_item_backup(self, caminho_backup, tipo, id_item, senha=None):
+        """
+        Restaura uma única senha, nota ou arquivo de um backup, mantendo os dados atuais.
+
+        Args:
+            caminho_backup (str): Caminho do backup
+            tipo (str): "senha", "nota" ou "arquivo"
+            id_item (int): ID do item no backup
+            senha (str, optional): Senha do backup, se diferente da atual
+        """
+        if not self.usuario_autenticado:
+            return False, "Usuário não autenticado"
+
+        try:
+            leitor = self._abrir_backup_fluxo(caminho_backup, senha)
+            if leitor is None:
+                return False, "Operação cancelada pelo usuário"
+
+            with leitor, RestauracaoParcial(leitor, self.banco_dados, self.armazem_blocos,
+                                            self.armazenamento_arquivos, self.caminho_arquivos,
+                                            self._contexto_compartimento) as restauracao:
+                inserido = restauracao.restaurar_item(tipo, id_item)
+
+            if not inserido:
+                return True, "O item já existe com o mesmo conteúdo"
+
+            self.banco_dados.registrar_log("sistema", f"Item restaurado de backup: {tipo} {id_item}")
+            return True, "Item restaurado com sucesso"
+        except Exception as e:
+            return False, f"Erro ao restaurar item do backup: {str(e)}"
+
+    def restaurar_compartimento_backup(self, caminho_backup, compartimento, senha=None):
+        """Restaura um compartimento e todos os seus itens de um backup, mantendo os dados atuais"""
+        if not self.usuario_autenticado:
+            return False, "Usuário não autenticado", None
+
+        try:
+            leitor = self._abrir_backup_fluxo(caminho_backup, senha)
+            if leitor is None:
+                return False, "Operação cancelada pelo usuário", None
+
+            with leitor, RestauracaoParcial(leitor, self.banco_dados, self.armazem_blocos,
+                                            self.armazenamento_arquivos, self.caminho_arquivos,
+                                            self._contexto_compartimento) as restauracao:
+                restaurados = restauracao.restaurar_compartimento(compartimento)
+
+            total = sum(restaurados.values())
+            self.banco_dados.registrar_log("sistema", f"Compartimento {compartimento} restaurado de backup: {total} itens")
+            return True, f"{total} itens restaurados", restaurados
+        except Exception as e:
+            return False, f"Erro ao restaurar compartimento do backup: {str(e)}", None
+
+    def _obter_chave_backup(self):
+        """Retorna (chave_base, salt_usuario) usados para cifrar backups, ou None sem usuário"""
+        conn = self.banco_dados.conectar()
+        cursor = conn.cursor()
+        cursor.execute("SELECT hash_senha, salt FROM usuarios LIMIT 1")
+        resultado = cursor.fetchone()
+        conn.close()
+        
+        if not resultado:
+            return None
+        
+        hash_senha_usuario, salt_usuario = resultado
+        return hash_senha_usuario[:32].encode(), salt_usuario
+
+    def _solicitar_chave_backup(self, salt_usuario, senha=None):
+        """Pede a senha do backup (se não informada) e reconstrói a chave com o salt gravado no backup"""
+        if senha is None:
+            senha = simpledialog.askstring("Senha de Backup", "Digite a senha usada para criar o backup:", show="*")
+        if not senha:
+            return None
+        
+        hash_senha, _ = self.criptografia.hash_senha(senha, salt_usuario)
+        return hash_senha[:32].encode()
+
+    def _restaurar_de_diretorio(self, extrair):
+        """
+        Substitui os dados atuais pelos extraídos de um backup.
+        
+        extrair(diretorio) grava sistema.db, config.json e arquivos/ no diretório
+        temporário e levanta ValueError se o backup não puder ser decifrado.
+        """
+        import shutil
+        import tempfile
+        
+        # Extrair no mesmo sistema de arquivos para que a substituição seja uma renomeação
+        temp_dir = tempfile.mkdtemp(prefix="restauracao_", dir=os.path.dirname(self.caminho_db))
+        try:
+            try:
+                extrair(temp_dir)
+            except ValueError as e:
+                return False, f"Erro ao descriptografar backup: {str(e)}"
+            
+            db_extraido = os.path.join(temp_dir, "sistema.db")
+            config_extraido = os.path.join(temp_dir, "config.json")
+            arquivos_extraidos = os.path.join(temp_dir, "arquivos")
+            
+            if not os.path.exists(db_extraido) or not os.path.exists(config_extraido):
+                return False, "Backup corrompido: arquivos não encontrados"
+            
+            # Fechar conexões com o banco de dados atual
+            self.encerrar_sessao()
+            self.migrador_arquivos.parar()
+            self.migrador_compartimentos.parar()
+            self.rotacao.parar(aguardar=True)
+            
+            # Fazer backup do banco de dados atual antes de substituí-lo
+            data_hora = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            backup_atual = os.path.join(os.path.dirname(self.caminho_db), f"pre_restauracao_{data_hora}.db")
+            self.banco_dados.snapshot.criar(backup_atual)
+            
+            # Substituir os arquivos
+            os.replace(db_extraido, self.caminho_db)
+            os.replace(config_extraido, self.caminho_config)
+            
+            # Arquivos e blocos têm nomes únicos, então podem ser mesclados no armazenamento atual
+            for raiz, _, nomes in os.walk(arquivos_extraidos):
+                relativo = os.path.relpath(raiz, arquivos_extraidos)
+                destino = os.path.normpath(os.path.join(self.caminho_arquivos, relativo))
+                os.makedirs(destino, exist_ok=True)
+                for nome in nomes:
+                    os.replace(os.path.join(raiz, nome), os.path.join(destino, nome))
+            
+            # Reinicializar o sistema; rotações pendentes no banco restaurado continuam no próximo desbloqueio
+            self.inicializar_sistema()
+            self.rotacao.iniciar()
+            
+            return True, "Backup restaurado com sucesso. Por favor, faça login novamente."
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _abrir_repositorio_incremental(self, caminho_repositorio=None, chave_base=None):
+        """Abre (ou cria) o repositório de backups incrementais; o acesso "principal" segue a senha atual"""
+        if caminho_repositorio is None:
+            caminho_repositorio = os.path.join(self.caminho_base, "backup", "incremental")
+        
+        repositorio = BackupIncremental(caminho_repositorio)
+        salt_usuario = None
+        
+        if chave_base is None:
+            chave_usuario = self._obter_chave_backup()
+            if chave_usuario is None:
+                raise ValueError("Usuário não encontrado")
+            chave_base, salt_usuario = chave_usuario
+        
+        repositorio.abrir(chave_base, {"salt_usuario": salt_usuario})
+        return repositorio
+
+    def _reproteger_repositorio_incremental(self, chave_antiga, chave_nova, novo_salt):
+        """
+        Acrescenta ao repositório padrão um acesso pela nova chave, na reconfiguração das senhas.
+
+        Returns:
+            BackupIncremental ou None se não houver repositório ou ele não abrir com a chave antiga
+        """
+        repositorio = BackupIncremental(os.path.join(self.caminho_base, "backup", "incremental"))
+        if not repositorio.existe():
+            return None
+        
+        try:
+            repositorio.abrir(chave_antiga)
+            repositorio.definir_acesso("reconfiguracao", chave_nova, {"salt_usuario": novo_salt})
+            return repositorio
+        except Exception as e:
+            self.banco_dados.registrar_log("erro", f"Erro ao proteger o backup incremental com a nova senha: {str(e)}")
+            return None
+
+    def fazer_backup_incremental(self, caminho_repositorio=None):
+        """Grava uma nova geração no repositório de backups incrementais, apenas com os pedaços alterados"""
+        if not self.usuario_autenticado:
+            return False, "Usuário não autenticado", None
+        
+        try:
+            repositorio = self._abrir_repositorio_incremental(caminho_repositorio)
+            
+            # O banco entra como snapshot consistente, sob o nome sistema.db
+            with self.banco_dados.snapshot.temporario(os.path.dirname(self.caminho_db)) as snapshot_db:
+                itens = [
+                    (self.caminho_db, "sistema.db"),
+                    (self.caminho_config, "config.json"),
+                    (self.caminho_arquivos, "arquivos")
+                ]
+                estatisticas = repositorio.criar_geracao(itens, {"sistema.db": snapshot_db})
+            
+            mensagem = (
+                f"Backup incremental {estatisticas['geracao']} realizado: "
+                f"{estatisticas['pedacos_novos']} pedaços novos, {estatisticas['bytes_gravados']} bytes gravados"
+            )
+            try:
+                self.banco_dados.registrar_log("sistema", mensagem)
+            except:
+                pass
+            return True, mensagem, estatisticas
+        except Exception as e:
+            try:
+                self.banco_dados.registrar_log("erro", f"Erro ao fazer backup incremental: {str(e)}")
+            except:
+                pass
+            return False, f"Erro ao fazer backup incremental: {str(e)}", None
+
+    def listar_backups_incrementais(self, caminho_repositorio=None):
+        """Lista as gerações do repositório de backups incrementais"""
+        if not self.usuario_autenticado:
+            return False, "Usuário não autenticado", None
+        
+        try:
+            geracoes = self._abrir_repositorio_incremental(caminho_repositorio).listar_geracoes()
+            return True, f"Encontradas {len(geracoes)} gerações", geracoes
+        except Exception as e:
+            return False, f"Erro ao listar backups incrementais: {str(e)}", None
+
+    def verificar_backups_incrementais(self, caminho_repositorio=None, completo=False):
+        """Verifica o encadeamento das gerações e a integridade dos pedaços"""
+        if not self.usuario_autenticado:
+            return False, "Usuário não autenticado", None
+        
+        try:
+            resultado = self._abrir_repositorio_incremental(caminho_repositorio).verificar(completo)
+            if resultado["ok"]:
+                return True, f"{resultado['geracoes']} gerações verificadas sem erros", resultado
+            
+            self.banco_dados.registrar_log("seguranca", f"Verificação de backups encontrou {len(resultado['erros'])} erros")
+            return False, f"Verificação encontrou {len(resultado['erros'])} erros", resultado
+        except Exception as e:
+            return False, f"Erro ao verificar backups incrementais: {str(e)}", None
+
+    def podar_backups_incrementais(self, manter, caminho_repositorio=None):
+        """Remove as gerações mais antigas, mantendo as mais recentes"""
+        if not self.usuario_autenticado:
+            return False, "Usuário não autenticado"
+        
+        try:
+            resultado = self._abrir_repositorio_incremental(caminho_repositorio).podar(manter)
+            mensagem = f"{resultado['geracoes_removidas']} gerações e {resultado['pedacos_removidos']} pedaços removidos"
+            self.banco_dados.registrar_log("sistema", f"Poda de backups incrementais: {mensagem}")
+            return True, mensagem
+        except Exception as e:
+            return False, f"Erro ao podar backups incrementais: {str(e)}"
+
+    def restaurar_backup_incremental(self, geracao=None, caminho_repositorio=None):
+        """Restaura uma geração do repositório de backups incrementais (a mais recente se None)"""
+        try:
+            if caminho_repositorio is None:
+                caminho_repositorio = os.path.join(self.caminho_base, "backup", "incremental")
+            
+            repositorio = BackupIncremental(caminho_repositorio)
+            if not repositorio.existe():
+                return False, "Repositório de backup não encontrado"
+            
+            senha = simpledialog.askstring("Senha de Backup", "Digite a senha do cofre:", show="*")
+            if not senha:
+                return False, "Operação cancelada pelo usuário"
+            
+            # Cada acesso por senha guarda o salt com que a chave é reconstruída
+            for acesso in repositorio.acessos().values():
+                if "salt_usuario" not in acesso:
+                    continue
+                try:
+                    repositorio = self._abrir_repositorio_incremental(
+                        caminho_repositorio, self._solicitar_chave_backup(acesso["salt_usuario"], senha)
+                    )
+                    break
+                except ValueError:
+                    continue
+            else:
+                return False, "Senha incorreta para este repositório de backup"
+            
+            return self._restaurar_de_diretorio(lambda temp_dir: repositorio.restaurar(geracao, temp_dir))
+        except Exception as e:
+            return False, f"Erro ao restaurar backup incremental: {str(e)}"
+
     def pesquisar_senhas(self, termo_busca):
         """Pesquisa senhas por título ou descrição"""
         if not self.usuario_autenticado:
@@ -1248,7 +1783,7 @@ class CofreDigital:
         
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
             # Pesquisar senhas que contenham o termo de busca no título ou descrição
@@ -1285,7 +1820,7 @@ class CofreDigital:
         
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
             # Pesquisar notas que contenham o termo de busca no título
@@ -1314,6 +1849,138 @@ class CofreDigital:
                 pass
             return False, f"Erro ao pesquisar notas: {str(e)}", None
 
+    def compartimentos_acessiveis(self):
+        """Compartimentos que a sessão pode ler: o principal e os desbloqueados no chaveiro"""
+        if getattr(self, "modo_acesso_restrito", False):
+            return [self.compartimento_restrito]
+        return ["principal"] + [comp for comp in self.chaveiro.desbloqueados() if comp != "principal"]
+
+    def pesquisar_compartimentos(self, termo_busca, tipos=None):
+        """Pesquisa senhas, notas e arquivos em todos os compartimentos desbloqueados, em uma única consulta"""
+        if not self.usuario_autenticado:
+            return False, "Usuário não autenticado", None
+
+        try:
+            compartimentos = self.compartimentos_acessiveis()
+
+            conn = self.banco_dados.conectar()
+            try:
+                resultados = BuscaFederada().pesquisar(conn.cursor(), termo_busca, compartimentos, tipos)
+            finally:
+                conn.close()
+
+            return True, f"Encontrados {len(resultados)} itens em {len(compartimentos)} compartimentos", resultados
+        except Exception as e:
+            try:
+                self.banco_dados.registrar_log("erro", f"Erro ao pesquisar compartimentos: {str(e)}")
+            except:
+                pass
+            return False, f"Erro ao pesquisar compartimentos: {str(e)}", None
+
+    def transferir_itens(self, tipo, destino, ids=None, categoria_id=None, filtro=None, copiar=False, origem=None, progresso=None):
+        """
+        Move ou copia senhas, notas ou arquivos para outro compartimento desbloqueado
+        
+        Os itens são selecionados por IDs, categoria e/ou filtro no compartimento de origem
+        (por padrão, o ativo) e recriptografados com a chave do destino em lotes.
+        """
+        if not self.usuario_autenticado:
+            return False, "Usuário não autenticado", None
+        
+        if self.modo_heranca_ativo:
+            return False, "Não é possível transferir itens no modo de herança", None
+        
+        origem = origem or self.compartimento_ativo
+        contexto_origem = self._contexto_compartimento(origem)
+        contexto_destino = self._contexto_compartimento(destino)
+        if contexto_origem is None or contexto_destino is None:
+            return False, "Os compartimentos de origem e destino precisam estar desbloqueados", None
+        
+        try:
+            transferencia_id, quantidade = self.transferencia.iniciar(
+                tipo, origem, destino, copiar, ids, categoria_id, filtro
+            )
+            resumo = self.transferencia.executar(transferencia_id, contexto_origem, contexto_destino, progresso)
+            resumo["id"] = transferencia_id
+            
+            operacao = "copiados" if copiar else "movidos"
+            mensagem = f"{resumo['transferidos']} de {quantidade} itens {operacao} de '{origem}' para '{destino}'"
+            if resumo["falhas"]:
+                mensagem += f" ({len(resumo['falhas'])} falhas; a transferência pode ser retomada)"
+            
+            self.banco_dados.registrar_log("dados", mensagem)
+            return not resumo["falhas"], mensagem, resumo
+        except Exception as e:
+            self.banco_dados.registrar_log("erro", f"Erro ao transferir itens: {str(e)}")
+            return False, f"Erro ao transferir itens: {str(e)}", None
+
+    def retomar_transferencias(self, progresso=None):
+        """Retoma as transferências interrompidas cujos compartimentos estão desbloqueados"""
+        if not self.usuario_autenticado:
+            return False, "Usuário não autenticado", None
+        
+        try:
+            resumos = []
+            for pendente in self.transferencia.pendentes():
+                contexto_origem = self._contexto_compartimento(pendente["origem"])
+                contexto_destino = self._contexto_compartimento(pendente["destino"])
+                if contexto_origem is None or contexto_destino is None:
+                    continue
+                
+                resumo = self.transferencia.executar(pendente["id"], contexto_origem, contexto_destino, progresso)
+                resumo["id"] = pendente["id"]
+                resumos.append(resumo)
+            
+            transferidos = sum(resumo["transferidos"] for resumo in resumos)
+            return True, f"{len(resumos)} transferências retomadas, {transferidos} itens transferidos", resumos
+        except Exception as e:
+            self.banco_dados.registrar_log("erro", f"Erro ao retomar transferências: {str(e)}")
+            return False, f"Erro ao retomar transferências: {str(e)}", None
+
+    def rotacionar_chave(self, compartimento=None):
+        """
+        Cria uma nova versão da chave de dados de um compartimento desbloqueado (por padrão, o ativo)
+        
+        O cofre continua em uso: os registros novos já usam a nova versão, e os antigos são
+        recriptografados em segundo plano, em lotes, até a versão anterior ser aposentada.
+        """
+        if not self.usuario_autenticado:
+            return False, "Usuário não autenticado", None
+        
+        if self.modo_heranca_ativo:
+            return False, "Não é possível rotacionar chaves no modo de herança", None
+        
+        compartimento = compartimento or self.compartimento_ativo
+        contexto = self._contexto_compartimento(compartimento)
+        if contexto is None:
+            return False, f"O compartimento '{compartimento}' precisa estar desbloqueado", None
+        
+        # As versões são protegidas por uma chave que não fica no banco; cofres anteriores a ela precisam criá-la
+        if contexto.chave_versoes is None or not self.rotacao.protegido(compartimento):
+            if compartimento == "principal":
+                return False, "Defina as senhas novamente para habilitar a rotação de chaves", None
+            return False, f"Desbloqueie o compartimento '{compartimento}' pela frase para habilitar a rotação de chaves", None
+        
+        try:
+            versao = self.rotacao.iniciar_rotacao(contexto)
+            return True, f"Rotação iniciada: o compartimento '{compartimento}' passa à versão {versao} da chave", versao
+        except Exception as e:
+            self.banco_dados.registrar_log("erro", f"Erro ao rotacionar chave: {str(e)}")
+            return False, f"Erro ao rotacionar chave: {str(e)}", None
+
+    def progresso_rotacao(self, compartimento=None):
+        """Versão atual da chave de um compartimento e quantos registros ainda usam cada versão"""
+        if not self.usuario_autenticado:
+            return False, "Usuário não autenticado", None
+        
+        compartimento = compartimento or self.compartimento_ativo
+        try:
+            progresso = self.rotacao.progresso(compartimento)
+            situacao = "em andamento" if progresso["em_andamento"] else "concluída"
+            return True, f"Rotação {situacao} no compartimento '{compartimento}' (versão {progresso['versao']})", progresso
+        except Exception as e:
+            return False, f"Erro ao obter progresso da rotação: {str(e)}", None
+
     def excluir_senha(self, id_senha):
         """Exclui uma senha do cofre"""
         if not self.usuario_autenticado:
@@ -1321,7 +1988,7 @@ class CofreDigital:
         
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
             # Verificar se a senha existe
@@ -1356,7 +2023,7 @@ class CofreDigital:
         
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
             # Verificar se a nota existe
@@ -1391,28 +2058,35 @@ class CofreDigital:
         
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.banco_dados.conectar()
             cursor = conn.cursor()
             
             # Verificar se o arquivo existe
-            cursor.execute("SELECT nome_original, nome_criptografado FROM arquivos WHERE id = ?", (id_arquivo,))
+            cursor.execute("SELECT nome_original, nome_criptografado, armazenamento FROM arquivos WHERE id = ?", (id_arquivo,))
             resultado = cursor.fetchone()
             
             if not resultado:
                 conn.close()
                 return False, "Arquivo não encontrado"
             
-            nome_original, nome_criptografado = resultado
+            nome_original, nome_criptografado, armazenamento = resultado
             
-            # Excluir o arquivo físico
-            caminho_arquivo = os.path.join(self.caminho_base, "arquivos", nome_criptografado)
-            if os.path.exists(caminho_arquivo):
-                os.remove(caminho_arquivo)
+            if armazenamento == "blocos":
+                # Liberar as referências aos blocos; os compartilhados permanecem
+                self.armazem_blocos.liberar(cursor, id_arquivo)
+            else:
+                # Excluir o arquivo físico
+                self._remover_arquivo_fisico(nome_criptografado, armazenamento)
             
             # Excluir o registro do banco de dados
             cursor.execute("DELETE FROM arquivos WHERE id = ?", (id_arquivo,))
             
             conn.commit()
+            
+            # Remover os blocos que ficaram sem referências
+            if armazenamento == "blocos":
+                self.armazem_blocos.coletar_lixo(conn)
+            
             conn.close()
             
             self.banco_dados.registrar_log("sistema", f"Arquivo '{nome_original}' excluído")
@@ -1442,6 +2116,12 @@ class CofreDigital:
             self.modo_camuflagem = config.get("modo_camuflagem", "bloco_notas")
             self.autodestruicao_ativada = config.get("autodestruicao_ativada", True)
             self.nome_exibicao = config.get("nome_exibicao", "Bloco de Notas Portátil")
+            self.banco_dados.rastreador.limite_lento_ms = config.get("limite_consulta_lenta_ms", 100)
+            self.tempo_bloqueio_compartimento = config.get("tempo_bloqueio_compartimento_min", 15) * 60
+            self.alvo_kdf_ms = config.get("alvo_kdf_ms", ALVO_PADRAO_MS)
+            self.perfil_kdf_configurado = config.get("perfil_kdf")
+            self.algoritmo_cifra = config.get("algoritmo_cifra", ALGORITMO_PADRAO)
+            self.intervalo_rotacao_dias = config.get("intervalo_rotacao_dias", INTERVALO_ROTACAO_DIAS_PADRAO)
             
             # Registrar log
             self.banco_dados.registrar_log("sistema", "Configurações carregadas com sucesso")
@@ -1461,19 +2141,12 @@ class CofreDigital:
         if not self.usuario_autenticado:
             return False, "Usuário não autenticado", None
         
-        if not BIP39_DISPONIVEL:
-            return False, "Suporte a frases mnemônicas não disponível", None
-        
         try:
-            # Gerar entropia aleatória (128 bits = 16 bytes = frase de 12 palavras)
-            entropia = secrets.token_bytes(16)
-            mnemo = Mnemonic("english")
-            
-            # Gerar frase mnemônica
-            frase_mnemonica = mnemo.to_mnemonic(entropia)
+            # Gerar frase mnemônica de 12 palavras (128 bits de entropia)
+            frase_mnemonica = self.bip39.gerar_frase(12)
             
             # Gerar seed a partir da frase (com senha vazia como passphrase)
-            seed = mnemo.to_seed(frase_mnemonica, "")
+            seed = self.derivacao_seed.derivar(frase_mnemonica)
             
             # Derivar identificador único do compartimento (primeiros 16 bytes do seed)
             compartimento_id = seed[:16].hex()
@@ -1483,19 +2156,12 @@ class CofreDigital:
             
             # Criptografar a chave do compartimento com a chave mestra do usuário
             # (isso permite que o usuário acesse todos os compartimentos com sua senha principal)
-            usuario = self.banco_dados.obter_usuario()
-            if not usuario:
+            contexto_principal = self._contexto_compartimento("principal")
+            if contexto_principal is None:
                 return False, "Usuário não encontrado", None
             
-            # Desempacotar com tratamento para o caso de seed_hex não estar disponível
-            if len(usuario) == 5:
-                id_usuario, hash_senha, salt, hash_senha_heranca, salt_heranca = usuario
-                seed_hex = None
-            else:
-                id_usuario, hash_senha, salt, hash_senha_heranca, salt_heranca, seed_hex = usuario
-            
-            # Usar o hash da senha do usuário como base para a chave de criptografia
-            chave_base = hash_senha[:32].encode()
+            # A chave principal da sessão, sem reler o usuário
+            chave_base = contexto_principal.chave
             
             # Criptografar a chave do compartimento
             chave_criptografada, iv = self.criptografia.criptografar(chave_compartimento.hex(), chave_base)
@@ -1518,31 +2184,78 @@ class CofreDigital:
             self.banco_dados.registrar_log("erro", f"Erro ao criar compartimento: {str(e)}")
             return False, f"Erro ao criar compartimento: {str(e)}", None
     
+    def derivar_seed_frase(self, frase_mnemonica):
+        """
+        Inicia em segundo plano a derivação da seed de uma frase.
+
+        A interface espera o futuro sem travar e depois chama ativar_compartimento_por_frase
+        ou autenticar_por_frase, que encontram a seed no cache da sessão. Frases inválidas,
+        desconhecidas ou já desbloqueadas não passam pelo PBKDF2 (o futuro já vem resolvido com None).
+        """
+        frase_normalizada = " ".join(frase_mnemonica.lower().split())
+        if self.chaveiro.localizar(frase_normalizada) is not None:
+            return futuro_concluido(None)
+        
+        # Login por frase durante o bloqueio por tentativas: nada a derivar
+        if not self.usuario_autenticado and self.guarda.espera("frase"):
+            return futuro_concluido(None)
+        
+        impressao = self.impressao_frase.calcular(frase_mnemonica)
+        if impressao is None or not self.impressao_frase.pode_corresponder("compartimentos", impressao):
+            return futuro_concluido(None)
+        return self.derivacao_seed.derivar_async(frase_mnemonica)
+
+    def _localizar_compartimento_por_frase(self, frase_mnemonica):
+        """
+        Encontra o compartimento de uma frase.
+        
+        A impressão da frase é verificada no índice antes do PBKDF2, então frases
+        inválidas ou desconhecidas são recusadas sem derivar a seed.
+        
+        Returns:
+            tuple: (compartimento, seed, mensagem_erro)
+        """
+        impressao = self.impressao_frase.calcular(frase_mnemonica)
+        if impressao is None:
+            return None, None, "Frase mnemônica inválida"
+        
+        if not self.impressao_frase.pode_corresponder("compartimentos", impressao):
+            return None, None, "Compartimento não encontrado para esta frase mnemônica"
+        
+        # Gerar seed a partir da frase e derivar o identificador do compartimento
+        seed = self.derivacao_seed.derivar(frase_mnemonica)
+        compartimento = self.banco_dados.obter_compartimento_por_id(seed[:16].hex())
+        
+        if not compartimento:
+            return None, None, "Compartimento não encontrado para esta frase mnemônica"
+        
+        # Compartimento anterior às impressões: gravar a impressão agora que a frase foi confirmada
+        if compartimento["impressao_frase"] is None:
+            self.impressao_frase.registrar("compartimentos", compartimento["compartimento_id"], impressao)
+        
+        return compartimento, seed, None
+
     def ativar_compartimento_por_frase(self, frase_mnemonica):
         """Ativa um compartimento específico usando sua frase mnemônica"""
-        if not BIP39_DISPONIVEL:
-            return False, "Suporte a frases mnemônicas não disponível"
-        
         try:
-            # Verificar se a frase é válida
-            mnemo = Mnemonic("english")
-            if not mnemo.check(frase_mnemonica):
-                return False, "Frase mnemônica inválida"
-            
-            # Gerar seed a partir da frase
-            seed = mnemo.to_seed(frase_mnemonica, "")
+            # Frase já usada na sessão: ativar direto do chaveiro, sem recalcular o seed
+            frase_normalizada = " ".join(frase_mnemonica.lower().split())
+            nome_desbloqueado = self.chaveiro.localizar(frase_normalizada)
+            if nome_desbloqueado is not None:
+                self.compartimento_ativo = nome_desbloqueado
+                return True, f"Compartimento '{nome_desbloqueado}' ativado com sucesso"
             
-            # Derivar identificador do compartimento
-            compartimento_id = seed[:16].hex()
-            
-            # Buscar compartimento no banco de dados
-            compartimento = self.banco_dados.obter_compartimento_por_id(compartimento_id)
+            # Buscar o compartimento da frase
+            compartimento, seed, erro = self._localizar_compartimento_por_frase(frase_mnemonica)
             
             if not compartimento:
-                return False, "Compartimento não encontrado para esta frase mnemônica"
+                return False, erro
             
-            # Derivar chave do compartimento
-            self.chave_compartimento_ativo = self.derivar_chave_compartimento(seed)
+            # Derivar chave do compartimento e guardá-la no chaveiro da sessão
+            self.chaveiro.guardar(
+                compartimento["nome"], self.derivar_chave_compartimento(seed), referencia=frase_normalizada,
+                chave_versoes=self._chave_versoes_compartimento(compartimento["nome"], seed)
+            )
             self.compartimento_ativo = compartimento["nome"]
             
             self.banco_dados.registrar_log("sistema", f"Compartimento ativado: {self.compartimento_ativo}")
@@ -1557,28 +2270,32 @@ class CofreDigital:
             return False, "Usuário não autenticado"
         
         try:
+            # Compartimento já desbloqueado na sessão
+            if self.chaveiro.desbloqueado(nome_compartimento):
+                self.compartimento_ativo = nome_compartimento
+                return True, f"Compartimento '{nome_compartimento}' ativado com sucesso"
+            
             # Buscar compartimento no banco de dados
             compartimento = self.banco_dados.obter_compartimento_por_nome(nome_compartimento)
             
             if not compartimento:
                 return False, f"Compartimento '{nome_compartimento}' não encontrado"
             
-            # Obter dados do usuário
-            usuario = self.banco_dados.obter_usuario()
-            if not usuario:
+            # A chave principal da sessão, sem reler o usuário
+            contexto_principal = self._contexto_compartimento("principal")
+            if contexto_principal is None:
                 return False, "Usuário não encontrado"
-            
-            id_usuario, hash_senha, salt, hash_senha_heranca, salt_heranca, seed_hex = usuario
-            
-            # Usar o hash da senha do usuário como base para a chave de criptografia
-            chave_base = hash_senha[:32].encode()
+            chave_base = contexto_principal.chave
             
             # Descriptografar a chave do compartimento
             chave_criptografada = compartimento["chave_criptografada"]
             iv = compartimento["iv"]
             
             chave_hex = self.criptografia.descriptografar(chave_criptografada, iv, chave_base).decode()
-            self.chave_compartimento_ativo = bytes.fromhex(chave_hex)
+            self.chaveiro.guardar(
+                nome_compartimento, bytes.fromhex(chave_hex),
+                chave_versoes=self.rotacao.abrir_compartimento(nome_compartimento, contexto_principal.chave_versoes)
+            )
             self.compartimento_ativo = nome_compartimento
             
             self.banco_dados.registrar_log("sistema", f"Compartimento ativado: {self.compartimento_ativo}")
@@ -1592,6 +2309,17 @@ class CofreDigital:
         # Usar HMAC-SHA256 para derivar uma chave de 32 bytes
         return hmac.new(b"compartimento", seed, hashlib.sha256).digest()
     
+    def _chave_versoes_compartimento(self, nome_compartimento, seed):
+        """
+        Deriva a chave das versões de um compartimento e, se ainda não estiver guardada, a protege
+        com a do principal (quando esta estiver na sessão) para o desbloqueio pelo nome
+        """
+        chave_versoes = self.rotacao.chave_versoes_da_seed(seed)
+        chave_principal = self.chaveiro.chave_versoes("principal")
+        if chave_principal is not None and not self.rotacao.protegido(nome_compartimento):
+            self.rotacao.proteger_compartimento(nome_compartimento, chave_versoes, chave_principal)
+        return chave_versoes
+    
     def listar_compartimentos(self):
         """Lista todos os compartimentos disponíveis"""
         if not self.usuario_autenticado:
@@ -1609,24 +2337,17 @@ class CofreDigital:
         if not self.usuario_autenticado:
             return False, "Usuário não autenticado", None
         
-        if not BIP39_DISPONIVEL:
-            return False, "Suporte a frases mnemônicas não disponível", None
-        
         try:
             # Verificar se já existe um compartimento com este nome
             compartimento_existente = self.banco_dados.obter_compartimento_por_nome(nome)
             if compartimento_existente:
                 return False, f"Já existe um compartimento chamado '{nome}'", None
             
-            # Gerar entropia aleatória (128 bits = 16 bytes = frase de 12 palavras)
-            entropia = secrets.token_bytes(16)
-            mnemo = Mnemonic("english")
-            
-            # Gerar frase mnemônica
-            frase_mnemonica = mnemo.to_mnemonic(entropia)
+            # Gerar frase mnemônica de 12 palavras (128 bits de entropia)
+            frase_mnemonica = self.bip39.gerar_frase(12)
             
             # Gerar seed a partir da frase (com senha vazia como passphrase)
-            seed = mnemo.to_seed(frase_mnemonica, "")
+            seed = self.derivacao_seed.derivar(frase_mnemonica)
             
             # Derivar identificador único do compartimento (primeiros 16 bytes do seed)
             compartimento_id = seed[:16].hex()
@@ -1636,19 +2357,12 @@ class CofreDigital:
             
             # Criptografar a chave do compartimento com a chave mestra do usuário
             # (isso permite que o usuário acesse todos os compartimentos com sua senha principal)
-            usuario = self.banco_dados.obter_usuario()
-            if not usuario:
+            contexto_principal = self._contexto_compartimento("principal")
+            if contexto_principal is None:
                 return False, "Usuário não encontrado", None
             
-            # Desempacotar com tratamento para o caso de seed_hex não estar disponível
-            if len(usuario) == 5:
-                id_usuario, hash_senha, salt, hash_senha_heranca, salt_heranca = usuario
-                seed_hex = None
-            else:
-                id_usuario, hash_senha, salt, hash_senha_heranca, salt_heranca, seed_hex = usuario
-            
-            # Usar o hash da senha do usuário como base para a chave de criptografia
-            chave_base = hash_senha[:32].encode()
+            # A chave principal da sessão, sem reler o usuário
+            chave_base = contexto_principal.chave
             
             # Criptografar a chave do compartimento
             chave_criptografada, iv = self.criptografia.criptografar(chave_compartimento.hex(), chave_base)
@@ -1661,10 +2375,12 @@ class CofreDigital:
                 chave_criptografada, 
                 iv, 
                 descricao, 
-                data_atual
+                data_atual,
+                self.impressao_frase.calcular(frase_mnemonica)
             )
             
             if sucesso:
+                self._chave_versoes_compartimento(nome, seed).zerar()
                 self.banco_dados.registrar_log("sistema", f"Novo compartimento criado: {nome}")
                 return True, f"Compartimento '{nome}' criado com sucesso", frase_mnemonica
             else:
@@ -1675,39 +2391,36 @@ class CofreDigital:
 
     def autenticar_por_frase(self, frase_mnemonica):
         """Autentica o usuário usando uma frase mnemônica"""
-        if not BIP39_DISPONIVEL:
-            return False, "Suporte a frases mnemônicas não disponível", False
-        
         try:
-            # Verificar se a frase é válida
-            mnemo = Mnemonic("english")
-            if not mnemo.check(frase_mnemonica):
-                self.tentativas_senha += 1
-                self.banco_dados.registrar_log("autenticacao", "Tentativa de autenticação falhou: frase mnemônica inválida")
-                return False, "Frase mnemônica inválida", False
+            # Mesmo controle de tentativas da senha, em um alvo próprio, antes de qualquer derivação
+            permitido, espera = self.guarda.verificar("frase")
+            if not permitido:
+                return False, f"Muitas tentativas incorretas. Tente novamente em {espera} segundos.", False
             
-            # Gerar seed a partir da frase
-            seed = mnemo.to_seed(frase_mnemonica, "")
-            
-            # Derivar identificador do compartimento
-            compartimento_id = seed[:16].hex()
-            
-            # Buscar compartimento no banco de dados
-            compartimento = self.banco_dados.obter_compartimento_por_id(compartimento_id)
+            # Buscar o compartimento da frase
+            compartimento, seed, erro = self._localizar_compartimento_por_frase(frase_mnemonica)
             
             if not compartimento:
+                self.guarda.registrar_falha("frase")
                 self.tentativas_senha += 1
-                self.banco_dados.registrar_log("autenticacao", "Tentativa de autenticação falhou: compartimento não encontrado")
-                return False, "Compartimento não encontrado para esta frase mnemônica", False
+                self.banco_dados.registrar_log("autenticacao", f"Tentativa de autenticação falhou: {erro}")
+                return False, erro, False
             
             # Autenticar o usuário em modo restrito (acesso apenas a este compartimento)
             self.usuario_autenticado = True
             self.tentativas_senha = 0
+            self.guarda.registrar_sucesso("frase")
             self.modo_acesso_restrito = True
             self.compartimento_restrito = compartimento["nome"]
             
-            # Derivar chave do compartimento
-            self.chave_compartimento_ativo = self.derivar_chave_compartimento(seed)
+            # Derivar chave do compartimento; no acesso restrito ela vale até o fim da sessão
+            self.chaveiro.guardar(
+                compartimento["nome"],
+                self.derivar_chave_compartimento(seed),
+                referencia=" ".join(frase_mnemonica.lower().split()),
+                expira=False,
+                chave_versoes=self._chave_versoes_compartimento(compartimento["nome"], seed)
+            )
             self.compartimento_ativo = compartimento["nome"]
             
             self.banco_dados.registrar_log("autenticacao", f"Usuário autenticado com frase mnemônica para o compartimento: {self.compartimento_ativo}")
@@ -1814,4 +2527,5 @@ def main():
     interface.iniciar()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
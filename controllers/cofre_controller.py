@@ -6,6 +6,8 @@ import tkinter as tk
 
 from models.cofre_model import CofreDigitalModel
 from models.bip39_validator import BIP39Validator
+from models.derivacao_seed import acompanhar
+from models.agendador_backup import AgendadorBackup
 
 
 class CofreController:
@@ -22,6 +24,9 @@ class CofreController:
         self.exportando_dados = False
         self.temporizadores = {}
         
+        # Backup automático, agendado com os temporizadores do controlador
+        self.agendador_backup = AgendadorBackup(self.model, self.definir_temporizador, self.cancelar_temporizador)
+        
         # Iniciar verificação automática de período
         self._iniciar_verificacao_automatica()
     
@@ -58,11 +63,9 @@ class CofreController:
     
     def _verificar_usuario_existe(self):
         """Verifica se existe um usuário configurado."""
-        import sqlite3
-        
         try:
             # Conexão com o banco de dados
-            conn = sqlite3.connect(self.model.caminho_db)
+            conn = self.model.conectar()
             cursor = conn.cursor()
             
             # Verificar se existe pelo menos um usuário na tabela
@@ -144,6 +147,11 @@ class CofreController:
         # Chamar o modelo para autenticar
         sucesso, mensagem, modo_heranca = self.model.autenticar(senha)
         
+        # Agendar o backup automático e a expiração das chaves da sessão
+        if sucesso:
+            self.agendador_backup.iniciar()
+            self._agendar_expiracao_chaves()
+        
         # Se autenticado com sucesso, redirecionar para o dashboard
         if sucesso and self.view:
             self.view.mostrar_dashboard(modo_heranca)
@@ -155,12 +163,34 @@ class CofreController:
         # Chamar o modelo para autenticar
         sucesso, mensagem, modo_heranca = self.model.autenticar_por_frase(frase)
         
+        # Agendar o backup automático e a expiração das chaves da sessão
+        if sucesso:
+            self.agendador_backup.iniciar()
+            self._agendar_expiracao_chaves()
+        
         # Se autenticado com sucesso, redirecionar para o dashboard
         if sucesso and self.view:
             self.view.mostrar_dashboard(modo_heranca)
         
         return sucesso, mensagem, modo_heranca
     
+    def autenticar_por_frase_async(self, frase, agendar, ao_concluir, ao_aguardar=None, ativo=None):
+        """
+        Autentica com a frase sem travar a interface.
+        
+        A seed é derivada em segundo plano; agendar (por exemplo widget.after) verifica
+        o andamento e ao_aguardar recebe os quadros do indicador de espera. Se ativo
+        retornar False (diálogo fechado), a autenticação é abandonada; senão, ao final,
+        ao_concluir recebe o mesmo resultado de autenticar_por_frase.
+        """
+        acompanhar(
+            self.model.derivar_seed_frase(frase),
+            agendar,
+            lambda futuro: ao_concluir(*self.autenticar_por_frase(frase)),
+            ao_aguardar,
+            ativo
+        )
+    
     def renovar_periodo(self):
         """Renova o período de confirmação de vida."""
         if not self.model.usuario_autenticado:
@@ -177,14 +207,12 @@ class CofreController:
     
     def logout(self):
         """Encerra a sessão atual."""
-        # Limpar dados da sessão
-        self.model.usuario_autenticado = False
-        self.model.usuario_atual = None
-        self.model.modo_heranca_ativo = False
-        self.model.chave_compartimento_ativo = None
+        # Limpar dados da sessão e zerar as chaves dos compartimentos
+        self.model.encerrar_sessao()
         self.compartimento_atual = "principal"
         
-        # Cancelar todos os temporizadores
+        # Interromper o backup automático e cancelar todos os temporizadores
+        self.agendador_backup.parar()
         for timer_id in list(self.temporizadores.keys()):
             self.cancelar_temporizador(timer_id)
         
@@ -225,8 +253,8 @@ class CofreController:
         # Chamar o modelo para listar os compartimentos
         return self.model.listar_compartimentos()
     
-    def alternar_compartimento(self, compartimento_id, senha):
-        """Alterna para um compartimento específico."""
+    def alternar_compartimento(self, compartimento_id, senha=None):
+        """Alterna para um compartimento específico (sem senha, se já estiver desbloqueado)."""
         if not self.model.usuario_autenticado:
             return False, "Usuário não autenticado"
         
@@ -243,6 +271,49 @@ class CofreController:
         
         return sucesso, mensagem
     
+    def compartimento_desbloqueado(self, compartimento_id):
+        """Verifica se um compartimento está desbloqueado na sessão."""
+        return self.model.chaveiro.desbloqueado(compartimento_id)
+    
+    def bloquear_compartimento(self, compartimento_id):
+        """Bloqueia um compartimento desbloqueado na sessão."""
+        if not self.model.usuario_autenticado:
+            return False, "Usuário não autenticado"
+        
+        sucesso, mensagem = self.model.bloquear_compartimento(compartimento_id)
+        self._sincronizar_compartimento_ativo()
+        
+        return sucesso, mensagem
+    
+    def pesquisar_compartimentos(self, termo_busca, tipos=None):
+        """Pesquisa em todos os compartimentos desbloqueados."""
+        if not self.model.usuario_autenticado:
+            raise Exception("Usuário não autenticado")
+        
+        return self.model.pesquisar_compartimentos(termo_busca, tipos)
+    
+    def _sincronizar_compartimento_ativo(self):
+        """Atualiza a view quando o modelo voltou ao compartimento principal."""
+        if self.model.compartimento_ativo != self.compartimento_atual:
+            self.compartimento_atual = self.model.compartimento_ativo
+            if self.view:
+                self.view.atualizar_compartimento_ativo(self.compartimento_atual)
+    
+    def _agendar_expiracao_chaves(self, intervalo=60):
+        """Bloqueia periodicamente os compartimentos inativos enquanto houver sessão."""
+        def expirar():
+            if not self.model.usuario_autenticado:
+                return
+            
+            expirados = self.model.chaveiro.expirar()
+            if self.model.compartimento_ativo in expirados:
+                self.model.compartimento_ativo = "principal"
+                self._sincronizar_compartimento_ativo()
+            
+            self._agendar_expiracao_chaves(intervalo)
+        
+        self.definir_temporizador(expirar, intervalo)
+    
     # === Funções de gerenciamento de BIP39 ===
     
     def validar_frase_bip39(self, frase):
@@ -253,6 +324,10 @@ class CofreController:
         """Gera uma nova frase mnemônica BIP39."""
         return self.bip39.gerar_frase(comprimento)
     
+    def completar_palavra_bip39(self, prefixo, limite=8):
+        """Sugere palavras BIP39 que começam com o prefixo digitado."""
+        return self.bip39.completar(prefixo, limite)
+    
     # === Funções de utilidade ===
     
     def definir_temporizador(self, funcao, segundos, *args, **kwargs):
@@ -308,7 +383,56 @@ class CofreController:
             self.model.config[chave] = valor
         
         # Salvar configurações
-        return self.model.salvar_configuracoes()
+        resultado = self.model.salvar_configuracoes()
+        
+        # Reagendar o backup automático com a nova cadência
+        if any("backup" in chave for chave in novas_configuracoes):
+            self.agendador_backup.iniciar()
+        
+        return resultado
+    
+    # === Funções de backup automático ===
+    
+    def obter_status_backup(self):
+        """Obtém o estado do backup automático para exibição no dashboard."""
+        return self.agendador_backup.obter_status()
+    
+    def fazer_backup_agora(self):
+        """Inicia um backup incremental imediatamente, em segundo plano."""
+        if not self.model.usuario_autenticado:
+            return False, "Usuário não autenticado"
+        
+        return self.agendador_backup.executar_agora()
+    
+    def restaurar_backup(self, senha, geracao=None):
+        """Restaura uma geração do backup incremental e volta à tela de login."""
+        if not self.model.usuario_autenticado:
+            return False, "Usuário não autenticado"
+        
+        if self.model.modo_heranca_ativo:
+            return False, "Não é possível restaurar backups no modo de herança"
+        
+        sucesso, mensagem = self.agendador_backup.restaurar(senha, geracao)
+        
+        # A sessão foi encerrada pela restauração: cancelar os temporizadores e pedir um novo login
+        if sucesso:
+            self.compartimento_atual = "principal"
+            for timer_id in list(self.temporizadores.keys()):
+                self.cancelar_temporizador(timer_id)
+            if self.view:
+                self.view.mostrar_tela_login(self.model.verificar_modo_heranca())
+        
+        return sucesso, mensagem
+    
+    def pausar_backup(self):
+        """Pausa o backup automático."""
+        self.agendador_backup.pausar()
+        return True, "Backup automático pausado"
+    
+    def resumir_backup(self):
+        """Retoma o backup automático."""
+        self.agendador_backup.resumir()
+        return True, "Backup automático retomado"
     
     def obter_intervalo_confirmacao(self):
         """Obtém o intervalo atual de confirmação de vida."""
@@ -6,15 +6,22 @@ from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.backends import default_backend
 
+from models.compressao import Compressao
+from models.perfis_kdf import PerfilKDF
+
 class Criptografia:
     def __init__(self):
         pass
     
-    def gerar_chave_derivada(self, senha, salt=None):
-        """Gera uma chave derivada a partir da senha usando PBKDF2"""
+    def gerar_chave_derivada(self, senha, salt=None, perfil=None):
+        """Gera uma chave derivada a partir da senha usando PBKDF2 (ou o perfil de derivação informado)"""
         if salt is None:
             salt = secrets.token_bytes(16)
         
+        # Perfil gravado com o registro (ver models/perfis_kdf.py)
+        if perfil is not None:
+            return PerfilKDF.decodificar(perfil).derivar(senha, salt), salt
+        
         # Garantir que a senha seja bytes
         if isinstance(senha, str):
             senha = senha.encode('utf-8')
@@ -38,12 +45,16 @@ class Criptografia:
         hash_senha = hashlib.sha512((senha + salt).encode()).hexdigest()
         return hash_senha, salt
     
-    def criptografar(self, dados, chave):
-        """Criptografa dados usando ChaCha20Poly1305"""
+    def criptografar(self, dados, chave, comprimir=False):
+        """Criptografa dados usando ChaCha20Poly1305, opcionalmente comprimindo-os antes"""
         # Garantir que os dados sejam bytes
         if isinstance(dados, str):
             dados = dados.encode('utf-8')
         
+        # Comprimir antes de cifrar; o cabeçalho registra o algoritmo escolhido
+        if comprimir:
+            dados = Compressao.empacotar(dados)
+        
         # Garantir que a chave seja bytes e tenha o tamanho correto
         if isinstance(chave, str):
             chave = chave.encode('utf-8')
@@ -61,8 +72,8 @@ class Criptografia:
         # Retornar como strings base64 para armazenamento seguro
         return base64.b64encode(texto_cifrado).decode(), base64.b64encode(nonce).decode()
     
-    def descriptografar(self, texto_cifrado, nonce, chave):
-        """Descriptografa dados usando ChaCha20Poly1305"""
+    def descriptografar(self, texto_cifrado, nonce, chave, descomprimir=False):
+        """Descriptografa dados usando ChaCha20Poly1305, descomprimindo-os se tiverem cabeçalho de compressão"""
         try:
             # Garantir que a chave seja bytes e tenha o tamanho correto
             if isinstance(chave, str):
@@ -80,6 +91,9 @@ class Criptografia:
             cipher = ChaCha20Poly1305(chave)
             dados = cipher.decrypt(nonce_bytes, texto_cifrado_bytes, None)
             
+            if descomprimir:
+                dados = Compressao.desempacotar(dados)
+            
             return dados
         except Exception as e:
             print(f"Erro na descriptografia: {str(e)}")
@@ -5,10 +5,12 @@ import time
 import json
 import os
 import datetime
-import sqlite3
 import traceback
 from styles import *
 from custom_dialogs import show_info, show_error, show_warning, show_success, ask_yes_no, ask_input
+from models.derivacao_seed import acompanhar
+from models.memoria_segura import copiar_para_area_transferencia, TEMPO_AREA_TRANSFERENCIA_S
+from models.contexto_cifra import ALGORITMO_PADRAO, algoritmos_disponiveis
 
 def aplicar_estilo_padrao(func):
     """Decorador para aplicar estilo padrão em janelas"""
@@ -1348,7 +1350,7 @@ class InterfaceGrafica:
         
         janela = tk.Toplevel(self.janela)
         janela.title("Configurações Gerais")
-        janela.geometry("500x300")
+        janela.geometry("500x340")
         janela.grab_set()  # Torna a janela modal
         
         tk.Label(janela, text="Configurações do Sistema", font=("Arial", 14)).pack(pady=10)
@@ -1390,6 +1392,16 @@ class InterfaceGrafica:
         entrada_nome.pack(side=tk.LEFT, padx=10)
         entrada_nome.insert(0, config.get("nome_exibicao", "Bloco de Notas Portátil"))
         
+        # Cifra dos novos registros (os existentes continuam legíveis)
+        frame_cifra = tk.Frame(janela)
+        frame_cifra.pack(fill=tk.X, padx=20, pady=5)
+        
+        algoritmo = tk.StringVar()
+        algoritmo.set(config.get("algoritmo_cifra", ALGORITMO_PADRAO))
+        
+        tk.Label(frame_cifra, text="Cifra dos novos registros:").pack(side=tk.LEFT)
+        tk.OptionMenu(frame_cifra, algoritmo, *algoritmos_disponiveis()).pack(side=tk.LEFT, padx=10)
+        
         def salvar():
             try:
                 intervalo = int(entrada_intervalo.get())
@@ -1399,7 +1411,15 @@ class InterfaceGrafica:
                     messagebox.showerror("Erro", "Os valores devem ser maiores que zero")
                     return
                 
+                # Aplicar o algoritmo de cifra antes de gravar o restante
+                if algoritmo.get() != config.get("algoritmo_cifra", ALGORITMO_PADRAO):
+                    sucesso, mensagem = self.cofre.definir_algoritmo_cifra(algoritmo.get())
+                    if not sucesso:
+                        messagebox.showerror("Erro", mensagem)
+                        return
+                
                 # Atualizar configurações
+                config["algoritmo_cifra"] = algoritmo.get()
                 config["intervalo_confirmacao"] = intervalo
                 config["max_tentativas_senha"] = tentativas
                 config["autodestruicao_ativada"] = autodestruicao.get()
@@ -1655,14 +1675,33 @@ class InterfaceGrafica:
                 messagebox.showinfo("Aviso", "Selecione um diretório de destino")
                 return
             
-            sucesso, mensagem = self.cofre.fazer_backup(destino)
+            # Executar o backup fora da thread da interface para mantê-la responsiva
+            botao_backup.config(state=tk.DISABLED, text="Fazendo backup...")
+            resultado = {}
             
-            if sucesso:
-                messagebox.showinfo("Sucesso", mensagem, parent=janela)
-            else:
-                messagebox.showerror("Erro", mensagem, parent=janela)
+            def executar():
+                resultado["valor"] = self.cofre.fazer_backup(destino)
+            
+            thread = threading.Thread(target=executar, daemon=True)
+            thread.start()
+            
+            def aguardar():
+                if thread.is_alive():
+                    janela.after(100, aguardar)
+                    return
+                
+                botao_backup.config(state=tk.NORMAL, text="Fazer Backup")
+                sucesso, mensagem = resultado["valor"]
+                
+                if sucesso:
+                    messagebox.showinfo("Sucesso", mensagem, parent=janela)
+                else:
+                    messagebox.showerror("Erro", mensagem, parent=janela)
+            
+            aguardar()
         
-        tk.Button(frame_backup, text="Fazer Backup", command=fazer_backup).pack(pady=5)
+        botao_backup = tk.Button(frame_backup, text="Fazer Backup", command=fazer_backup)
+        botao_backup.pack(pady=5)
         
         # Frame para restauração
         frame_restauracao = tk.LabelFrame(janela, text="Restaurar Backup")
@@ -1759,18 +1798,19 @@ class InterfaceGrafica:
         
         tk.Label(frame_senha, text="Senha:").pack(side=tk.LEFT)
         
+        # A senha (BufferSeguro) só vai para o campo enquanto "Mostrar" estiver marcado
+        segredo = senha['senha']
         var_senha = tk.StringVar()
-        var_senha.set(senha['senha'])
+        var_senha.set("•" * 8)
         
-        entrada_senha = tk.Entry(frame_senha, textvariable=var_senha, width=30, show="*")
+        entrada_senha = tk.Entry(frame_senha, textvariable=var_senha, width=30, state="readonly")
         entrada_senha.pack(side=tk.LEFT, padx=10)
         
         def mostrar_senha():
-            if entrada_senha.cget('show') == '*':
-                entrada_senha.config(show='')
-                check_mostrar.select()
+            if var_mostrar.get():
+                var_senha.set(segredo.texto())
             else:
-                entrada_senha.config(show='*')
+                var_senha.set("•" * 8)
         
         var_mostrar = tk.BooleanVar()
         check_mostrar = tk.Checkbutton(frame_senha, text="Mostrar", variable=var_mostrar, command=mostrar_senha)
@@ -1790,14 +1830,20 @@ class InterfaceGrafica:
         frame_botoes.pack(pady=10)
         
         def copiar_senha():
-            self.janela.clipboard_clear()
-            self.janela.clipboard_append(senha['senha'])
+            # A área de transferência é limpa depois de alguns segundos, se ainda tiver a senha
+            copiar_para_area_transferencia(self.janela, segredo)
             self.janela.update()
             
-            show_success(janela_senha, "Sucesso", "Senha copiada para a área de transferência")
+            show_success(janela_senha, "Sucesso", f"Senha copiada para a área de transferência por {TEMPO_AREA_TRANSFERENCIA_S} segundos")
+        
+        def fechar():
+            var_senha.set("")
+            segredo.zerar()
+            janela_senha.destroy()
         
+        janela_senha.protocol("WM_DELETE_WINDOW", fechar)
         tk.Button(frame_botoes, text="Copiar", command=copiar_senha).pack(side=tk.LEFT, padx=10)
-        tk.Button(frame_botoes, text="Fechar", command=janela_senha.destroy).pack(side=tk.LEFT, padx=10)
+        tk.Button(frame_botoes, text="Fechar", command=fechar).pack(side=tk.LEFT, padx=10)
     
     def visualizar_nota(self):
         """Visualiza o conteúdo de uma nota selecionada"""
@@ -1871,7 +1917,7 @@ class InterfaceGrafica:
         """Função de depuração para verificar o estado dos arquivos no banco de dados"""
         try:
             # Conectar diretamente ao banco de dados
-            conn = sqlite3.connect(self.cofre.caminho_db)
+            conn = self.cofre.banco_dados.conectar()
             cursor = conn.cursor()
             
             # Obter todos os registros da tabela de arquivos
@@ -1892,11 +1938,19 @@ class InterfaceGrafica:
                 print(registro)
             print("=====================================")
             
-            # Verificar arquivos físicos
-            diretorio_arquivos = os.path.join(self.cofre.caminho_base, "arquivos")
-            arquivos_fisicos = os.listdir(diretorio_arquivos)
-            print(f"Arquivos físicos no diretório: {len(arquivos_fisicos)}")
-            for arquivo in arquivos_fisicos:
+            # Verificar arquivos físicos nos armazenamentos fragmentados
+            objetos = list(self.cofre.armazenamento_arquivos.listar())
+            blocos = list(self.cofre.armazem_blocos.armazenamento.listar())
+            legados = [
+                entrada.name for entrada in os.scandir(self.cofre.caminho_arquivos)
+                if entrada.is_file()
+            ]
+            print(f"Arquivos fragmentados: {len(objetos)}")
+            for arquivo in objetos:
+                print(arquivo)
+            print(f"Blocos armazenados: {len(blocos)}")
+            print(f"Arquivos legados aguardando migração: {len(legados)}")
+            for arquivo in legados:
                 print(arquivo)
             
             return True
@@ -2120,21 +2174,39 @@ class InterfaceGrafica:
                 show_error(janela_frase, "Erro", "A frase mnemônica é obrigatória")
                 return
             
-            # Ativar compartimento
-            sucesso, mensagem = self.cofre.ativar_compartimento_por_frase(frase)
+            def ativar(futuro):
+                label_espera.config(text="")
+                botao_acessar.config(state=tk.NORMAL)
+                
+                # Ativar compartimento (a seed já está no cache da sessão)
+                sucesso, mensagem = self.cofre.ativar_compartimento_por_frase(frase)
+                
+                if sucesso:
+                    show_success(janela_frase, "Sucesso", mensagem)
+                    self.atualizar_interface()
+                    janela_frase.destroy()
+                else:
+                    show_error(janela_frase, "Erro", mensagem)
             
-            if sucesso:
-                show_success(janela_frase, "Sucesso", mensagem)
-                self.atualizar_interface()
-                janela_frase.destroy()
-            else:
-                show_error(janela_frase, "Erro", mensagem)
+            # Derivar a seed em segundo plano, com um indicador de espera
+            botao_acessar.config(state=tk.DISABLED)
+            acompanhar(
+                self.cofre.derivar_seed_frase(frase),
+                janela_frase.after,
+                ativar,
+                lambda quadro: label_espera.config(text=f"{quadro} Verificando a frase..."),
+                ativo=lambda: janela_frase.winfo_exists()
+            )
+        
+        label_espera = tk.Label(janela_frase, text="")
+        label_espera.pack(anchor=tk.W, padx=20)
         
         # Botões
         frame_botoes = tk.Frame(janela_frase)
         frame_botoes.pack(pady=15)
         
-        tk.Button(frame_botoes, text="Acessar", command=confirmar_acesso).pack(side=tk.LEFT, padx=10)
+        botao_acessar = tk.Button(frame_botoes, text="Acessar", command=confirmar_acesso)
+        botao_acessar.pack(side=tk.LEFT, padx=10)
         tk.Button(frame_botoes, text="Cancelar", command=janela_frase.destroy).pack(side=tk.LEFT, padx=10)
 
     def atualizar_interface(self):
@@ -2417,9 +2489,20 @@ class InterfaceGrafica:
             padx=15,
             pady=15
         )
-        texto_frase.pack(fill=tk.X, pady=(0, 20))
+        texto_frase.pack(fill=tk.X, pady=(0, 5))
         texto_frase.focus_set()
         
+        # Indicador de espera da verificação da frase
+        label_espera = tk.Label(
+            container,
+            text="",
+            font=FONT_REGULAR,
+            bg=DARK_BG,
+            fg=TEXT_SECONDARY,
+            anchor="w"
+        )
+        label_espera.pack(fill=tk.X, pady=(0, 10))
+        
         # Frame de botões
         btn_frame = tk.Frame(container, bg=DARK_BG)
         btn_frame.pack(fill=tk.X, pady=(10, 0))
@@ -2432,19 +2515,33 @@ class InterfaceGrafica:
                 show_error(janela_frase, "Erro", "A frase mnemônica é obrigatória")
                 return
             
-            try:
-                # Autenticar com a frase
-                sucesso, mensagem, modo_restrito = self.cofre.autenticar_por_frase(frase)
+            def autenticar(futuro):
+                label_espera.config(text="")
+                btn_acessar.config(state=tk.NORMAL)
                 
-                if sucesso:
-                    show_success(janela_frase, "Sucesso", mensagem)
-                    janela_frase.destroy()
-                    self.mostrar_tela_principal(modo_restrito=modo_restrito)
-                else:
-                    show_error(janela_frase, "Erro", mensagem)
-            except Exception as e:
-                traceback.print_exc()
-                show_error(janela_frase, "Erro", f"Erro ao autenticar: {str(e)}")
+                try:
+                    # Autenticar com a frase (a seed já está no cache da sessão)
+                    sucesso, mensagem, modo_restrito = self.cofre.autenticar_por_frase(frase)
+                    
+                    if sucesso:
+                        show_success(janela_frase, "Sucesso", mensagem)
+                        janela_frase.destroy()
+                        self.mostrar_tela_principal(modo_restrito=modo_restrito)
+                    else:
+                        show_error(janela_frase, "Erro", mensagem)
+                except Exception as e:
+                    traceback.print_exc()
+                    show_error(janela_frase, "Erro", f"Erro ao autenticar: {str(e)}")
+            
+            # Derivar a seed em segundo plano, com um indicador de espera
+            btn_acessar.config(state=tk.DISABLED)
+            acompanhar(
+                self.cofre.derivar_seed_frase(frase),
+                janela_frase.after,
+                autenticar,
+                lambda quadro: label_espera.config(text=f"{quadro} Verificando a frase..."),
+                ativo=lambda: janela_frase.winfo_exists()
+            )
         
         # Botão cancelar
         btn_cancelar = tk.Button(
@@ -1,3 +1,4 @@
+import multiprocessing
 import tkinter as tk
 from models.cofre_model import CofreDigitalModel
 from controllers.cofre_controller import CofreController
@@ -27,4 +28,5 @@ def main():
     app.mainloop()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main() 
\ No newline at end of file
@@ -0,0 +1,454 @@
+import os
+import time
+import shutil
+import datetime
+import tempfile
+import threading
+
+from models.autenticacao import MotorAutenticacao
+from models.backup_incremental import BackupIncremental
+from models.memoria_segura import BufferSeguro
+from models.snapshot_banco import SnapshotBanco
+
+
+# Valores padrão das configurações do backup automático
+INTERVALO_PADRAO_HORAS = 24
+GERACOES_MANTIDAS_PADRAO = 7
+LIMITE_LEITURA_MB_S = 8
+CARGA_MAXIMA = 0.5
+
+# Espera após o login antes de um backup atrasado, para não competir com a abertura do cofre
+ATRASO_INICIAL = 60
+
+# Espera antes de tentar novamente um backup que falhou
+ESPERA_APOS_FALHA = 30 * 60
+
+# Estados informados ao dashboard
+ESTADO_INATIVO = "inativo"
+ESTADO_AGENDADO = "agendado"
+ESTADO_EXECUTANDO = "executando"
+ESTADO_PAUSADO = "pausado"
+
+# Acesso do repositório aberto pela chave de dados da sessão
+ACESSO_DADOS = "dados"
+
+
+class BackupCancelado(Exception):
+    """Interrompe um backup automático em andamento."""
+
+
+class LimitadorRecursos:
+    """
+    Limita o ritmo de leitura e a fração de tempo de CPU de um backup.
+
+    consumir() é chamado após cada leitura. Ele dorme o necessário para manter
+    a taxa de leitura abaixo do limite e para que o trabalho ocupe no máximo
+    a fração `carga_maxima` do tempo. Também bloqueia enquanto o backup estiver
+    pausado e levanta BackupCancelado quando ele for cancelado.
+    """
+
+    def __init__(self, bytes_por_segundo, carga_maxima, liberado, cancelado):
+        """
+        Inicializa o limitador.
+
+        Args:
+            bytes_por_segundo (float): Taxa máxima de leitura (0 ou None desativa o limite)
+            carga_maxima (float): Fração do tempo ocupada com trabalho, entre 0 e 1
+            liberado (threading.Event): Limpo enquanto o backup estiver pausado
+            cancelado (threading.Event): Definido para interromper o backup
+        """
+        self.bytes_por_segundo = bytes_por_segundo
+        self.carga_maxima = min(max(carga_maxima, 0.05), 1.0)
+        self.liberado = liberado
+        self.cancelado = cancelado
+        self.bytes_lidos = 0
+        self._inicio = time.monotonic()
+        self._tempo_pausado = 0.0
+        self._ultimo = self._inicio
+
+    def _aguardar_liberacao(self):
+        inicio_pausa = time.monotonic()
+        while not self.liberado.wait(0.5):
+            if self.cancelado.is_set():
+                raise BackupCancelado()
+        self._tempo_pausado += time.monotonic() - inicio_pausa
+
+    def consumir(self, quantidade):
+        """Registra uma leitura e espera o tempo necessário para respeitar os limites."""
+        if self.cancelado.is_set():
+            raise BackupCancelado()
+        if not self.liberado.is_set():
+            self._aguardar_liberacao()
+
+        agora = time.monotonic()
+        trabalho = agora - self._ultimo
+        self.bytes_lidos += quantidade
+
+        # Tempo ocioso necessário para que o trabalho não passe da carga máxima
+        espera = trabalho * (1 - self.carga_maxima) / self.carga_maxima
+
+        if self.bytes_por_segundo:
+            decorrido = agora - self._inicio - self._tempo_pausado
+            espera = max(espera, self.bytes_lidos / self.bytes_por_segundo - decorrido)
+
+        if espera > 0 and self.cancelado.wait(espera):
+            raise BackupCancelado()
+        self._ultimo = time.monotonic()
+
+
+class AgendadorBackup:
+    """
+    Backups incrementais automáticos executados dentro do aplicativo.
+
+    O próximo backup é agendado com os temporizadores do controlador, a partir
+    da data do último backup bem-sucedido, então um backup atrasado roda logo
+    após o login. Cada execução grava uma geração no repositório incremental
+    (o mesmo usado por CofreDigital.fazer_backup_incremental) e remove as
+    gerações além de `backups_mantidos`. A leitura é limitada por
+    LimitadorRecursos e a thread do backup roda com prioridade reduzida,
+    para que a interface continue responsiva.
+
+    O repositório é aberto pela chave de dados da sessão (acesso "dados"), e os
+    registros das senhas que a protegem ficam gravados no acesso; restaurar()
+    confere a senha com eles e não depende do banco atual.
+
+    Configurações (em model.config):
+        backup_automatico           ativa o agendamento
+        intervalo_backup_horas      intervalo entre backups
+        backups_mantidos            gerações mantidas no repositório
+        limite_backup_mb_s          taxa máxima de leitura (0 desativa)
+        carga_maxima_backup         fração do tempo ocupada com trabalho
+        ultimo_backup_automatico    data do último backup bem-sucedido
+    """
+
+    def __init__(self, model, definir_temporizador, cancelar_temporizador, caminho_repositorio=None):
+        """
+        Inicializa o agendador.
+
+        Args:
+            model (CofreDigitalModel): Modelo com as configurações e o banco de dados
+            definir_temporizador (callable): Ver CofreController.definir_temporizador
+            cancelar_temporizador (callable): Ver CofreController.cancelar_temporizador
+            caminho_repositorio (str, optional): Repositório incremental (padrão: backup/incremental)
+        """
+        self.model = model
+        self.definir_temporizador = definir_temporizador
+        self.cancelar_temporizador = cancelar_temporizador
+        self.caminho_repositorio = caminho_repositorio or os.path.join(model.caminho_backup, "incremental")
+        self.snapshot = SnapshotBanco(model.conectar)
+
+        self._trava = threading.Lock()
+        self._liberado = threading.Event()
+        self._liberado.set()
+        self._cancelado = threading.Event()
+        self._temporizador = None
+        self._limitador = None
+        self._ultima_falha = None
+
+        self.estado = ESTADO_INATIVO
+        self.proximo_backup = None
+        self.ultima_mensagem = None
+
+    # === Agendamento ===
+
+    def _intervalo(self):
+        return datetime.timedelta(hours=float(self.model.config.get("intervalo_backup_horas", INTERVALO_PADRAO_HORAS)))
+
+    def _ultimo_backup(self):
+        ultimo = self.model.config.get("ultimo_backup_automatico")
+        return datetime.datetime.fromisoformat(ultimo) if ultimo else None
+
+    def iniciar(self):
+        """Agenda o próximo backup, se o backup automático estiver ativado."""
+        self._cancelar_agendamento()
+        self._cancelado.clear()
+
+        if not self.model.config.get("backup_automatico", True):
+            self.estado = ESTADO_INATIVO
+            self.proximo_backup = None
+            return
+
+        agora = datetime.datetime.now()
+        ultimo = self._ultimo_backup()
+        proximo = ultimo + self._intervalo() if ultimo else agora
+        proximo = max(proximo, agora + datetime.timedelta(seconds=ATRASO_INICIAL))
+        if self._ultima_falha is not None:
+            proximo = max(proximo, self._ultima_falha + datetime.timedelta(seconds=ESPERA_APOS_FALHA))
+
+        self.proximo_backup = proximo
+        self._temporizador = self.definir_temporizador(self._executar_agendado, (proximo - agora).total_seconds())
+        if self.estado != ESTADO_EXECUTANDO:
+            self.estado = ESTADO_PAUSADO if not self._liberado.is_set() else ESTADO_AGENDADO
+
+    def parar(self):
+        """Cancela o agendamento e interrompe um backup em andamento (por exemplo, no logout)."""
+        self._cancelar_agendamento()
+        self._cancelado.set()
+        self._liberado.set()
+        self.estado = ESTADO_INATIVO
+        self.proximo_backup = None
+
+    def _cancelar_agendamento(self):
+        if self._temporizador is not None:
+            self.cancelar_temporizador(self._temporizador)
+            self._temporizador = None
+
+    def pausar(self):
+        """Pausa o backup em andamento e adia os agendados até resumir()."""
+        self._liberado.clear()
+        self.estado = ESTADO_PAUSADO
+
+    def resumir(self):
+        """Retoma o backup pausado."""
+        self._liberado.set()
+        if self.estado == ESTADO_PAUSADO:
+            self.estado = ESTADO_EXECUTANDO if self._trava.locked() else ESTADO_AGENDADO
+
+    def executar_agora(self):
+        """Inicia um backup imediatamente em segundo plano."""
+        if self._trava.locked():
+            return False, "Um backup já está em andamento"
+
+        self._cancelar_agendamento()
+        self._cancelado.clear()
+        self._temporizador = self.definir_temporizador(self._executar_agendado, 0)
+        return True, "Backup iniciado em segundo plano"
+
+    def _executar_agendado(self):
+        self._temporizador = None
+        if not self._liberado.is_set():
+            # Pausado antes de começar: aguardar a retomada sem iniciar o backup
+            while not self._liberado.wait(1):
+                if self._cancelado.is_set():
+                    return
+        if self._cancelado.is_set():
+            return
+
+        self.executar()
+        if not self._cancelado.is_set():
+            self.iniciar()
+
+    # === Execução ===
+
+    @staticmethod
+    def _reduzir_prioridade():
+        """Reduz a prioridade da thread atual, onde o sistema permitir (no Linux cada thread tem a sua)."""
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+
+    def _obter_chave_backup(self):
+        """
+        Retorna (chave_dados, registros): uma cópia da chave de dados da sessão e os
+        registros das senhas que a protegem, gravados no repositório para a restauração.
+        """
+        chave = self.model.chaveiro.obter("principal")
+        if chave is None:
+            raise ValueError("Cofre bloqueado")
+        chave = BufferSeguro(chave)
+
+        conn = self.model.conectar()
+        cursor = conn.cursor()
+        cursor.execute("SELECT hash_senha, hash_senha_heranca FROM usuarios LIMIT 1")
+        resultado = cursor.fetchone()
+        conn.close()
+
+        if not resultado:
+            raise ValueError("Usuário não encontrado")
+
+        registros = {
+            papel: registro
+            for papel, registro in zip(("principal", "heranca"), resultado)
+            if MotorAutenticacao.perfil_e_salt(registro)[0] is not None
+        }
+        if not registros:
+            raise ValueError("Os registros de senha ainda não protegem a chave de dados")
+        return chave, registros
+
+    def _abrir_repositorio(self, chave_dados, registros):
+        """
+        Abre (ou cria) o repositório pela chave de dados e atualiza os registros gravados no acesso.
+
+        Um repositório da versão 1 tinha a chave derivada do início do registro de senha, que é
+        público; ele é mantido à parte, para restauração manual, e um novo repositório é criado.
+        """
+        repositorio = BackupIncremental(self.caminho_repositorio)
+        if repositorio.existe() and repositorio.ler_parametros().get("versao") == 1:
+            destino = f"{self.caminho_repositorio}.v1-{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            os.replace(self.caminho_repositorio, destino)
+            self.model.registrar_log("seguranca", f"Repositório de backup anterior movido para {destino}")
+            repositorio = BackupIncremental(self.caminho_repositorio)
+
+        repositorio.abrir(chave_dados, {"registros": registros}, ACESSO_DADOS)
+        if repositorio.acessos().get(ACESSO_DADOS, {}).get("registros") != registros:
+            repositorio.definir_acesso(ACESSO_DADOS, chave_dados, {"registros": registros})
+        return repositorio
+
+    def executar(self):
+        """
+        Executa um backup com os limites de recursos configurados.
+
+        Returns:
+            tuple: (sucesso, mensagem)
+        """
+        if not self._trava.acquire(blocking=False):
+            return False, "Um backup já está em andamento"
+
+        try:
+            self._cancelado.clear()
+            self._reduzir_prioridade()
+            self.estado = ESTADO_EXECUTANDO if self._liberado.is_set() else ESTADO_PAUSADO
+
+            config = self.model.config
+            self._limitador = LimitadorRecursos(
+                float(config.get("limite_backup_mb_s", LIMITE_LEITURA_MB_S)) * 1024 * 1024,
+                float(config.get("carga_maxima_backup", CARGA_MAXIMA)),
+                self._liberado,
+                self._cancelado
+            )
+
+            chave_dados, registros = self._obter_chave_backup()
+            with chave_dados:
+                repositorio = self._abrir_repositorio(chave_dados, registros)
+
+            with self.snapshot.temporario(
+                self.model.caminho_dados, progresso=lambda copiadas, total: self._limitador.consumir(0)
+            ) as snapshot_db:
+                itens = [
+                    (self.model.caminho_db, "sistema.db"),
+                    (self.model.caminho_config, "config.json"),
+                    (self.model.caminho_arquivos, "arquivos")
+                ]
+                estatisticas = repositorio.criar_geracao(itens, {"sistema.db": snapshot_db}, self._limitador.consumir)
+
+            poda = repositorio.podar(int(config.get("backups_mantidos", GERACOES_MANTIDAS_PADRAO)))
+
+            config["ultimo_backup_automatico"] = datetime.datetime.now().isoformat()
+            self.model.salvar_configuracoes()
+            self._ultima_falha = None
+
+            self.ultima_mensagem = (
+                f"Backup automático {estatisticas['geracao']} realizado: "
+                f"{estatisticas['pedacos_novos']} pedaços novos, {poda['geracoes_removidas']} gerações removidas"
+            )
+            self.model.registrar_log("sistema", self.ultima_mensagem)
+            return True, self.ultima_mensagem
+
+        except BackupCancelado:
+            self.ultima_mensagem = "Backup automático interrompido"
+            self.model.registrar_log("sistema", self.ultima_mensagem)
+            return False, self.ultima_mensagem
+
+        except Exception as e:
+            self._ultima_falha = datetime.datetime.now()
+            self.ultima_mensagem = f"Erro no backup automático: {str(e)}"
+            self.model.registrar_log("erro", self.ultima_mensagem)
+            return False, self.ultima_mensagem
+
+        finally:
+            self._limitador = None
+            if self.estado == ESTADO_EXECUTANDO:
+                self.estado = ESTADO_AGENDADO
+            self._trava.release()
+
+    # === Restauração ===
+
+    def _abrir_com_senha(self, senha):
+        """Abre o repositório com a senha principal ou de herança, pelos registros gravados nos acessos."""
+        repositorio = BackupIncremental(self.caminho_repositorio)
+        if not repositorio.existe():
+            raise ValueError("Repositório de backup não encontrado")
+
+        for acesso in repositorio.acessos().values():
+            registros = acesso.get("registros")
+            if not registros:
+                continue
+            _, chave_dados = MotorAutenticacao.verificar(senha, {papel: (registro, None) for papel, registro in registros.items()})
+            if chave_dados is None:
+                continue
+            with chave_dados:
+                try:
+                    repositorio.abrir(chave_dados)
+                    return repositorio
+                except ValueError:
+                    continue
+
+        raise ValueError("Senha incorreta para este repositório de backup")
+
+    def restaurar(self, senha, geracao=None):
+        """
+        Substitui os dados atuais por uma geração do repositório (a mais recente se None).
+
+        A senha (principal ou de herança) é conferida com os registros gravados no
+        repositório no último backup, então a restauração não depende do banco atual.
+        A sessão é encerrada e o banco atual é guardado em pre_restauracao_<data>.db.
+
+        Returns:
+            tuple: (sucesso, mensagem)
+        """
+        if self._trava.locked():
+            return False, "Um backup está em andamento"
+
+        try:
+            repositorio = self._abrir_com_senha(senha)
+        except ValueError as e:
+            return False, str(e)
+
+        # Extrair no mesmo sistema de arquivos para que a substituição seja uma renomeação
+        temp_dir = tempfile.mkdtemp(prefix="restauracao_", dir=self.model.caminho_dados)
+        try:
+            try:
+                repositorio.restaurar(geracao, temp_dir)
+            except ValueError as e:
+                return False, f"Erro ao descriptografar backup: {str(e)}"
+
+            db_extraido = os.path.join(temp_dir, "sistema.db")
+            config_extraido = os.path.join(temp_dir, "config.json")
+            arquivos_extraidos = os.path.join(temp_dir, "arquivos")
+
+            if not os.path.exists(db_extraido) or not os.path.exists(config_extraido):
+                return False, "Backup corrompido: arquivos não encontrados"
+
+            self.parar()
+            self.model.encerrar_sessao()
+
+            data_hora = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            self.snapshot.criar(os.path.join(self.model.caminho_dados, f"pre_restauracao_{data_hora}.db"))
+
+            os.replace(db_extraido, self.model.caminho_db)
+            os.replace(config_extraido, self.model.caminho_config)
+
+            # Arquivos e blocos têm nomes únicos, então podem ser mesclados no armazenamento atual
+            for raiz, _, nomes in os.walk(arquivos_extraidos):
+                relativo = os.path.relpath(raiz, arquivos_extraidos)
+                destino = os.path.normpath(os.path.join(self.model.caminho_arquivos, relativo))
+                os.makedirs(destino, exist_ok=True)
+                for nome in nomes:
+                    os.replace(os.path.join(raiz, nome), os.path.join(destino, nome))
+
+            self.model.inicializar_sistema()
+            self.model.registrar_log("sistema", "Backup incremental restaurado")
+            return True, "Backup restaurado com sucesso. Por favor, faça login novamente."
+
+        except Exception as e:
+            return False, f"Erro ao restaurar backup: {str(e)}"
+
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def obter_status(self):
+        """
+        Retorna o estado do backup automático para exibição.
+
+        Returns:
+            dict: estado, ultimo_backup, proximo_backup, bytes_lidos e mensagem
+        """
+        limitador = self._limitador
+        return {
+            "estado": self.estado,
+            "ultimo_backup": self._ultimo_backup(),
+            "proximo_backup": self.proximo_backup,
+            "bytes_lidos": limitador.bytes_lidos if limitador else 0,
+            "mensagem": self.ultima_mensagem
+        }
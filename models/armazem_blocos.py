@@ -0,0 +1,326 @@
+import hmac
+import hashlib
+import datetime
+
+from models.crypto_utils import CryptoUtils
+from models.armazenamento_fragmentado import ArmazenamentoFragmentado
+
+
+# Tamanho dos blocos em que os arquivos são divididos (1 MiB)
+TAMANHO_BLOCO = 1024 * 1024
+
+
+class ArmazemBlocos:
+    """
+    Armazenamento de arquivos criptografados endereçado por conteúdo.
+
+    Cada arquivo é dividido em blocos. O identificador de um bloco é um HMAC
+    do conteúdo com uma chave derivada da chave do compartimento, então blocos
+    iguais no mesmo compartimento são gravados uma única vez, sem que o
+    identificador revele o conteúdo fora do compartimento. A tabela blocos
+    mantém a contagem de referências, e blocos sem referências são removidos
+    pela coleta de lixo.
+
+    Os blocos são cifrados com a versão de chave atual do contexto do
+    compartimento, registrada em blocos.versao_chave; a leitura usa a versão
+    de cada bloco, então blocos de versões diferentes convivem num arquivo
+    durante uma rotação (ver RotacaoChaves).
+    """
+
+    def __init__(self, caminho_blocos, tamanho_bloco=TAMANHO_BLOCO):
+        """
+        Inicializa o armazém.
+
+        Args:
+            caminho_blocos (str): Diretório onde os blocos criptografados são gravados
+            tamanho_bloco (int): Tamanho máximo de cada bloco em bytes
+        """
+        self.caminho_blocos = caminho_blocos
+        self.tamanho_bloco = tamanho_bloco
+        # Blocos gravados antes da fragmentação continuam legíveis no diretório plano
+        self.armazenamento = ArmazenamentoFragmentado(caminho_blocos, caminho_legado=caminho_blocos)
+
+    @staticmethod
+    def criar_estrutura(cursor):
+        """Cria as tabelas de blocos e de composição dos arquivos."""
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS blocos (
+            id TEXT PRIMARY KEY,
+            compartimento TEXT NOT NULL,
+            tamanho INTEGER NOT NULL,
+            referencias INTEGER NOT NULL DEFAULT 0,
+            versao_chave INTEGER NOT NULL DEFAULT 0,
+            data_criacao TEXT NOT NULL
+        )
+        """)
+
+        # Blocos gravados antes das versões de chave usam a chave do compartimento (versão 0)
+        cursor.execute("PRAGMA table_info(blocos)")
+        if "versao_chave" not in {info[1] for info in cursor.fetchall()}:
+            cursor.execute("ALTER TABLE blocos ADD COLUMN versao_chave INTEGER NOT NULL DEFAULT 0")
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS arquivo_blocos (
+            arquivo_id INTEGER NOT NULL,
+            ordem INTEGER NOT NULL,
+            bloco_id TEXT NOT NULL,
+            PRIMARY KEY (arquivo_id, ordem),
+            FOREIGN KEY (arquivo_id) REFERENCES arquivos (id),
+            FOREIGN KEY (bloco_id) REFERENCES blocos (id)
+        )
+        """)
+
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_blocos_sem_referencia ON blocos (referencias) WHERE referencias <= 0")
+
+    def caminho_bloco(self, bloco_id):
+        """Retorna o caminho físico de um bloco no armazenamento fragmentado."""
+        return self.armazenamento.caminho(bloco_id)
+
+    @staticmethod
+    def identificar_bloco(dados, chave):
+        """
+        Calcula o identificador convergente de um bloco no escopo de um compartimento.
+
+        Args:
+            dados (bytes): Conteúdo do bloco em claro
+            chave (bytes): Chave do compartimento
+
+        Returns:
+            str: Identificador em hexadecimal
+        """
+        chave_id = CryptoUtils.derivar_subchave(chave, b"cofre-blocos-id")
+        return hmac.new(chave_id, dados, hashlib.sha256).hexdigest()
+
+    @staticmethod
+    def identificar_conteudo(blocos):
+        """Calcula o identificador do arquivo inteiro a partir da lista de blocos."""
+        return hashlib.sha256("".join(blocos).encode()).hexdigest()
+
+    def _gravar_bloco(self, bloco_id, dados, chave):
+        chave_cifra = CryptoUtils.derivar_subchave(chave, b"cofre-blocos-cifra")
+        dados_criptografados = CryptoUtils.criptografar_bytes(dados, chave_cifra, bloco_id.encode(), comprimir=True)
+
+        # Gravação atômica: um bloco nunca fica parcialmente escrito
+        self.armazenamento.gravar(bloco_id, dados_criptografados)
+
+    def _ler_bloco(self, bloco_id, chave):
+        chave_cifra = CryptoUtils.derivar_subchave(chave, b"cofre-blocos-cifra")
+        dados_criptografados = self.armazenamento.ler(bloco_id)
+        return CryptoUtils.descriptografar_bytes(dados_criptografados, chave_cifra, bloco_id.encode(), descomprimir=True)
+
+    def armazenar(self, cursor, caminho_arquivo, contexto):
+        """
+        Divide um arquivo em blocos e grava apenas os blocos ainda não armazenados.
+
+        Args:
+            cursor: Cursor de uma conexão aberta (o commit fica a cargo de quem chama)
+            caminho_arquivo (str): Arquivo a ser armazenado
+            contexto (ContextoCifra): Contexto do compartimento ao qual o arquivo pertence
+
+        Returns:
+            tuple: (lista_ids_blocos, tamanho_total, blocos_novos)
+        """
+        compartimento, versao_chave = contexto.compartimento, contexto.versao_chave
+        chave = contexto.chave_da_versao(versao_chave)
+        blocos = []
+        tamanho_total = 0
+        blocos_novos = 0
+        data_atual = datetime.datetime.now().isoformat()
+
+        with open(caminho_arquivo, 'rb') as f:
+            while True:
+                dados = f.read(self.tamanho_bloco)
+                if not dados and blocos:
+                    break
+
+                bloco_id = self.identificar_bloco(dados, chave)
+
+                # Só blocos ainda referenciados são reaproveitados; os sem referências podem estar
+                # sendo apagados pela coleta de lixo e são registrados de novo
+                cursor.execute("UPDATE blocos SET referencias = referencias + 1 WHERE id = ? AND referencias > 0", (bloco_id,))
+                if not cursor.rowcount:
+                    # O registro vem antes do arquivo: a partir dele a transação de quem chama detém a
+                    # escrita, e a coleta de lixo só roda depois que o bloco já está referenciado
+                    cursor.execute(
+                        "INSERT INTO blocos (id, compartimento, tamanho, referencias, versao_chave, data_criacao) VALUES (?, ?, ?, 1, ?, ?) "
+                        "ON CONFLICT(id) DO UPDATE SET referencias = 1, versao_chave = excluded.versao_chave",
+                        (bloco_id, compartimento, len(dados), versao_chave, data_atual)
+                    )
+                    self._gravar_bloco(bloco_id, dados, chave)
+                    blocos_novos += 1
+                elif not self.armazenamento.existe(bloco_id):
+                    self._gravar_bloco(bloco_id, dados, chave)
+                    blocos_novos += 1
+
+                blocos.append(bloco_id)
+                tamanho_total += len(dados)
+
+                if len(dados) < self.tamanho_bloco:
+                    break
+
+        return blocos, tamanho_total, blocos_novos
+
+    def recifrar_bloco(self, cursor, bloco_id, chave_origem, chave_destino, versao_destino):
+        """
+        Cifra um bloco de novo com outra chave do mesmo compartimento.
+
+        O identificador depende da chave, então o bloco ganha um novo: ele herda as
+        referências do antigo, os arquivos passam a apontar para ele e o antigo fica
+        sem referências, para a coleta de lixo depois do commit de quem chama.
+
+        Args:
+            cursor: Cursor de uma conexão aberta (o commit fica a cargo de quem chama)
+            bloco_id (str): Bloco a recifrar
+            chave_origem (bytes): Chave com que o bloco foi cifrado
+            chave_destino (bytes): Nova chave
+            versao_destino (int): Versão da nova chave (ver RotacaoChaves)
+
+        Returns:
+            tuple: (novo identificador, IDs dos arquivos que usam o bloco); (None, []) se ele já não tinha referências
+        """
+        dados = self._ler_bloco(bloco_id, chave_origem)
+        novo_id = self.identificar_bloco(dados, chave_destino)
+
+        # As referências passam ao novo bloco na mesma instrução que as lê; como em armazenar,
+        # o registro vem antes do arquivo
+        cursor.execute(
+            "INSERT INTO blocos (id, compartimento, tamanho, referencias, versao_chave, data_criacao) "
+            "SELECT ?, compartimento, tamanho, referencias, ?, data_criacao FROM blocos WHERE id = ? AND referencias > 0 "
+            "ON CONFLICT(id) DO UPDATE SET referencias = MAX(referencias, 0) + excluded.referencias",
+            (novo_id, versao_destino, bloco_id)
+        )
+        if not cursor.rowcount:
+            return None, []
+        if not self.armazenamento.existe(novo_id):
+            self._gravar_bloco(novo_id, dados, chave_destino)
+
+        cursor.execute("SELECT DISTINCT arquivo_id FROM arquivo_blocos WHERE bloco_id = ?", (bloco_id,))
+        arquivos = [linha[0] for linha in cursor.fetchall()]
+        cursor.execute("UPDATE arquivo_blocos SET bloco_id = ? WHERE bloco_id = ?", (novo_id, bloco_id))
+        cursor.execute("UPDATE blocos SET referencias = 0 WHERE id = ?", (bloco_id,))
+        return novo_id, arquivos
+
+    def renomear_arquivos(self, cursor, arquivo_ids):
+        """Recalcula o nome físico dos arquivos, derivado dos identificadores dos seus blocos."""
+        for arquivo_id in arquivo_ids:
+            cursor.execute(
+                "UPDATE arquivos SET nome_criptografado = ? WHERE id = ?",
+                (self.identificar_conteudo(self.blocos_do_arquivo(cursor, arquivo_id)), arquivo_id)
+            )
+
+    def vincular(self, cursor, arquivo_id, blocos):
+        """Registra a sequência de blocos que compõe um arquivo."""
+        cursor.executemany(
+            "INSERT INTO arquivo_blocos (arquivo_id, ordem, bloco_id) VALUES (?, ?, ?)",
+            [(arquivo_id, ordem, bloco_id) for ordem, bloco_id in enumerate(blocos)]
+        )
+
+    def blocos_do_arquivo(self, cursor, arquivo_id):
+        """Retorna os identificadores dos blocos de um arquivo, em ordem."""
+        cursor.execute(
+            "SELECT bloco_id FROM arquivo_blocos WHERE arquivo_id = ? ORDER BY ordem",
+            (arquivo_id,)
+        )
+        return [linha[0] for linha in cursor.fetchall()]
+
+    def blocos_com_versao(self, cursor, arquivo_id):
+        """Retorna (identificador, versão da chave) de cada bloco de um arquivo, em ordem."""
+        cursor.execute(
+            "SELECT ab.bloco_id, COALESCE(b.versao_chave, 0) FROM arquivo_blocos ab "
+            "LEFT JOIN blocos b ON b.id = ab.bloco_id WHERE ab.arquivo_id = ? ORDER BY ab.ordem",
+            (arquivo_id,)
+        )
+        return cursor.fetchall()
+
+    def extrair(self, cursor, arquivo_id, contexto, destino):
+        """
+        Reconstrói um arquivo bloco a bloco, sem carregá-lo inteiro em memória.
+
+        Args:
+            cursor: Cursor de uma conexão aberta
+            arquivo_id (int): ID do arquivo na tabela arquivos
+            contexto (ContextoCifra): Contexto do compartimento do arquivo
+            destino (str): Caminho do arquivo de saída
+
+        Returns:
+            int: Número de bytes escritos
+        """
+        escritos = 0
+        with open(destino, 'wb') as f:
+            for bloco_id, versao_chave in self.blocos_com_versao(cursor, arquivo_id):
+                dados = self._ler_bloco(bloco_id, contexto.chave_da_versao(versao_chave))
+                f.write(dados)
+                escritos += len(dados)
+        return escritos
+
+    def liberar(self, cursor, arquivo_id):
+        """
+        Remove o vínculo de um arquivo com seus blocos e decrementa as referências.
+
+        Args:
+            cursor: Cursor de uma conexão aberta (o commit fica a cargo de quem chama)
+            arquivo_id (int): ID do arquivo na tabela arquivos
+
+        Returns:
+            int: Número de blocos desvinculados
+        """
+        blocos = self.blocos_do_arquivo(cursor, arquivo_id)
+        cursor.executemany(
+            "UPDATE blocos SET referencias = referencias - 1 WHERE id = ?",
+            [(bloco_id,) for bloco_id in blocos]
+        )
+        cursor.execute("DELETE FROM arquivo_blocos WHERE arquivo_id = ?", (arquivo_id,))
+        return len(blocos)
+
+    def coletar_lixo(self, conn, varrer_orfaos=False):
+        """
+        Apaga os blocos sem referências.
+
+        A exclusão dos registros e a dos arquivos físicos acontecem na mesma
+        transação de escrita, e só são apagados os arquivos dos registros que
+        o DELETE de fato removeu: um bloco registrado de novo por outra
+        conexão (ver armazenar) nunca perde o arquivo. Uma falha no meio do
+        processo deixa no máximo arquivos órfãos, nunca registros apontando
+        para blocos inexistentes.
+
+        Args:
+            conn: Conexão aberta com o banco de dados
+            varrer_orfaos (bool): Também remove arquivos de blocos sem registro no banco
+
+        Returns:
+            int: Número de blocos físicos removidos
+        """
+        cursor = conn.cursor()
+        if conn.in_transaction:
+            conn.commit()
+
+        # A trava de escrita vale até o fim das remoções: nenhum bloco é registrado de novo no meio delas
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("DELETE FROM blocos WHERE referencias <= 0 RETURNING id")
+            remover = [linha[0] for linha in cursor.fetchall()]
+
+            if varrer_orfaos:
+                cursor.execute("SELECT id FROM blocos")
+                registrados = {linha[0] for linha in cursor.fetchall()}
+                remover.extend(
+                    nome for nome in self.armazenamento.listar()
+                    if nome not in registrados
+                )
+
+            removidos = 0
+            for bloco_id in remover:
+                if self.armazenamento.remover(bloco_id):
+                    removidos += 1
+
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        return removidos
+
+    def ids_todos_blocos(self, cursor):
+        """Retorna os identificadores de todos os blocos registrados."""
+        cursor.execute("SELECT id FROM blocos")
+        return [linha[0] for linha in cursor.fetchall()]
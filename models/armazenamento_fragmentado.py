@@ -0,0 +1,301 @@
+import os
+import re
+import time
+import shutil
+import secrets
+import threading
+
+
+# Nomes aceitos pelo armazenamento: apenas hexadecimal, sem revelar o nome original
+PADRAO_NOME = re.compile(r"^[0-9a-f]{8,128}$")
+
+# Registros cujo arquivo legado não existia na migração: mantêm o nome antigo, que não é um nome opaco
+ARMAZENAMENTO_AUSENTE = "ausente"
+
+
+class ArmazenamentoFragmentado:
+    """
+    Armazenamento de arquivos com nomes opacos distribuídos em dois níveis de diretórios.
+
+    Um objeto chamado "a1b2c3..." fica em <raiz>/a1/b2/a1b2c3..., o que limita
+    cada diretório a 256 entradas por nível e mantém listagens e verificações
+    de existência rápidas mesmo com centenas de milhares de arquivos.
+    """
+
+    def __init__(self, caminho_raiz, caminho_legado=None):
+        """
+        Inicializa o armazenamento.
+
+        Args:
+            caminho_raiz (str): Diretório raiz dos fragmentos
+            caminho_legado (str, optional): Diretório plano consultado para objetos ainda não migrados
+        """
+        self.caminho_raiz = caminho_raiz
+        self.caminho_legado = caminho_legado
+        os.makedirs(self.caminho_raiz, exist_ok=True)
+
+    @staticmethod
+    def gerar_nome():
+        """Gera um nome opaco aleatório para um novo objeto."""
+        return secrets.token_hex(16)
+
+    @staticmethod
+    def nome_valido(nome):
+        """Verifica se um nome pode ser usado no armazenamento fragmentado."""
+        return bool(PADRAO_NOME.match(nome))
+
+    def caminho(self, nome):
+        """
+        Retorna o caminho fragmentado de um objeto.
+
+        Args:
+            nome (str): Nome opaco do objeto
+
+        Returns:
+            str: Caminho no formato <raiz>/ab/cd/<nome>
+        """
+        if not self.nome_valido(nome):
+            raise ValueError(f"Nome de objeto inválido: {nome}")
+        return os.path.join(self.caminho_raiz, nome[0:2], nome[2:4], nome)
+
+    def localizar(self, nome):
+        """
+        Localiza um objeto no armazenamento fragmentado ou, durante a migração, no diretório plano.
+
+        Returns:
+            str: Caminho existente do objeto, ou None se não for encontrado
+        """
+        caminho = self.caminho(nome)
+        if os.path.exists(caminho):
+            return caminho
+
+        if self.caminho_legado:
+            caminho_legado = os.path.join(self.caminho_legado, nome)
+            if os.path.isfile(caminho_legado):
+                return caminho_legado
+
+        return None
+
+    def existe(self, nome):
+        """Verifica se um objeto existe."""
+        return self.localizar(nome) is not None
+
+    def gravar(self, nome, dados):
+        """Grava um objeto de forma atômica (arquivo temporário seguido de renomeação)."""
+        caminho = self.caminho(nome)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+
+        caminho_temporario = caminho + ".tmp"
+        with open(caminho_temporario, 'wb') as f:
+            f.write(dados)
+        os.replace(caminho_temporario, caminho)
+
+    def ler(self, nome):
+        """Lê o conteúdo de um objeto."""
+        caminho = self.localizar(nome)
+        if caminho is None:
+            raise FileNotFoundError(nome)
+
+        with open(caminho, 'rb') as f:
+            return f.read()
+
+    def remover(self, nome):
+        """
+        Remove um objeto, onde quer que esteja.
+
+        Returns:
+            bool: True se algum arquivo foi removido
+        """
+        removido = False
+        caminhos = [self.caminho(nome)]
+        if self.caminho_legado:
+            caminhos.append(os.path.join(self.caminho_legado, nome))
+
+        for caminho in caminhos:
+            try:
+                os.remove(caminho)
+                removido = True
+            except FileNotFoundError:
+                pass
+
+        return removido
+
+    def importar(self, caminho_origem, nome):
+        """
+        Traz um arquivo existente para o armazenamento sem remover a origem.
+
+        Usa um link físico quando possível (sem cópia de dados) e, caso
+        contrário, copia o arquivo.
+
+        Returns:
+            str: Caminho fragmentado do objeto
+        """
+        caminho = self.caminho(nome)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+
+        try:
+            os.link(caminho_origem, caminho)
+        except FileExistsError:
+            pass
+        except OSError:
+            shutil.copy2(caminho_origem, caminho)
+
+        return caminho
+
+    def listar(self):
+        """Percorre os nomes de todos os objetos fragmentados (e dos planos ainda não migrados)."""
+        for nivel1 in os.scandir(self.caminho_raiz):
+            if not nivel1.is_dir() or len(nivel1.name) != 2:
+                continue
+            for nivel2 in os.scandir(nivel1.path):
+                if not nivel2.is_dir():
+                    continue
+                for entrada in os.scandir(nivel2.path):
+                    if entrada.is_file() and not entrada.name.endswith(".tmp"):
+                        yield entrada.name
+
+        if self.caminho_legado and os.path.isdir(self.caminho_legado):
+            for entrada in os.scandir(self.caminho_legado):
+                if entrada.is_file() and self.nome_valido(entrada.name):
+                    yield entrada.name
+
+
+class MigradorArmazenamento:
+    """
+    Migra, em segundo plano, os arquivos do diretório plano para o armazenamento fragmentado.
+
+    Arquivos legados ("<token>_<nome original>") recebem nomes opacos, e blocos
+    gravados no formato plano são movidos para seus fragmentos. Cada arquivo é
+    primeiro vinculado ao novo caminho, depois o banco é atualizado e só então
+    a origem é removida, de modo que leituras continuam funcionando durante
+    toda a migração e uma interrupção nunca perde dados.
+    """
+
+    def __init__(self, conectar, caminho_legado, objetos, blocos=None, tamanho_lote=50, pausa=0.05, registrar_log=None):
+        """
+        Inicializa o migrador.
+
+        Args:
+            conectar (callable): Função que abre uma conexão com o banco de dados
+            caminho_legado (str): Diretório plano com os arquivos legados
+            objetos (ArmazenamentoFragmentado): Destino dos arquivos legados
+            blocos (ArmazenamentoFragmentado, optional): Armazenamento de blocos a reorganizar
+            tamanho_lote (int): Arquivos migrados por transação
+            pausa (float): Intervalo em segundos entre lotes, para não disputar E/S com a interface
+            registrar_log (callable, optional): Recebe (tipo, mensagem)
+        """
+        self.conectar = conectar
+        self.caminho_legado = caminho_legado
+        self.objetos = objetos
+        self.blocos = blocos
+        self.tamanho_lote = tamanho_lote
+        self.pausa = pausa
+        self.migrados = 0
+        self.em_execucao = False
+        self._parar = threading.Event()
+        self._thread = None
+        self.registrar_log = registrar_log
+
+    def _log(self, tipo, mensagem):
+        if self.registrar_log is not None:
+            try:
+                self.registrar_log(tipo, mensagem)
+            except Exception:
+                pass
+
+    def iniciar(self):
+        """Inicia a migração em uma thread de segundo plano."""
+        if self.em_execucao:
+            return False
+
+        self._parar.clear()
+        self._thread = threading.Thread(target=self.executar, daemon=True)
+        self._thread.start()
+        return True
+
+    def parar(self):
+        """Solicita a interrupção da migração ao fim do lote atual."""
+        self._parar.set()
+
+    def executar(self):
+        """Executa a migração completa; pode ser chamada diretamente ou via iniciar()."""
+        self.em_execucao = True
+        try:
+            self._corrigir_ausentes()
+
+            while not self._parar.is_set():
+                if self._migrar_lote_arquivos() == 0:
+                    break
+                time.sleep(self.pausa)
+
+            if self.blocos is not None and not self._parar.is_set():
+                self._migrar_blocos_planos()
+        except Exception as e:
+            self._log("erro", f"Erro na migração do armazenamento de arquivos: {str(e)}")
+        finally:
+            self.em_execucao = False
+
+        return self.migrados
+
+    def _corrigir_ausentes(self):
+        # Versões anteriores marcavam esses registros como fragmentados, mantendo o nome legado
+        conn = self.conectar()
+        try:
+            conn.execute(
+                "UPDATE arquivos SET armazenamento = ? WHERE armazenamento = 'fragmentado' AND nome_criptografado GLOB '*[^0-9a-f]*'",
+                (ARMAZENAMENTO_AUSENTE,)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _migrar_lote_arquivos(self):
+        conn = self.conectar()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            "SELECT id, nome_criptografado FROM arquivos WHERE armazenamento IS NULL OR armazenamento = 'legado' LIMIT ?",
+            (self.tamanho_lote,)
+        )
+        lote = cursor.fetchall()
+
+        origens = []
+        for id_arquivo, nome_criptografado in lote:
+            caminho_origem = os.path.join(self.caminho_legado, nome_criptografado)
+
+            if not os.path.isfile(caminho_origem):
+                # Registro sem arquivo físico: marcado à parte, porque o nome legado não é aceito pelo armazenamento
+                cursor.execute("UPDATE arquivos SET armazenamento = ? WHERE id = ?", (ARMAZENAMENTO_AUSENTE, id_arquivo))
+                continue
+
+            novo_nome = self.objetos.gerar_nome()
+            self.objetos.importar(caminho_origem, novo_nome)
+            cursor.execute(
+                "UPDATE arquivos SET nome_criptografado = ?, armazenamento = 'fragmentado' WHERE id = ?",
+                (novo_nome, id_arquivo)
+            )
+            origens.append(caminho_origem)
+
+        conn.commit()
+        conn.close()
+
+        # Só remover as origens depois que o banco aponta para os novos caminhos
+        for caminho_origem in origens:
+            try:
+                os.remove(caminho_origem)
+            except FileNotFoundError:
+                pass
+
+        self.migrados += len(origens)
+        return len(lote)
+
+    def _migrar_blocos_planos(self):
+        raiz = self.blocos.caminho_raiz
+        for entrada in os.scandir(raiz):
+            if self._parar.is_set():
+                break
+            if entrada.is_file() and self.blocos.nome_valido(entrada.name):
+                destino = self.blocos.caminho(entrada.name)
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                os.replace(entrada.path, destino)
+                self.migrados += 1
@@ -0,0 +1,141 @@
+import hmac
+import secrets
+
+from models.crypto_utils import CryptoUtils
+from models.memoria_segura import BufferSeguro
+from models.perfis_kdf import (
+    PerfilKDF, TAMANHO_SALT, TAMANHO_CHAVE, verificar_senha, perfil_do_verificador, precisa_atualizar,
+    _b64, _de_b64
+)
+
+
+# Prefixo dos registros em que a derivação gera o verificador e a chave que protege a chave de dados
+PREFIXO_DIVIDIDO = "$d$"
+
+
+def _desmontar(armazenado):
+    # "$d$algoritmo$parametros$salt$verificador$chave_cifrada"
+    _, _, algoritmo, parametros, salt, verificador, chave_cifrada = armazenado.split("$")
+    return f"{algoritmo}${parametros}", salt, _de_b64(verificador), _de_b64(chave_cifrada)
+
+
+class MotorAutenticacao:
+    """
+    Verificação das senhas principal e de herança com uma única derivação.
+
+    Cada papel guarda um registro "$d$algoritmo$parametros$salt$verificador$chave_cifrada".
+    A derivação da senha produz 64 bytes: os 32 primeiros são comparados
+    (em tempo constante) com o verificador e os 32 últimos decifram a chave
+    de dados do papel, então o login não precisa de uma segunda derivação
+    para obter a chave. Como a chave de dados fica cifrada, e não é a própria
+    saída da derivação, o perfil pode ser refeito sem recriptografar dados.
+
+    Os dois papéis usam o mesmo salt e o mesmo perfil, então uma derivação
+    confere os dois; ambos são sempre comparados, sem retorno antecipado,
+    e o tempo do login não revela qual papel (se algum) conferiu. Registros
+    anteriores (verificador simples ou SHA-512) continuam aceitos e são
+    convertidos no próximo login bem-sucedido do papel (ver atualizar).
+    """
+
+    @staticmethod
+    def criar_registro(senha, papel, chave_dados, perfil, salt=None):
+        """
+        Cria o registro de um papel.
+
+        Args:
+            senha (str): A senha do papel
+            papel (str): "principal" ou "heranca" (autenticado junto com a chave cifrada)
+            chave_dados (bytes): A chave de dados protegida pelo registro
+            perfil (PerfilKDF): Perfil da derivação
+            salt (bytes, optional): Salt compartilhado com o outro papel; um novo se omitido
+
+        Returns:
+            str: O registro
+        """
+        salt = salt or secrets.token_bytes(TAMANHO_SALT)
+        with perfil.derivar_em(senha, salt, BufferSeguro(2 * TAMANHO_CHAVE)) as saida:
+            visao = memoryview(saida)
+            try:
+                chave_cifrada = CryptoUtils.criptografar_bytes(chave_dados, visao[TAMANHO_CHAVE:], papel.encode())
+                verificador = _b64(visao[:TAMANHO_CHAVE])
+            finally:
+                visao.release()
+        return f"{PREFIXO_DIVIDIDO}{perfil.codificar()}${_b64(salt)}${verificador}${_b64(chave_cifrada)}"
+
+    @staticmethod
+    def verificar(senha, registros):
+        """
+        Confere a senha com os registros de todos os papéis.
+
+        Args:
+            senha (str): A senha fornecida
+            registros (dict): Papel → (registro, salt_legado); salt_legado é usado só por hashes SHA-512
+
+        Returns:
+            tuple: (papel, chave_dados); papel é None se nenhum conferir, e chave_dados (um
+                   BufferSeguro) é None para registros anteriores, cuja chave ainda é derivada à parte
+        """
+        derivacoes = {}
+        resultados = {}
+
+        try:
+            for papel, (armazenado, salt_legado) in registros.items():
+                if not (armazenado or "").startswith(PREFIXO_DIVIDIDO):
+                    resultados[papel] = (verificar_senha(senha, armazenado, salt_legado), None, None)
+                    continue
+
+                perfil, salt, verificador, chave_cifrada = _desmontar(armazenado)
+
+                # Papéis com o mesmo perfil e salt compartilham a derivação
+                if (perfil, salt) not in derivacoes:
+                    derivacoes[(perfil, salt)] = PerfilKDF.decodificar(perfil).derivar_em(
+                        senha, _de_b64(salt), BufferSeguro(2 * TAMANHO_CHAVE)
+                    )
+                saida = memoryview(derivacoes[(perfil, salt)])
+
+                resultados[papel] = (
+                    hmac.compare_digest(saida[:TAMANHO_CHAVE], verificador), saida[TAMANHO_CHAVE:], chave_cifrada
+                )
+
+            # Todas as comparações já foram feitas; escolher o papel só depois delas
+            papel = next((papel for papel, (conferiu, _, _) in resultados.items() if conferiu), None)
+            if papel is None:
+                return None, None
+
+            _, chave_protecao, chave_cifrada = resultados[papel]
+            if chave_protecao is None:
+                return papel, None
+            return papel, CryptoUtils.descriptografar_bytes_seguro(chave_cifrada, chave_protecao, papel.encode())
+        finally:
+            for saida in derivacoes.values():
+                saida.zerar()
+
+    @staticmethod
+    def perfil_e_salt(armazenado):
+        """Perfil e salt de um registro dividido, para que o outro papel os reutilize (ou None)."""
+        if not (armazenado or "").startswith(PREFIXO_DIVIDIDO):
+            return None, None
+        perfil, salt, _, _ = _desmontar(armazenado)
+        return PerfilKDF.decodificar(perfil), _de_b64(salt)
+
+    @staticmethod
+    def precisa_atualizar(armazenado, perfil_alvo):
+        """Indica se o registro ainda não é dividido ou usa um perfil mais fraco que o configurado."""
+        if not (armazenado or "").startswith(PREFIXO_DIVIDIDO):
+            return True
+        return precisa_atualizar(perfil_do_verificador("$" + armazenado[len(PREFIXO_DIVIDIDO):]), perfil_alvo)
+
+    @classmethod
+    def atualizar(cls, senha, papel, chave_dados, perfil_alvo, registro_outro_papel=None):
+        """
+        Refaz o registro de um papel recém-autenticado com o perfil configurado.
+
+        Reutiliza o salt do outro papel quando ele já está no mesmo perfil, para que
+        os dois voltem a ser conferidos por uma única derivação.
+
+        Returns:
+            str: O novo registro
+        """
+        perfil_outro, salt_outro = cls.perfil_e_salt(registro_outro_papel)
+        salt = salt_outro if perfil_outro == perfil_alvo else None
+        return cls.criar_registro(senha, papel, chave_dados, perfil_alvo, salt)
@@ -0,0 +1,623 @@
+import os
+import io
+import json
+import struct
+import secrets
+import hashlib
+import bisect
+import tarfile
+import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from models.crypto_utils import CryptoUtils
+
+
+# Assinatura e versão do formato de backup em fluxo
+MAGICA = b"CDBK"
+VERSAO = 3
+
+# Versões que este módulo consegue ler (a 2 não tem índice de quadros)
+VERSOES_SUPORTADAS = (2, 3)
+
+# Quantidade de bytes do fluxo tar comprimida e cifrada em cada quadro (1 MiB)
+TAMANHO_QUADRO = 1024 * 1024
+
+FORMATO_QUADRO = ">I"
+FORMATO_AAD = ">Q?"
+
+# Rodapé da versão 3: posição do índice de quadros seguida de uma assinatura
+FORMATO_RODAPE = ">Q4s"
+MAGICA_INDICE = b"CDIX"
+
+
+def _derivar_chave(chave_base, sal):
+    """Deriva a chave de um backup a partir da chave do usuário e do sal do backup."""
+    return CryptoUtils.derivar_subchave(chave_base, b"cofre-backup" + sal)
+
+
+def _dados_associados(identificador, indice, final):
+    """Vincula cada quadro ao backup, à sua posição e ao marcador de fim do fluxo."""
+    return identificador + struct.pack(FORMATO_AAD, indice, final)
+
+
+def _selar_quadro(dados, chave, dados_associados):
+    """Comprime e cifra um quadro; executado nas threads de trabalho."""
+    return CryptoUtils.criptografar_bytes(dados, chave, dados_associados, comprimir=True)
+
+
+def _abrir_quadro(cifrado, chave, identificador, indice, final=None):
+    """
+    Decifra e descomprime um quadro; executado nas threads de trabalho.
+
+    Args:
+        final (bool, optional): Marcador de fim esperado; se None, os dois valores são tentados
+
+    Returns:
+        tuple: (dados, final)
+    """
+    tentativas = (False, True) if final is None else (final,)
+    for tentativa in tentativas:
+        try:
+            dados = CryptoUtils.descriptografar_bytes(
+                cifrado, chave, _dados_associados(identificador, indice, tentativa), descomprimir=True
+            )
+            return dados, tentativa
+        except ValueError:
+            continue
+
+    raise ValueError(f"Falha de autenticação no quadro {indice}: senha incorreta ou backup corrompido")
+
+
+class EscritorQuadros(io.RawIOBase):
+    """
+    Arquivo somente de escrita que comprime e cifra o fluxo em quadros de tamanho fixo.
+
+    Cada quadro é gravado como [tamanho (4 bytes)][nonce + texto cifrado].
+    Os dados associados incluem o identificador do backup, o índice do quadro
+    e se ele é o último, de forma que quadros trocados, reordenados ou um
+    arquivo truncado são detectados na leitura.
+
+    Com um executor, os quadros são comprimidos e cifrados em paralelo e
+    gravados na ordem original; no máximo `janela` quadros ficam em memória.
+    Ao fechar, grava o índice cifrado dos quadros e o rodapé que aponta para ele.
+    """
+
+    def __init__(self, destino, chave, identificador, tamanho_quadro=TAMANHO_QUADRO, executor=None, janela=None):
+        super().__init__()
+        self.destino = destino
+        self.chave = chave
+        self.identificador = identificador
+        self.tamanho_quadro = tamanho_quadro
+        self.executor = executor
+        self.janela = janela or 4
+        self.indice = 0
+        self.bytes_lidos = 0
+        self.quadros = []
+        self.extras_indice = {}
+        self._posicao = destino.tell()
+        self._buffer = bytearray()
+        self._pendentes = deque()
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self._buffer += dados
+        self.bytes_lidos += len(dados)
+
+        while len(self._buffer) >= self.tamanho_quadro:
+            quadro = bytes(self._buffer[:self.tamanho_quadro])
+            del self._buffer[:self.tamanho_quadro]
+            self._emitir(quadro, final=False)
+
+        return len(dados)
+
+    def _emitir(self, dados, final):
+        aad = _dados_associados(self.identificador, self.indice, final)
+        self.indice += 1
+
+        if self.executor is None:
+            self._gravar(_selar_quadro(dados, self.chave, aad), len(dados))
+            return
+
+        self._pendentes.append((self.executor.submit(_selar_quadro, dados, self.chave, aad), len(dados)))
+        while len(self._pendentes) > self.janela:
+            self._gravar_proximo()
+
+    def _gravar_proximo(self):
+        futuro, tamanho_claro = self._pendentes.popleft()
+        self._gravar(futuro.result(), tamanho_claro)
+
+    def _gravar(self, cifrado, tamanho_claro):
+        self.quadros.append([self._posicao, len(cifrado), tamanho_claro])
+        self.destino.write(struct.pack(FORMATO_QUADRO, len(cifrado)) + cifrado)
+        self._posicao += struct.calcsize(FORMATO_QUADRO) + len(cifrado)
+
+    def close(self):
+        if not self.closed:
+            # O último quadro é sempre gravado, mesmo vazio, para marcar o fim do fluxo
+            self._emitir(bytes(self._buffer), final=True)
+            self._buffer = bytearray()
+            while self._pendentes:
+                self._gravar_proximo()
+            self._gravar_indice()
+        super().close()
+
+    def _gravar_indice(self):
+        indice = dict(self.extras_indice)
+        indice["quadros"] = self.quadros
+        cifrado = CryptoUtils.criptografar_bytes(
+            json.dumps(indice).encode(), self.chave, self.identificador + b"indice", comprimir=True
+        )
+
+        posicao_indice = self._posicao
+        self.destino.write(struct.pack(FORMATO_QUADRO, len(cifrado)) + cifrado)
+        self.destino.write(struct.pack(FORMATO_RODAPE, posicao_indice, MAGICA_INDICE))
+        self._posicao += struct.calcsize(FORMATO_QUADRO) + len(cifrado) + struct.calcsize(FORMATO_RODAPE)
+
+
+class LeitorQuadros(io.RawIOBase):
+    """
+    Arquivo somente de leitura que decifra e descomprime o que EscritorQuadros gravou.
+
+    Sem índice, lê os quadros em sequência (formato da versão 2). Com o
+    índice de quadros e um executor, lê cada quadro pela posição registrada
+    e decifra até `janela` quadros em paralelo, entregando-os em ordem.
+    """
+
+    def __init__(self, origem, chave, identificador, quadros=None, executor=None, janela=None):
+        super().__init__()
+        self.origem = origem
+        self.chave = chave
+        self.identificador = identificador
+        self.quadros = quadros
+        self.executor = executor
+        self.janela = janela or 4
+        self.indice = 0
+        self.terminado = False
+        self._proximo_envio = 0
+        self._pendentes = deque()
+        self._buffer = b""
+        self._posicao = 0
+
+    def readable(self):
+        return True
+
+    def _ler_cifrado(self, posicao=None):
+        if posicao is not None:
+            self.origem.seek(posicao)
+
+        cabecalho = self.origem.read(struct.calcsize(FORMATO_QUADRO))
+        if len(cabecalho) < struct.calcsize(FORMATO_QUADRO):
+            raise ValueError("Backup truncado: fim do fluxo não encontrado")
+
+        tamanho, = struct.unpack(FORMATO_QUADRO, cabecalho)
+        cifrado = self.origem.read(tamanho)
+        if len(cifrado) < tamanho:
+            raise ValueError("Backup truncado: quadro incompleto")
+
+        return cifrado
+
+    def _proximo_quadro(self):
+        if self.quadros is None:
+            dados, final = _abrir_quadro(self._ler_cifrado(), self.chave, self.identificador, self.indice)
+        else:
+            # Manter a janela de leitura antecipada cheia
+            while self._proximo_envio < len(self.quadros) and len(self._pendentes) < self.janela:
+                indice = self._proximo_envio
+                cifrado = self._ler_cifrado(self.quadros[indice][0])
+                final = indice == len(self.quadros) - 1
+                argumentos = (cifrado, self.chave, self.identificador, indice, final)
+                if self.executor is None:
+                    self._pendentes.append(_abrir_quadro(*argumentos))
+                else:
+                    self._pendentes.append(self.executor.submit(_abrir_quadro, *argumentos))
+                self._proximo_envio += 1
+
+            if not self._pendentes:
+                raise ValueError("Backup truncado: fim do fluxo não encontrado")
+
+            pendente = self._pendentes.popleft()
+            dados, final = pendente if isinstance(pendente, tuple) else pendente.result()
+
+        self.indice += 1
+        self.terminado = final
+        return dados
+
+    def readinto(self, destino):
+        while self._posicao >= len(self._buffer):
+            if self.terminado:
+                return 0
+            self._buffer = self._proximo_quadro()
+            self._posicao = 0
+
+        quantidade = min(len(destino), len(self._buffer) - self._posicao)
+        destino[:quantidade] = self._buffer[self._posicao:self._posicao + quantidade]
+        self._posicao += quantidade
+        return quantidade
+
+
+class _TarComSumario(tarfile.TarFile):
+    """TarFile que anota a posição dos dados de cada arquivo no fluxo tar."""
+
+    def addfile(self, tarinfo, fileobj=None):
+        super().addfile(tarinfo, fileobj)
+        if tarinfo.isfile():
+            # Após addfile, self.offset aponta para o fim dos dados (alinhados em blocos de 512 bytes)
+            blocos = -(-tarinfo.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            self.sumario.append({
+                "nome": tarinfo.name,
+                "tamanho": tarinfo.size,
+                "deslocamento": self.offset - blocos
+            })
+
+
+class LeitorBackup:
+    """
+    Acesso aleatório a um backup da versão 3 por meio do índice de quadros e do sumário.
+
+    Permite listar o conteúdo sem decifrar quadros, verificar todas as
+    etiquetas de autenticação sem gravar nada e extrair um único arquivo
+    decifrando apenas os quadros que o contêm.
+    """
+
+    def __init__(self, caminho_backup, chave_base, trabalhadores=1):
+        self.caminho_backup = caminho_backup
+        self.trabalhadores = trabalhadores
+        self.executor = ThreadPoolExecutor(max_workers=trabalhadores) if trabalhadores > 1 else None
+        self._arquivo = open(caminho_backup, 'rb')
+
+        try:
+            self.metadados, self.identificador = BackupFluxo._ler_cabecalho(self._arquivo)
+            self.chave = _derivar_chave(chave_base, bytes.fromhex(self.metadados["sal"]))
+            self.indice = BackupFluxo._ler_indice(self._arquivo, self.metadados, self.chave, self.identificador)
+            if self.indice is None:
+                raise ValueError("Backup sem índice (versão 2): use a restauração completa")
+        except Exception:
+            self.fechar()
+            raise
+
+        self.quadros = self.indice["quadros"]
+        self.sumario = self.indice.get("conteudo", [])
+        self._por_nome = {entrada["nome"]: entrada for entrada in self.sumario}
+
+        # Posição, no fluxo tar, do primeiro byte de cada quadro
+        self._inicios = []
+        inicio = 0
+        for _, _, tamanho_claro in self.quadros:
+            self._inicios.append(inicio)
+            inicio += tamanho_claro
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.fechar()
+
+    def fechar(self):
+        """Fecha o arquivo e encerra as threads de trabalho."""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if not self._arquivo.closed:
+            self._arquivo.close()
+
+    def conteudo(self):
+        """Retorna o sumário: um dicionário com nome, tamanho e deslocamento por arquivo."""
+        return list(self.sumario)
+
+    def membro(self, nome):
+        """Retorna a entrada do sumário de um arquivo, ou None."""
+        return self._por_nome.get(nome)
+
+    def _ler_cifrado(self, indice):
+        posicao, tamanho, _ = self.quadros[indice]
+        self._arquivo.seek(posicao + struct.calcsize(FORMATO_QUADRO))
+        cifrado = self._arquivo.read(tamanho)
+        if len(cifrado) < tamanho:
+            raise ValueError(f"Backup truncado: quadro {indice} incompleto")
+        return cifrado
+
+    def _abrir_quadros(self, indices):
+        """Decifra os quadros indicados, em paralelo, entregando-os em ordem."""
+        pendentes = deque()
+        indices = iter(indices)
+        ultimo = len(self.quadros) - 1
+
+        while True:
+            while len(pendentes) < 2 * self.trabalhadores:
+                indice = next(indices, None)
+                if indice is None:
+                    break
+                argumentos = (self._ler_cifrado(indice), self.chave, self.identificador, indice, indice == ultimo)
+                if self.executor is None:
+                    pendentes.append((indice, _abrir_quadro(*argumentos)))
+                else:
+                    pendentes.append((indice, self.executor.submit(_abrir_quadro, *argumentos)))
+
+            if not pendentes:
+                return
+
+            indice, pendente = pendentes.popleft()
+            dados, _ = pendente if isinstance(pendente, tuple) else pendente.result()
+            yield indice, dados
+
+    def ler_intervalo(self, deslocamento, tamanho):
+        """
+        Lê um intervalo do fluxo tar decifrando apenas os quadros que o cobrem.
+
+        Yields:
+            bytes: Trechos consecutivos do intervalo
+        """
+        if tamanho <= 0:
+            return
+
+        fim = deslocamento + tamanho
+        primeiro = bisect.bisect_right(self._inicios, deslocamento) - 1
+        ultimo = bisect.bisect_right(self._inicios, fim - 1) - 1
+
+        for indice, dados in self._abrir_quadros(range(primeiro, ultimo + 1)):
+            inicio_quadro = self._inicios[indice]
+            yield dados[max(deslocamento - inicio_quadro, 0):fim - inicio_quadro]
+
+    def extrair_membro(self, nome, caminho_destino):
+        """
+        Extrai um único arquivo do backup.
+
+        Returns:
+            int: Bytes gravados
+        """
+        entrada = self.membro(nome)
+        if entrada is None:
+            raise ValueError(f"Arquivo não encontrado no backup: {nome}")
+
+        os.makedirs(os.path.dirname(caminho_destino) or ".", exist_ok=True)
+        caminho_temporario = caminho_destino + ".tmp"
+        escritos = 0
+        with open(caminho_temporario, 'wb') as f:
+            for trecho in self.ler_intervalo(entrada["deslocamento"], entrada["tamanho"]):
+                f.write(trecho)
+                escritos += len(trecho)
+        os.replace(caminho_temporario, caminho_destino)
+        return escritos
+
+    def verificar(self):
+        """
+        Confere a etiqueta de autenticação de todos os quadros sem gravar nada.
+
+        Returns:
+            dict: ok, quadros verificados e lista de erros
+        """
+        erros = []
+        verificados = 0
+        ultimo = len(self.quadros) - 1
+        pendentes = deque()
+
+        def conferir(pendente):
+            try:
+                pendente.result() if self.executor is not None else pendente()
+            except ValueError as e:
+                erros.append(str(e))
+
+        for indice in range(len(self.quadros)):
+            try:
+                cifrado = self._ler_cifrado(indice)
+            except ValueError as e:
+                erros.append(str(e))
+                continue
+
+            argumentos = (cifrado, self.chave, self.identificador, indice, indice == ultimo)
+            if self.executor is None:
+                pendentes.append(lambda argumentos=argumentos: _abrir_quadro(*argumentos))
+            else:
+                pendentes.append(self.executor.submit(_abrir_quadro, *argumentos))
+
+            while len(pendentes) > 2 * self.trabalhadores:
+                conferir(pendentes.popleft())
+            verificados += 1
+
+        while pendentes:
+            conferir(pendentes.popleft())
+
+        return {"ok": not erros, "quadros": verificados, "erros": erros}
+
+
+class BackupFluxo:
+    """
+    Backup criptografado em fluxo: escritor tar → compressão → AEAD em quadros → arquivo.
+
+    Nenhuma etapa materializa o arquivo inteiro em memória ou em disco; o uso
+    de memória fica limitado a alguns quadros, independentemente do tamanho do
+    cofre. Compressão e criptografia dos quadros são distribuídas entre
+    threads de trabalho, tanto na criação quanto na restauração.
+    """
+
+    def __init__(self, tamanho_quadro=TAMANHO_QUADRO, trabalhadores=None):
+        """
+        Inicializa o componente.
+
+        Args:
+            tamanho_quadro (int): Bytes do fluxo tar por quadro
+            trabalhadores (int, optional): Threads de compressão e criptografia; por padrão, uma por núcleo
+        """
+        self.tamanho_quadro = tamanho_quadro
+        self.trabalhadores = trabalhadores or os.cpu_count() or 1
+
+    def _executor(self):
+        if self.trabalhadores <= 1:
+            return None
+        return ThreadPoolExecutor(max_workers=self.trabalhadores)
+
+    @staticmethod
+    def eh_backup_fluxo(caminho_backup):
+        """Verifica se um arquivo está no formato de backup em fluxo."""
+        with open(caminho_backup, 'rb') as f:
+            return f.read(len(MAGICA)) == MAGICA
+
+    @staticmethod
+    def _gravar_cabecalho(f, metadados):
+        conteudo = json.dumps(metadados).encode()
+        cabecalho = MAGICA + struct.pack(">BI", VERSAO, len(conteudo)) + conteudo
+        f.write(cabecalho)
+        return hashlib.sha256(cabecalho).digest()
+
+    @staticmethod
+    def _ler_cabecalho(f):
+        magica = f.read(len(MAGICA))
+        if magica != MAGICA:
+            raise ValueError("Arquivo não é um backup em fluxo do cofre")
+
+        versao, tamanho = struct.unpack(">BI", f.read(5))
+        if versao not in VERSOES_SUPORTADAS:
+            raise ValueError(f"Versão de backup não suportada: {versao}")
+
+        conteudo = f.read(tamanho)
+        cabecalho = magica + struct.pack(">BI", versao, tamanho) + conteudo
+        metadados = json.loads(conteudo)
+        metadados["versao"] = versao
+        return metadados, hashlib.sha256(cabecalho).digest()
+
+    @staticmethod
+    def _ler_indice(f, metadados, chave, identificador):
+        """Lê o índice cifrado de um backup da versão 3; retorna None para a versão 2."""
+        if metadados["versao"] < 3:
+            return None
+
+        f.seek(-struct.calcsize(FORMATO_RODAPE), os.SEEK_END)
+        posicao_indice, magica = struct.unpack(FORMATO_RODAPE, f.read(struct.calcsize(FORMATO_RODAPE)))
+        if magica != MAGICA_INDICE:
+            raise ValueError("Backup truncado: índice de quadros não encontrado")
+
+        f.seek(posicao_indice)
+        tamanho, = struct.unpack(FORMATO_QUADRO, f.read(struct.calcsize(FORMATO_QUADRO)))
+        try:
+            dados = CryptoUtils.descriptografar_bytes(
+                f.read(tamanho), chave, identificador + b"indice", descomprimir=True
+            )
+        except ValueError:
+            raise ValueError("Falha de autenticação no índice: senha incorreta ou backup corrompido")
+
+        return json.loads(dados)
+
+    def ler_metadados(self, caminho_backup):
+        """Retorna os metadados em claro do cabeçalho de um backup."""
+        with open(caminho_backup, 'rb') as f:
+            metadados, _ = self._ler_cabecalho(f)
+        return metadados
+
+    def abrir(self, caminho_backup, chave_base):
+        """
+        Abre um backup para listagem, verificação e extração parcial.
+
+        Returns:
+            LeitorBackup: Leitor a ser fechado com fechar() ou usado como contexto
+        """
+        return LeitorBackup(caminho_backup, chave_base, self.trabalhadores)
+
+    def criar(self, caminho_backup, chave_base, itens, metadados=None):
+        """
+        Cria um backup em fluxo.
+
+        Args:
+            caminho_backup (str): Arquivo de destino
+            chave_base (bytes): Chave do usuário (32 bytes)
+            itens (list): Pares (caminho_local, nome_no_backup); diretórios são incluídos recursivamente
+            metadados (dict, optional): Informações adicionais gravadas em claro no cabeçalho
+
+        Returns:
+            dict: Estatísticas com bytes_lidos, bytes_gravados e quadros
+        """
+        sal = secrets.token_bytes(16)
+        metadados = dict(metadados or {})
+        metadados.update({
+            "sal": sal.hex(),
+            "tamanho_quadro": self.tamanho_quadro,
+            "data_backup": datetime.datetime.now().isoformat()
+        })
+
+        chave = _derivar_chave(chave_base, sal)
+        caminho_temporario = caminho_backup + ".tmp"
+        executor = self._executor()
+
+        try:
+            with open(caminho_temporario, 'wb') as f:
+                identificador = self._gravar_cabecalho(f, metadados)
+                escritor = EscritorQuadros(
+                    f, chave, identificador, self.tamanho_quadro, executor, janela=2 * self.trabalhadores
+                )
+
+                with _TarComSumario.open(fileobj=escritor, mode="w|") as tar:
+                    tar.sumario = []
+                    for caminho_local, nome in itens:
+                        if os.path.exists(caminho_local):
+                            tar.add(caminho_local, arcname=nome, filter=self._filtrar_temporarios)
+
+                # O sumário vai no índice cifrado, junto com as posições dos quadros
+                escritor.extras_indice["conteudo"] = tar.sumario
+                escritor.close()
+                estatisticas = {
+                    "bytes_lidos": escritor.bytes_lidos,
+                    "bytes_gravados": f.tell(),
+                    "quadros": escritor.indice
+                }
+
+            # Publicar o backup apenas depois de completo
+            os.replace(caminho_temporario, caminho_backup)
+        except Exception:
+            if os.path.exists(caminho_temporario):
+                os.remove(caminho_temporario)
+            raise
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return estatisticas
+
+    @staticmethod
+    def _filtrar_temporarios(info):
+        return None if info.name.endswith(".tmp") else info
+
+    def restaurar(self, caminho_backup, chave_base, destino):
+        """
+        Extrai um backup em fluxo para um diretório, decifrando os quadros em paralelo.
+
+        Args:
+            caminho_backup (str): Arquivo de backup
+            chave_base (bytes): Chave do usuário (32 bytes)
+            destino (str): Diretório onde os itens serão extraídos
+
+        Returns:
+            list: Nomes dos itens extraídos
+        """
+        executor = self._executor()
+        try:
+            with open(caminho_backup, 'rb') as f:
+                metadados, identificador = self._ler_cabecalho(f)
+                chave = _derivar_chave(chave_base, bytes.fromhex(metadados["sal"]))
+                indice = self._ler_indice(f, metadados, chave, identificador)
+
+                if indice is None:
+                    # Versão 2: leitura sequencial a partir do fim do cabeçalho
+                    f.seek(0)
+                    self._ler_cabecalho(f)
+                    leitor = LeitorQuadros(f, chave, identificador)
+                else:
+                    leitor = LeitorQuadros(
+                        f, chave, identificador, indice["quadros"], executor, janela=2 * self.trabalhadores
+                    )
+
+                nomes = []
+                with tarfile.open(fileobj=leitor, mode="r|") as tar:
+                    for info in tar:
+                        tar.extract(info, destino, filter="data")
+                        nomes.append(info.name)
+
+                # Ler até o quadro final garante que o backup não foi truncado
+                while leitor.read(self.tamanho_quadro):
+                    pass
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return nomes
@@ -0,0 +1,558 @@
+import os
+import hmac
+import json
+import secrets
+import hashlib
+import datetime
+
+from models.crypto_utils import CryptoUtils
+from models.armazenamento_fragmentado import ArmazenamentoFragmentado
+
+
+# Limites dos pedaços definidos pelo conteúdo
+TAMANHO_MINIMO_PEDACO = 16 * 1024
+TAMANHO_MAXIMO_PEDACO = 256 * 1024
+
+# Quantidade de dados lida por vez de cada arquivo
+TAMANHO_LEITURA = 4 * TAMANHO_MAXIMO_PEDACO
+
+VERSAO_REPOSITORIO = 2
+TEXTO_VERIFICADOR = b"cofre-backup-incremental"
+
+
+class BackupIncremental:
+    """
+    Repositório de backups incrementais com pedaços definidos pelo conteúdo.
+
+    Cada execução gera uma geração: um manifesto cifrado que lista, para cada
+    arquivo, os pedaços que o compõem. Os pedaços são endereçados por um HMAC
+    do conteúdo e gravados uma única vez, então uma nova geração só grava os
+    pedaços novos ou alterados. Como cada manifesto descreve o estado completo,
+    qualquer geração é restaurada diretamente, sem reaplicar as anteriores, e
+    a poda de gerações antigas nunca invalida as mais novas.
+
+    Os cortes entre pedaços ocorrem após um marcador de dois bytes derivado da
+    chave, localizado com bytes.find, respeitando tamanhos mínimo e máximo.
+    Inserções ou remoções no meio de um arquivo alteram apenas os pedaços
+    vizinhos, e o marcador não é previsível sem a chave.
+
+    Estrutura do repositório:
+        repositorio.json      parâmetros em claro (sal, acessos com a chave do repositório cifrada)
+        geracoes/NNNNNN.man   manifestos cifrados, encadeados pelo hash do anterior
+        pedacos/ab/cd/<id>    pedaços cifrados e comprimidos
+    """
+
+    def __init__(self, caminho_repositorio, tamanho_minimo=TAMANHO_MINIMO_PEDACO, tamanho_maximo=TAMANHO_MAXIMO_PEDACO):
+        """
+        Inicializa o acesso ao repositório.
+
+        Args:
+            caminho_repositorio (str): Diretório do repositório
+            tamanho_minimo (int): Tamanho mínimo de um pedaço em bytes
+            tamanho_maximo (int): Tamanho máximo de um pedaço em bytes
+        """
+        self.caminho_repositorio = caminho_repositorio
+        self.caminho_geracoes = os.path.join(caminho_repositorio, "geracoes")
+        self.caminho_parametros = os.path.join(caminho_repositorio, "repositorio.json")
+        self.tamanho_minimo = tamanho_minimo
+        self.tamanho_maximo = tamanho_maximo
+        self.pedacos = None
+        self.parametros = None
+        self._chave_repositorio = None
+        self._chave_id = None
+        self._chave_pedacos = None
+        self._chave_manifestos = None
+        self._marcador = None
+
+    def existe(self):
+        """Verifica se o repositório já foi inicializado."""
+        return os.path.exists(self.caminho_parametros)
+
+    def ler_parametros(self):
+        """Retorna os parâmetros em claro do repositório."""
+        with open(self.caminho_parametros, 'r') as f:
+            return json.load(f)
+
+    def abrir(self, chave_base, metadados=None, acesso="principal"):
+        """
+        Abre o repositório, criando-o se ainda não existir.
+
+        A chave do repositório é aleatória e fica gravada cifrada por cada chave de
+        acesso (ver definir_acesso); chave_base abre o repositório se abrir qualquer
+        um dos acessos. Repositórios da versão 1, cuja chave era derivada da própria
+        chave_base, são convertidos na abertura, mantendo a chave (e os pedaços).
+
+        Args:
+            chave_base (bytes): Chave de acesso (32 bytes)
+            metadados (dict, optional): Informações em claro do acesso criado com o repositório
+            acesso (str): Nome do acesso criado com o repositório ou na conversão
+
+        Raises:
+            ValueError: Se a chave não abrir nenhum acesso do repositório
+        """
+        os.makedirs(self.caminho_geracoes, exist_ok=True)
+        self.pedacos = ArmazenamentoFragmentado(os.path.join(self.caminho_repositorio, "pedacos"))
+
+        if self.existe():
+            self.parametros = self.ler_parametros()
+            versao = self.parametros.get("versao")
+            if versao == 1:
+                self._abrir_versao_1(chave_base, acesso)
+                return
+            if versao != VERSAO_REPOSITORIO:
+                raise ValueError(f"Versão de repositório não suportada: {versao}")
+
+            for nome, dados_acesso in self.parametros.get("acessos", {}).items():
+                try:
+                    chave = CryptoUtils.descriptografar_bytes(
+                        bytes.fromhex(dados_acesso["chave"]), self._chave_acesso(chave_base), f"acesso:{nome}".encode()
+                    )
+                except ValueError:
+                    continue
+                self._derivar_chaves(chave)
+                return
+            raise ValueError("Senha incorreta para este repositório de backup")
+
+        self._derivar_chaves(secrets.token_bytes(32))
+        self.parametros = {
+            "versao": VERSAO_REPOSITORIO,
+            "sal": secrets.token_hex(16),
+            "acessos": {},
+            "podadas_ate": 0,
+            "data_criacao": datetime.datetime.now().isoformat()
+        }
+        self.definir_acesso(acesso, chave_base, metadados)
+
+    def _abrir_versao_1(self, chave_base, acesso):
+        """Abre um repositório da versão 1 e o converte, guardando a chave derivada como chave do repositório."""
+        chave = CryptoUtils.derivar_subchave(chave_base, b"cofre-backup-incremental" + bytes.fromhex(self.parametros["sal"]))
+        chave_verificador = CryptoUtils.derivar_subchave(chave, b"verificador")
+        verificador = hmac.new(chave_verificador, TEXTO_VERIFICADOR, hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(verificador, self.parametros["verificador"]):
+            raise ValueError("Senha incorreta para este repositório de backup")
+
+        self._derivar_chaves(chave)
+        metadados = {"salt_usuario": self.parametros.pop("salt_usuario", None)}
+        del self.parametros["verificador"]
+        self.parametros.update({"versao": VERSAO_REPOSITORIO, "acessos": {}})
+        self.definir_acesso(acesso, chave_base, metadados)
+
+    def _chave_acesso(self, chave_base):
+        return CryptoUtils.derivar_subchave(chave_base, b"cofre-backup-acesso" + bytes.fromhex(self.parametros["sal"]))
+
+    def acessos(self):
+        """Retorna os metadados em claro de cada acesso (nome → dict), sem exigir a chave."""
+        parametros = self.parametros if self.parametros is not None else self.ler_parametros()
+        if parametros.get("versao") == 1:
+            return {"principal": {"salt_usuario": parametros.get("salt_usuario")}}
+        return {
+            nome: {campo: valor for campo, valor in dados.items() if campo != "chave"}
+            for nome, dados in parametros.get("acessos", {}).items()
+        }
+
+    def definir_acesso(self, nome, chave_base, metadados=None):
+        """
+        Grava a chave do repositório cifrada por uma chave de acesso, substituindo o acesso de mesmo nome.
+
+        Args:
+            nome (str): Nome do acesso
+            chave_base (bytes): Chave de acesso (32 bytes)
+            metadados (dict, optional): Informações em claro do acesso (ex.: o salt da senha)
+        """
+        self._exigir_aberto()
+        dados_acesso = dict(metadados or {})
+        dados_acesso["chave"] = CryptoUtils.criptografar_bytes(
+            self._chave_repositorio, self._chave_acesso(chave_base), f"acesso:{nome}".encode()
+        ).hex()
+        self.parametros["acessos"][nome] = dados_acesso
+        self._gravar_parametros()
+
+    def remover_acesso(self, nome):
+        """Remove um acesso; o último não pode ser removido."""
+        self._exigir_aberto()
+        acessos = self.parametros["acessos"]
+        if nome not in acessos:
+            return
+        if len(acessos) == 1:
+            raise ValueError("O repositório precisa de ao menos um acesso")
+        del acessos[nome]
+        self._gravar_parametros()
+
+    def _derivar_chaves(self, chave):
+        self._chave_repositorio = chave
+        self._chave_id = CryptoUtils.derivar_subchave(chave, b"id")
+        self._chave_pedacos = CryptoUtils.derivar_subchave(chave, b"pedacos")
+        self._chave_manifestos = CryptoUtils.derivar_subchave(chave, b"manifestos")
+
+        # Marcador de corte: dois bytes não nulos e distintos, derivados da chave
+        semente = CryptoUtils.derivar_subchave(chave, b"marcador")
+        primeiro = semente[0] | 1
+        segundo = semente[1] | 1
+        if segundo == primeiro:
+            segundo ^= 0x80
+        self._marcador = bytes([primeiro, segundo])
+
+    def _gravar_parametros(self):
+        caminho_temporario = self.caminho_parametros + ".tmp"
+        with open(caminho_temporario, 'w') as f:
+            json.dump(self.parametros, f, indent=4)
+        os.replace(caminho_temporario, self.caminho_parametros)
+
+    def _exigir_aberto(self):
+        if self._chave_id is None:
+            raise ValueError("Repositório de backup não foi aberto")
+
+    def cortes(self, dados):
+        """
+        Calcula os pontos de corte dos pedaços em um trecho de dados.
+
+        Args:
+            dados (bytes): Dados a dividir
+
+        Returns:
+            list: Posições finais (exclusivas) de cada pedaço; o último pode ser parcial
+        """
+        cortes = []
+        inicio = 0
+        total = len(dados)
+
+        while inicio < total:
+            limite = min(inicio + self.tamanho_maximo, total)
+            posicao = dados.find(self._marcador, inicio + self.tamanho_minimo, limite)
+            fim = limite if posicao < 0 else posicao + len(self._marcador)
+            cortes.append(fim)
+            inicio = fim
+
+        return cortes
+
+    def identificar_pedaco(self, dados):
+        """Calcula o identificador de um pedaço (HMAC do conteúdo, em hexadecimal)."""
+        return hmac.new(self._chave_id, dados, hashlib.sha256).hexdigest()
+
+    def _gravar_pedaco(self, pedaco_id, dados):
+        cifrado = CryptoUtils.criptografar_bytes(dados, self._chave_pedacos, pedaco_id.encode(), comprimir=True)
+        self.pedacos.gravar(pedaco_id, cifrado)
+        return len(cifrado)
+
+    def _ler_pedaco(self, pedaco_id):
+        cifrado = self.pedacos.ler(pedaco_id)
+        return CryptoUtils.descriptografar_bytes(cifrado, self._chave_pedacos, pedaco_id.encode(), descomprimir=True)
+
+    def _dividir_arquivo(self, caminho, existentes, estatisticas, ao_ler=None):
+        """Divide um arquivo em pedaços, gravando apenas os que ainda não estão no repositório."""
+        ids = []
+        pendente = b""
+
+        with open(caminho, 'rb') as f:
+            while True:
+                leitura = f.read(TAMANHO_LEITURA)
+                fim_arquivo = not leitura
+                dados = pendente + leitura
+                estatisticas["bytes_lidos"] += len(leitura)
+                if ao_ler is not None:
+                    ao_ler(len(leitura))
+
+                inicio = 0
+                for corte in self.cortes(dados):
+                    # O último pedaço de um trecho pode continuar na próxima leitura
+                    if corte == len(dados) and not fim_arquivo and corte - inicio < self.tamanho_maximo:
+                        break
+
+                    pedaco = dados[inicio:corte]
+                    pedaco_id = self.identificar_pedaco(pedaco)
+                    if pedaco_id not in existentes:
+                        estatisticas["bytes_gravados"] += self._gravar_pedaco(pedaco_id, pedaco)
+                        estatisticas["pedacos_novos"] += 1
+                        existentes.add(pedaco_id)
+                    ids.append(pedaco_id)
+                    inicio = corte
+
+                pendente = dados[inicio:]
+                if fim_arquivo:
+                    break
+
+        return ids
+
+    def _caminho_manifesto(self, geracao):
+        return os.path.join(self.caminho_geracoes, f"{geracao:06d}.man")
+
+    def geracoes(self):
+        """Retorna os números das gerações existentes, em ordem crescente."""
+        numeros = []
+        for nome in os.listdir(self.caminho_geracoes):
+            if nome.endswith(".man") and nome[:-4].isdigit():
+                numeros.append(int(nome[:-4]))
+        return sorted(numeros)
+
+    def _ler_manifesto_bruto(self, geracao):
+        with open(self._caminho_manifesto(geracao), 'rb') as f:
+            return f.read()
+
+    def ler_manifesto(self, geracao):
+        """
+        Decifra o manifesto de uma geração.
+
+        Raises:
+            ValueError: Se o manifesto tiver sido alterado ou a chave estiver incorreta
+        """
+        self._exigir_aberto()
+        cifrado = self._ler_manifesto_bruto(geracao)
+        dados = CryptoUtils.descriptografar_bytes(
+            cifrado, self._chave_manifestos, f"geracao:{geracao}".encode(), descomprimir=True
+        )
+        return json.loads(dados)
+
+    def _gravar_manifesto(self, geracao, manifesto):
+        dados = json.dumps(manifesto).encode()
+        cifrado = CryptoUtils.criptografar_bytes(
+            dados, self._chave_manifestos, f"geracao:{geracao}".encode(), comprimir=True
+        )
+
+        caminho = self._caminho_manifesto(geracao)
+        caminho_temporario = caminho + ".tmp"
+        with open(caminho_temporario, 'wb') as f:
+            f.write(cifrado)
+        os.replace(caminho_temporario, caminho)
+
+    @staticmethod
+    def _percorrer_itens(itens):
+        """Expande os itens em pares (caminho_local, nome_no_backup) de arquivos comuns."""
+        for caminho_local, nome in itens:
+            if os.path.isfile(caminho_local):
+                yield caminho_local, nome
+            elif os.path.isdir(caminho_local):
+                for raiz, diretorios, arquivos in os.walk(caminho_local):
+                    diretorios.sort()
+                    for arquivo in sorted(arquivos):
+                        if arquivo.endswith(".tmp"):
+                            continue
+                        caminho = os.path.join(raiz, arquivo)
+                        relativo = os.path.relpath(caminho, caminho_local).replace(os.sep, "/")
+                        yield caminho, f"{nome}/{relativo}"
+
+    def criar_geracao(self, itens, substituicoes=None, ao_ler=None):
+        """
+        Grava uma nova geração com os itens informados.
+
+        Arquivos com mesmo nome, tamanho e data de modificação que na geração
+        anterior reaproveitam a lista de pedaços sem serem lidos novamente.
+
+        Args:
+            itens (list): Pares (caminho_local, nome_no_backup); diretórios são incluídos recursivamente
+            substituicoes (dict, optional): Nome no backup → caminho a ler no lugar do original
+                (por exemplo, um snapshot do banco de dados)
+            ao_ler (callable, optional): Chamada como ao_ler(bytes) após cada leitura; pode
+                bloquear para limitar o ritmo do backup ou levantar uma exceção para interrompê-lo
+
+        Returns:
+            dict: Estatísticas da geração (geracao, arquivos, reaproveitados, pedacos_novos, bytes_lidos, bytes_gravados)
+        """
+        self._exigir_aberto()
+        substituicoes = substituicoes or {}
+
+        numeros = self.geracoes()
+        anterior = numeros[-1] if numeros else None
+        entradas_anteriores = {}
+        hash_anterior = None
+
+        if anterior is not None:
+            hash_anterior = hashlib.sha256(self._ler_manifesto_bruto(anterior)).hexdigest()
+            for entrada in self.ler_manifesto(anterior)["arquivos"]:
+                entradas_anteriores[entrada["nome"]] = entrada
+
+        existentes = set(self.pedacos.listar())
+        estatisticas = {"arquivos": 0, "reaproveitados": 0, "pedacos_novos": 0, "bytes_lidos": 0, "bytes_gravados": 0}
+        entradas = []
+
+        for caminho, nome in self._percorrer_itens(itens):
+            caminho = substituicoes.get(nome, caminho)
+            info = os.stat(caminho)
+            entrada = {"nome": nome, "tamanho": info.st_size, "modificado": info.st_mtime_ns}
+
+            anterior_entrada = entradas_anteriores.get(nome)
+            if (anterior_entrada
+                    and anterior_entrada["tamanho"] == entrada["tamanho"]
+                    and anterior_entrada["modificado"] == entrada["modificado"]
+                    and all(pedaco_id in existentes for pedaco_id in anterior_entrada["pedacos"])):
+                entrada["pedacos"] = anterior_entrada["pedacos"]
+                estatisticas["reaproveitados"] += 1
+            else:
+                entrada["pedacos"] = self._dividir_arquivo(caminho, existentes, estatisticas, ao_ler)
+
+            entradas.append(entrada)
+            estatisticas["arquivos"] += 1
+
+        geracao = (anterior or 0) + 1
+        self._gravar_manifesto(geracao, {
+            "geracao": geracao,
+            "anterior": anterior,
+            "hash_anterior": hash_anterior,
+            "data": datetime.datetime.now().isoformat(),
+            "arquivos": entradas
+        })
+
+        estatisticas["geracao"] = geracao
+        return estatisticas
+
+    def listar_geracoes(self):
+        """
+        Lista as gerações do repositório.
+
+        Returns:
+            list: Dicionários com geracao, data, arquivos e tamanho (bytes originais)
+        """
+        lista = []
+        for geracao in self.geracoes():
+            manifesto = self.ler_manifesto(geracao)
+            lista.append({
+                "geracao": geracao,
+                "data": manifesto["data"],
+                "arquivos": len(manifesto["arquivos"]),
+                "tamanho": sum(entrada["tamanho"] for entrada in manifesto["arquivos"])
+            })
+        return lista
+
+    def restaurar(self, geracao, destino, filtro=None):
+        """
+        Reconstrói os arquivos de uma geração em um diretório.
+
+        Args:
+            geracao (int): Número da geração (a mais recente se None)
+            destino (str): Diretório de destino
+            filtro (callable, optional): Recebe o nome no backup e retorna True para restaurá-lo
+
+        Returns:
+            list: Nomes dos arquivos restaurados
+        """
+        self._exigir_aberto()
+        if geracao is None:
+            numeros = self.geracoes()
+            if not numeros:
+                raise ValueError("Repositório de backup sem gerações")
+            geracao = numeros[-1]
+
+        manifesto = self.ler_manifesto(geracao)
+        destino_absoluto = os.path.abspath(destino)
+        restaurados = []
+
+        for entrada in manifesto["arquivos"]:
+            nome = entrada["nome"]
+            if filtro is not None and not filtro(nome):
+                continue
+
+            caminho = os.path.abspath(os.path.join(destino_absoluto, *nome.split("/")))
+            if not caminho.startswith(destino_absoluto + os.sep):
+                raise ValueError(f"Nome inválido no manifesto: {nome}")
+
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            caminho_temporario = caminho + ".tmp"
+            escritos = 0
+            with open(caminho_temporario, 'wb') as f:
+                for pedaco_id in entrada["pedacos"]:
+                    dados = self._ler_pedaco(pedaco_id)
+                    f.write(dados)
+                    escritos += len(dados)
+
+            if escritos != entrada["tamanho"]:
+                os.remove(caminho_temporario)
+                raise ValueError(f"Tamanho restaurado de {nome} não confere com o manifesto")
+
+            os.replace(caminho_temporario, caminho)
+            restaurados.append(nome)
+
+        return restaurados
+
+    def verificar(self, completo=False):
+        """
+        Verifica a cadeia de gerações e a presença (ou integridade) dos pedaços.
+
+        Args:
+            completo (bool): Também decifra cada pedaço e confere seu identificador
+
+        Returns:
+            dict: ok, geracoes verificadas, pedacos verificados e lista de erros
+        """
+        self._exigir_aberto()
+        erros = []
+        existentes = set(self.pedacos.listar())
+        referenciados = set()
+        numeros = self.geracoes()
+        hash_anterior = None
+        geracao_anterior = None
+
+        for geracao in numeros:
+            try:
+                bruto = self._ler_manifesto_bruto(geracao)
+                manifesto = self.ler_manifesto(geracao)
+            except ValueError as e:
+                erros.append(f"Geração {geracao}: manifesto inválido ({str(e)})")
+                hash_anterior, geracao_anterior = None, geracao
+                continue
+
+            if manifesto.get("geracao") != geracao:
+                erros.append(f"Geração {geracao}: número no manifesto não confere")
+
+            if geracao_anterior is None:
+                # A primeira geração restante só pode apontar para uma geração podada
+                if manifesto["anterior"] is not None and manifesto["anterior"] > self.parametros.get("podadas_ate", 0):
+                    erros.append(f"Geração {geracao}: geração anterior {manifesto['anterior']} ausente")
+            elif manifesto["anterior"] != geracao_anterior or manifesto["hash_anterior"] != hash_anterior:
+                erros.append(f"Geração {geracao}: encadeamento com a geração {geracao_anterior} não confere")
+
+            for entrada in manifesto["arquivos"]:
+                for pedaco_id in entrada["pedacos"]:
+                    referenciados.add(pedaco_id)
+                    if pedaco_id not in existentes:
+                        erros.append(f"Geração {geracao}: pedaço ausente em {entrada['nome']}")
+
+            hash_anterior = hashlib.sha256(bruto).hexdigest()
+            geracao_anterior = geracao
+
+        verificados = 0
+        if completo:
+            for pedaco_id in sorted(referenciados & existentes):
+                try:
+                    if self.identificar_pedaco(self._ler_pedaco(pedaco_id)) != pedaco_id:
+                        erros.append(f"Pedaço {pedaco_id}: conteúdo não confere com o identificador")
+                except ValueError:
+                    erros.append(f"Pedaço {pedaco_id}: falha de autenticação")
+                verificados += 1
+
+        return {"ok": not erros, "geracoes": len(numeros), "pedacos": verificados, "erros": erros}
+
+    def podar(self, manter):
+        """
+        Remove as gerações mais antigas e os pedaços que só elas referenciavam.
+
+        Args:
+            manter (int): Quantidade de gerações mais recentes a manter (mínimo 1)
+
+        Returns:
+            dict: geracoes_removidas e pedacos_removidos
+        """
+        self._exigir_aberto()
+        manter = max(1, manter)
+        numeros = self.geracoes()
+        remover = numeros[:-manter]
+
+        if not remover:
+            return {"geracoes_removidas": 0, "pedacos_removidos": 0}
+
+        # Registrar a poda antes de apagar, para a verificação aceitar o novo início da cadeia
+        self.parametros["podadas_ate"] = max(self.parametros.get("podadas_ate", 0), remover[-1])
+        self._gravar_parametros()
+
+        for geracao in remover:
+            os.remove(self._caminho_manifesto(geracao))
+
+        referenciados = set()
+        for geracao in numeros[-manter:]:
+            for entrada in self.ler_manifesto(geracao)["arquivos"]:
+                referenciados.update(entrada["pedacos"])
+
+        pedacos_removidos = 0
+        for pedaco_id in list(self.pedacos.listar()):
+            if pedaco_id not in referenciados and self.pedacos.remover(pedaco_id):
+                pedacos_removidos += 1
+
+        return {"geracoes_removidas": len(remover), "pedacos_removidos": pedacos_removidos}
@@ -1,152 +1,217 @@
-import re
+import os
+import bisect
 import hashlib
+import secrets
+import threading
 import unicodedata
 
+
+# Lista oficial de 2048 palavras do BIP39 em inglês, distribuída com o aplicativo
+CAMINHO_PALAVRAS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "bip39_english.txt")
+
+# SHA-256 da lista oficial (um arquivo truncado ou alterado é recusado)
+SHA256_PALAVRAS = "2f5eed53a4727b4bf8880d8f3f199efc90e58503646d9ff8eff3a2ed3b24dbda"
+
+# Bits de entropia por quantidade de palavras
+BITS_ENTROPIA = {12: 128, 15: 160, 18: 192, 21: 224, 24: 256}
+
+# Iterações do PBKDF2 na derivação da seed (BIP39)
+ITERACOES_SEED = 2048
+
+# A lista é carregada uma única vez por processo e compartilhada por todas as instâncias
+_palavras = None
+_indice = None
+_trava = threading.Lock()
+
+
+def _carregar_palavras():
+    global _palavras, _indice
+    if _palavras is not None:
+        return _palavras, _indice
+
+    with _trava:
+        if _palavras is None:
+            with open(CAMINHO_PALAVRAS, 'rb') as f:
+                conteudo = f.read()
+
+            if hashlib.sha256(conteudo).hexdigest() != SHA256_PALAVRAS:
+                raise RuntimeError(f"Lista de palavras BIP39 inválida ou incompleta: {CAMINHO_PALAVRAS}")
+
+            palavras = tuple(conteudo.decode('utf-8').split())
+            _indice = {palavra: i for i, palavra in enumerate(palavras)}
+            _palavras = palavras
+
+    return _palavras, _indice
+
+
 class BIP39Validator:
-    """Validador de frases mnemônicas compatíveis com BIP39."""
-    
+    """
+    Frases mnemônicas BIP39 sem depender da biblioteca mnemonic.
+
+    A lista oficial é lida uma vez e indexada em um dicionário palavra → índice,
+    então validar uma frase custa uma consulta por palavra. As palavras são
+    empacotadas em um inteiro de 11 bits por palavra, do qual saem a entropia
+    e o checksum (primeiros bits do SHA-256 da entropia). Como a lista é
+    ordenada, completar() encontra as palavras de um prefixo por busca binária.
+    """
+
     def __init__(self):
-        # Carregar lista de palavras BIP39 em inglês
-        try:
-            with open('assets/bip39_english.txt', 'r') as f:
-                self.wordlist = [w.strip() for w in f.readlines()]
-        except FileNotFoundError:
-            # Lista de palavras não disponível, criar em tempo de execução
-            self._criar_arquivo_palavras()
-    
-    def _criar_arquivo_palavras(self):
-        """
-        Cria o arquivo de palavras BIP39 se não existir.
-        Usamos as 2048 palavras padrão do BIP39 inglês.
-        """
-        # Lista padrão (truncada por brevidade - será expandida na implementação real)
-        # Exemplo com apenas as primeiras 20 palavras:
-        self.wordlist = [
-            "abandon", "ability", "able", "about", "above", "absent", "absorb", "abstract",
-            "absurd", "abuse", "access", "accident", "account", "accuse", "achieve", "acid",
-            "acoustic", "acquire", "across", "act"
-        ]
-        
-        # Na implementação real, incluir todas as 2048 palavras
-        import os
-        os.makedirs('assets', exist_ok=True)
-        try:
-            with open('assets/bip39_english.txt', 'w') as f:
-                for word in self.wordlist:
-                    f.write(word + "\n")
-        except:
-            pass  # Falhar silenciosamente se não puder criar o arquivo
-    
+        self.wordlist, self.indice = _carregar_palavras()
+
+    @staticmethod
+    def normalizar(frase):
+        """Normaliza a frase (NFKD, minúsculas e um espaço entre palavras)."""
+        return " ".join(unicodedata.normalize('NFKD', frase).lower().split())
+
     def validar_frase(self, frase):
         """
         Valida se uma frase mnemônica está de acordo com BIP39.
-        
+
         Args:
             frase (str): A frase mnemônica com palavras separadas por espaço
-            
+
         Returns:
             tuple: (valida, mensagem, lista_palavras)
         """
-        # Normalizar a frase (remover espaços extras, converter para minúsculas)
-        frase = unicodedata.normalize('NFKD', frase.lower())
-        frase = re.sub(r'\s+', ' ', frase).strip()
-        
-        # Dividir em palavras
-        palavras = frase.split()
-        
+        palavras = self.normalizar(frase).split()
+
         # Verificar número de palavras (deve ser 12, 15, 18, 21 ou 24)
         num_palavras = len(palavras)
-        if num_palavras not in [12, 15, 18, 21, 24]:
+        if num_palavras not in BITS_ENTROPIA:
             return False, f"Número inválido de palavras: {num_palavras}. Deve ser 12, 15, 18, 21 ou 24.", palavras
-        
+
         # Verificar se todas as palavras estão na lista
-        palavras_invalidas = [p for p in palavras if p not in self.wordlist]
+        palavras_invalidas = [p for p in palavras if p not in self.indice]
         if palavras_invalidas:
             return False, f"Palavras inválidas encontradas: {', '.join(palavras_invalidas)}", palavras
-        
+
         # Verificar o checksum
         if not self._verificar_checksum(palavras):
             return False, "Checksum inválido. A frase não é válida de acordo com BIP39.", palavras
-        
+
         return True, "Frase mnemônica válida.", palavras
-    
+
+    def frase_valida(self, frase):
+        """Verifica apenas se a frase é válida (substitui Mnemonic.check)."""
+        return self.validar_frase(frase)[0]
+
+    def _desempacotar(self, palavras):
+        """
+        Converte as palavras em (entropia, checksum, bits_checksum).
+
+        Cada palavra contribui 11 bits; os últimos len(palavras) * 11 / 33 bits são o checksum.
+        """
+        bits = 0
+        for palavra in palavras:
+            bits = (bits << 11) | self.indice[palavra]
+
+        total_bits = len(palavras) * 11
+        bits_checksum = total_bits // 33
+        entropia = (bits >> bits_checksum).to_bytes((total_bits - bits_checksum) // 8, 'big')
+        return entropia, bits & ((1 << bits_checksum) - 1), bits_checksum
+
+    @staticmethod
+    def _checksum(entropia, bits_checksum):
+        # No máximo 8 bits (24 palavras), então o primeiro byte do hash basta
+        return hashlib.sha256(entropia).digest()[0] >> (8 - bits_checksum)
+
     def _verificar_checksum(self, palavras):
         """
         Verifica o checksum de uma frase BIP39.
-        Implementação simplificada para demonstração.
-        
+
         Args:
-            palavras (list): Lista de palavras da frase
-            
+            palavras (list): Lista de palavras da frase (todas presentes na lista oficial)
+
         Returns:
             bool: True se o checksum for válido, False caso contrário
         """
-        # Esta é uma implementação simplificada. Na realidade, o BIP39
-        # requer uma verificação de checksum mais complexa que envolve:
-        # 1. Converter palavras para índices
-        # 2. Converter índices para bits
-        # 3. Calcular o checksum como os primeiros bits do hash SHA-256
-        # 4. Verificar se os bits do checksum correspondem
-        
-        # Implementação simplificada para demonstração
-        # Na prática, usaríamos biblioteca como 'mnemonic'
-        try:
-            # Tentar importar a biblioteca mnemonic
-            from mnemonic import Mnemonic
-            mnemo = Mnemonic("english")
-            return mnemo.check(" ".join(palavras))
-        except ImportError:
-            # Se a biblioteca não estiver disponível, assumimos que a frase é válida
-            # (apenas para fins de demonstração)
-            return True
-    
+        entropia, checksum, bits_checksum = self._desempacotar(palavras)
+        return self._checksum(entropia, bits_checksum) == checksum
+
+    def frase_para_entropia(self, frase):
+        """
+        Recupera a entropia codificada em uma frase válida.
+
+        Returns:
+            bytes: A entropia, ou None se a frase for inválida
+        """
+        valida, _, palavras = self.validar_frase(frase)
+        if not valida:
+            return None
+        return self._desempacotar(palavras)[0]
+
+    def entropia_para_frase(self, entropia):
+        """
+        Codifica uma entropia de 16 a 32 bytes como frase (substitui Mnemonic.to_mnemonic).
+
+        Args:
+            entropia (bytes): 16, 20, 24, 28 ou 32 bytes
+
+        Returns:
+            str: A frase mnemônica
+        """
+        bits_entropia = len(entropia) * 8
+        if bits_entropia not in BITS_ENTROPIA.values():
+            raise ValueError(f"Tamanho de entropia inválido: {len(entropia)} bytes")
+
+        bits_checksum = bits_entropia // 32
+        bits = (int.from_bytes(entropia, 'big') << bits_checksum) | self._checksum(entropia, bits_checksum)
+
+        num_palavras = (bits_entropia + bits_checksum) // 11
+        return " ".join(
+            self.wordlist[(bits >> (11 * (num_palavras - 1 - i))) & 0x7FF]
+            for i in range(num_palavras)
+        )
+
     def gerar_frase(self, comprimento=12):
         """
         Gera uma nova frase mnemônica BIP39.
-        
+
         Args:
             comprimento (int): Comprimento da frase (12, 15, 18, 21 ou 24 palavras)
-            
+
         Returns:
             str: A frase mnemônica gerada
         """
-        try:
-            # Tentar usar a biblioteca mnemonic
-            from mnemonic import Mnemonic
-            mnemo = Mnemonic("english")
-            # Gerar a quantidade correta de entropia para o comprimento desejado
-            entropia_bits = {
-                12: 128, 15: 160, 18: 192, 21: 224, 24: 256
-            }
-            entropia_bytes = entropia_bits[comprimento] // 8
-            entropy = bytes(secrets.token_bytes(entropia_bytes))
-            return mnemo.to_mnemonic(entropy)
-        except (ImportError, NameError):
-            # Implementação alternativa (menos segura, só para demonstração)
-            import random
-            if comprimento not in [12, 15, 18, 21, 24]:
-                comprimento = 12
-            return " ".join(random.choice(self.wordlist) for _ in range(comprimento))
-    
+        if comprimento not in BITS_ENTROPIA:
+            raise ValueError(f"Comprimento inválido: {comprimento}. Deve ser 12, 15, 18, 21 ou 24.")
+        return self.entropia_para_frase(secrets.token_bytes(BITS_ENTROPIA[comprimento] // 8))
+
+    def completar(self, prefixo, limite=8):
+        """
+        Lista as palavras da lista oficial que começam com o prefixo.
+
+        Args:
+            prefixo (str): Início da palavra digitada
+            limite (int): Quantidade máxima de sugestões
+
+        Returns:
+            list: Palavras em ordem alfabética
+        """
+        prefixo = prefixo.strip().lower()
+        if not prefixo:
+            return []
+
+        inicio = bisect.bisect_left(self.wordlist, prefixo)
+        sugestoes = []
+        for palavra in self.wordlist[inicio:inicio + limite]:
+            if not palavra.startswith(prefixo):
+                break
+            sugestoes.append(palavra)
+        return sugestoes
+
     @staticmethod
     def gerar_seed_from_frase(frase, passphrase=""):
         """
-        Gera a seed a partir de uma frase mnemônica.
-        
+        Gera a seed a partir de uma frase mnemônica (PBKDF2-HMAC-SHA512, 2048 iterações).
+
         Args:
             frase (str): A frase mnemônica
             passphrase (str): Passphrase adicional (opcional)
-            
+
         Returns:
-            bytes: A seed
-        """
-        try:
-            # Tentar usar a biblioteca mnemonic
-            from mnemonic import Mnemonic
-            mnemo = Mnemonic("english")
-            return mnemo.to_seed(frase, passphrase)
-        except ImportError:
-            # Implementação alternativa usando PBKDF2 diretamente
-            salt = "mnemonic" + passphrase
-            seed = hashlib.pbkdf2_hmac("sha512", frase.encode(), salt.encode(), 2048, 64)
-            return seed 
\ No newline at end of file
+            bytes: A seed de 64 bytes
+        """
+        frase = BIP39Validator.normalizar(frase)
+        salt = unicodedata.normalize('NFKD', "mnemonic" + passphrase)
+        return hashlib.pbkdf2_hmac("sha512", frase.encode('utf-8'), salt.encode('utf-8'), ITERACOES_SEED, 64)
@@ -0,0 +1,114 @@
+# Fontes pesquisadas: tabela, coluna de título, coluna de descrição (ou None) e coluna de data
+FONTES = {
+    "senha": ("senhas", "titulo", "descricao", "data_criacao"),
+    "nota": ("notas", "titulo", None, "data_criacao"),
+    "arquivo": ("arquivos", "nome_original", "descricao", "data_upload")
+}
+
+# Relevância (menor é melhor)
+RELEVANCIA_TITULO_EXATO = 0
+RELEVANCIA_PREFIXO_TITULO = 1
+RELEVANCIA_TITULO = 2
+RELEVANCIA_DESCRICAO = 3
+
+LIMITE_PADRAO = 200
+
+
+def _escapar_like(texto):
+    """Escapa os curingas do LIKE para que o termo seja buscado literalmente."""
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class BuscaFederada:
+    """
+    Pesquisa em todos os compartimentos desbloqueados com uma única consulta.
+
+    As tabelas senhas, notas e arquivos guardam todos os compartimentos,
+    distinguidos pela coluna compartimento, então a busca é um único SELECT
+    (UNION ALL das três tabelas) filtrado por `compartimento IN (...)`, em vez
+    de uma consulta por compartimento. Os índices de cobertura de
+    GerenciadorIndices começam por compartimento e já contêm título e
+    descrição, então cada compartimento é lido só do índice.
+
+    Cada termo da busca precisa aparecer no título ou na descrição. Os
+    resultados são ordenados por relevância (título exato, prefixo do título,
+    termos no título, termos só na descrição) e depois por título, e cada um
+    informa o compartimento de origem.
+    """
+
+    def __init__(self, fontes=None):
+        """
+        Inicializa a busca.
+
+        Args:
+            fontes (dict, optional): Tipo → (tabela, coluna_titulo, coluna_descricao, coluna_data)
+        """
+        self.fontes = fontes or FONTES
+
+    def _subconsulta(self, tipo, termos, compartimentos):
+        tabela, coluna_titulo, coluna_descricao, coluna_data = self.fontes[tipo]
+        parametros = []
+
+        # Relevância calculada na própria consulta, para que ORDER BY e LIMIT fiquem no SQLite
+        relevancia = (
+            f"CASE WHEN lower({coluna_titulo}) = lower(?) THEN {RELEVANCIA_TITULO_EXATO} "
+            f"WHEN {coluna_titulo} LIKE ? ESCAPE '\\' THEN {RELEVANCIA_PREFIXO_TITULO} "
+        )
+        frase = " ".join(termos)
+        parametros.extend([frase, _escapar_like(frase) + "%"])
+
+        condicoes_titulo = " AND ".join(f"{coluna_titulo} LIKE ? ESCAPE '\\'" for _ in termos)
+        relevancia += f"WHEN {condicoes_titulo} THEN {RELEVANCIA_TITULO} ELSE {RELEVANCIA_DESCRICAO} END"
+        parametros.extend(f"%{_escapar_like(termo)}%" for termo in termos)
+
+        coluna_descricao_sql = coluna_descricao or "NULL"
+        sql = (
+            f"SELECT '{tipo}' AS tipo, id, {coluna_titulo} AS titulo, {coluna_descricao_sql} AS descricao, "
+            f"compartimento, {coluna_data} AS data, {relevancia} AS relevancia "
+            f"FROM {tabela} WHERE compartimento IN ({', '.join('?' for _ in compartimentos)})"
+        )
+        parametros.extend(compartimentos)
+
+        for termo in termos:
+            padrao = f"%{_escapar_like(termo)}%"
+            if coluna_descricao:
+                sql += f" AND ({coluna_titulo} LIKE ? ESCAPE '\\' OR {coluna_descricao} LIKE ? ESCAPE '\\')"
+                parametros.extend([padrao, padrao])
+            else:
+                sql += f" AND {coluna_titulo} LIKE ? ESCAPE '\\'"
+                parametros.append(padrao)
+
+        return sql, parametros
+
+    def pesquisar(self, cursor, termo_busca, compartimentos, tipos=None, limite=LIMITE_PADRAO):
+        """
+        Pesquisa o termo em todos os compartimentos informados.
+
+        Args:
+            cursor (sqlite3.Cursor): Cursor do banco de dados
+            termo_busca (str): Termos separados por espaço
+            compartimentos (list): Compartimentos desbloqueados na sessão
+            tipos (list, optional): Subconjunto de "senha", "nota" e "arquivo"
+            limite (int): Quantidade máxima de resultados
+
+        Returns:
+            list: Dicionários com tipo, id, titulo, descricao, compartimento, data e relevancia
+        """
+        termos = termo_busca.split()
+        compartimentos = list(dict.fromkeys(compartimentos))
+        if not termos or not compartimentos:
+            return []
+
+        consultas = []
+        parametros = []
+        for tipo in tipos or self.fontes:
+            sql, parametros_tipo = self._subconsulta(tipo, termos, compartimentos)
+            consultas.append(sql)
+            parametros.extend(parametros_tipo)
+
+        sql = " UNION ALL ".join(consultas) + " ORDER BY relevancia, titulo COLLATE NOCASE LIMIT ?"
+        parametros.append(limite)
+
+        cursor.execute(sql, parametros)
+        colunas = [coluna[0] for coluna in cursor.description]
+        return [dict(zip(colunas, linha)) for linha in cursor.fetchall()]
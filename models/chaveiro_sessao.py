@@ -0,0 +1,242 @@
+import hmac
+import time
+import hashlib
+import secrets
+import threading
+
+from models.memoria_segura import BufferSeguro
+from models.contexto_cifra import ContextoCifra, VERSAO_AAD
+
+
+# Tempo de inatividade, em segundos, após o qual um compartimento é bloqueado novamente
+TEMPO_LIMITE_PADRAO = 15 * 60
+
+
+class _EntradaChave:
+    """Chave de um compartimento desbloqueado (e a que protege as suas versões), guardadas em BufferSeguro."""
+
+    __slots__ = ("chave", "chave_versoes", "tempo_limite", "ultimo_uso", "referencia", "contexto")
+
+    def __init__(self, chave, tempo_limite, referencia, chave_versoes=None):
+        # Um BufferSeguro passa a pertencer ao chaveiro; outros valores são copiados para um
+        self.chave = chave if isinstance(chave, BufferSeguro) else BufferSeguro(chave)
+        self.chave_versoes = None
+        if chave_versoes is not None:
+            self.chave_versoes = chave_versoes if isinstance(chave_versoes, BufferSeguro) else BufferSeguro(chave_versoes)
+        self.tempo_limite = tempo_limite
+        self.ultimo_uso = time.monotonic()
+        self.referencia = referencia
+        self.contexto = None
+
+    def expirada(self, agora):
+        return self.tempo_limite is not None and agora - self.ultimo_uso > self.tempo_limite
+
+    def zerar(self):
+        if self.contexto is not None:
+            self.contexto.descartar()
+            self.contexto = None
+        if self.chave_versoes is not None:
+            self.chave_versoes.zerar()
+        self.chave.zerar()
+
+
+class ChaveiroSessao:
+    """
+    Chaves dos compartimentos desbloqueados durante a sessão.
+
+    Depois do primeiro desbloqueio (senha ou frase mnemônica), voltar a um
+    compartimento é uma consulta a um dicionário, sem repetir a derivação de
+    chave. Cada chave expira após `tempo_limite` segundos sem uso, pode ser
+    bloqueada individualmente e é zerada ao ser removida; bloquear_todos()
+    é chamado no logout.
+
+    Um compartimento pode ser associado a uma referência (por exemplo, a frase
+    mnemônica normalizada). A referência é guardada apenas como HMAC com uma
+    chave aleatória da sessão, e localizar() encontra o compartimento sem
+    que a frase precise ficar em memória.
+    """
+
+    def __init__(self, tempo_limite=TEMPO_LIMITE_PADRAO, versao_cifra=VERSAO_AAD, preparar_contexto=None):
+        """
+        Inicializa o chaveiro.
+
+        Args:
+            tempo_limite (float): Segundos de inatividade até o bloqueio automático (None desativa)
+            versao_cifra (int): Versão de cifra dos registros gravados pelos contextos (ver ContextoCifra)
+            preparar_contexto (callable, optional): Recebe cada contexto recém-criado, ou que acabou de receber a
+                                                    chave das versões (ex.: para carregar as versões rotacionadas)
+        """
+        self.tempo_limite = tempo_limite
+        self.versao_cifra = versao_cifra
+        self.preparar_contexto = preparar_contexto
+        self._entradas = {}
+        self._referencias = {}
+        self._chave_referencias = secrets.token_bytes(32)
+        self._trava = threading.RLock()
+
+    def _digerir(self, referencia):
+        if isinstance(referencia, str):
+            referencia = referencia.encode('utf-8')
+        return hmac.new(self._chave_referencias, referencia, hashlib.sha256).digest()
+
+    def _remover(self, compartimento):
+        entrada = self._entradas.pop(compartimento, None)
+        if entrada is None:
+            return False
+        if entrada.referencia is not None:
+            self._referencias.pop(entrada.referencia, None)
+        entrada.zerar()
+        return True
+
+    def guardar(self, compartimento, chave, referencia=None, expira=True, chave_versoes=None):
+        """
+        Guarda a chave de um compartimento desbloqueado.
+
+        Args:
+            compartimento (str): Identificador do compartimento
+            chave (bytes ou BufferSeguro): Chave do compartimento (um BufferSeguro é guardado sem cópia)
+            referencia (str|bytes, optional): Valor que também localiza o compartimento (ex.: a frase)
+            expira (bool): False para chaves válidas até o fim da sessão (ex.: a do compartimento principal)
+            chave_versoes (bytes ou BufferSeguro, optional): Chave que protege as versões rotacionadas
+        """
+        with self._trava:
+            self._remover(compartimento)
+            digest = self._digerir(referencia) if referencia is not None else None
+            self._entradas[compartimento] = _EntradaChave(
+                chave, self.tempo_limite if expira else None, digest, chave_versoes
+            )
+            if digest is not None:
+                self._referencias[digest] = compartimento
+
+    def definir_chave_versoes(self, compartimento, chave_versoes):
+        """
+        Associa a chave que protege as versões a um compartimento já desbloqueado.
+
+        Returns:
+            bool: False se o compartimento estiver bloqueado (a chave é zerada)
+        """
+        if not isinstance(chave_versoes, BufferSeguro):
+            chave_versoes = BufferSeguro(chave_versoes)
+        with self._trava:
+            entrada = self._entrada_ativa(compartimento, renovar=False)
+            if entrada is None:
+                chave_versoes.zerar()
+                return False
+            if entrada.chave_versoes is not None and entrada.chave_versoes is not chave_versoes:
+                entrada.chave_versoes.zerar()
+            entrada.chave_versoes = chave_versoes
+            if entrada.contexto is not None:
+                # O contexto já criado passa a ler as versões que dependiam desta chave
+                entrada.contexto.chave_versoes = chave_versoes
+                if self.preparar_contexto is not None:
+                    self.preparar_contexto(entrada.contexto)
+            return True
+
+    def chave_versoes(self, compartimento):
+        """Chave que protege as versões de um compartimento desbloqueado (None se bloqueado ou sem ela), sem renovar o prazo."""
+        with self._trava:
+            entrada = self._entrada_ativa(compartimento, renovar=False)
+            return entrada.chave_versoes if entrada is not None else None
+
+    def _entrada_ativa(self, compartimento, renovar=True):
+        entrada = self._entradas.get(compartimento)
+        if entrada is None:
+            return None
+
+        agora = time.monotonic()
+        if entrada.expirada(agora):
+            self._remover(compartimento)
+            return None
+
+        if renovar:
+            entrada.ultimo_uso = agora
+        return entrada
+
+    def obter(self, compartimento):
+        """
+        Retorna a chave de um compartimento desbloqueado e renova o seu prazo.
+
+        Returns:
+            BufferSeguro: A própria chave guardada (sem cópia), zerada quando o compartimento
+                          for bloqueado; None se estiver bloqueado ou tiver expirado
+        """
+        with self._trava:
+            entrada = self._entrada_ativa(compartimento)
+            return entrada.chave if entrada is not None else None
+
+    def contexto(self, compartimento, renovar=True):
+        """
+        Retorna o contexto de cifra de um compartimento desbloqueado e renova o seu prazo.
+
+        Tarefas de segundo plano passam renovar=False, para não manter o compartimento desbloqueado.
+
+        O contexto é criado no primeiro uso após o desbloqueio e reutilizado até o
+        compartimento ser bloqueado, quando é descartado junto com a chave. Ele
+        grava com a versão de cifra atual do chaveiro, mesmo que ela mude na sessão.
+
+        Returns:
+            ContextoCifra: O contexto, ou None se o compartimento estiver bloqueado ou tiver expirado
+        """
+        with self._trava:
+            entrada = self._entrada_ativa(compartimento, renovar)
+            if entrada is None:
+                return None
+            if entrada.contexto is None:
+                contexto = ContextoCifra(entrada.chave, compartimento, self.versao_cifra)
+                contexto.chave_versoes = entrada.chave_versoes
+                if self.preparar_contexto is not None:
+                    self.preparar_contexto(contexto)
+                entrada.contexto = contexto
+            entrada.contexto.versao = self.versao_cifra
+            return entrada.contexto
+
+    def localizar(self, referencia):
+        """Retorna o compartimento associado a uma referência, se ele ainda estiver desbloqueado."""
+        with self._trava:
+            compartimento = self._referencias.get(self._digerir(referencia))
+            if compartimento is None or self.obter(compartimento) is None:
+                return None
+            return compartimento
+
+    def desbloqueado(self, compartimento):
+        """Verifica se um compartimento está desbloqueado, sem renovar o seu prazo."""
+        with self._trava:
+            entrada = self._entradas.get(compartimento)
+            return entrada is not None and not entrada.expirada(time.monotonic())
+
+    def desbloqueados(self):
+        """Lista os compartimentos desbloqueados."""
+        self.expirar()
+        with self._trava:
+            return list(self._entradas)
+
+    def bloquear(self, compartimento):
+        """
+        Remove e zera a chave de um compartimento.
+
+        Returns:
+            bool: True se o compartimento estava desbloqueado
+        """
+        with self._trava:
+            return self._remover(compartimento)
+
+    def expirar(self):
+        """
+        Bloqueia os compartimentos inativos há mais que o tempo limite.
+
+        Returns:
+            list: Compartimentos bloqueados
+        """
+        with self._trava:
+            agora = time.monotonic()
+            expirados = [comp for comp, entrada in self._entradas.items() if entrada.expirada(agora)]
+            for compartimento in expirados:
+                self._remover(compartimento)
+            return expirados
+
+    def bloquear_todos(self):
+        """Zera e remove todas as chaves (logout)."""
+        with self._trava:
+            for compartimento in list(self._entradas):
+                self._remover(compartimento)
+            self._referencias.clear()
@@ -1,5 +1,4 @@
 import os
-import sqlite3
 import json
 import datetime
 import secrets
@@ -8,6 +7,20 @@ from dateutil.relativedelta import relativedelta
 
 from models.crypto_utils import CryptoUtils
 from models.bip39_validator import BIP39Validator
+from models.derivacao_seed import ServicoDerivacaoSeed, futuro_concluido
+from models.impressao_frase import ImpressaoFrase
+from models.guarda_autenticacao import GuardaAutenticacao
+from models.perfis_kdf import PerfilKDF, PERFIL_LEGADO, ALVO_PADRAO_MS, calibrar, precisa_atualizar
+from models.autenticacao import MotorAutenticacao
+from models.rastreador_sql import RastreadorSQL
+from models.gerenciador_indices import GerenciadorIndices
+from models.chaveiro_sessao import ChaveiroSessao
+from models.memoria_segura import BufferSeguro
+from models.layout_compartimentos import LayoutCompartimentos, MigradorCompartimentos
+from models.busca_federada import BuscaFederada
+
+# Colunas devolvidas por listar_senhas: tudo o que a tabela mostra, sem a senha nem as notas
+COLUNAS_LISTAGEM_SENHAS = ("id", "titulo", "usuario", "url", "categoria", "categoria_id", "data_criacao", "data_modificacao")
 
 class CofreDigitalModel:
     """Modelo principal do Cofre Digital Póstumo."""
@@ -32,7 +45,6 @@ class CofreDigitalModel:
         self.usuario_atual = None
         self.modo_heranca_ativo = False
         self.compartimento_ativo = "principal"
-        self.chave_compartimento_ativo = None
         self.tentativas_senha = 0
         
         # Configuração padrão
@@ -44,15 +56,84 @@ class CofreDigitalModel:
             "autodestruicao_ativada": False,
             "nome_exibicao": "Cofre Digital Póstumo",
             "email_notificacao": "",
-            "periodo_notificacao": 15  # dias antes do vencimento
+            "periodo_notificacao": 15,  # dias antes do vencimento
+            "limite_consulta_lenta_ms": 100,
+            "tempo_bloqueio_compartimento_min": 15,  # inatividade até bloquear um compartimento
+            "backup_automatico": True,
+            "intervalo_backup_horas": 24,
+            "backups_mantidos": 7,
+            "limite_backup_mb_s": 8,  # taxa máxima de leitura do backup automático
+            "carga_maxima_backup": 0.5,  # fração do tempo ocupada pelo backup automático
+            "alvo_kdf_ms": ALVO_PADRAO_MS,  # latência de desbloqueio buscada na calibração da derivação
+            "perfil_kdf": None,  # perfil calibrado nesta máquina (ver models/perfis_kdf.py)
+            "ultimo_backup_automatico": None
         }
         
         # Utilitários
         self.crypto = CryptoUtils()
         self.bip39 = BIP39Validator()
+        self.derivacao_seed = ServicoDerivacaoSeed()
+        self.impressao_frase = ImpressaoFrase(self.conectar, self.bip39)
+        self.guarda = GuardaAutenticacao(self.conectar, self.registrar_logs)
+        self.rastreador = RastreadorSQL(self.caminho_db, self.config["limite_consulta_lenta_ms"], registrar_log=self.registrar_log)
+        self.layout = LayoutCompartimentos()
         
         # Inicializar banco de dados e configurações
         self.inicializar_sistema()
+        
+        # Migrar em segundo plano as tabelas por compartimento para as tabelas compartilhadas
+        self.migrador_compartimentos = MigradorCompartimentos(self.conectar, self.layout, registrar_log=self.registrar_log)
+        self.migrador_compartimentos.iniciar()
+        
+        # Chaves dos compartimentos desbloqueados na sessão
+        self.chaveiro = ChaveiroSessao(self.config.get("tempo_bloqueio_compartimento_min", 15) * 60)
+    
+    @property
+    def chave_compartimento_ativo(self):
+        """Chave do compartimento ativo (o BufferSeguro do chaveiro); se ele expirou, a sessão volta ao principal."""
+        chave = self.chaveiro.obter(self.compartimento_ativo)
+        if chave is None and self.compartimento_ativo != "principal":
+            self.compartimento_ativo = "principal"
+            chave = self.chaveiro.obter("principal")
+        return chave
+    
+    def encerrar_sessao(self):
+        """Encerra a sessão, zerando as chaves de todos os compartimentos."""
+        self.usuario_autenticado = False
+        self.usuario_atual = None
+        self.modo_heranca_ativo = False
+        self.compartimento_ativo = "principal"
+        self.chaveiro.bloquear_todos()
+        self.derivacao_seed.limpar()
+    
+    @property
+    def perfil_kdf(self):
+        """Perfil de derivação configurado, calibrado nesta máquina na primeira vez que é necessário."""
+        if not self.config.get("perfil_kdf"):
+            self.config["perfil_kdf"] = calibrar(self.config.get("alvo_kdf_ms", ALVO_PADRAO_MS)).codificar()
+            self.salvar_configuracoes()
+            self.registrar_log("sistema", f"Derivação de chaves calibrada: {self.config['perfil_kdf']}")
+        return PerfilKDF.decodificar(self.config["perfil_kdf"])
+    
+    def _atualizar_registro_senha(self, id_usuario, papel, senha, chave, registros):
+        """
+        Refaz o registro de senha de um papel recém-autenticado, se ainda não for dividido ou o perfil configurado for mais forte.
+
+        A chave de dados continua a mesma: só a derivação que a protege muda.
+        """
+        coluna, outra_coluna = ("hash_senha", "hash_senha_heranca") if papel == "principal" else ("hash_senha_heranca", "hash_senha")
+        perfil = self.perfil_kdf
+        if not MotorAutenticacao.precisa_atualizar(registros[coluna], perfil):
+            return
+        
+        registro = MotorAutenticacao.atualizar(senha, papel, chave, perfil, registros[outra_coluna])
+        conn = self.conectar()
+        try:
+            conn.execute(f"UPDATE usuarios SET {coluna} = ? WHERE id = ?", (registro, id_usuario))
+            conn.commit()
+        finally:
+            conn.close()
+        self.registrar_log("sistema", f"Registro de senha atualizado para {perfil.codificar()}")
     
     def inicializar_sistema(self):
         """Inicializa o banco de dados e configurações."""
@@ -68,9 +149,13 @@ class CofreDigitalModel:
         # Verificar modo de herança
         self.verificar_modo_heranca()
     
+    def conectar(self):
+        """Abre uma conexão rastreada com o banco de dados."""
+        return self.rastreador.conectar()
+    
     def criar_estrutura_db(self):
         """Cria a estrutura inicial do banco de dados."""
-        conn = sqlite3.connect(self.caminho_db)
+        conn = self.conectar()
         cursor = conn.cursor()
         
         # Tabela de usuários
@@ -88,50 +173,8 @@ class CofreDigitalModel:
         )
         """)
         
-        # Tabela de senhas
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS senhas (
-            id INTEGER PRIMARY KEY,
-            titulo TEXT NOT NULL,
-            senha TEXT NOT NULL,
-            usuario TEXT,
-            url TEXT,
-            categoria TEXT,
-            notas TEXT,
-            data_criacao TEXT NOT NULL,
-            data_modificacao TEXT
-        )
-        """)
-        
-        # Tabela de notas
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS notas (
-            id INTEGER PRIMARY KEY,
-            titulo TEXT NOT NULL,
-            conteudo_criptografado TEXT NOT NULL,
-            iv TEXT NOT NULL,
-            data_criacao TEXT NOT NULL,
-            data_modificacao TEXT NOT NULL,
-            categoria_id INTEGER,
-            compartimento TEXT DEFAULT 'principal',
-            FOREIGN KEY (categoria_id) REFERENCES categorias (id)
-        )
-        """)
-        
-        # Tabela de arquivos
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS arquivos (
-            id INTEGER PRIMARY KEY,
-            nome_original TEXT NOT NULL,
-            nome_criptografado TEXT NOT NULL,
-            descricao TEXT,
-            iv TEXT NOT NULL,
-            data_upload TEXT NOT NULL,
-            categoria_id INTEGER,
-            compartimento TEXT DEFAULT 'principal',
-            FOREIGN KEY (categoria_id) REFERENCES categorias (id)
-        )
-        """)
+        # Tabelas de senhas, notas, arquivos e carteiras, compartilhadas por todos os compartimentos
+        LayoutCompartimentos.criar_estrutura(cursor)
         
         # Tabela de categorias
         cursor.execute("""
@@ -162,25 +205,9 @@ class CofreDigitalModel:
             chave_criptografada TEXT NOT NULL,
             iv TEXT NOT NULL,
             descricao TEXT,
-            data_criacao TEXT NOT NULL
-        )
-        """)
-        
-        # Tabela de carteiras BTC
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS carteiras_btc (
-            id INTEGER PRIMARY KEY,
-            nome TEXT NOT NULL,
-            descricao TEXT,
-            frase_criptografada TEXT NOT NULL,
-            iv TEXT NOT NULL,
-            passphrase_criptografada TEXT,
-            iv_passphrase TEXT,
             data_criacao TEXT NOT NULL,
-            data_modificacao TEXT NOT NULL,
-            categoria_id INTEGER,
-            compartimento TEXT DEFAULT 'principal',
-            FOREIGN KEY (categoria_id) REFERENCES categorias (id)
+            salt TEXT,  -- salt da derivação da chave a partir da senha do compartimento
+            kdf TEXT  -- perfil dessa derivação (NULL: PBKDF2-SHA256 com 100.000 iterações)
         )
         """)
         
@@ -198,6 +225,15 @@ class CofreDigitalModel:
         )
         """)
         
+        # Impressões indexadas das frases de usuários e compartimentos
+        ImpressaoFrase.criar_estrutura(cursor)
+        
+        # Tentativas de autenticação, preservadas entre reinícios
+        GuardaAutenticacao.criar_estrutura(cursor)
+        
+        # Tabela de diagnóstico de consultas lentas
+        RastreadorSQL.criar_estrutura(cursor)
+        
         conn.commit()
         conn.close()
         
@@ -207,79 +243,33 @@ class CofreDigitalModel:
     def verificar_estrutura_db(self):
         """Verifica e atualiza a estrutura do banco de dados conforme necessário."""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
-            # Verificar se a tabela senhas tem todas as colunas necessárias
-            cursor.execute("PRAGMA table_info(senhas)")
-            colunas = {info[1] for info in cursor.fetchall()}
-            
-            # Colunas que devem existir na tabela senhas
-            colunas_necessarias = {
-                "titulo", "senha", "usuario", "url", "categoria", "notas", 
-                "data_criacao", "data_modificacao"
-            }
+            # Unificar os esquemas de senhas do modelo e do cofre, sem descartar colunas de nenhum dos dois
+            mensagens_layout = self.layout.atualizar_estrutura(cursor)
+            conn.commit()
             
-            # Verificar se alguma coluna está faltando
-            colunas_faltando = colunas_necessarias - colunas
+            # Compartimentos precisam do salt para derivar novamente a chave a partir da senha
+            cursor.execute("PRAGMA table_info(compartimentos)")
+            colunas_compartimentos = {info[1] for info in cursor.fetchall()}
+            if "salt" not in colunas_compartimentos:
+                cursor.execute("ALTER TABLE compartimentos ADD COLUMN salt TEXT")
+                conn.commit()
             
-            # Se houver colunas faltando, adicionar uma a uma
-            if colunas_faltando:
-                self.registrar_log("sistema", f"Atualizando estrutura da tabela senhas. Adicionando colunas: {', '.join(colunas_faltando)}")
-                
-                # SQLite não permite ALTER TABLE ADD COLUMN com NOT NULL sem valor padrão
-                # Por isso, vamos recriar a tabela se ela estiver muito diferente
-                
-                if "senha" in colunas_faltando or "titulo" in colunas_faltando or "data_criacao" in colunas_faltando:
-                    # Casos que exigiriam NOT NULL, melhor recriar a tabela
-                    # Primeiro, fazer backup da tabela existente
-                    try:
-                        cursor.execute("ALTER TABLE senhas RENAME TO senhas_old")
-                        
-                        # Criar a nova tabela com a estrutura correta
-                        cursor.execute("""
-                        CREATE TABLE senhas (
-                            id INTEGER PRIMARY KEY,
-                            titulo TEXT NOT NULL,
-                            senha TEXT NOT NULL,
-                            usuario TEXT,
-                            url TEXT,
-                            categoria TEXT,
-                            notas TEXT,
-                            data_criacao TEXT NOT NULL,
-                            data_modificacao TEXT
-                        )
-                        """)
-                        
-                        # Transferir dados da tabela antiga para a nova (apenas colunas existentes)
-                        cursor.execute("PRAGMA table_info(senhas_old)")
-                        colunas_old = [info[1] for info in cursor.fetchall()]
-                        
-                        # Colunas em comum entre ambas as tabelas
-                        colunas_comuns = list(set(colunas_old) & set(["id", "titulo", "senha", "usuario", "url", "categoria", "notas", "data_criacao", "data_modificacao"]))
-                        
-                        if colunas_comuns:
-                            # Copiar dados preservando as colunas em comum
-                            colunas_str = ", ".join(colunas_comuns)
-                            cursor.execute(f"INSERT INTO senhas ({colunas_str}) SELECT {colunas_str} FROM senhas_old")
-                        
-                        # Excluir tabela antiga
-                        cursor.execute("DROP TABLE senhas_old")
-                        
-                    except Exception as e:
-                        self.registrar_log("erro", f"Erro ao recriar tabela senhas: {str(e)}")
-                else:
-                    # Adicionar apenas colunas opcionais (sem NOT NULL)
-                    for coluna in colunas_faltando:
-                        try:
-                            cursor.execute(f"ALTER TABLE senhas ADD COLUMN {coluna} TEXT")
-                        except Exception as e:
-                            self.registrar_log("erro", f"Erro ao adicionar coluna {coluna}: {str(e)}")
-                            pass
-                
+            # Perfil da derivação da senha de cada compartimento
+            if "kdf" not in colunas_compartimentos:
+                cursor.execute("ALTER TABLE compartimentos ADD COLUMN kdf TEXT")
                 conn.commit()
             
+            # Criar e manter os índices de cobertura das listagens
+            mensagens_indices = GerenciadorIndices().aplicar_e_verificar(cursor)
+            conn.commit()
             conn.close()
+            
+            for mensagem in mensagens_layout + mensagens_indices:
+                self.registrar_log("sistema", mensagem)
+            
             return True
             
         except Exception as e:
@@ -295,6 +285,9 @@ class CofreDigitalModel:
                     # Atualizar configurações existentes
                     for chave, valor in configuracoes.items():
                         self.config[chave] = valor
+                
+                # Aplicar o limite de consultas lentas configurado
+                self.rastreador.limite_lento_ms = self.config.get("limite_consulta_lenta_ms", 100)
             else:
                 # Criar arquivo de configuração padrão
                 self.salvar_configuracoes()
@@ -404,7 +397,7 @@ class CofreDigitalModel:
         """Configura o usuário principal do sistema."""
         try:
             # Verificar se já existe um usuário
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             cursor.execute("SELECT COUNT(*) FROM usuarios")
@@ -414,23 +407,32 @@ class CofreDigitalModel:
                 conn.close()
                 return False, "Já existe um usuário configurado"
             
-            # Criar hash da senha principal
-            hash_senha, salt = self.crypto.hash_senha(senha)
-            
-            # Criar hash da senha de herança
-            hash_senha_heranca, salt_heranca = self.crypto.hash_senha(senha_heranca)
+            # Calibrar a derivação nesta máquina e criar os registros das duas senhas com o mesmo
+            # salt, para que um login confira as duas com uma derivação; os dois papéis protegem a
+            # mesma chave de dados aleatória, então o herdeiro abre o mesmo cofre (as colunas salt e
+            # salt_heranca só servem a registros anteriores)
+            perfil = self.perfil_kdf
+            salt_registros = secrets.token_bytes(16)
+            with BufferSeguro(secrets.token_bytes(32)) as chave_dados:
+                hash_senha = MotorAutenticacao.criar_registro(senha, "principal", chave_dados, perfil, salt_registros)
+                hash_senha_heranca = MotorAutenticacao.criar_registro(
+                    senha_heranca, "heranca", chave_dados, perfil, salt_registros
+                )
+            salt, salt_heranca = secrets.token_hex(16), secrets.token_hex(16)
             
             # Gerar seed para backup
             seed_hex = None
             frase_mnemonica = None
+            impressao = None
             
             try:
                 # Gerar entropia aleatória (128 bits = 16 bytes = frase de 12 palavras)
                 frase_mnemonica = self.bip39.gerar_frase(12)
                 
                 # Gerar seed a partir da frase (com senha vazia como passphrase)
-                seed = self.bip39.gerar_seed_from_frase(frase_mnemonica, "")
+                seed = self.derivacao_seed.derivar(frase_mnemonica)
                 seed_hex = seed.hex()
+                impressao = self.impressao_frase.calcular(frase_mnemonica)
                 
                 # Registrar log
                 self.registrar_log("sistema", "Frase mnemônica gerada com sucesso")
@@ -439,8 +441,9 @@ class CofreDigitalModel:
             
             # Inserir usuário
             cursor.execute(
-                "INSERT INTO usuarios (nome, hash_senha, salt, hash_senha_heranca, salt_heranca, data_criacao, seed_hex, email) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                (nome, hash_senha, salt, hash_senha_heranca, salt_heranca, datetime.datetime.now().isoformat(), seed_hex, email)
+                "INSERT INTO usuarios (nome, hash_senha, salt, hash_senha_heranca, salt_heranca, data_criacao, seed_hex, email, impressao_frase) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (nome, hash_senha, salt, hash_senha_heranca, salt_heranca, datetime.datetime.now().isoformat(), seed_hex, email, impressao)
             )
             
             conn.commit()
@@ -461,8 +464,13 @@ class CofreDigitalModel:
     def autenticar(self, senha):
         """Autentica o usuário no sistema."""
         try:
+            # Durante o bloqueio por tentativas, recusar antes de qualquer derivação
+            permitido, espera = self.guarda.verificar("senha")
+            if not permitido:
+                return False, f"Muitas tentativas incorretas. Tente novamente em {espera} segundos.", False
+            
             # Obter dados do usuário
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             cursor.execute("SELECT id, nome, hash_senha, salt, hash_senha_heranca, salt_heranca FROM usuarios LIMIT 1")
@@ -474,57 +482,125 @@ class CofreDigitalModel:
                 return False, "Usuário não encontrado", False
             
             id_usuario, nome, hash_senha, salt, hash_senha_heranca, salt_heranca = resultado
+            conn.close()
             
-            # Verificar senha principal
-            hash_verificacao, _ = self.crypto.hash_senha(senha, salt)
-            senha_principal_correta = hash_verificacao == hash_senha
+            # Conferir as duas senhas de uma vez: uma derivação quando os registros compartilham o salt,
+            # sempre as mesmas comparações, e a chave de dados já sai da mesma derivação
+            papel, chave = MotorAutenticacao.verificar(senha, {
+                "principal": (hash_senha, salt),
+                "heranca": (hash_senha_heranca, salt_heranca)
+            })
+            
+            if papel is not None and chave is None:
+                # Registro anterior aos registros divididos: a chave ainda é derivada do salt do papel
+                salt_papel = salt if papel == "principal" else salt_heranca
+                chave, _ = self.crypto.gerar_chave_derivada(senha, salt_papel.encode() if isinstance(salt_papel, str) else salt_papel)
+            
+            if papel is not None:
+                self._atualizar_registro_senha(id_usuario, papel, senha, chave, {
+                    "hash_senha": hash_senha, "hash_senha_heranca": hash_senha_heranca
+                })
             
-            # Verificar senha de herança
-            hash_verificacao_heranca, _ = self.crypto.hash_senha(senha, salt_heranca)
-            senha_heranca_correta = hash_verificacao_heranca == hash_senha_heranca
+            if papel is not None:
+                self.tentativas_senha = 0
+                self.guarda.registrar_sucesso("senha")
             
-            if senha_principal_correta:
+            if papel == "principal":
                 # Senha principal correta
                 self.usuario_autenticado = True
                 self.usuario_atual = {"id": id_usuario, "nome": nome}
                 self.registrar_log("autenticacao", f"Usuário {nome} autenticado com sucesso")
                 
-                # Gerar chave para o compartimento principal
-                chave, _ = self.crypto.gerar_chave_derivada(senha, salt.encode() if isinstance(salt, str) else salt)
-                self.chave_compartimento_ativo = chave
+                # Chave do compartimento principal, válida até o logout
+                self.compartimento_ativo = "principal"
+                self.chaveiro.guardar("principal", chave, expira=False)
                 
                 # Verificar modo de herança
                 modo_heranca = self.verificar_modo_heranca()
                 
                 return True, "Autenticação bem-sucedida", modo_heranca
                 
-            elif senha_heranca_correta:
+            elif papel == "heranca":
                 # Senha de herança correta - modo de herança ativado
                 self.usuario_autenticado = True
                 self.usuario_atual = {"id": id_usuario, "nome": nome}
                 self.modo_heranca_ativo = True
                 self.registrar_log("autenticacao", f"Usuário {nome} autenticado com senha de herança")
                 
-                # Gerar chave para o compartimento principal
-                chave, _ = self.crypto.gerar_chave_derivada(senha, salt_heranca.encode() if isinstance(salt_heranca, str) else salt_heranca)
-                self.chave_compartimento_ativo = chave
+                # Chave do compartimento principal, válida até o logout
+                self.compartimento_ativo = "principal"
+                self.chaveiro.guardar("principal", chave, expira=False)
                 
                 return True, "Autenticação com senha de herança bem-sucedida", True
             
             else:
-                # Senha incorreta
+                # Senha incorreta: falha gravada no controle de tentativas (com log em lote); a
+                # autodestruição conta só as falhas desta sessão, as gravadas servem ao atraso
+                maximo = self.config.get("max_tentativas_senha", 5)
+                self.guarda.registrar_falha("senha", maximo)
                 self.tentativas_senha += 1
-                self.registrar_log("autenticacao", f"Tentativa de autenticação falhou: senha incorreta ({self.tentativas_senha})")
                 
-                return False, "Senha incorreta", False
+                if self.tentativas_senha >= maximo:
+                    if self.config.get("autodestruicao_ativada", False):
+                        self.guarda.descarregar()
+                        self.autodestruir()
+                        return False, "Número máximo de tentativas excedido. Dados apagados.", False
+                    return False, "Número máximo de tentativas excedido. Acesso bloqueado temporariamente.", False
+                
+                return False, f"Senha incorreta. Tentativas restantes: {maximo - self.tentativas_senha}", False
                 
         except Exception as e:
             self.registrar_log("erro", f"Erro ao autenticar: {str(e)}")
             return False, f"Erro ao autenticar: {str(e)}", False
     
+    def autodestruir(self):
+        """Apaga senhas, notas, arquivos e carteiras de todos os compartimentos."""
+        try:
+            self.registrar_log("sistema", "Iniciando autodestruição dos dados")
+            
+            conn = self.conectar()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+            existentes = {nome for (nome,) in cursor.fetchall()}
+            
+            # Tabelas compartilhadas e, se o cofre legado as criou, as de blocos dos arquivos
+            for tabela in ("senhas", "notas", "arquivo_blocos", "blocos", "arquivos", "carteiras_btc",
+                           "versoes_chave", "rotacoes_chave"):
+                if tabela in existentes:
+                    cursor.execute(f"DELETE FROM {tabela}")
+            
+            # Tabelas por compartimento que ainda não foram migradas
+            for tabela, _, _ in self.layout.tabelas_legadas(cursor):
+                cursor.execute(f'DROP TABLE "{tabela}"')
+            self.layout.pendentes.clear()
+            
+            conn.commit()
+            conn.close()
+            
+            self.registrar_log("sistema", "Autodestruição concluída")
+            return True, "Dados apagados com sucesso"
+        except Exception as e:
+            self.registrar_log("erro", f"Erro durante autodestruição: {str(e)}")
+            return False, f"Erro durante autodestruição: {str(e)}"
+    
+    def derivar_seed_frase(self, frase):
+        """Inicia a derivação da seed em segundo plano (None imediato para frases inválidas ou desconhecidas)."""
+        if self.guarda.espera("frase"):
+            return futuro_concluido(None)
+        impressao = self.impressao_frase.calcular(frase)
+        if impressao is None or not self.impressao_frase.pode_corresponder("usuarios", impressao):
+            return futuro_concluido(None)
+        return self.derivacao_seed.derivar_async(frase)
+    
     def autenticar_por_frase(self, frase):
         """Autentica o usuário usando a frase mnemônica."""
         try:
+            # Mesmo controle de tentativas da senha, em um alvo próprio, antes de qualquer derivação
+            permitido, espera = self.guarda.verificar("frase")
+            if not permitido:
+                return False, f"Muitas tentativas incorretas. Tente novamente em {espera} segundos.", False
+            
             # Validar a frase primeiro
             valida, mensagem, _ = self.bip39.validar_frase(frase)
             
@@ -532,35 +608,48 @@ class CofreDigitalModel:
                 return False, mensagem, False
             
             # Obter dados do usuário
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
-            cursor.execute("SELECT id, nome, seed_hex FROM usuarios LIMIT 1")
+            cursor.execute("SELECT id, nome, seed_hex, impressao_frase FROM usuarios LIMIT 1")
             resultado = cursor.fetchone()
+            conn.close()
             
             if not resultado:
                 self.registrar_log("autenticacao", "Tentativa de autenticação com frase falhou: usuário não encontrado")
                 return False, "Usuário não encontrado", False
             
-            id_usuario, nome, seed_hex = resultado
+            id_usuario, nome, seed_hex, impressao_gravada = resultado
             
             if not seed_hex:
                 self.registrar_log("autenticacao", "Tentativa de autenticação com frase falhou: seed não configurada")
                 return False, "Usuário não possui seed configurada", False
             
-            # Gerar seed a partir da frase informada
-            seed = self.bip39.gerar_seed_from_frase(frase, "")
+            # Impressão diferente da gravada: frase incorreta, recusada sem derivar a seed
+            impressao = self.impressao_frase.calcular(frase)
+            if impressao_gravada is not None and impressao_gravada != impressao:
+                self.guarda.registrar_falha("frase")
+                return False, "Frase mnemônica incorreta", False
+            
+            # Gerar seed a partir da frase informada (já no cache se a interface usou derivar_seed_frase)
+            seed = self.derivacao_seed.derivar(frase)
             seed_verificacao = seed.hex()
             
             if seed_verificacao == seed_hex:
                 # Seed correta
+                self.guarda.registrar_sucesso("frase")
                 self.usuario_autenticado = True
                 self.usuario_atual = {"id": id_usuario, "nome": nome}
                 self.registrar_log("autenticacao", f"Usuário {nome} autenticado com frase mnemônica")
                 
-                # Gerar chave para o compartimento principal
+                # Usuário anterior às impressões: gravar a impressão agora que a frase foi confirmada
+                if impressao_gravada is None:
+                    self.impressao_frase.registrar("usuarios", id_usuario, impressao)
+                
+                # Gerar chave para o compartimento principal, válida até o logout
                 chave, _ = self.crypto.gerar_chave_derivada(frase, seed[:16])
-                self.chave_compartimento_ativo = chave
+                self.compartimento_ativo = "principal"
+                self.chaveiro.guardar("principal", chave, expira=False)
                 
                 # Ativar modo de recuperação (somente leitura)
                 self.modo_heranca_ativo = True
@@ -569,7 +658,7 @@ class CofreDigitalModel:
             
             else:
                 # Frase incorreta
-                self.registrar_log("autenticacao", "Tentativa de autenticação com frase falhou: frase incorreta")
+                self.guarda.registrar_falha("frase")
                 return False, "Frase mnemônica incorreta", False
                 
         except Exception as e:
@@ -579,7 +668,7 @@ class CofreDigitalModel:
     def registrar_log(self, tipo, mensagem):
         """Registra uma mensagem no log do sistema."""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             cursor.execute(
@@ -594,68 +683,32 @@ class CofreDigitalModel:
             # Falha silenciosa - não podemos registrar o erro de registro :)
             pass
     
+    def registrar_logs(self, eventos):
+        """Registra vários eventos (tipo, mensagem, data) numa única transação."""
+        try:
+            conn = self.conectar()
+            conn.executemany("INSERT INTO logs (tipo, mensagem, data) VALUES (?, ?, ?)", eventos)
+            conn.commit()
+            conn.close()
+        except Exception:
+            pass
+    
     def obter_estatisticas(self):
         """Obtém estatísticas do uso do sistema no compartimento atual."""
         try:
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
-            # Definir as tabelas com base no compartimento ativo
-            tabela_senhas = "senhas"
-            tabela_notas = "notas"
-            tabela_arquivos = "arquivos"
-            tabela_carteiras = "carteiras_btc"
-            
-            if self.compartimento_ativo != "principal":
-                tabela_senhas = f"compartimento_{self.compartimento_ativo}_senhas"
-                tabela_notas = f"compartimento_{self.compartimento_ativo}_notas"
-                tabela_arquivos = f"compartimento_{self.compartimento_ativo}_arquivos"
-                tabela_carteiras = f"compartimento_{self.compartimento_ativo}_carteiras_btc"
-            
-            # Contar senhas - verifica se a tabela existe primeiro
-            count_senhas = 0
-            try:
-                cursor.execute(f"SELECT COUNT(*) FROM {tabela_senhas}")
-                count_senhas = cursor.fetchone()[0]
-            except:
-                # A tabela pode não existir ainda
-                pass
-            
-            # Contar notas - verifica se a tabela existe primeiro
-            count_notas = 0
-            try:
-                cursor.execute(f"SELECT COUNT(*) FROM {tabela_notas}")
-                count_notas = cursor.fetchone()[0]
-            except:
-                # A tabela pode não existir ainda
-                pass
-            
-            # Contar arquivos - verifica se a tabela existe primeiro
-            count_arquivos = 0
-            try:
-                cursor.execute(f"SELECT COUNT(*) FROM {tabela_arquivos}")
-                count_arquivos = cursor.fetchone()[0]
-            except:
-                # A tabela pode não existir ainda
-                pass
-            
-            # Contar carteiras BTC - verifica se a tabela existe primeiro
-            count_carteiras = 0
-            try:
-                cursor.execute(f"SELECT COUNT(*) FROM {tabela_carteiras}")
-                count_carteiras = cursor.fetchone()[0]
-            except:
-                # A tabela pode não existir ainda
-                pass
+            # Todas as tabelas são compartilhadas; a contagem usa o índice por compartimento
+            contagens = {}
+            for tabela in ("senhas", "notas", "arquivos", "carteiras_btc"):
+                sql, parametros = self.layout.consulta_compartimento(cursor, tabela, self.compartimento_ativo)
+                cursor.execute(f"SELECT COUNT(*) FROM ({sql})", parametros)
+                contagens[tabela] = cursor.fetchone()[0]
             
             conn.close()
             
-            return {
-                "senhas": count_senhas,
-                "notas": count_notas,
-                "arquivos": count_arquivos,
-                "carteiras_btc": count_carteiras
-            }
+            return contagens
             
         except Exception as e:
             self.registrar_log("erro", f"Erro ao obter estatísticas: {str(e)}")
@@ -674,36 +727,34 @@ class CofreDigitalModel:
             compartimento_id = self.crypto.gerar_id_seguro(16)
             
             # Gerar chave aleatória para o compartimento
-            chave_comp = secrets.token_bytes(32)
+            chave_comp = BufferSeguro(secrets.token_bytes(32))
             
-            # Criptografar a chave do compartimento com a senha fornecida
-            chave_derivada, salt = self.crypto.gerar_chave_derivada(senha)
-            chave_criptografada_base64, iv_base64 = self.crypto.criptografar(chave_comp, chave_derivada)
+            # Criptografar a chave do compartimento com a senha fornecida, no perfil de derivação configurado
+            perfil = self.perfil_kdf.codificar()
+            chave_derivada, salt = self.crypto.gerar_chave_derivada(senha, perfil=perfil)
+            with chave_derivada:
+                chave_criptografada_base64, iv_base64 = self.crypto.criptografar(chave_comp, chave_derivada)
             
             # Preparar frase de recuperação (usando BIP39)
-            # Converter a chave do compartimento em frase mnemônica
-            try:
-                # Usar apenas os primeiros 16 bytes (128 bits) para uma frase de 12 palavras
-                from mnemonic import Mnemonic
-                mnemo = Mnemonic("english")
-                # Usar os primeiros 16 bytes da chave do compartimento
-                frase_recuperacao = mnemo.to_mnemonic(chave_comp[:16])
-            except:
-                # Fallback se não conseguir usar a biblioteca
-                frase_recuperacao = base64.b64encode(chave_comp).decode()
+            # Usar os primeiros 16 bytes (128 bits) da chave do compartimento para uma frase de 12 palavras
+            frase_recuperacao = self.bip39.entropia_para_frase(chave_comp[:16])
             
             # Inserir informações do compartimento no banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             cursor.execute(
-                "INSERT INTO compartimentos (nome, compartimento_id, chave_criptografada, iv, descricao, data_criacao) VALUES (?, ?, ?, ?, ?, ?)",
-                (nome, compartimento_id, chave_criptografada_base64, iv_base64, descricao, datetime.datetime.now().isoformat())
+                "INSERT INTO compartimentos (nome, compartimento_id, chave_criptografada, iv, descricao, data_criacao, salt, kdf) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (nome, compartimento_id, chave_criptografada_base64, iv_base64, descricao, datetime.datetime.now().isoformat(),
+                 base64.b64encode(salt).decode(), perfil)
             )
             
             conn.commit()
             conn.close()
             
+            # O compartimento recém-criado já fica desbloqueado na sessão
+            self.chaveiro.guardar(compartimento_id, chave_comp)
+            
             self.registrar_log("compartimento", f"Compartimento '{nome}' criado com sucesso")
             
             return True, f"Compartimento '{nome}' criado com sucesso", frase_recuperacao
@@ -718,7 +769,7 @@ class CofreDigitalModel:
             if not self.usuario_autenticado:
                 return False, "Usuário não autenticado", None
             
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             cursor.execute("SELECT id, nome, compartimento_id, descricao, data_criacao FROM compartimentos")
@@ -742,8 +793,13 @@ class CofreDigitalModel:
             self.registrar_log("erro", f"Erro ao listar compartimentos: {str(e)}")
             return False, f"Erro ao listar compartimentos: {str(e)}", None
     
-    def alternar_compartimento(self, compartimento_id, senha):
-        """Alterna para um compartimento específico."""
+    def alternar_compartimento(self, compartimento_id, senha=None):
+        """
+        Alterna para um compartimento específico.
+        
+        Compartimentos já desbloqueados na sessão são ativados direto do chaveiro,
+        sem senha e sem repetir a derivação da chave.
+        """
         try:
             if not self.usuario_autenticado:
                 return False, "Usuário não autenticado"
@@ -751,12 +807,16 @@ class CofreDigitalModel:
             if self.modo_heranca_ativo:
                 return False, "Não é possível alternar compartimentos no modo de herança"
             
+            if compartimento_id == "principal":
+                self.compartimento_ativo = "principal"
+                return True, "Compartimento principal ativado com sucesso"
+            
             # Buscar informações do compartimento
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             cursor.execute(
-                "SELECT nome, chave_criptografada, iv FROM compartimentos WHERE compartimento_id = ?",
+                "SELECT nome, chave_criptografada, iv, salt, kdf FROM compartimentos WHERE compartimento_id = ?",
                 (compartimento_id,)
             )
             
@@ -766,50 +826,105 @@ class CofreDigitalModel:
             if not resultado:
                 return False, "Compartimento não encontrado"
             
-            nome, chave_criptografada, iv = resultado
+            nome, chave_criptografada, iv, salt, kdf = resultado
             
-            # Derivar a chave a partir da senha
-            chave_derivada, _ = self.crypto.gerar_chave_derivada(senha)
-            
-            try:
-                # Descriptografar a chave do compartimento
-                chave_comp = self.crypto.descriptografar(chave_criptografada, iv, chave_derivada)
+            if not self.chaveiro.desbloqueado(compartimento_id):
+                if not senha:
+                    return False, "Compartimento bloqueado. Digite a senha"
                 
-                # Se chegou aqui, a chave foi descriptografada com sucesso
-                self.compartimento_ativo = compartimento_id
-                self.chave_compartimento_ativo = chave_comp
+                if not salt:
+                    return False, "Compartimento criado sem o salt da senha; não é possível desbloqueá-lo por senha"
                 
-                self.registrar_log("compartimento", f"Alternado para compartimento '{nome}'")
+                # Derivar a chave a partir da senha, com o salt e o perfil gravados na criação
+                chave_derivada, _ = self.crypto.gerar_chave_derivada(
+                    senha, base64.b64decode(salt), perfil=kdf or PERFIL_LEGADO
+                )
                 
-                return True, f"Compartimento '{nome}' ativado com sucesso"
+                try:
+                    # Descriptografar a chave do compartimento (o chaveiro fica com o buffer, sem cópia)
+                    with chave_derivada:
+                        chave_comp = self.crypto.descriptografar_seguro(chave_criptografada, iv, chave_derivada)
+                except Exception:
+                    return False, "Senha incorreta para este compartimento"
                 
-            except:
-                return False, "Senha incorreta para este compartimento"
+                # Perfil mais fraco que o configurado: proteger de novo a chave com o perfil atual
+                if precisa_atualizar(PerfilKDF.decodificar(kdf), self.perfil_kdf):
+                    self._reproteger_chave_compartimento(compartimento_id, chave_comp, senha)
+                
+                self.chaveiro.guardar(compartimento_id, chave_comp)
+            
+            self.compartimento_ativo = compartimento_id
+            self.registrar_log("compartimento", f"Alternado para compartimento '{nome}'")
+            
+            return True, f"Compartimento '{nome}' ativado com sucesso"
             
         except Exception as e:
             self.registrar_log("erro", f"Erro ao alternar compartimento: {str(e)}")
             return False, f"Erro ao alternar compartimento: {str(e)}"
     
+    def _reproteger_chave_compartimento(self, compartimento_id, chave_comp, senha):
+        """Cifra de novo a chave de um compartimento com um salt novo e o perfil de derivação configurado."""
+        perfil = self.perfil_kdf.codificar()
+        chave_derivada, salt = self.crypto.gerar_chave_derivada(senha, perfil=perfil)
+        with chave_derivada:
+            chave_criptografada, iv = self.crypto.criptografar(chave_comp, chave_derivada)
+        
+        conn = self.conectar()
+        try:
+            conn.execute(
+                "UPDATE compartimentos SET chave_criptografada = ?, iv = ?, salt = ?, kdf = ? WHERE compartimento_id = ?",
+                (chave_criptografada, iv, base64.b64encode(salt).decode(), perfil, compartimento_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def compartimentos_desbloqueados(self):
+        """Lista os compartimentos desbloqueados na sessão (além do principal)."""
+        return [comp for comp in self.chaveiro.desbloqueados() if comp != "principal"]
+    
+    def bloquear_compartimento(self, compartimento_id):
+        """Bloqueia um compartimento, zerando a sua chave; se ele estiver ativo, volta ao principal."""
+        if compartimento_id == "principal":
+            return False, "O compartimento principal só é bloqueado no logout"
+        
+        if not self.chaveiro.bloquear(compartimento_id):
+            return False, "Compartimento já está bloqueado"
+        
+        if self.compartimento_ativo == compartimento_id:
+            self.compartimento_ativo = "principal"
+        
+        self.registrar_log("compartimento", f"Compartimento {compartimento_id} bloqueado")
+        return True, "Compartimento bloqueado"
+    
+    def pesquisar_compartimentos(self, termo_busca, tipos=None):
+        """Pesquisa senhas, notas e arquivos em todos os compartimentos desbloqueados com uma única consulta."""
+        self._verifica_autenticacao()
+        
+        try:
+            conn = self.conectar()
+            resultados = BuscaFederada().pesquisar(conn.cursor(), termo_busca, self.chaveiro.desbloqueados(), tipos)
+            conn.close()
+            return resultados
+        except Exception as e:
+            self.registrar_log("erro", f"Erro ao pesquisar compartimentos: {str(e)}")
+            return []
+    
     # === Funções de gerenciamento de senhas ===
     
     def listar_senhas(self):
         """Lista as senhas do compartimento atual."""
         self._verifica_autenticacao()
         
-        # Definir a tabela correta com base no compartimento ativo
-        tabela = "senhas"
-        if self.compartimento_ativo != "principal":
-            tabela = f"compartimento_{self.compartimento_ativo}_senhas"
-        
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
-            # Executar consulta
-            cursor.execute(
-                f"SELECT * FROM {tabela} ORDER BY titulo"
-            )
+            # Senhas do compartimento ativo, incluindo as que ainda aguardam migração; só as colunas
+            # da listagem: a senha em si só sai em obter_senha, dentro de um BufferSeguro
+            sql, parametros = self.layout.consulta_compartimento(cursor, "senhas", self.compartimento_ativo)
+            cursor.execute(f"SELECT {', '.join(COLUNAS_LISTAGEM_SENHAS)} FROM ({sql}) ORDER BY titulo", parametros)
             
             # Converter para lista de dicionários
             colunas = [coluna[0] for coluna in cursor.description]
@@ -828,20 +943,19 @@ class CofreDigitalModel:
         """Obtém os detalhes de uma senha específica."""
         self._verifica_autenticacao()
         
-        # Definir a tabela correta com base no compartimento ativo
-        tabela = "senhas"
-        if self.compartimento_ativo != "principal":
-            tabela = f"compartimento_{self.compartimento_ativo}_senhas"
-        
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
+            # IDs negativos são de senhas ainda na tabela antiga do compartimento
+            senha_id = self.layout.resolver_id(cursor, "senhas", self.compartimento_ativo, senha_id)
+            conn.commit()
+            
             # Executar consulta
             cursor.execute(
-                f"SELECT * FROM {tabela} WHERE id = ?",
-                (senha_id,)
+                "SELECT * FROM senhas WHERE id = ? AND compartimento = ?",
+                (senha_id, self.compartimento_ativo)
             )
             
             # Obter resultado
@@ -858,6 +972,10 @@ class CofreDigitalModel:
             # Fechar conexão
             conn.close()
             
+            # A senha vai para a interface num buffer que ela zera ao fechar os detalhes
+            if senha.get("senha") is not None:
+                senha["senha"] = BufferSeguro.de_texto(senha["senha"])
+            
             return senha
             
         except Exception as e:
@@ -872,14 +990,9 @@ class CofreDigitalModel:
         if self.modo_heranca_ativo:
             return False, "Não é possível adicionar senhas no modo de herança"
         
-        # Definir a tabela correta com base no compartimento ativo
-        tabela = "senhas"
-        if self.compartimento_ativo != "principal":
-            tabela = f"compartimento_{self.compartimento_ativo}_senhas"
-        
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             # Data atual
@@ -887,12 +1000,12 @@ class CofreDigitalModel:
             
             # Inserir senha
             cursor.execute(
-                f"""
-                INSERT INTO {tabela} 
-                (titulo, senha, usuario, url, categoria, notas, data_criacao) 
-                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """
+                INSERT INTO senhas 
+                (titulo, senha, usuario, url, categoria, notas, data_criacao, data_modificacao, compartimento) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
-                (titulo, senha, usuario, url, categoria, notas, data_criacao)
+                (titulo, senha, usuario, url, categoria, notas, data_criacao, data_criacao, self.compartimento_ativo)
             )
             
             # Salvar alterações
@@ -919,20 +1032,16 @@ class CofreDigitalModel:
         if self.modo_heranca_ativo:
             return False, "Não é possível atualizar senhas no modo de herança"
         
-        # Definir a tabela correta com base no compartimento ativo
-        tabela = "senhas"
-        if self.compartimento_ativo != "principal":
-            tabela = f"compartimento_{self.compartimento_ativo}_senhas"
-        
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             # Verificar se a senha existe
+            senha_id = self.layout.resolver_id(cursor, "senhas", self.compartimento_ativo, senha_id)
             cursor.execute(
-                f"SELECT titulo FROM {tabela} WHERE id = ?",
-                (senha_id,)
+                "SELECT titulo FROM senhas WHERE id = ? AND compartimento = ?",
+                (senha_id, self.compartimento_ativo)
             )
             
             resultado = cursor.fetchone()
@@ -978,7 +1087,7 @@ class CofreDigitalModel:
             # Atualizar senha
             cursor.execute(
                 f"""
-                UPDATE {tabela} 
+                UPDATE senhas 
                 SET {", ".join(campos)}
                 WHERE id = ?
                 """,
@@ -1009,20 +1118,16 @@ class CofreDigitalModel:
         if self.modo_heranca_ativo:
             return False, "Não é possível excluir senhas no modo de herança"
         
-        # Definir a tabela correta com base no compartimento ativo
-        tabela = "senhas"
-        if self.compartimento_ativo != "principal":
-            tabela = f"compartimento_{self.compartimento_ativo}_senhas"
-        
         try:
             # Conectar ao banco de dados
-            conn = sqlite3.connect(self.caminho_db)
+            conn = self.conectar()
             cursor = conn.cursor()
             
             # Verificar se a senha existe
+            senha_id = self.layout.resolver_id(cursor, "senhas", self.compartimento_ativo, senha_id)
             cursor.execute(
-                f"SELECT titulo FROM {tabela} WHERE id = ?",
-                (senha_id,)
+                "SELECT titulo FROM senhas WHERE id = ? AND compartimento = ?",
+                (senha_id, self.compartimento_ativo)
             )
             
             resultado = cursor.fetchone()
@@ -1034,7 +1139,7 @@ class CofreDigitalModel:
             
             # Excluir senha
             cursor.execute(
-                f"DELETE FROM {tabela} WHERE id = ?",
+                "DELETE FROM senhas WHERE id = ?",
                 (senha_id,)
             )
             
@@ -0,0 +1,133 @@
+import zlib
+import math
+import struct
+from collections import Counter
+
+# zstd é opcional; sem ele a compressão usa zlib
+try:
+    import zstandard
+    ZSTD_DISPONIVEL = True
+except ImportError:
+    ZSTD_DISPONIVEL = False
+
+
+# Cabeçalho dos dados empacotados: marcador, algoritmo e tamanho original.
+# O marcador começa com um byte nulo, que não aparece em textos de notas
+# gravados antes da compressão existir.
+MARCADOR = b"\x00CZ1"
+FORMATO_CABECALHO = ">4sBQ"
+TAMANHO_CABECALHO = struct.calcsize(FORMATO_CABECALHO)
+
+ALGORITMO_NENHUM = 0
+ALGORITMO_ZLIB = 1
+ALGORITMO_ZSTD = 2
+
+# Acima desta entropia (bits por byte) a amostra é tratada como incompressível
+LIMITE_ENTROPIA = 7.5
+
+# Itens menores que isto não compensam o custo do cabeçalho
+TAMANHO_MINIMO = 128
+
+# Tamanho de cada janela lida pela sonda de entropia
+TAMANHO_AMOSTRA = 1024
+
+
+class Compressao:
+    """Compressão opcional aplicada antes da criptografia."""
+
+    @staticmethod
+    def entropia(dados, tamanho_amostra=TAMANHO_AMOSTRA):
+        """
+        Estima a entropia dos dados a partir de amostras do início, meio e fim.
+
+        Args:
+            dados (bytes): Os dados a serem avaliados
+            tamanho_amostra (int): Tamanho de cada janela amostrada
+
+        Returns:
+            float: Entropia estimada em bits por byte (0 a 8)
+        """
+        if len(dados) <= 3 * tamanho_amostra:
+            amostra = dados
+        else:
+            meio = len(dados) // 2
+            amostra = (
+                dados[:tamanho_amostra]
+                + dados[meio:meio + tamanho_amostra]
+                + dados[-tamanho_amostra:]
+            )
+
+        if not amostra:
+            return 0.0
+
+        total = len(amostra)
+        return -sum(
+            (ocorrencias / total) * math.log2(ocorrencias / total)
+            for ocorrencias in Counter(amostra).values()
+        )
+
+    @staticmethod
+    def escolher_algoritmo(dados):
+        """Escolhe o algoritmo de compressão para um item com base na sonda de entropia."""
+        if len(dados) < TAMANHO_MINIMO or Compressao.entropia(dados) >= LIMITE_ENTROPIA:
+            return ALGORITMO_NENHUM
+        return ALGORITMO_ZSTD if ZSTD_DISPONIVEL else ALGORITMO_ZLIB
+
+    @staticmethod
+    def empacotar(dados):
+        """
+        Comprime os dados, se compensar, e acrescenta o cabeçalho com o algoritmo usado.
+
+        Args:
+            dados (bytes): Os dados em claro
+
+        Returns:
+            bytes: Cabeçalho seguido dos dados (comprimidos ou não)
+        """
+        algoritmo = Compressao.escolher_algoritmo(dados)
+        conteudo = dados
+
+        if algoritmo == ALGORITMO_ZSTD:
+            conteudo = zstandard.ZstdCompressor(level=3).compress(dados)
+        elif algoritmo == ALGORITMO_ZLIB:
+            conteudo = zlib.compress(dados, 6)
+
+        # A sonda pode errar; nunca guardar um resultado maior que o original
+        if algoritmo != ALGORITMO_NENHUM and len(conteudo) >= len(dados):
+            algoritmo = ALGORITMO_NENHUM
+            conteudo = dados
+
+        return struct.pack(FORMATO_CABECALHO, MARCADOR, algoritmo, len(dados)) + conteudo
+
+    @staticmethod
+    def desempacotar(dados):
+        """
+        Reverte empacotar. Dados sem o cabeçalho (gravados antes da compressão) são devolvidos como estão.
+
+        Args:
+            dados (bytes): Os dados descriptografados
+
+        Returns:
+            bytes: Os dados originais
+        """
+        if len(dados) < TAMANHO_CABECALHO or not dados.startswith(MARCADOR):
+            return dados
+
+        _, algoritmo, tamanho_original = struct.unpack(FORMATO_CABECALHO, dados[:TAMANHO_CABECALHO])
+        conteudo = dados[TAMANHO_CABECALHO:]
+
+        if algoritmo == ALGORITMO_NENHUM:
+            resultado = conteudo
+        elif algoritmo == ALGORITMO_ZLIB:
+            resultado = zlib.decompress(conteudo)
+        elif algoritmo == ALGORITMO_ZSTD:
+            if not ZSTD_DISPONIVEL:
+                raise ValueError("Dados comprimidos com zstd, mas a biblioteca zstandard não está instalada")
+            resultado = zstandard.ZstdDecompressor().decompress(conteudo, max_output_size=tamanho_original)
+        else:
+            raise ValueError(f"Algoritmo de compressão desconhecido: {algoritmo}")
+
+        if len(resultado) != tamanho_original:
+            raise ValueError("Tamanho dos dados descomprimidos não confere com o cabeçalho")
+
+        return resultado
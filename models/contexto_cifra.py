@@ -0,0 +1,243 @@
+import base64
+import secrets
+import threading
+
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+
+from models.compressao import Compressao
+from models.crypto_utils import CryptoUtils
+
+# AES-GCM-SIV depende da versão da biblioteca de criptografia (42 ou mais recente) e do OpenSSL
+# a que ela está ligada (3.2 ou mais recente): a classe existe mesmo quando o OpenSSL não a
+# oferece, então a disponibilidade é conferida criando uma instância
+try:
+    from cryptography.exceptions import UnsupportedAlgorithm
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCMSIV
+    AESGCMSIV(bytes(32))
+    AES_GCM_SIV_DISPONIVEL = True
+except (ImportError, UnsupportedAlgorithm):
+    AES_GCM_SIV_DISPONIVEL = False
+
+
+# Versão gravada na coluna iv ("1$nonce"), com o registro nos dados associados:
+# 1 = ChaCha20-Poly1305, 2 = AES-256-GCM-SIV, ambos com nonce aleatório de 96 bits.
+# Um iv sem versão é de um registro cifrado por Criptografia.criptografar, sem dados associados.
+# Registros cifrados com uma versão de chave rotacionada (ver RotacaoChaves) levam o número
+# dela num terceiro campo ("1$nonce$3"); sem ele, a chave é a do compartimento (versão 0)
+VERSAO_AAD = 1
+VERSAO_GCM_SIV = 2
+SEPARADOR_VERSAO = "$"
+
+# Algoritmos que podem ser escolhidos para os novos registros de um cofre
+ALGORITMOS = {
+    "chacha20-poly1305": VERSAO_AAD,
+    "aes-256-gcm-siv": VERSAO_GCM_SIV
+}
+ALGORITMO_PADRAO = "chacha20-poly1305"
+
+# Rótulo da subchave do AES-GCM-SIV, para que a mesma chave não seja usada pelos dois algoritmos
+ROTULO_SUBCHAVE_GCM_SIV = b"contexto-cifra/aes-256-gcm-siv"
+
+
+def dados_associados(tabela, id_registro, compartimento):
+    """Dados associados que prendem o texto cifrado a um registro: tabela, ID e compartimento."""
+    return f"{tabela}|{id_registro}|{compartimento}".encode('utf-8')
+
+
+def algoritmos_disponiveis():
+    """Algoritmos que a biblioteca de criptografia instalada oferece."""
+    return [nome for nome, versao in ALGORITMOS.items() if versao != VERSAO_GCM_SIV or AES_GCM_SIV_DISPONIVEL]
+
+
+def versao_do_algoritmo(algoritmo):
+    """Versão gravada pelos registros de um algoritmo; ValueError se ele for desconhecido ou indisponível."""
+    if algoritmo not in ALGORITMOS:
+        raise ValueError(f"Algoritmo de cifra desconhecido: {algoritmo}")
+    if algoritmo not in algoritmos_disponiveis():
+        raise ValueError(f"Algoritmo de cifra indisponível nesta instalação: {algoritmo}")
+    return ALGORITMOS[algoritmo]
+
+
+def _desmontar_iv(iv):
+    # (versão do formato, nonce em base64, versão da chave)
+    partes = (iv or "").split(SEPARADOR_VERSAO)
+    if len(partes) == 1:
+        return 0, partes[0], 0
+    return int(partes[0]), partes[1], int(partes[2]) if len(partes) > 2 else 0
+
+
+def versao_do_iv(iv):
+    """Versão do formato de um iv gravado (0 para registros sem versão)."""
+    return _desmontar_iv(iv)[0]
+
+
+def versao_chave_do_iv(iv):
+    """Versão da chave com que um registro foi cifrado (0 para a chave do compartimento)."""
+    return _desmontar_iv(iv)[2]
+
+
+class ContextoCifra:
+    """
+    Cifra de um compartimento desbloqueado, criada uma vez e usada por todas as operações.
+
+    Guarda as instâncias de cifra da chave, então cifrar e decifrar um
+    registro não repetem a validação da chave nem a preparação da cifra.
+    Os nonces são sempre 96 bits aleatórios por registro. Um contador não
+    serviria: contextos são recriados a cada login e desbloqueio para as
+    mesmas chaves de longa duração, e nada garantiria que dois deles não
+    recomeçassem do mesmo ponto.
+
+    AES-256-GCM-SIV (versão 2) resiste à repetição de nonce: uma colisão
+    só revelaria que dois registros com os mesmos dados associados têm o
+    mesmo conteúdo, e nunca expõe a chave de autenticação; uma chave pode
+    cifrar registros sem limite prático, sem troca forçada de chave. Usa
+    uma subchave derivada da chave do compartimento. A versão de escrita é
+    escolhida por cofre; a leitura segue a versão gravada no iv de cada
+    registro, então as duas convivem.
+
+    Cada registro é cifrado com a tabela, o ID e o compartimento como dados
+    associados, de modo que um texto cifrado copiado para outra linha,
+    tabela ou compartimento não é aceito. Registros anteriores, sem versão
+    no iv, continuam sendo lidos sem dados associados.
+
+    Além da chave do compartimento (versão 0), o contexto pode guardar
+    versões de chave criadas por rotação: cifra com versao_chave e decifra
+    cada registro com a versão gravada no seu iv. chave_versoes é a chave,
+    independente da versão 0, que protege essas versões no banco (ver
+    RotacaoChaves); ela pertence ao chaveiro.
+
+    As instâncias de cifra guardam cópias da chave fora do BufferSeguro; por
+    isso o contexto pertence à entrada do chaveiro e é descartado junto com
+    ela quando o compartimento é bloqueado.
+    """
+
+    def __init__(self, chave, compartimento, versao=VERSAO_AAD):
+        """
+        Inicializa o contexto.
+
+        Args:
+            chave (bytes ou BufferSeguro): Chave do compartimento (32 bytes), mantida por referência
+            compartimento (str): Compartimento cujos registros o contexto cifra
+            versao (int): Versão usada nos registros cifrados pelo contexto (VERSAO_AAD ou VERSAO_GCM_SIV)
+        """
+        if len(chave) != 32:
+            raise ValueError("A chave deve ter 32 bytes")
+
+        self.chave = chave
+        self.compartimento = compartimento
+        self.versao = versao
+        self.versao_chave = 0
+        self.chave_versoes = None
+        self._chaves = {0: chave}
+        self._cifras = {(0, VERSAO_AAD): ChaCha20Poly1305(chave)}
+        self._trava = threading.Lock()
+
+    def adicionar_chave(self, versao_chave, chave):
+        """Passa a aceitar uma versão de chave rotacionada (um BufferSeguro, que o contexto zera ao descartá-la)."""
+        with self._trava:
+            self._chaves[versao_chave] = chave
+
+    def remover_chave(self, versao_chave):
+        """Descarta uma versão de chave aposentada e a zera (a versão 0 pertence ao chaveiro e só deixa de ser aceita)."""
+        with self._trava:
+            chave = self._chaves.pop(versao_chave, None)
+            for indice in [indice for indice in self._cifras if indice[0] == versao_chave]:
+                del self._cifras[indice]
+        if chave is not None and versao_chave:
+            chave.zerar()
+
+    def chave_da_versao(self, versao_chave):
+        """Chave de uma versão aceita pelo contexto; ValueError se ela foi aposentada ou não foi carregada."""
+        chave = self._chaves.get(versao_chave)
+        if chave is None:
+            raise ValueError(f"Versão de chave {versao_chave} indisponível no compartimento '{self.compartimento}'")
+        return chave
+
+    def versoes_chave(self):
+        """Versões de chave que o contexto consegue decifrar."""
+        return sorted(self._chaves)
+
+    def descartar(self):
+        """Zera as versões de chave rotacionadas (a do compartimento pertence ao chaveiro)."""
+        for versao_chave in self.versoes_chave():
+            if versao_chave:
+                self.remover_chave(versao_chave)
+
+    def _cifra(self, versao, versao_chave=0):
+        cifra = self._cifras.get((versao_chave, versao))
+        if cifra is not None:
+            return cifra
+        if versao not in (VERSAO_AAD, VERSAO_GCM_SIV):
+            raise ValueError(f"Versão de cifra desconhecida: {versao}")
+        if versao == VERSAO_GCM_SIV and not AES_GCM_SIV_DISPONIVEL:
+            raise ValueError("AES-GCM-SIV não está disponível nesta instalação")
+
+        with self._trava:
+            chave = self.chave_da_versao(versao_chave)
+            if (versao_chave, versao) not in self._cifras:
+                if versao == VERSAO_GCM_SIV:
+                    cifra = AESGCMSIV(CryptoUtils.derivar_subchave(chave, ROTULO_SUBCHAVE_GCM_SIV))
+                else:
+                    cifra = ChaCha20Poly1305(chave)
+                self._cifras[(versao_chave, versao)] = cifra
+            return self._cifras[(versao_chave, versao)]
+
+    def _preparar(self, texto_cifrado, iv, tabela, id_registro):
+        versao, nonce, versao_chave = _desmontar_iv(iv)
+        if versao == 0:
+            return self._cifra(VERSAO_AAD), base64.b64decode(nonce), base64.b64decode(texto_cifrado), None
+
+        aad = dados_associados(tabela, id_registro, self.compartimento)
+        return self._cifra(versao, versao_chave), base64.b64decode(nonce), base64.b64decode(texto_cifrado), aad
+
+    def cifrar(self, dados, tabela, id_registro, comprimir=False):
+        """
+        Cifra os dados de um registro.
+
+        Args:
+            dados (str ou bytes): Os dados
+            tabela (str): Tabela do registro
+            id_registro (int): ID do registro (inserido antes, para que o ID exista)
+            comprimir (bool): Comprime os dados antes de cifrar, se compensar
+
+        Returns:
+            tuple: (texto cifrado em base64, iv com a versão do formato e a da chave)
+        """
+        if isinstance(dados, str):
+            dados = dados.encode('utf-8')
+        if comprimir:
+            dados = Compressao.empacotar(dados)
+
+        versao, versao_chave = self.versao, self.versao_chave
+        nonce = secrets.token_bytes(12)
+        texto_cifrado = self._cifra(versao, versao_chave).encrypt(
+            nonce, dados, dados_associados(tabela, id_registro, self.compartimento)
+        )
+
+        iv = f"{versao}{SEPARADOR_VERSAO}{base64.b64encode(nonce).decode()}"
+        if versao_chave:
+            iv += f"{SEPARADOR_VERSAO}{versao_chave}"
+        return base64.b64encode(texto_cifrado).decode(), iv
+
+    def decifrar(self, texto_cifrado, iv, tabela, id_registro, descomprimir=False):
+        """
+        Decifra os dados de um registro, no formato atual ou no anterior.
+
+        Returns:
+            bytes: Os dados (descomprimidos, se pedido)
+        """
+        cifra, nonce, texto_cifrado, aad = self._preparar(texto_cifrado, iv, tabela, id_registro)
+        dados = cifra.decrypt(nonce, texto_cifrado, aad)
+        if descomprimir:
+            dados = Compressao.desempacotar(dados)
+        return dados
+
+    def decifrar_seguro(self, texto_cifrado, iv, tabela, id_registro):
+        """
+        Decifra os dados de um registro (sem compressão) diretamente para um BufferSeguro.
+
+        Returns:
+            BufferSeguro: Os dados
+        """
+        cifra, nonce, texto_cifrado, aad = self._preparar(texto_cifrado, iv, tabela, id_registro)
+        return CryptoUtils._decifrar_em_buffer(cifra, nonce, texto_cifrado, aad)
@@ -1,17 +1,19 @@
 import os
+import hmac
 import base64
 import secrets
 import hashlib
 from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.backends import default_backend
+
+from models.compressao import Compressao
+from models.perfis_kdf import PerfilKDF, PERFIL_LEGADO
+from models.memoria_segura import BufferSeguro
 
 class CryptoUtils:
     """Utilitários de criptografia para o cofre digital."""
     
     @staticmethod
-    def gerar_chave_derivada(senha, salt=None, iterations=100000):
+    def gerar_chave_derivada(senha, salt=None, iterations=100000, perfil=None):
         """
         Gera uma chave segura a partir de uma senha usando PBKDF2.
         
@@ -19,26 +21,19 @@ class CryptoUtils:
             senha (str): A senha para derivar a chave
             salt (bytes, optional): O salt para uso em PBKDF2. Se não for fornecido, um novo será gerado.
             iterations (int): Número de iterações para PBKDF2
+            perfil (str, optional): Perfil de derivação gravado com o registro (substitui o PBKDF2 fixo)
             
         Returns:
-            tuple: (chave_derivada, salt)
+            tuple: (chave_derivada, salt); a chave é um BufferSeguro de 32 bytes (256 bits para ChaCha20)
         """
         if salt is None:
             salt = secrets.token_bytes(16)
         
-        # Garantir que a senha seja bytes
-        if isinstance(senha, str):
-            senha = senha.encode('utf-8')
-        
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,  # 256 bits para ChaCha20
-            salt=salt,
-            iterations=iterations,
-            backend=default_backend()
-        )
+        if perfil is None:
+            perfil = f"pbkdf2-sha256$i={iterations}" if iterations != 100000 else PERFIL_LEGADO
         
-        chave = kdf.derive(senha)
+        # Derivar diretamente no buffer que pode ser zerado
+        chave = PerfilKDF.decodificar(perfil).derivar_em(senha, salt, BufferSeguro(32))
         return chave, salt
     
     @staticmethod
@@ -126,6 +121,113 @@ class CryptoUtils:
         except Exception as e:
             raise ValueError(f"Erro na descriptografia: {str(e)}")
     
+    @staticmethod
+    def descriptografar_seguro(texto_cifrado, nonce, chave):
+        """
+        Descriptografa como descriptografar, mas para um BufferSeguro.
+        
+        Com cryptography 45 ou superior (decrypt_into) o texto claro é escrito direto
+        no buffer, sem um bytes intermediário que não poderia ser zerado.
+        
+        Returns:
+            BufferSeguro: Os dados descriptografados
+        """
+        try:
+            if len(chave) != 32:
+                raise ValueError("A chave deve ter 32 bytes")
+            
+            return CryptoUtils._decifrar_em_buffer(
+                ChaCha20Poly1305(chave), base64.b64decode(nonce), base64.b64decode(texto_cifrado), None
+            )
+        except Exception as e:
+            raise ValueError(f"Erro na descriptografia: {str(e)}")
+    
+    @staticmethod
+    def descriptografar_bytes_seguro(dados, chave, dados_associados=None):
+        """
+        Descriptografa dados produzidos por criptografar_bytes (sem compressão) para um BufferSeguro.
+        
+        Returns:
+            BufferSeguro: Os dados descriptografados
+        """
+        try:
+            if len(chave) != 32:
+                raise ValueError("A chave deve ter 32 bytes")
+            
+            return CryptoUtils._decifrar_em_buffer(ChaCha20Poly1305(chave), dados[:12], dados[12:], dados_associados)
+        except Exception as e:
+            raise ValueError(f"Erro na descriptografia: {str(e)}")
+    
+    @staticmethod
+    def _decifrar_em_buffer(cipher, nonce, texto_cifrado, dados_associados):
+        if not hasattr(cipher, "decrypt_into"):
+            return BufferSeguro(cipher.decrypt(nonce, texto_cifrado, dados_associados))
+        
+        # O texto cifrado traz a etiqueta de autenticação de 16 bytes no final
+        dados = BufferSeguro(max(len(texto_cifrado) - 16, 0))
+        cipher.decrypt_into(nonce, texto_cifrado, dados_associados, dados)
+        return dados
+    
+    @staticmethod
+    def criptografar_bytes(dados, chave, dados_associados=None, comprimir=False):
+        """
+        Criptografa dados binários usando ChaCha20Poly1305, sem codificação base64.
+        
+        Args:
+            dados (bytes): Os dados a serem criptografados
+            chave (bytes): A chave de criptografia (32 bytes)
+            dados_associados (bytes, optional): Dados autenticados mas não cifrados
+            comprimir (bool): Comprime os dados antes de cifrar, se compensar
+            
+        Returns:
+            bytes: O nonce (12 bytes) seguido do texto cifrado
+        """
+        if len(chave) != 32:
+            raise ValueError("A chave deve ter 32 bytes")
+        
+        if comprimir:
+            dados = Compressao.empacotar(dados)
+        
+        nonce = secrets.token_bytes(12)
+        return nonce + ChaCha20Poly1305(chave).encrypt(nonce, dados, dados_associados)
+    
+    @staticmethod
+    def descriptografar_bytes(dados, chave, dados_associados=None, descomprimir=False):
+        """
+        Descriptografa dados produzidos por criptografar_bytes.
+        
+        Args:
+            dados (bytes): O nonce seguido do texto cifrado
+            chave (bytes): A chave de descriptografia (32 bytes)
+            dados_associados (bytes, optional): Os mesmos dados associados usados na cifragem
+            descomprimir (bool): Descomprime os dados que tiverem cabeçalho de compressão
+            
+        Returns:
+            bytes: Os dados descriptografados
+        """
+        try:
+            if len(chave) != 32:
+                raise ValueError("A chave deve ter 32 bytes")
+            
+            dados = ChaCha20Poly1305(chave).decrypt(dados[:12], dados[12:], dados_associados)
+            return Compressao.desempacotar(dados) if descomprimir else dados
+        except Exception as e:
+            raise ValueError(f"Erro na descriptografia: {str(e)}")
+    
+    @staticmethod
+    def derivar_subchave(chave, contexto):
+        """
+        Deriva uma subchave independente para um contexto usando HMAC-SHA256.
+        
+        Args:
+            chave (bytes): A chave de origem
+            contexto (bytes): Rótulo que identifica o uso da subchave
+            
+        Returns:
+            bytes: A subchave de 32 bytes
+        """
+        return hmac.new(chave, contexto, hashlib.sha256).digest()
+    
     @staticmethod
     def gerar_id_seguro(comprimento=16):
         """
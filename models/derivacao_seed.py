@@ -0,0 +1,161 @@
+import hmac
+import hashlib
+import secrets
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from models.bip39_validator import BIP39Validator
+
+
+# Threads da pool de derivação (uma derivação por vez é o caso comum na interface)
+TRABALHADORES_PADRAO = 2
+
+# Intervalo entre verificações do futuro na interface e quadros do indicador de espera
+INTERVALO_ACOMPANHAMENTO_MS = 80
+QUADROS_ESPERA = "⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏"
+
+
+def futuro_concluido(resultado):
+    """Futuro já resolvido, para caminhos que dispensam a derivação."""
+    futuro = Future()
+    futuro.set_result(resultado)
+    return futuro
+
+
+def acompanhar(futuro, agendar, ao_concluir, ao_aguardar=None, ativo=None, intervalo_ms=INTERVALO_ACOMPANHAMENTO_MS):
+    """
+    Espera um futuro sem bloquear o laço de eventos da interface.
+
+    Args:
+        futuro (Future): Derivação em andamento
+        agendar (callable): agendar(ms, funcao), por exemplo widget.after
+        ao_concluir (callable): Recebe o futuro já concluído
+        ao_aguardar (callable, optional): Recebe o quadro do indicador de espera a cada verificação
+        ativo (callable, optional): Quando retorna False (janela fechada), a espera é abandonada
+        intervalo_ms (int): Intervalo entre verificações
+    """
+    def verificar(passo=0):
+        if ativo is not None and not ativo():
+            return
+        if futuro.done():
+            ao_concluir(futuro)
+            return
+        if ao_aguardar:
+            ao_aguardar(QUADROS_ESPERA[passo % len(QUADROS_ESPERA)])
+        agendar(intervalo_ms, lambda: verificar(passo + 1))
+
+    verificar()
+
+
+class ServicoDerivacaoSeed:
+    """
+    Deriva seeds BIP39 fora da thread da interface e memoriza o resultado na sessão.
+
+    O PBKDF2-HMAC-SHA512 de gerar_seed_from_frase roda em uma pool de
+    threads criada na primeira derivação; o hashlib libera o GIL durante o
+    PBKDF2, então a interface continua responsiva. Uma pool de processos foi
+    descartada: só iniciar um processo custa dezenas de vezes o tempo das
+    2048 iterações. Cada seed fica guardada sob
+    um HMAC da frase normalizada com uma chave aleatória da sessão, então a
+    frase nunca é usada como chave do dicionário; pedidos simultâneos da mesma
+    frase compartilham a mesma derivação. limpar() zera as seeds e troca a
+    chave, e deve ser chamado ao encerrar a sessão.
+    """
+
+    def __init__(self, trabalhadores=TRABALHADORES_PADRAO):
+        """
+        Inicializa o serviço.
+
+        Args:
+            trabalhadores (int): Quantidade de threads da pool
+        """
+        self.trabalhadores = trabalhadores
+        self._executor = None
+        self._chave = secrets.token_bytes(32)
+        self._seeds = {}
+        self._em_andamento = {}
+        self._geracao = 0
+        self._trava = threading.RLock()
+
+    def _submeter(self, frase, passphrase, resultado):
+        """Executa a derivação e repassa o desfecho para o futuro resultado."""
+        with self._trava:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.trabalhadores, thread_name_prefix="derivacao-seed")
+            interno = self._executor.submit(BIP39Validator.gerar_seed_from_frase, frase, passphrase)
+
+        def repassar(concluido):
+            erro = concluido.exception()
+            if erro is not None:
+                resultado.set_exception(erro)
+            else:
+                resultado.set_result(concluido.result())
+
+        interno.add_done_callback(repassar)
+
+    def _identificador(self, frase, passphrase):
+        mensagem = (BIP39Validator.normalizar(frase) + "\0" + passphrase).encode('utf-8')
+        return hmac.new(self._chave, mensagem, hashlib.sha256).digest()
+
+    def derivar_async(self, frase, passphrase=""):
+        """
+        Inicia a derivação da seed, ou devolve a seed já conhecida na sessão.
+
+        Args:
+            frase (str): A frase mnemônica
+            passphrase (str): Passphrase adicional (opcional)
+
+        Returns:
+            Future: Resolve com a seed de 64 bytes
+        """
+        with self._trava:
+            identificador = self._identificador(frase, passphrase)
+
+            seed = self._seeds.get(identificador)
+            if seed is not None:
+                return futuro_concluido(bytes(seed))
+
+            futuro = self._em_andamento.get(identificador)
+            if futuro is not None:
+                return futuro
+
+            futuro = Future()
+            self._em_andamento[identificador] = futuro
+            geracao = self._geracao
+
+        def memorizar(concluido):
+            with self._trava:
+                if self._em_andamento.get(identificador) is concluido:
+                    del self._em_andamento[identificador]
+                # Derivações que terminam depois de limpar() não voltam ao cache
+                if geracao == self._geracao and concluido.exception() is None:
+                    self._seeds[identificador] = bytearray(concluido.result())
+
+        futuro.add_done_callback(memorizar)
+        try:
+            self._submeter(frase, passphrase, futuro)
+        except Exception as e:
+            futuro.set_exception(e)
+        return futuro
+
+    def derivar(self, frase, passphrase=""):
+        """Deriva a seed e espera o resultado (usa o cache da sessão)."""
+        return self.derivar_async(frase, passphrase).result()
+
+    def limpar(self):
+        """Zera as seeds memorizadas e troca a chave do cache."""
+        with self._trava:
+            for seed in self._seeds.values():
+                seed[:] = bytes(len(seed))
+            self._seeds.clear()
+            self._em_andamento.clear()
+            self._chave = secrets.token_bytes(32)
+            self._geracao += 1
+
+    def encerrar(self):
+        """Limpa o cache e encerra a pool de derivação."""
+        self.limpar()
+        with self._trava:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,232 @@
+import sqlite3
+
+
+# Prefixo dos índices mantidos por este componente
+PREFIXO_INDICE = "idx_cofre_"
+
+# Índices de cobertura para os caminhos de acesso das listagens:
+# filtro por compartimento, opcionalmente por categoria, ordenado por título
+INDICES = [
+    {
+        "nome": "idx_cofre_senhas_comp_titulo",
+        "tabela": "senhas",
+        "colunas": ["compartimento", "titulo", "categoria_id", "descricao", "data_criacao", "data_modificacao"]
+    },
+    {
+        "nome": "idx_cofre_senhas_comp_cat_titulo",
+        "tabela": "senhas",
+        "colunas": ["compartimento", "categoria_id", "titulo"]
+    },
+    {
+        "nome": "idx_cofre_notas_comp_titulo",
+        "tabela": "notas",
+        "colunas": ["compartimento", "titulo", "categoria_id", "data_criacao", "data_modificacao"]
+    },
+    {
+        "nome": "idx_cofre_notas_comp_cat_titulo",
+        "tabela": "notas",
+        "colunas": ["compartimento", "categoria_id", "titulo"]
+    },
+    {
+        "nome": "idx_cofre_arquivos_comp_nome",
+        "tabela": "arquivos",
+        "colunas": ["compartimento", "nome_original", "categoria_id", "descricao", "data_upload"]
+    },
+    {
+        "nome": "idx_cofre_arquivos_comp_cat_nome",
+        "tabela": "arquivos",
+        "colunas": ["compartimento", "categoria_id", "nome_original"]
+    },
+    {
+        "nome": "idx_cofre_compartimentos_nome",
+        "tabela": "compartimentos",
+        "colunas": ["nome"]
+    }
+]
+
+# Consultas representativas usadas para verificar os planos de execução
+CONSULTAS_VERIFICACAO = [
+    {
+        "indice": "idx_cofre_senhas_comp_titulo",
+        "sql": "SELECT id, titulo, descricao, data_criacao, data_modificacao, categoria_id FROM senhas WHERE compartimento = ? ORDER BY titulo",
+        "parametros": ("principal",)
+    },
+    {
+        "indice": "idx_cofre_senhas_comp_cat_titulo",
+        "sql": "SELECT id, titulo FROM senhas WHERE compartimento = ? AND categoria_id = ? ORDER BY titulo",
+        "parametros": ("principal", 1)
+    },
+    {
+        "indice": "idx_cofre_notas_comp_titulo",
+        "sql": "SELECT id, titulo, data_criacao, data_modificacao, categoria_id FROM notas WHERE compartimento = ? ORDER BY titulo",
+        "parametros": ("principal",)
+    },
+    {
+        "indice": "idx_cofre_notas_comp_cat_titulo",
+        "sql": "SELECT id, titulo FROM notas WHERE compartimento = ? AND categoria_id = ? ORDER BY titulo",
+        "parametros": ("principal", 1)
+    },
+    {
+        "indice": "idx_cofre_arquivos_comp_nome",
+        "sql": "SELECT id, nome_original, descricao, data_upload, categoria_id FROM arquivos WHERE compartimento = ? ORDER BY nome_original",
+        "parametros": ("principal",)
+    },
+    {
+        "indice": "idx_cofre_arquivos_comp_cat_nome",
+        "sql": "SELECT id, nome_original FROM arquivos WHERE compartimento = ? AND categoria_id = ? ORDER BY nome_original",
+        "parametros": ("principal", 1)
+    },
+    {
+        "indice": "idx_cofre_compartimentos_nome",
+        "sql": "SELECT id, nome, compartimento_id FROM compartimentos WHERE nome = ?",
+        "parametros": ("principal",)
+    }
+]
+
+
+class GerenciadorIndices:
+    """Cria, mantém e verifica os índices secundários do banco de dados."""
+
+    def __init__(self, indices=None, consultas=None):
+        """
+        Inicializa o gerenciador.
+
+        Args:
+            indices (list, optional): Definições de índices; por padrão INDICES
+            consultas (list, optional): Consultas de verificação; por padrão CONSULTAS_VERIFICACAO
+        """
+        self.indices = INDICES if indices is None else indices
+        self.consultas = CONSULTAS_VERIFICACAO if consultas is None else consultas
+
+    @staticmethod
+    def _colunas_tabela(cursor, tabela):
+        cursor.execute(f"PRAGMA table_info({tabela})")
+        return {info[1] for info in cursor.fetchall()}
+
+    @staticmethod
+    def _colunas_indice(cursor, nome):
+        cursor.execute(f"PRAGMA index_info({nome})")
+        return [info[2] for info in sorted(cursor.fetchall())]
+
+    @staticmethod
+    def _indices_gerenciados(cursor):
+        cursor.execute(
+            "SELECT name, tbl_name FROM sqlite_master WHERE type = 'index' AND substr(name, 1, ?) = ?",
+            (len(PREFIXO_INDICE), PREFIXO_INDICE)
+        )
+        return {nome: tabela for nome, tabela in cursor.fetchall()}
+
+    def aplicar(self, cursor):
+        """
+        Cria os índices ausentes, recria os que mudaram de definição e remove os obsoletos.
+
+        Índices cujas colunas não existem no esquema atual são ignorados.
+
+        Args:
+            cursor: Cursor de uma conexão aberta (o commit fica a cargo de quem chama)
+
+        Returns:
+            dict: Listas de índices criados, recriados, removidos e ignorados
+        """
+        resultado = {"criados": [], "recriados": [], "removidos": [], "ignorados": []}
+        existentes = self._indices_gerenciados(cursor)
+        definidos = set()
+
+        for indice in self.indices:
+            nome = indice["nome"]
+            colunas_tabela = self._colunas_tabela(cursor, indice["tabela"])
+
+            if not colunas_tabela or not set(indice["colunas"]) <= colunas_tabela:
+                resultado["ignorados"].append(nome)
+                continue
+
+            definidos.add(nome)
+            colunas_sql = ", ".join(indice["colunas"])
+
+            if nome in existentes:
+                if self._colunas_indice(cursor, nome) == indice["colunas"]:
+                    continue
+                cursor.execute(f"DROP INDEX {nome}")
+                resultado["recriados"].append(nome)
+            else:
+                resultado["criados"].append(nome)
+
+            cursor.execute(f"CREATE INDEX {nome} ON {indice['tabela']} ({colunas_sql})")
+
+        # Remover índices gerenciados que não fazem mais parte das definições
+        for nome in existentes:
+            if nome not in definidos and nome not in resultado["ignorados"]:
+                cursor.execute(f"DROP INDEX {nome}")
+                resultado["removidos"].append(nome)
+
+        if resultado["criados"] or resultado["recriados"]:
+            # Atualizar as estatísticas usadas pelo planejador
+            cursor.execute("ANALYZE")
+        else:
+            cursor.execute("PRAGMA optimize")
+
+        return resultado
+
+    def aplicar_e_verificar(self, cursor):
+        """
+        Aplica os índices e gera mensagens de log sobre as alterações e os planos verificados.
+
+        Args:
+            cursor: Cursor de uma conexão aberta (o commit fica a cargo de quem chama)
+
+        Returns:
+            list: Mensagens a registrar no log depois do commit
+        """
+        resultado = self.aplicar(cursor)
+        mensagens = []
+
+        for nome in resultado["criados"]:
+            mensagens.append(f"Índice {nome} criado")
+        for nome in resultado["recriados"]:
+            mensagens.append(f"Índice {nome} recriado com nova definição")
+        for nome in resultado["removidos"]:
+            mensagens.append(f"Índice obsoleto {nome} removido")
+
+        for item in self.verificar(cursor):
+            if not item["ok"]:
+                plano = item["plano"].replace("\n", " | ")
+                mensagens.append(f"Consulta não usa o índice {item['indice']} sem ordenação: {plano}")
+
+        return mensagens
+
+    def verificar(self, cursor):
+        """
+        Confere com o planejador se as listagens usam os índices esperados e evitam ordenação.
+
+        Args:
+            cursor: Cursor de uma conexão aberta
+
+        Returns:
+            list: Um dicionário por consulta com indice, plano, usa_indice, ordenacao_temporaria e ok
+        """
+        existentes = self._indices_gerenciados(cursor)
+        relatorio = []
+
+        for consulta in self.consultas:
+            if consulta["indice"] not in existentes:
+                continue
+
+            try:
+                cursor.execute(f"EXPLAIN QUERY PLAN {consulta['sql']}", consulta["parametros"])
+                plano = "\n".join(linha[-1] for linha in cursor.fetchall())
+            except sqlite3.Error as e:
+                plano = f"erro: {str(e)}"
+
+            usa_indice = consulta["indice"] in plano
+            ordenacao_temporaria = "TEMP B-TREE" in plano
+
+            relatorio.append({
+                "indice": consulta["indice"],
+                "sql": consulta["sql"],
+                "plano": plano,
+                "usa_indice": usa_indice,
+                "ordenacao_temporaria": ordenacao_temporaria,
+                "ok": usa_indice and not ordenacao_temporaria
+            })
+
+        return relatorio
@@ -0,0 +1,170 @@
+import math
+import time
+import datetime
+import threading
+
+
+# Falhas consecutivas toleradas antes do primeiro atraso
+FALHAS_SEM_ATRASO = 3
+
+# Atraso após a primeira falha além da tolerância; dobra a cada nova falha até o máximo
+ATRASO_INICIAL_S = 1
+ATRASO_MAXIMO_S = 15 * 60
+
+# Registros de log acumulados antes de uma gravação, e tempo máximo que esperam por ela
+TAMANHO_LOTE_LOG = 20
+INTERVALO_LOTE_LOG_S = 5
+
+
+def calcular_atraso(falhas):
+    """Segundos de bloqueio após a quantidade de falhas consecutivas informada."""
+    if falhas < FALHAS_SEM_ATRASO:
+        return 0
+    return min(ATRASO_MAXIMO_S, ATRASO_INICIAL_S * 2 ** (falhas - FALHAS_SEM_ATRASO))
+
+
+class GuardaAutenticacao:
+    """
+    Controle de tentativas de autenticação, gravado no banco para sobreviver a reinícios.
+
+    Cada alvo (por exemplo "senha") tem uma linha com as falhas consecutivas e o
+    instante em que a próxima tentativa volta a ser aceita. verificar() é
+    consultado antes de qualquer derivação: durante o bloqueio a tentativa é
+    recusada com uma leitura pela chave primária, sem derivar nada, e o atraso
+    dobra a cada falha além de FALHAS_SEM_ATRASO. Um sucesso zera o alvo.
+
+    As falhas gravadas servem só ao atraso. A autodestruição conta as falhas
+    da sessão em andamento: falhas somadas entre reinícios não podem apagar
+    o cofre.
+
+    Os logs das falhas e das recusas vão para um lote gravado de uma vez
+    (TAMANHO_LOTE_LOG registros, INTERVALO_LOTE_LOG_S segundos ou descarregar()),
+    para que uma sequência de tentativas não faça uma gravação por tentativa.
+    """
+
+    def __init__(self, conectar, gravar_logs):
+        """
+        Inicializa o guarda.
+
+        Args:
+            conectar (callable): Função que abre uma conexão com o banco de dados
+            gravar_logs (callable): Recebe uma lista de (tipo, mensagem, data) e grava todos de uma vez
+        """
+        self.conectar = conectar
+        self.gravar_logs = gravar_logs
+        self._pendentes = []
+        self._temporizador = None
+        self._trava = threading.Lock()
+
+    @staticmethod
+    def criar_estrutura(cursor):
+        """Cria a tabela de tentativas."""
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tentativas_autenticacao (
+            alvo TEXT PRIMARY KEY,
+            falhas INTEGER NOT NULL DEFAULT 0,
+            ultima_falha TEXT,
+            liberado_em REAL NOT NULL DEFAULT 0
+        )
+        """)
+
+    def _ler(self, alvo):
+        conn = self.conectar()
+        try:
+            linha = conn.execute(
+                "SELECT falhas, liberado_em FROM tentativas_autenticacao WHERE alvo = ?", (alvo,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return linha or (0, 0)
+
+    def falhas(self, alvo):
+        """Falhas consecutivas registradas para o alvo."""
+        return self._ler(alvo)[0]
+
+    def espera(self, alvo):
+        """Segundos até o alvo voltar a aceitar tentativas (0 se já aceita), sem registrar log."""
+        _, liberado_em = self._ler(alvo)
+        return max(0, math.ceil(liberado_em - time.time()))
+
+    def verificar(self, alvo):
+        """
+        Indica se uma tentativa pode ser feita agora.
+
+        Returns:
+            tuple: (permitido, segundos de espera restantes)
+        """
+        espera = self.espera(alvo)
+        if not espera:
+            return True, 0
+
+        self.registrar_log("autenticacao", f"Tentativa recusada durante o bloqueio ({alvo}, {espera} s restantes)")
+        return False, espera
+
+    def registrar_falha(self, alvo, limite=None):
+        """
+        Registra uma falha e aplica o próximo atraso.
+
+        Args:
+            alvo (str): O alvo da tentativa
+            limite (int, optional): Falhas a partir das quais o bloqueio passa direto ao máximo
+
+        Returns:
+            int: Falhas consecutivas após esta
+        """
+        conn = self.conectar()
+        try:
+            # Incremento e leitura na mesma transação: outra instância pode estar usando o mesmo banco
+            conn.execute(
+                "INSERT INTO tentativas_autenticacao (alvo, falhas, ultima_falha) VALUES (?, 1, ?) "
+                "ON CONFLICT(alvo) DO UPDATE SET falhas = falhas + 1, ultima_falha = excluded.ultima_falha",
+                (alvo, datetime.datetime.now().isoformat())
+            )
+            falhas = conn.execute("SELECT falhas FROM tentativas_autenticacao WHERE alvo = ?", (alvo,)).fetchone()[0]
+            atraso = ATRASO_MAXIMO_S if limite and falhas >= limite else calcular_atraso(falhas)
+            conn.execute(
+                "UPDATE tentativas_autenticacao SET liberado_em = ? WHERE alvo = ?", (time.time() + atraso, alvo)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.registrar_log("autenticacao", f"Tentativa de autenticação falhou ({alvo}, {falhas} consecutivas)")
+        return falhas
+
+    def registrar_sucesso(self, alvo):
+        """Zera as falhas do alvo e grava os logs pendentes."""
+        if self.falhas(alvo):
+            conn = self.conectar()
+            try:
+                conn.execute("DELETE FROM tentativas_autenticacao WHERE alvo = ?", (alvo,))
+                conn.commit()
+            finally:
+                conn.close()
+        self.descarregar()
+
+    # === Logs em lote ===
+
+    def registrar_log(self, tipo, mensagem):
+        """Acumula um log para a próxima gravação em lote."""
+        with self._trava:
+            self._pendentes.append((tipo, mensagem, datetime.datetime.now().isoformat()))
+            cheio = len(self._pendentes) >= TAMANHO_LOTE_LOG
+            if not cheio and self._temporizador is None:
+                self._temporizador = threading.Timer(INTERVALO_LOTE_LOG_S, self.descarregar)
+                self._temporizador.daemon = True
+                self._temporizador.start()
+
+        if cheio:
+            self.descarregar()
+
+    def descarregar(self):
+        """Grava os logs pendentes."""
+        with self._trava:
+            pendentes, self._pendentes = self._pendentes, []
+            if self._temporizador is not None:
+                self._temporizador.cancel()
+                self._temporizador = None
+
+        if pendentes:
+            self.gravar_logs(pendentes)
@@ -0,0 +1,125 @@
+import hmac
+import hashlib
+import secrets
+import threading
+
+
+# Tabelas com frase associada e a coluna que identifica cada linha
+TABELAS = {
+    "compartimentos": "compartimento_id",
+    "usuarios": "id"
+}
+
+# Bytes do HMAC guardados: o bastante para descartar frases erradas, pouco para confirmar uma frase
+TAMANHO_IMPRESSAO = 4
+
+
+class ImpressaoFrase:
+    """
+    Impressão curta e com chave da entropia de uma frase mnemônica, para descartar frases desconhecidas.
+
+    A impressão é o HMAC-SHA256 da entropia da frase (não da seed), com uma
+    chave aleatória do cofre, truncado em TAMANHO_IMPRESSAO bytes e gravado em
+    uma coluna indexada. Uma frase fora do BIP39 ou cuja impressão não existe
+    no banco é recusada com uma validação, um HMAC e uma busca no índice,
+    antes do PBKDF2 da seed. Como a impressão é curta, muitas frases
+    compartilham a mesma; ela só filtra, e a identificação continua sendo a
+    comparação com a seed derivada.
+
+    Linhas gravadas antes da impressão ficam com a coluna nula e continuam
+    aceitando qualquer frase válida (com a derivação completa) até que a
+    frase correta seja usada uma vez e registrar() preencha a coluna.
+    """
+
+    def __init__(self, conectar, bip39):
+        """
+        Inicializa a impressão.
+
+        Args:
+            conectar (callable): Função que abre uma conexão com o banco de dados
+            bip39 (BIP39Validator): Validador usado para extrair a entropia da frase
+        """
+        self.conectar = conectar
+        self.bip39 = bip39
+        self._chave = None
+        self._trava = threading.Lock()
+
+    @staticmethod
+    def criar_estrutura(cursor):
+        """Cria a tabela da chave e as colunas indexadas das impressões."""
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chave_impressao_frase (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            chave BLOB NOT NULL
+        )
+        """)
+
+        for tabela in TABELAS:
+            cursor.execute(f"PRAGMA table_info({tabela})")
+            colunas = {info[1] for info in cursor.fetchall()}
+            if colunas and "impressao_frase" not in colunas:
+                cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN impressao_frase TEXT")
+            if colunas:
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_impressao_frase ON {tabela} (impressao_frase)")
+
+    def _obter_chave(self):
+        if self._chave is None:
+            with self._trava:
+                if self._chave is None:
+                    conn = self.conectar()
+                    try:
+                        # INSERT OR IGNORE: outra conexão pode ter criado a chave ao mesmo tempo
+                        conn.execute(
+                            "INSERT OR IGNORE INTO chave_impressao_frase (id, chave) VALUES (1, ?)",
+                            (secrets.token_bytes(32),)
+                        )
+                        conn.commit()
+                        self._chave = conn.execute("SELECT chave FROM chave_impressao_frase WHERE id = 1").fetchone()[0]
+                    finally:
+                        conn.close()
+        return self._chave
+
+    def calcular(self, frase):
+        """
+        Calcula a impressão de uma frase.
+
+        Returns:
+            str: A impressão em hexadecimal, ou None se a frase não for válida no BIP39
+        """
+        entropia = self.bip39.frase_para_entropia(frase)
+        if entropia is None:
+            return None
+        return hmac.new(self._obter_chave(), entropia, hashlib.sha256).digest()[:TAMANHO_IMPRESSAO].hex()
+
+    def pode_corresponder(self, tabela, impressao):
+        """
+        Indica se alguma linha da tabela pode pertencer à frase dessa impressão.
+
+        Verdadeiro quando há uma linha com a mesma impressão ou ainda sem impressão;
+        só nesse caso vale a pena derivar a seed.
+        """
+        if tabela not in TABELAS:
+            raise ValueError(f"Tabela sem impressão de frase: {tabela}")
+
+        conn = self.conectar()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT 1 FROM {tabela} WHERE impressao_frase = ? OR impressao_frase IS NULL LIMIT 1",
+                (impressao,)
+            )
+            return cursor.fetchone() is not None
+        finally:
+            conn.close()
+
+    def registrar(self, tabela, identificador, impressao):
+        """Grava a impressão de uma linha cuja frase acabou de ser confirmada pela seed."""
+        conn = self.conectar()
+        try:
+            conn.execute(
+                f"UPDATE {tabela} SET impressao_frase = ? WHERE {TABELAS[tabela]} = ? AND impressao_frase IS NULL",
+                (impressao, identificador)
+            )
+            conn.commit()
+        finally:
+            conn.close()
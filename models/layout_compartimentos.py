@@ -0,0 +1,425 @@
+import re
+import time
+import threading
+
+
+# Colunas das tabelas compartilhadas por todos os compartimentos, distinguidos pela coluna compartimento.
+# A tabela senhas reúne as colunas do cofre legado (dados_criptografados, iv, descricao, categoria_id)
+# e as do modelo (senha, usuario, url, categoria, notas); por isso só título e data são obrigatórios.
+COLUNAS = {
+    "senhas": [
+        ("id", "INTEGER PRIMARY KEY"),
+        ("titulo", "TEXT NOT NULL"),
+        ("descricao", "TEXT"),
+        ("dados_criptografados", "TEXT"),
+        ("iv", "TEXT"),
+        ("senha", "TEXT"),
+        ("usuario", "TEXT"),
+        ("url", "TEXT"),
+        ("categoria", "TEXT"),
+        ("notas", "TEXT"),
+        ("data_criacao", "TEXT NOT NULL"),
+        ("data_modificacao", "TEXT"),
+        ("categoria_id", "INTEGER"),
+        ("compartimento", "TEXT DEFAULT 'principal'")
+    ],
+    "notas": [
+        ("id", "INTEGER PRIMARY KEY"),
+        ("titulo", "TEXT NOT NULL"),
+        ("conteudo_criptografado", "TEXT NOT NULL"),
+        ("iv", "TEXT NOT NULL"),
+        ("data_criacao", "TEXT NOT NULL"),
+        ("data_modificacao", "TEXT NOT NULL"),
+        ("categoria_id", "INTEGER"),
+        ("compartimento", "TEXT DEFAULT 'principal'")
+    ],
+    "arquivos": [
+        ("id", "INTEGER PRIMARY KEY"),
+        ("nome_original", "TEXT NOT NULL"),
+        ("nome_criptografado", "TEXT NOT NULL"),
+        ("descricao", "TEXT"),
+        ("iv", "TEXT NOT NULL"),
+        ("data_upload", "TEXT NOT NULL"),
+        ("categoria_id", "INTEGER"),
+        ("compartimento", "TEXT DEFAULT 'principal'"),
+        ("armazenamento", "TEXT DEFAULT 'legado'"),
+        ("tamanho", "INTEGER")
+    ],
+    "carteiras_btc": [
+        ("id", "INTEGER PRIMARY KEY"),
+        ("nome", "TEXT NOT NULL"),
+        ("descricao", "TEXT"),
+        ("frase_criptografada", "TEXT NOT NULL"),
+        ("iv", "TEXT NOT NULL"),
+        ("passphrase_criptografada", "TEXT"),
+        ("iv_passphrase", "TEXT"),
+        ("data_criacao", "TEXT NOT NULL"),
+        ("data_modificacao", "TEXT NOT NULL"),
+        ("categoria_id", "INTEGER"),
+        ("compartimento", "TEXT DEFAULT 'principal'")
+    ]
+}
+
+# Tabelas por compartimento do layout antigo: compartimento_<id>_<tabela>
+PADRAO_TABELA_LEGADA = re.compile(r"^compartimento_(.+)_(" + "|".join(COLUNAS) + r")$")
+
+TAMANHO_LOTE_PADRAO = 200
+
+
+def tabela_legada(compartimento, tabela):
+    """Nome da tabela do layout antigo que guardava `tabela` para um compartimento."""
+    return f"compartimento_{compartimento}_{tabela}"
+
+
+class LayoutCompartimentos:
+    """
+    Layout único de armazenamento dos compartimentos.
+
+    Senhas, notas, arquivos e carteiras de todos os compartimentos ficam nas
+    mesmas tabelas, filtradas pela coluna compartimento, que é a primeira
+    coluna dos índices de GerenciadorIndices. As tabelas por compartimento
+    do layout antigo (compartimento_<id>_senhas etc.) são esvaziadas em
+    segundo plano por MigradorCompartimentos.
+
+    Enquanto a migração não termina, consulta_compartimento() inclui as linhas
+    que ainda estão na tabela antiga, com o ID negativo. resolver_id()
+    converte um ID negativo no ID da tabela compartilhada, movendo a linha na
+    hora se o migrador ainda não chegou nela, e a tabela migracao_compartimentos
+    guarda a correspondência para IDs obtidos antes da migração.
+    """
+
+    def __init__(self):
+        """Inicializa o layout; as tabelas antigas pendentes são lidas em atualizar_estrutura()."""
+        self.pendentes = set()
+
+    @staticmethod
+    def _sql_criacao(tabela, nome=None):
+        definicoes = [f"{coluna} {tipo}" for coluna, tipo in COLUNAS[tabela]]
+        definicoes.append("FOREIGN KEY (categoria_id) REFERENCES categorias (id)")
+        return f"CREATE TABLE IF NOT EXISTS {nome or tabela} (\n    " + ",\n    ".join(definicoes) + "\n)"
+
+    @staticmethod
+    def criar_estrutura(cursor):
+        """Cria as tabelas compartilhadas e a tabela de correspondência de IDs migrados."""
+        for tabela in COLUNAS:
+            cursor.execute(LayoutCompartimentos._sql_criacao(tabela))
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS migracao_compartimentos (
+            tabela TEXT NOT NULL,
+            compartimento TEXT NOT NULL,
+            id_origem INTEGER NOT NULL,
+            id_destino INTEGER NOT NULL,
+            PRIMARY KEY (tabela, compartimento, id_origem)
+        )
+        """)
+
+    @staticmethod
+    def _info_colunas(cursor, tabela):
+        cursor.execute(f'PRAGMA table_info("{tabela}")')
+        return {info[1]: bool(info[3]) for info in cursor.fetchall()}
+
+    def _recriar_tabela(self, cursor, tabela, colunas_atuais):
+        """Recria uma tabela com a definição compartilhada, preservando todas as linhas."""
+        temporaria = f"{tabela}_unificada"
+        cursor.execute(f"DROP TABLE IF EXISTS {temporaria}")
+        cursor.execute(self._sql_criacao(tabela, temporaria))
+
+        # Colunas fora da definição compartilhada também são mantidas
+        definidas = {coluna for coluna, _ in COLUNAS[tabela]}
+        for coluna in colunas_atuais:
+            if coluna not in definidas:
+                cursor.execute(f"ALTER TABLE {temporaria} ADD COLUMN {coluna}")
+
+        comuns = list(colunas_atuais)
+        lista_colunas = ", ".join(comuns)
+        cursor.execute(f"INSERT INTO {temporaria} ({lista_colunas}) SELECT {lista_colunas} FROM {tabela}")
+        cursor.execute(f"DROP TABLE {tabela}")
+        cursor.execute(f"ALTER TABLE {temporaria} RENAME TO {tabela}")
+
+    def atualizar_estrutura(self, cursor):
+        """
+        Leva as tabelas existentes ao layout compartilhado sem perder colunas de nenhum dos dois esquemas.
+
+        Colunas ausentes são adicionadas; uma tabela só é recriada quando uma
+        coluna que deixou de ser obrigatória ainda tem NOT NULL (por exemplo,
+        senha no esquema do modelo ou dados_criptografados no do cofre legado).
+        Deve rodar antes de GerenciadorIndices, que recria os índices da tabela.
+
+        Args:
+            cursor: Cursor de uma conexão aberta (o commit fica a cargo de quem chama)
+
+        Returns:
+            list: Mensagens a registrar no log depois do commit
+        """
+        self.criar_estrutura(cursor)
+        mensagens = []
+
+        for tabela, definicoes in COLUNAS.items():
+            colunas_atuais = self._info_colunas(cursor, tabela)
+            opcionais = {coluna for coluna, tipo in definicoes if "NOT NULL" not in tipo and coluna != "id"}
+
+            if any(colunas_atuais.get(coluna) for coluna in opcionais):
+                self._recriar_tabela(cursor, tabela, colunas_atuais)
+                mensagens.append(f"Tabela {tabela} convertida para o layout compartilhado")
+                continue
+
+            for coluna, tipo in definicoes:
+                if coluna not in colunas_atuais and "NOT NULL" not in tipo:
+                    cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}")
+                    mensagens.append(f"Adicionada coluna {coluna} à tabela {tabela}")
+
+        self.pendentes = {nome for nome, _, _ in self.tabelas_legadas(cursor)}
+        if self.pendentes:
+            mensagens.append(f"{len(self.pendentes)} tabelas por compartimento aguardando migração")
+
+        return mensagens
+
+    @staticmethod
+    def tabelas_legadas(cursor):
+        """
+        Lista as tabelas por compartimento que ainda existem.
+
+        Returns:
+            list: Tuplas (nome da tabela, compartimento, tabela compartilhada)
+        """
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'compartimento%'")
+        legadas = []
+        for (nome,) in cursor.fetchall():
+            correspondencia = PADRAO_TABELA_LEGADA.match(nome)
+            if correspondencia:
+                legadas.append((nome, correspondencia.group(1), correspondencia.group(2)))
+        return legadas
+
+    # === Leitura ===
+
+    def consulta_compartimento(self, cursor, tabela, compartimento):
+        """
+        Monta a consulta de todas as linhas de um compartimento.
+
+        Sem tabela antiga pendente, é um SELECT na tabela compartilhada que usa
+        o índice por compartimento. Durante a migração, inclui com UNION ALL
+        as linhas que ainda não foram movidas, com o ID negativo.
+
+        Args:
+            cursor: Cursor de uma conexão aberta
+            tabela (str): Tabela compartilhada ("senhas", "notas", "arquivos" ou "carteiras_btc")
+            compartimento (str): Identificador do compartimento
+
+        Returns:
+            tuple: (sql, parâmetros) de um SELECT com as colunas da tabela compartilhada
+        """
+        sql = f"SELECT * FROM {tabela} WHERE compartimento = ?"
+        parametros = [compartimento]
+
+        legada = tabela_legada(compartimento, tabela)
+        if legada not in self.pendentes:
+            return sql, parametros
+
+        colunas_legadas = self._info_colunas(cursor, legada)
+        if not colunas_legadas:
+            # Migrada por outra conexão entre a leitura de pendentes e esta consulta
+            self.pendentes.discard(legada)
+            return sql, parametros
+
+        expressoes = []
+        for coluna in self._info_colunas(cursor, tabela):
+            if coluna == "id":
+                expressoes.append("-id")
+            elif coluna == "compartimento":
+                expressoes.append("?")
+            else:
+                expressoes.append(coluna if coluna in colunas_legadas else "NULL")
+
+        sql += f' UNION ALL SELECT {", ".join(expressoes)} FROM "{legada}"'
+        parametros.append(compartimento)
+        return sql, parametros
+
+    def resolver_id(self, cursor, tabela, compartimento, id_item):
+        """
+        Converte um ID de listagem no ID da tabela compartilhada.
+
+        IDs negativos vêm da tabela antiga: se a linha já foi migrada, o novo
+        ID vem de migracao_compartimentos; senão ela é movida agora. Se a linha
+        for movida, o commit fica a cargo de quem chama.
+
+        Returns:
+            int: ID na tabela compartilhada, ou None se o item não existir
+        """
+        id_item = int(id_item)
+        if id_item >= 0:
+            return id_item
+
+        conn = cursor.connection
+        if not conn.in_transaction:
+            # Impede que o migrador mova a mesma linha ao mesmo tempo
+            cursor.execute("BEGIN IMMEDIATE")
+
+        cursor.execute(
+            "SELECT id_destino FROM migracao_compartimentos WHERE tabela = ? AND compartimento = ? AND id_origem = ?",
+            (tabela, compartimento, -id_item)
+        )
+        linha = cursor.fetchone()
+        if linha:
+            return linha[0]
+
+        legada = tabela_legada(compartimento, tabela)
+        if not self._info_colunas(cursor, legada):
+            return None
+
+        movidas = self.mover_linhas(cursor, legada, compartimento, tabela, [-id_item])
+        return movidas.get(-id_item)
+
+    # === Migração ===
+
+    def mover_linhas(self, cursor, legada, compartimento, tabela, ids=None, limite=TAMANHO_LOTE_PADRAO):
+        """
+        Move linhas de uma tabela antiga para a tabela compartilhada.
+
+        Precisa rodar dentro de uma transação de escrita: a inserção, o registro
+        da correspondência de IDs e a exclusão da origem são confirmados juntos.
+
+        Args:
+            cursor: Cursor com uma transação aberta
+            legada (str): Tabela antiga de origem
+            compartimento (str): Compartimento gravado nas linhas movidas
+            tabela (str): Tabela compartilhada de destino
+            ids (list, optional): IDs específicos; por padrão as primeiras `limite` linhas
+            limite (int): Linhas movidas quando ids não é informado
+
+        Returns:
+            dict: ID de origem → ID na tabela compartilhada
+        """
+        colunas_destino = self._info_colunas(cursor, tabela)
+        comuns = [
+            coluna for coluna in self._info_colunas(cursor, legada)
+            if coluna in colunas_destino and coluna not in ("id", "compartimento")
+        ]
+        lista_colunas = ", ".join(comuns)
+
+        if ids is None:
+            cursor.execute(f'SELECT id, {lista_colunas} FROM "{legada}" ORDER BY id LIMIT ?', (limite,))
+        else:
+            marcadores = ", ".join("?" for _ in ids)
+            cursor.execute(f'SELECT id, {lista_colunas} FROM "{legada}" WHERE id IN ({marcadores})', list(ids))
+        linhas = cursor.fetchall()
+
+        movidas = {}
+        marcadores = ", ".join("?" for _ in range(len(comuns) + 1))
+        for linha in linhas:
+            cursor.execute(
+                f"INSERT INTO {tabela} ({lista_colunas}, compartimento) VALUES ({marcadores})",
+                tuple(linha[1:]) + (compartimento,)
+            )
+            movidas[linha[0]] = cursor.lastrowid
+
+        if movidas:
+            cursor.executemany(
+                "INSERT OR REPLACE INTO migracao_compartimentos (tabela, compartimento, id_origem, id_destino) "
+                "VALUES (?, ?, ?, ?)",
+                [(tabela, compartimento, origem, destino) for origem, destino in movidas.items()]
+            )
+            cursor.executemany(f'DELETE FROM "{legada}" WHERE id = ?', [(origem,) for origem in movidas])
+
+        return movidas
+
+
+class MigradorCompartimentos:
+    """
+    Migra, em segundo plano, as tabelas por compartimento para as tabelas compartilhadas.
+
+    Cada lote é movido em uma transação (inserção no destino, correspondência
+    de IDs e exclusão na origem), então uma interrupção nunca duplica nem
+    perde linhas e a migração continua de onde parou na próxima execução.
+    Uma tabela antiga é removida quando fica vazia.
+    """
+
+    def __init__(self, conectar, layout, tamanho_lote=TAMANHO_LOTE_PADRAO, pausa=0.05, registrar_log=None):
+        """
+        Inicializa o migrador.
+
+        Args:
+            conectar (callable): Função que abre uma conexão com o banco de dados
+            layout (LayoutCompartimentos): Layout compartilhado com as leituras
+            tamanho_lote (int): Linhas movidas por transação
+            pausa (float): Intervalo em segundos entre lotes, para não disputar o banco com a interface
+            registrar_log (callable, optional): Recebe (tipo, mensagem)
+        """
+        self.conectar = conectar
+        self.layout = layout
+        self.tamanho_lote = tamanho_lote
+        self.pausa = pausa
+        self.migrados = 0
+        self.em_execucao = False
+        self._parar = threading.Event()
+        self._thread = None
+        self.registrar_log = registrar_log
+
+    def _log(self, tipo, mensagem):
+        if self.registrar_log is not None:
+            try:
+                self.registrar_log(tipo, mensagem)
+            except Exception:
+                pass
+
+    def iniciar(self):
+        """Inicia a migração em uma thread de segundo plano, se houver tabelas pendentes."""
+        if self.em_execucao or not self.layout.pendentes:
+            return False
+
+        self._parar.clear()
+        self._thread = threading.Thread(target=self.executar, daemon=True)
+        self._thread.start()
+        return True
+
+    def parar(self):
+        """Solicita a interrupção da migração ao fim do lote atual."""
+        self._parar.set()
+
+    def executar(self):
+        """Executa a migração completa; pode ser chamada diretamente ou via iniciar()."""
+        self.em_execucao = True
+        try:
+            conn = self.conectar()
+            legadas = self.layout.tabelas_legadas(conn.cursor())
+            conn.close()
+
+            for legada, compartimento, tabela in legadas:
+                try:
+                    while not self._parar.is_set():
+                        if self._migrar_lote(legada, compartimento, tabela) == 0:
+                            break
+                        time.sleep(self.pausa)
+                except Exception as e:
+                    # Uma tabela com linhas incompatíveis não impede a migração das demais
+                    self._log("erro", f"Erro ao migrar a tabela {legada}: {str(e)}")
+        except Exception as e:
+            self._log("erro", f"Erro na migração das tabelas de compartimentos: {str(e)}")
+        finally:
+            self.em_execucao = False
+
+        return self.migrados
+
+    def _migrar_lote(self, legada, compartimento, tabela):
+        conn = self.conectar()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            movidas = self.layout.mover_linhas(
+                cursor, legada, compartimento, tabela, limite=self.tamanho_lote
+            )
+
+            if not movidas:
+                cursor.execute(f'DROP TABLE IF EXISTS "{legada}"')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        if not movidas:
+            self.layout.pendentes.discard(legada)
+
+        self.migrados += len(movidas)
+        return len(movidas)
@@ -0,0 +1,189 @@
+import sys
+import hmac
+import hashlib
+import secrets
+import mmap
+import ctypes
+import ctypes.util
+import threading
+
+
+def _carregar_travamento():
+    """Funções que travam e destravam páginas na memória física (mlock ou VirtualLock), se existirem."""
+    try:
+        if sys.platform == "win32":
+            kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+            travar, destravar = kernel32.VirtualLock, kernel32.VirtualUnlock
+            sucesso = lambda retorno: retorno != 0
+        else:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            travar, destravar = libc.mlock, libc.munlock
+            sucesso = lambda retorno: retorno == 0
+    except (OSError, AttributeError, TypeError):
+        return None, None
+
+    for funcao in (travar, destravar):
+        funcao.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        funcao.restype = ctypes.c_int
+    return (lambda inicio: sucesso(travar(inicio, mmap.PAGESIZE))), (lambda inicio: destravar(inicio, mmap.PAGESIZE))
+
+
+_travar_pagina, _destravar_pagina = _carregar_travamento()
+MLOCK_DISPONIVEL = _travar_pagina is not None
+
+# Buffers por página travada: buffers pequenos dividem páginas, e uma página só é destravada
+# quando o último buffer nela é zerado
+_paginas_travadas = {}
+_trava_paginas = threading.Lock()
+
+
+def _endereco(buffer):
+    visao = (ctypes.c_char * len(buffer)).from_buffer(buffer)
+    try:
+        return ctypes.addressof(visao)
+    finally:
+        del visao
+
+
+def _paginas(inicio, tamanho):
+    primeira = inicio - inicio % mmap.PAGESIZE
+    return range(primeira, inicio + tamanho, mmap.PAGESIZE)
+
+
+class BufferSeguro(bytearray):
+    """
+    Bytes de uma chave ou de um segredo descriptografado, que podem ser zerados.
+
+    É um bytearray de tamanho fixo, aceito onde a biblioteca de criptografia
+    e o hmac aceitam chaves, sem cópias imutáveis em bytes. As páginas que o
+    contêm são travadas na memória física (mlock/VirtualLock) quando o
+    sistema permite, para que não sejam gravadas em swap. zerar() apaga o
+    conteúdo e esvazia o buffer, de modo que quem ainda tiver uma referência
+    recebe um erro de tamanho de chave em vez de usar zeros como chave; o
+    buffer também é zerado ao sair de um bloco with e ao ser coletado.
+
+    Operações que mudariam o tamanho são recusadas, porque o bytearray
+    realocaria o conteúdo e deixaria a cópia antiga para trás.
+    """
+
+    def __init__(self, dados=0):
+        """
+        Cria o buffer.
+
+        Args:
+            dados (bytes ou int): Conteúdo inicial, ou o tamanho de um buffer zerado
+        """
+        super().__init__(dados)
+        self._paginas = ()
+        self.travado = False
+        if MLOCK_DISPONIVEL and len(self):
+            self._travar()
+
+    @classmethod
+    def de_texto(cls, texto):
+        """Cria o buffer com o texto em UTF-8."""
+        return cls(texto.encode('utf-8'))
+
+    def _travar(self):
+        paginas = _paginas(_endereco(self), len(self))
+        with _trava_paginas:
+            travadas = []
+            for pagina in paginas:
+                if _paginas_travadas.get(pagina) or _travar_pagina(pagina):
+                    _paginas_travadas[pagina] = _paginas_travadas.get(pagina, 0) + 1
+                    travadas.append(pagina)
+        self._paginas = tuple(travadas)
+        self.travado = len(travadas) == len(paginas)
+
+    def _destravar(self):
+        with _trava_paginas:
+            for pagina in self._paginas:
+                _paginas_travadas[pagina] -= 1
+                if not _paginas_travadas[pagina]:
+                    del _paginas_travadas[pagina]
+                    _destravar_pagina(pagina)
+        self._paginas = ()
+        self.travado = False
+
+    def texto(self):
+        """
+        Conteúdo como texto, para widgets e área de transferência.
+
+        A str retornada é uma cópia que não pode ser zerada; deve ser obtida só no momento de usar.
+        """
+        return self.decode('utf-8')
+
+    def zerar(self):
+        """Sobrescreve o conteúdo com zeros, destrava as páginas e esvazia o buffer."""
+        if len(self):
+            ctypes.memset(_endereco(self), 0, len(self))
+        if self._paginas:
+            self._destravar()
+        try:
+            super().clear()
+        except BufferError:
+            # Há uma visão exportada em uso (por exemplo, numa operação de outra thread): fica zerado
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.zerar()
+
+    def __del__(self):
+        try:
+            self.zerar()
+        except Exception:
+            pass
+
+    def __eq__(self, outro):
+        try:
+            return hmac.compare_digest(self, outro)
+        except TypeError:
+            return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"BufferSeguro(<{len(self)} bytes>)"
+
+    __str__ = __repr__
+
+    def _tamanho_fixo(self, *args, **kwargs):
+        raise TypeError("BufferSeguro tem tamanho fixo")
+
+    append = extend = insert = pop = remove = clear = _tamanho_fixo
+    __iadd__ = __imul__ = __delitem__ = _tamanho_fixo
+
+
+# Segundos até a área de transferência ser limpa depois de receber um segredo
+TEMPO_AREA_TRANSFERENCIA_S = 30
+
+
+def copiar_para_area_transferencia(widget, segredo, segundos=TEMPO_AREA_TRANSFERENCIA_S):
+    """
+    Copia um BufferSeguro para a área de transferência do Tk e a limpa depois de alguns segundos.
+
+    A limpeza é agendada na janela raiz (sobrevive ao fechamento da janela que copiou)
+    e só acontece se a área de transferência ainda contiver o segredo, comparado por
+    um HMAC com chave descartável em vez de uma cópia do texto.
+    """
+    chave = secrets.token_bytes(32)
+    impressao = hmac.new(chave, segredo, hashlib.sha256).digest()
+
+    widget.clipboard_clear()
+    widget.clipboard_append(segredo.texto())
+
+    raiz = widget.nametowidget(".")
+
+    def limpar():
+        try:
+            atual = raiz.clipboard_get()
+        except Exception:
+            # Área de transferência vazia, com outro tipo de conteúdo ou aplicação encerrada
+            return
+        if hmac.compare_digest(hmac.new(chave, atual.encode('utf-8'), hashlib.sha256).digest(), impressao):
+            raiz.clipboard_clear()
+
+    raiz.after(int(segundos * 1000), limpar)
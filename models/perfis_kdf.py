@@ -0,0 +1,250 @@
+import hmac
+import time
+import base64
+import secrets
+import hashlib
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+try:
+    from cryptography.hazmat.primitives.kdf.argon2 import Argon2id
+    ARGON2_DISPONIVEL = True
+except ImportError:
+    ARGON2_DISPONIVEL = False
+
+
+# Latência de desbloqueio buscada pela calibração
+ALVO_PADRAO_MS = 250
+
+TAMANHO_SALT = 16
+TAMANHO_CHAVE = 32
+
+# Parâmetros mínimos de cada algoritmo; a calibração nunca escolhe menos que isso
+# pbkdf2-sha256: i = iterações | scrypt: n = custo (potência de 2), r = bloco, p = paralelismo
+# argon2id: m = memória em KiB, t = passadas, p = faixas
+PISOS = {
+    "pbkdf2-sha256": {"i": 100000},
+    "scrypt": {"n": 2 ** 14, "r": 8, "p": 1},
+    "argon2id": {"m": 65536, "t": 2, "p": 1}
+}
+
+# Ordem de preferência: um perfil de algoritmo anterior na lista é considerado mais fraco
+PREFERENCIA = ["pbkdf2-sha256", "scrypt", "argon2id"]
+
+# Perfil dos registros gravados antes dos perfis (PBKDF2-SHA256 fixo em 100.000 iterações)
+PERFIL_LEGADO = "pbkdf2-sha256$i=100000"
+
+# Limites da calibração (o scrypt usa 128 * n * r bytes de memória)
+N_MAXIMO_SCRYPT = 2 ** 20
+T_MAXIMO_ARGON2 = 64
+
+
+class PerfilKDF:
+    """
+    Algoritmo e parâmetros de uma derivação de chave a partir de senha.
+
+    Um perfil é gravado junto de cada registro derivado de senha, no formato
+    "algoritmo$parametro=valor,...", então registros antigos continuam
+    legíveis quando o perfil padrão muda e podem ser refeitos com o perfil
+    novo no próximo login bem-sucedido (ver precisa_atualizar).
+    """
+
+    def __init__(self, algoritmo, **parametros):
+        if algoritmo not in PISOS:
+            raise ValueError(f"Algoritmo de derivação desconhecido: {algoritmo}")
+        if algoritmo == "argon2id" and not ARGON2_DISPONIVEL:
+            raise ValueError("Argon2id requer cryptography 44 ou superior")
+
+        self.algoritmo = algoritmo
+        self.parametros = {**PISOS[algoritmo], **{nome: int(valor) for nome, valor in parametros.items()}}
+
+    @classmethod
+    def decodificar(cls, texto):
+        """Lê um perfil no formato "algoritmo$parametro=valor,..."."""
+        algoritmo, _, parametros = (texto or PERFIL_LEGADO).partition("$")
+        valores = dict(par.split("=", 1) for par in parametros.split(",") if par)
+        return cls(algoritmo, **valores)
+
+    def codificar(self):
+        """Representação textual gravada com o registro."""
+        parametros = ",".join(f"{nome}={valor}" for nome, valor in sorted(self.parametros.items()))
+        return f"{self.algoritmo}${parametros}"
+
+    def __eq__(self, outro):
+        return isinstance(outro, PerfilKDF) and self.codificar() == outro.codificar()
+
+    def __repr__(self):
+        return f"PerfilKDF({self.codificar()!r})"
+
+    def derivar(self, senha, salt, tamanho=TAMANHO_CHAVE):
+        """
+        Deriva bytes a partir da senha.
+
+        Args:
+            senha (str ou bytes): A senha
+            salt (bytes): O salt do registro
+            tamanho (int): Quantidade de bytes derivados
+
+        Returns:
+            bytes: O material derivado
+        """
+        if isinstance(senha, str):
+            senha = senha.encode('utf-8')
+
+        p = self.parametros
+        if self.algoritmo == "pbkdf2-sha256":
+            return hashlib.pbkdf2_hmac("sha256", senha, salt, p["i"], tamanho)
+
+        if self.algoritmo == "scrypt":
+            memoria = 128 * p["n"] * p["r"] * (p["p"] + 1)
+            return hashlib.scrypt(senha, salt=salt, n=p["n"], r=p["r"], p=p["p"], maxmem=memoria, dklen=tamanho)
+
+        return Argon2id(
+            salt=salt, length=tamanho, iterations=p["t"], lanes=p["p"], memory_cost=p["m"]
+        ).derive(senha)
+
+    def derivar_em(self, senha, salt, destino):
+        """
+        Deriva len(destino) bytes diretamente em um buffer gravável (ex.: BufferSeguro).
+
+        Com cryptography 47 ou superior (derive_into) o material não passa por um bytes
+        intermediário; em versões anteriores, é derivado e copiado.
+        """
+        if isinstance(senha, str):
+            senha = senha.encode('utf-8')
+
+        p = self.parametros
+        if self.algoritmo == "pbkdf2-sha256":
+            kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=len(destino), salt=salt, iterations=p["i"])
+        elif self.algoritmo == "scrypt":
+            kdf = Scrypt(salt=salt, length=len(destino), n=p["n"], r=p["r"], p=p["p"])
+        else:
+            kdf = Argon2id(salt=salt, length=len(destino), iterations=p["t"], lanes=p["p"], memory_cost=p["m"])
+
+        if hasattr(kdf, "derive_into"):
+            kdf.derive_into(senha, destino)
+        else:
+            destino[:] = kdf.derive(senha)
+        return destino
+
+    def mais_fraco_que(self, outro):
+        """Indica se este perfil deve ser substituído pelo outro."""
+        if self.algoritmo != outro.algoritmo:
+            return PREFERENCIA.index(self.algoritmo) < PREFERENCIA.index(outro.algoritmo)
+        return any(self.parametros[nome] < valor for nome, valor in outro.parametros.items())
+
+
+def algoritmo_recomendado():
+    """Argon2id quando disponível, senão scrypt."""
+    return "argon2id" if ARGON2_DISPONIVEL else "scrypt"
+
+
+def _medir(perfil):
+    inicio = time.perf_counter()
+    perfil.derivar(b"calibracao", b"\0" * TAMANHO_SALT)
+    return (time.perf_counter() - inicio) * 1000
+
+
+def calibrar(alvo_ms=ALVO_PADRAO_MS, algoritmo=None):
+    """
+    Mede esta máquina e escolhe os parâmetros que levam cerca de alvo_ms por derivação.
+
+    O parâmetro de tempo de cada algoritmo (iterações do PBKDF2, n do scrypt,
+    passadas do Argon2id) cresce a partir do piso até atingir o alvo; a memória
+    do Argon2id fica no piso de 64 MiB.
+
+    Args:
+        alvo_ms (float): Latência desejada por derivação
+        algoritmo (str, optional): Algoritmo a calibrar; por padrão, algoritmo_recomendado()
+
+    Returns:
+        PerfilKDF: O perfil calibrado
+    """
+    algoritmo = algoritmo or algoritmo_recomendado()
+    perfil = PerfilKDF(algoritmo)
+
+    if algoritmo == "pbkdf2-sha256":
+        # Custo linear nas iterações: uma medição basta
+        iteracoes = perfil.parametros["i"] * alvo_ms / _medir(perfil)
+        return PerfilKDF(algoritmo, i=max(PISOS[algoritmo]["i"], round(iteracoes, -3)))
+
+    if algoritmo == "scrypt":
+        # n precisa ser potência de 2: dobrar enquanto a próxima medição não passar do alvo
+        tempo = _medir(perfil)
+        while tempo * 2 <= alvo_ms and perfil.parametros["n"] < N_MAXIMO_SCRYPT:
+            perfil = PerfilKDF(algoritmo, n=perfil.parametros["n"] * 2)
+            tempo = _medir(perfil)
+        return perfil
+
+    # Argon2id: custo linear nas passadas
+    passadas = perfil.parametros["t"] * alvo_ms / _medir(perfil)
+    return PerfilKDF(algoritmo, t=min(T_MAXIMO_ARGON2, max(PISOS[algoritmo]["t"], round(passadas))))
+
+
+# === Verificadores de senha ===
+
+def _b64(dados):
+    return base64.b64encode(dados).decode().rstrip("=")
+
+
+def _de_b64(texto):
+    return base64.b64decode(texto + "=" * (-len(texto) % 4))
+
+
+def gerar_verificador(senha, perfil):
+    """
+    Cria o verificador de uma senha: "$algoritmo$parametros$salt$hash".
+
+    O verificador leva o próprio salt e os parâmetros, independentes do salt
+    usado para derivar chaves de dados.
+    """
+    salt = secrets.token_bytes(TAMANHO_SALT)
+    return f"${perfil.codificar()}${_b64(salt)}${_b64(perfil.derivar(senha, salt))}"
+
+
+def perfil_do_verificador(armazenado):
+    """Perfil de um verificador, ou None para o hash SHA-512 legado."""
+    if not armazenado or not armazenado.startswith("$"):
+        return None
+    algoritmo, parametros = armazenado[1:].split("$")[:2]
+    return PerfilKDF.decodificar(f"{algoritmo}${parametros}")
+
+
+def verificar_senha(senha, armazenado, salt_legado=None):
+    """
+    Confere a senha com um verificador ou com o hash SHA-512 legado, em tempo constante.
+
+    Args:
+        senha (str): A senha fornecida
+        armazenado (str): O verificador gravado
+        salt_legado (str, optional): Salt do hash legado (coluna salt do registro)
+
+    Returns:
+        bool: True se a senha confere
+    """
+    if not armazenado:
+        return False
+
+    if not armazenado.startswith("$"):
+        calculado = hashlib.sha512((senha + (salt_legado or "")).encode()).hexdigest()
+        return hmac.compare_digest(calculado, armazenado)
+
+    _, algoritmo, parametros, salt, esperado = armazenado.split("$")
+    perfil = PerfilKDF.decodificar(f"{algoritmo}${parametros}")
+    esperado = _de_b64(esperado)
+    return hmac.compare_digest(perfil.derivar(senha, _de_b64(salt), len(esperado)), esperado)
+
+
+def precisa_atualizar(perfil_atual, perfil_alvo):
+    """
+    Indica se um registro com perfil_atual deve ser refeito com perfil_alvo.
+
+    Args:
+        perfil_atual (PerfilKDF ou None): Perfil do registro (None para o formato legado)
+        perfil_alvo (PerfilKDF ou None): Perfil configurado (None desativa a atualização)
+    """
+    if perfil_alvo is None:
+        return False
+    return perfil_atual is None or perfil_atual.mais_fraco_que(perfil_alvo)
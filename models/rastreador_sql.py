@@ -0,0 +1,350 @@
+import re
+import time
+import sqlite3
+import datetime
+import threading
+from collections import deque
+
+
+# Comandos para os quais o SQLite consegue gerar um plano de execução
+COMANDOS_COM_PLANO = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+# Comandos que devolvem linhas (o tempo de leitura também é contabilizado)
+COMANDOS_DE_CONSULTA = ("SELECT", "WITH", "PRAGMA", "EXPLAIN")
+
+
+def _normalizar_sql(sql):
+    """Remove espaços redundantes para agrupar comandos iguais nas estatísticas."""
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def _comando(sql):
+    """Retorna a primeira palavra do comando SQL em maiúsculas."""
+    partes = sql.lstrip().split(None, 1)
+    return partes[0].upper() if partes else ""
+
+
+def formato_parametros(parametros):
+    """
+    Descreve o formato dos parâmetros sem expor seus valores.
+
+    Args:
+        parametros: Sequência ou dicionário de parâmetros do comando
+
+    Returns:
+        str: Descrição como "(str, int)" ou "{nome: str}"
+    """
+    if parametros is None:
+        return "()"
+
+    if isinstance(parametros, dict):
+        itens = ", ".join(f"{chave}: {type(valor).__name__}" for chave, valor in parametros.items())
+        return "{" + itens + "}"
+
+    try:
+        return "(" + ", ".join(type(valor).__name__ for valor in parametros) + ")"
+    except TypeError:
+        return type(parametros).__name__
+
+
+def parametros_nulos(parametros):
+    """
+    Parâmetros do mesmo formato com todos os valores trocados por NULL.
+
+    Bastam para o EXPLAIN QUERY PLAN, sem manter em memória os valores reais
+    (textos cifrados, ivs, hashes) até a captura do plano.
+    """
+    if parametros is None:
+        return ()
+
+    if isinstance(parametros, dict):
+        return dict.fromkeys(parametros)
+
+    try:
+        return (None,) * len(parametros)
+    except TypeError:
+        return ()
+
+
+class CursorRastreado(sqlite3.Cursor):
+    """Cursor que mede duração e linhas de cada comando executado."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._rastreador = None
+        self._pendente = None
+
+    def execute(self, sql, parametros=()):
+        self._finalizar()
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            self._iniciar_registro(sql, parametros, inicio)
+
+    def executemany(self, sql, sequencia_parametros):
+        self._finalizar()
+        sequencia_parametros = list(sequencia_parametros)
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, sequencia_parametros)
+        finally:
+            amostra = sequencia_parametros[0] if sequencia_parametros else ()
+            self._iniciar_registro(sql, amostra, inicio, lote=len(sequencia_parametros))
+
+    def executescript(self, script):
+        self._finalizar()
+        inicio = time.perf_counter()
+        try:
+            return super().executescript(script)
+        finally:
+            self._iniciar_registro(script, (), inicio)
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        linha = super().fetchone()
+        self._acumular(inicio, 0 if linha is None else 1)
+        if linha is None:
+            self._finalizar()
+        return linha
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        linhas = super().fetchmany(self.arraysize if size is None else size)
+        self._acumular(inicio, len(linhas))
+        if not linhas:
+            self._finalizar()
+        return linhas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        linhas = super().fetchall()
+        self._acumular(inicio, len(linhas))
+        self._finalizar()
+        return linhas
+
+    def __next__(self):
+        inicio = time.perf_counter()
+        try:
+            linha = super().__next__()
+        except StopIteration:
+            self._acumular(inicio, 0)
+            self._finalizar()
+            raise
+        self._acumular(inicio, 1)
+        return linha
+
+    def close(self):
+        self._finalizar()
+        super().close()
+
+    def _iniciar_registro(self, sql, parametros, inicio, lote=None):
+        """Abre o registro do comando; consultas só fecham após a leitura das linhas."""
+        if self._rastreador is None:
+            return
+
+        self._pendente = {
+            "sql": sql,
+            "parametros": parametros,
+            "lote": lote,
+            "duracao": time.perf_counter() - inicio,
+            "linhas": 0
+        }
+
+        if _comando(sql) not in COMANDOS_DE_CONSULTA:
+            self._pendente["linhas"] = max(self.rowcount, 0)
+            self._finalizar()
+        else:
+            # Consultas lidas parcialmente são finalizadas quando a conexão fecha
+            self.connection._cursores_pendentes.add(self)
+
+    def _acumular(self, inicio, linhas):
+        if self._pendente is not None:
+            self._pendente["duracao"] += time.perf_counter() - inicio
+            self._pendente["linhas"] += linhas
+
+    def _finalizar(self):
+        pendente, self._pendente = self._pendente, None
+        if pendente is not None and self._rastreador is not None:
+            self.connection._cursores_pendentes.discard(self)
+            self._rastreador.registrar(**pendente)
+
+
+class ConexaoRastreada(sqlite3.Connection):
+    """Conexão que entrega cursores rastreados e descarrega os diagnósticos ao fechar."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._rastreador = None
+        self._cursores_pendentes = set()
+
+    def cursor(self, factory=CursorRastreado):
+        cursor = super().cursor(factory)
+        if isinstance(cursor, CursorRastreado):
+            cursor._rastreador = self._rastreador
+        return cursor
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, sequencia_parametros):
+        return self.cursor().executemany(sql, sequencia_parametros)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+    def close(self):
+        for cursor in list(self._cursores_pendentes):
+            cursor._finalizar()
+        super().close()
+
+        # Só gravar diagnósticos depois de liberar os bloqueios desta conexão
+        if self._rastreador is not None:
+            self._rastreador.descarregar_diagnosticos()
+
+
+class RastreadorSQL:
+    """
+    Camada de rastreamento para os comandos SQL do cofre.
+
+    Registra texto do comando, formato dos parâmetros, número de linhas e
+    duração. Comandos acima do limite configurado têm o EXPLAIN QUERY PLAN
+    capturado e gravado na tabela diagnostico_consultas. Os valores dos
+    parâmetros nunca são guardados: o plano é obtido com NULL no lugar deles.
+    """
+
+    def __init__(self, caminho_db, limite_lento_ms=100, capacidade=500, registrar_log=None):
+        """
+        Inicializa o rastreador.
+
+        Args:
+            caminho_db (str): Caminho do banco de dados SQLite
+            limite_lento_ms (float): Duração a partir da qual um comando é considerado lento
+            capacidade (int): Quantidade de comandos recentes mantidos em memória
+            registrar_log (callable, optional): Recebe (tipo, mensagem) para erros ao gravar diagnósticos
+        """
+        self.caminho_db = caminho_db
+        self.limite_lento_ms = limite_lento_ms
+        self.ativo = True
+        self.registrar_log = registrar_log
+        self.recentes = deque(maxlen=capacidade)
+        self._estatisticas = {}
+        self._lentos_pendentes = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def criar_estrutura(cursor):
+        """Cria a tabela de diagnósticos de consultas lentas."""
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS diagnostico_consultas (
+            id INTEGER PRIMARY KEY,
+            sql TEXT NOT NULL,
+            formato_parametros TEXT,
+            linhas INTEGER,
+            duracao_ms REAL NOT NULL,
+            plano TEXT,
+            data TEXT NOT NULL
+        )
+        """)
+
+    def conectar(self, **kwargs):
+        """
+        Abre uma conexão rastreada com o banco de dados.
+
+        Returns:
+            sqlite3.Connection: Conexão cujos cursores são rastreados
+        """
+        conn = sqlite3.connect(self.caminho_db, factory=ConexaoRastreada, **kwargs)
+        if self.ativo:
+            conn._rastreador = self
+        return conn
+
+    def registrar(self, sql, parametros, duracao, linhas, lote=None):
+        """Registra a execução de um comando e agenda a captura do plano se for lento."""
+        duracao_ms = duracao * 1000
+        sql_normalizado = _normalizar_sql(sql)
+        formato = formato_parametros(parametros)
+        if lote is not None:
+            formato = f"{lote} x {formato}"
+
+        registro = {
+            "sql": sql_normalizado,
+            "formato_parametros": formato,
+            "linhas": linhas,
+            "duracao_ms": duracao_ms,
+            "data": datetime.datetime.now().isoformat()
+        }
+
+        with self._lock:
+            self.recentes.append(registro)
+
+            estatistica = self._estatisticas.setdefault(
+                sql_normalizado, {"execucoes": 0, "total_ms": 0.0, "maximo_ms": 0.0, "linhas": 0}
+            )
+            estatistica["execucoes"] += 1
+            estatistica["total_ms"] += duracao_ms
+            estatistica["maximo_ms"] = max(estatistica["maximo_ms"], duracao_ms)
+            estatistica["linhas"] += linhas
+
+            if duracao_ms >= self.limite_lento_ms:
+                # Só o formato dos parâmetros fica em memória até a captura do plano
+                self._lentos_pendentes.append((registro, sql, parametros_nulos(parametros)))
+
+    def estatisticas(self):
+        """
+        Retorna as estatísticas agregadas por comando, dos mais custosos aos mais baratos.
+
+        Returns:
+            list: Lista de dicionários com sql, execucoes, total_ms, medio_ms, maximo_ms e linhas
+        """
+        with self._lock:
+            itens = [
+                dict(sql=sql, medio_ms=dados["total_ms"] / dados["execucoes"], **dados)
+                for sql, dados in self._estatisticas.items()
+            ]
+
+        return sorted(itens, key=lambda item: item["total_ms"], reverse=True)
+
+    def capturar_plano(self, conn, sql, parametros):
+        """
+        Captura o EXPLAIN QUERY PLAN de um comando.
+
+        Returns:
+            str: Plano em texto, uma linha por nó, ou None se não for possível obtê-lo
+        """
+        if _comando(sql) not in COMANDOS_COM_PLANO:
+            return None
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parametros if parametros is not None else ())
+            return "\n".join(linha[-1] for linha in cursor.fetchall()) or None
+        except sqlite3.Error:
+            return None
+
+    def descarregar_diagnosticos(self):
+        """Captura os planos dos comandos lentos pendentes e grava na tabela de diagnósticos."""
+        with self._lock:
+            pendentes, self._lentos_pendentes = self._lentos_pendentes, []
+
+        if not pendentes:
+            return
+
+        try:
+            # Conexão sem rastreamento para não registrar os próprios diagnósticos
+            conn = sqlite3.connect(self.caminho_db)
+            cursor = conn.cursor()
+            self.criar_estrutura(cursor)
+
+            for registro, sql, parametros in pendentes:
+                plano = self.capturar_plano(conn, sql, parametros)
+                cursor.execute(
+                    "INSERT INTO diagnostico_consultas (sql, formato_parametros, linhas, duracao_ms, plano, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    (registro["sql"], registro["formato_parametros"], registro["linhas"], registro["duracao_ms"], plano, registro["data"])
+                )
+
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            if self.registrar_log is not None:
+                self.registrar_log("erro", f"Erro ao gravar diagnóstico de consultas: {str(e)}")
@@ -0,0 +1,283 @@
+import os
+import sqlite3
+import tempfile
+
+from models.armazenamento_fragmentado import ARMAZENAMENTO_AUSENTE
+from models.contexto_cifra import versao_do_iv
+
+
+# Tabelas de itens que podem ser restaurados individualmente e a coluna usada como título
+TABELAS_ITENS = {
+    "senha": ("senhas", "titulo"),
+    "nota": ("notas", "titulo"),
+    "arquivo": ("arquivos", "nome_original")
+}
+
+# Coluna cifrada dos itens cujo texto cifrado está preso ao ID da linha
+COLUNAS_CIFRADAS = {
+    "senha": "dados_criptografados",
+    "nota": "conteudo_criptografado"
+}
+
+
+class RestauracaoParcial:
+    """
+    Restaura itens, arquivos ou compartimentos inteiros de um backup sem substituir os dados atuais.
+
+    Apenas o membro sistema.db do backup é extraído (para um arquivo
+    temporário) e, de um arquivo em blocos, somente os seus blocos; os demais
+    quadros do backup nem chegam a ser decifrados. Itens que já existem de
+    forma idêntica são mantidos; se o ID estiver ocupado por outro conteúdo,
+    o item restaurado recebe um novo ID, e uma senha ou nota cifrada com o
+    ID nos dados associados é cifrada de novo com o contexto do seu
+    compartimento, que precisa estar desbloqueado.
+    """
+
+    def __init__(self, leitor, banco_dados, armazem_blocos, armazenamento_arquivos, caminho_arquivos, contextos=None):
+        """
+        Inicializa a restauração.
+
+        Args:
+            leitor (LeitorBackup): Backup aberto
+            banco_dados (BancoDados): Banco de dados atual
+            armazem_blocos (ArmazemBlocos): Armazém de blocos atual
+            armazenamento_arquivos (ArmazenamentoFragmentado): Armazenamento dos arquivos migrados
+            caminho_arquivos (str): Diretório plano dos arquivos legados
+            contextos (callable, optional): Recebe um compartimento e retorna o seu ContextoCifra (ou None)
+        """
+        self.leitor = leitor
+        self.banco_dados = banco_dados
+        self.armazem_blocos = armazem_blocos
+        self.armazenamento_arquivos = armazenamento_arquivos
+        self.caminho_arquivos = caminho_arquivos
+        self.contextos = contextos
+        self._caminho_snapshot = None
+
+        # Localizar membros do armazenamento pelo nome do objeto, qualquer que seja o diretório
+        self._membros_arquivos = {}
+        for entrada in leitor.conteudo():
+            if entrada["nome"].startswith("arquivos/"):
+                self._membros_arquivos[entrada["nome"].rsplit("/", 1)[-1]] = entrada["nome"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.fechar()
+
+    def fechar(self):
+        """Remove o snapshot temporário do banco extraído do backup."""
+        if self._caminho_snapshot and os.path.exists(self._caminho_snapshot):
+            os.remove(self._caminho_snapshot)
+        self._caminho_snapshot = None
+
+    def _conectar_snapshot(self):
+        if self._caminho_snapshot is None:
+            descritor, caminho = tempfile.mkstemp(
+                prefix="restauracao_", suffix=".db", dir=os.path.dirname(self.banco_dados.caminho_db)
+            )
+            os.close(descritor)
+            self.leitor.extrair_membro("sistema.db", caminho)
+            self._caminho_snapshot = caminho
+
+        return sqlite3.connect(self._caminho_snapshot)
+
+    @staticmethod
+    def _colunas(cursor, tabela):
+        cursor.execute(f"PRAGMA table_info({tabela})")
+        return [info[1] for info in cursor.fetchall()]
+
+    def listar_itens(self):
+        """
+        Lista os itens contidos no banco do backup.
+
+        Returns:
+            dict: Por tipo ("senha", "nota", "arquivo", "compartimento"), listas de dicionários
+        """
+        conn = self._conectar_snapshot()
+        cursor = conn.cursor()
+        itens = {}
+
+        for tipo, (tabela, coluna_titulo) in TABELAS_ITENS.items():
+            colunas = self._colunas(cursor, tabela)
+            if coluna_titulo not in colunas:
+                itens[tipo] = []
+                continue
+            coluna_compartimento = "compartimento" if "compartimento" in colunas else "'principal'"
+            cursor.execute(f"SELECT id, {coluna_titulo}, {coluna_compartimento} FROM {tabela} ORDER BY id")
+            itens[tipo] = [
+                {"id": id_item, "titulo": titulo, "compartimento": compartimento}
+                for id_item, titulo, compartimento in cursor.fetchall()
+            ]
+
+        cursor.execute("SELECT compartimento_id, nome FROM compartimentos ORDER BY nome")
+        itens["compartimento"] = [{"id": id_comp, "titulo": nome} for id_comp, nome in cursor.fetchall()]
+
+        conn.close()
+        return itens
+
+    def _copiar_linha(self, origem, destino, tabela, id_item):
+        """
+        Copia uma linha do banco do backup para o banco atual.
+
+        Returns:
+            tuple: (id no banco atual, True se a linha foi inserida)
+        """
+        colunas_destino = set(self._colunas(destino, tabela))
+        colunas = [coluna for coluna in self._colunas(origem, tabela) if coluna in colunas_destino]
+        lista_colunas = ", ".join(colunas)
+
+        origem.execute(f"SELECT {lista_colunas} FROM {tabela} WHERE id = ?", (id_item,))
+        linha = origem.fetchone()
+        if linha is None:
+            raise ValueError(f"Item {id_item} não encontrado em {tabela} no backup")
+
+        destino.execute(f"SELECT {lista_colunas} FROM {tabela} WHERE id = ?", (id_item,))
+        atual = destino.fetchone()
+
+        if atual == linha:
+            return id_item, False
+
+        if atual is not None:
+            # ID ocupado por outro conteúdo: inserir com um novo ID
+            indice_id = colunas.index("id")
+            colunas = colunas[:indice_id] + colunas[indice_id + 1:]
+            linha = linha[:indice_id] + linha[indice_id + 1:]
+
+        marcadores = ", ".join("?" for _ in colunas)
+        destino.execute(f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({marcadores})", linha)
+        return (id_item if atual is None else destino.lastrowid), True
+
+    def _garantir_objeto(self, nome, caminho_destino):
+        """Extrai um arquivo físico do backup se ele não existir no armazenamento atual."""
+        if os.path.exists(caminho_destino):
+            return
+        membro = self._membros_arquivos.get(nome)
+        if membro is None:
+            raise ValueError(f"Conteúdo do arquivo {nome} não está no backup")
+        self.leitor.extrair_membro(membro, caminho_destino)
+
+    def _restaurar_conteudo_arquivo(self, origem, destino, id_origem, id_destino):
+        """Restaura os blocos ou o objeto físico de um arquivo recém-inserido."""
+        origem.execute("SELECT nome_criptografado, armazenamento FROM arquivos WHERE id = ?", (id_origem,))
+        nome_criptografado, armazenamento = origem.fetchone()
+
+        if armazenamento != "blocos":
+            if armazenamento == ARMAZENAMENTO_AUSENTE:
+                # O registro já não tinha arquivo físico quando o backup foi feito
+                return
+            if armazenamento == "fragmentado":
+                caminho = self.armazenamento_arquivos.caminho(nome_criptografado)
+            else:
+                caminho = os.path.join(self.caminho_arquivos, nome_criptografado)
+            self._garantir_objeto(nome_criptografado, caminho)
+            return
+
+        blocos = self.armazem_blocos.blocos_do_arquivo(origem, id_origem)
+        for bloco_id in blocos:
+            if not self.armazem_blocos.armazenamento.existe(bloco_id):
+                self._garantir_objeto(bloco_id, self.armazem_blocos.caminho_bloco(bloco_id))
+
+            # Backups anteriores às versões de chave não têm a coluna: os blocos usam a versão 0
+            origem.execute("SELECT * FROM blocos WHERE id = ?", (bloco_id,))
+            bloco = dict(zip([coluna[0] for coluna in origem.description], origem.fetchone()))
+            destino.execute(
+                "INSERT INTO blocos (id, compartimento, tamanho, referencias, versao_chave, data_criacao) VALUES (?, ?, ?, 1, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET referencias = referencias + 1",
+                (bloco_id, bloco["compartimento"], bloco["tamanho"], bloco.get("versao_chave", 0), bloco["data_criacao"])
+            )
+
+        self.armazem_blocos.vincular(destino, id_destino, blocos)
+
+    def _reassociar(self, destino, tabela, coluna_cifrada, id_origem, id_destino):
+        """Cifra de novo, com o novo ID nos dados associados, um item que mudou de ID."""
+        destino.execute(f"SELECT {coluna_cifrada}, iv, compartimento FROM {tabela} WHERE id = ?", (id_destino,))
+        cifrado, iv, compartimento = destino.fetchone()
+        if not versao_do_iv(iv):
+            return
+
+        contexto = self.contextos(compartimento) if self.contextos else None
+        if contexto is None:
+            raise ValueError(f"O compartimento '{compartimento}' precisa estar desbloqueado para restaurar o item com um novo ID")
+
+        dados = contexto.decifrar(cifrado, iv, tabela, id_origem)
+        novo_cifrado, novo_iv = contexto.cifrar(dados, tabela, id_destino)
+        destino.execute(
+            f"UPDATE {tabela} SET {coluna_cifrada} = ?, iv = ? WHERE id = ?", (novo_cifrado, novo_iv, id_destino)
+        )
+
+    def _restaurar(self, destino, origem, tipo, id_item):
+        tabela, _ = TABELAS_ITENS[tipo]
+        id_destino, inserido = self._copiar_linha(origem, destino, tabela, id_item)
+        if inserido and tipo == "arquivo":
+            self._restaurar_conteudo_arquivo(origem, destino, id_item, id_destino)
+        elif inserido and id_destino != id_item:
+            self._reassociar(destino, tabela, COLUNAS_CIFRADAS[tipo], id_item, id_destino)
+        return inserido
+
+    def restaurar_item(self, tipo, id_item):
+        """
+        Restaura uma senha, nota ou arquivo do backup.
+
+        Args:
+            tipo (str): "senha", "nota" ou "arquivo"
+            id_item (int): ID do item no backup
+
+        Returns:
+            bool: True se o item foi inserido, False se já existia idêntico
+        """
+        if tipo not in TABELAS_ITENS:
+            raise ValueError(f"Tipo de item inválido: {tipo}")
+
+        origem_conn = self._conectar_snapshot()
+        conn = self.banco_dados.conectar()
+        try:
+            inserido = self._restaurar(conn.cursor(), origem_conn.cursor(), tipo, id_item)
+            conn.commit()
+        finally:
+            conn.close()
+            origem_conn.close()
+
+        return inserido
+
+    def restaurar_compartimento(self, compartimento_id):
+        """
+        Restaura um compartimento e todos os seus itens.
+
+        Args:
+            compartimento_id (str): Identificador do compartimento ("principal" para o principal)
+
+        Returns:
+            dict: Quantidade de itens inseridos por tipo
+        """
+        origem_conn = self._conectar_snapshot()
+        origem = origem_conn.cursor()
+        conn = self.banco_dados.conectar()
+        destino = conn.cursor()
+        restaurados = {tipo: 0 for tipo in TABELAS_ITENS}
+
+        try:
+            origem.execute("SELECT id FROM compartimentos WHERE compartimento_id = ?", (compartimento_id,))
+            linha = origem.fetchone()
+            if linha is None and compartimento_id != "principal":
+                raise ValueError(f"Compartimento {compartimento_id} não encontrado no backup")
+
+            if linha is not None:
+                destino.execute("SELECT 1 FROM compartimentos WHERE compartimento_id = ?", (compartimento_id,))
+                if destino.fetchone() is None:
+                    self._copiar_linha(origem, destino, "compartimentos", linha[0])
+
+            for tipo, (tabela, _) in TABELAS_ITENS.items():
+                if "compartimento" not in self._colunas(origem, tabela):
+                    continue
+                origem.execute(f"SELECT id FROM {tabela} WHERE compartimento = ? ORDER BY id", (compartimento_id,))
+                for (id_item,) in origem.fetchall():
+                    if self._restaurar(destino, origem, tipo, id_item):
+                        restaurados[tipo] += 1
+
+            conn.commit()
+        finally:
+            conn.close()
+            origem_conn.close()
+
+        return restaurados
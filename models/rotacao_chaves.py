@@ -0,0 +1,694 @@
+import os
+import time
+import hmac
+import base64
+import hashlib
+import secrets
+import datetime
+import threading
+
+from models.crypto_utils import CryptoUtils
+from models.memoria_segura import BufferSeguro
+from models.autenticacao import MotorAutenticacao
+from models.contexto_cifra import versao_chave_do_iv
+
+
+# Tabelas recriptografadas pela rotação e a coluna cifrada de cada uma
+TABELAS_ROTACAO = {
+    "senhas": "dados_criptografados",
+    "notas": "conteudo_criptografado"
+}
+
+# Registros recriptografados por transação
+TAMANHO_LOTE_PADRAO = 32
+
+# Blocos de arquivo (até 1 MiB cada) recriptografados por transação
+BLOCOS_POR_LOTE = 4
+
+# Pausa entre lotes, para não disputar o banco com a interface
+PAUSA_ENTRE_LOTES_S = 0.2
+
+# Intervalo entre verificações quando não há rotação pendente (ou o compartimento está bloqueado)
+INTERVALO_OCIOSO_S = 30
+
+# Idade da versão de chave mais recente a partir da qual uma rotação é iniciada sozinha (0 desativa)
+INTERVALO_ROTACAO_DIAS_PADRAO = 90
+
+ESTADO_ATIVA = "ativa"
+ESTADO_APOSENTADA = "aposentada"
+
+# Papéis cujas senhas protegem a chave das versões do compartimento principal; nos outros
+# compartimentos, o papel "principal" guarda a chave cifrada com a do compartimento principal
+PAPEIS_PRINCIPAL = ("principal", "heranca")
+
+# Rótulo da chave das versões de um compartimento derivada da seed da sua frase
+ROTULO_CHAVE_VERSOES = b"versoes-chave"
+
+
+def _dados_associados(compartimento, versao):
+    return f"versoes_chave|{compartimento}|{versao}".encode('utf-8')
+
+
+def _dados_associados_protecao(compartimento):
+    return f"protecao_versoes|{compartimento}".encode('utf-8')
+
+
+class RotacaoChaves:
+    """
+    Rotação das chaves de dados dos compartimentos, sem interromper o uso do cofre.
+
+    Rotacionar cria uma nova versão de chave: uma chave aleatória guardada em
+    versoes_chave. A partir daí os contextos de cifra gravam com a nova
+    versão, que vai no iv de cada registro e em blocos.versao_chave, e
+    continuam lendo qualquer versão ativa.
+
+    As versões não são cifradas com a chave do compartimento (a versão 0),
+    mas com uma chave própria do compartimento, a chave das versões, que
+    fica em protecao_versoes: no principal, cifrada pelas senhas principal e
+    de herança (registros de MotorAutenticacao); nos outros, derivada da seed
+    da frase e guardada também cifrada com a chave das versões do principal,
+    para o desbloqueio pelo nome. Quem obtiver uma versão antiga, inclusive
+    a versão 0, não decifra as seguintes.
+
+    Uma thread de prioridade reduzida recriptografa senhas, notas e blocos
+    de arquivo em lotes pequenos, com uma pausa entre eles, e inicia sozinha
+    uma rotação quando a versão mais recente passa de intervalo_rotacao_dias.
+    O progresso (último ID de cada tabela) é confirmado junto com cada lote
+    em rotacoes_chave, então uma rotação interrompida continua de onde
+    parou; compartimentos bloqueados simplesmente esperam o próximo
+    desbloqueio. Cada regravação confere o iv lido, de modo que uma edição
+    feita no meio do lote nunca é sobrescrita.
+
+    Ao fim da varredura, uma conferência completa garante que nenhum registro
+    ou bloco ainda usa uma versão anterior; só então essas versões, inclusive
+    a 0, são aposentadas: a chave cifrada é apagada, o contexto deixa de
+    aceitá-las e os blocos antigos vão para a coleta de lixo. Enquanto algum
+    item não puder ser decifrado (ex.: um bloco no meio da migração do
+    armazenamento), a rotação fica pendente e é tentada de novo a cada
+    intervalo_ocioso, sem aposentar nada.
+    """
+
+    def __init__(self, conectar, contextos, armazem_blocos=None, registrar_log=None, tamanho_lote=TAMANHO_LOTE_PADRAO,
+                 pausa=PAUSA_ENTRE_LOTES_S, intervalo_ocioso=INTERVALO_OCIOSO_S,
+                 intervalo_rotacao_dias=INTERVALO_ROTACAO_DIAS_PADRAO):
+        """
+        Inicializa a rotação.
+
+        Args:
+            conectar (callable): Função que abre uma conexão com o banco de dados
+            contextos (callable): Recebe um compartimento e retorna o seu ContextoCifra, ou None se estiver bloqueado
+            armazem_blocos (ArmazemBlocos, optional): Armazém dos arquivos em blocos (sem ele, os blocos não são rotacionados)
+            registrar_log (callable, optional): Recebe (tipo, mensagem)
+            tamanho_lote (int): Registros recriptografados por transação
+            pausa (float): Segundos entre lotes
+            intervalo_ocioso (float): Segundos entre verificações sem trabalho a fazer
+            intervalo_rotacao_dias (float): Idade da versão mais recente que inicia uma rotação (0 desativa)
+        """
+        self.conectar = conectar
+        self.contextos = contextos
+        self.armazem_blocos = armazem_blocos
+        self.registrar_log = registrar_log
+        self.tamanho_lote = tamanho_lote
+        self.pausa = pausa
+        self.intervalo_ocioso = intervalo_ocioso
+        self.intervalo_rotacao_dias = intervalo_rotacao_dias
+        self.em_execucao = False
+        self._parar = threading.Event()
+        self._acordar = threading.Event()
+        self._thread = None
+        self._falhas = {}
+        self._avisados = {}
+        self._espera = {}
+
+    @staticmethod
+    def criar_estrutura(cursor):
+        """Cria as tabelas das versões de chave, da sua proteção e do progresso das rotações."""
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS versoes_chave (
+            compartimento TEXT NOT NULL,
+            versao INTEGER NOT NULL,
+            chave_cifrada TEXT,
+            estado TEXT NOT NULL DEFAULT 'ativa',
+            data_criacao TEXT NOT NULL,
+            data_aposentadoria TEXT,
+            PRIMARY KEY (compartimento, versao)
+        )
+        """)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS protecao_versoes (
+            compartimento TEXT NOT NULL,
+            papel TEXT NOT NULL,
+            chave_cifrada TEXT NOT NULL,
+            data_criacao TEXT NOT NULL,
+            PRIMARY KEY (compartimento, papel)
+        )
+        """)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS rotacoes_chave (
+            compartimento TEXT NOT NULL,
+            tabela TEXT NOT NULL,
+            versao INTEGER NOT NULL,
+            ultimo_id INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (compartimento, tabela)
+        )
+        """)
+
+    def _log(self, tipo, mensagem):
+        if self.registrar_log is not None:
+            try:
+                self.registrar_log(tipo, mensagem)
+            except Exception:
+                pass
+
+    def _gravar(self, cursor, comando, parametros):
+        # Grava no cursor de quem chama (que confirma a transação) ou numa conexão própria
+        if cursor is not None:
+            cursor.execute(comando, parametros)
+            return
+        conn = self.conectar()
+        try:
+            conn.execute(comando, parametros)
+            conn.commit()
+        finally:
+            conn.close()
+
+    # === Chave das versões ===
+
+    @staticmethod
+    def chave_versoes_da_seed(seed):
+        """Chave das versões de um compartimento, derivada da seed da sua frase (independente da versão 0)."""
+        return BufferSeguro(hmac.new(ROTULO_CHAVE_VERSOES, seed, hashlib.sha256).digest())
+
+    def proteger_com_senhas(self, chave_versoes, senhas, perfil, cursor=None):
+        """
+        Guarda a chave das versões do compartimento principal cifrada por cada senha.
+
+        Chamado ao configurar o usuário e ao trocar as senhas (a chave continua a mesma,
+        então as versões e os compartimentos protegidos por ela não são regravados).
+
+        Args:
+            chave_versoes (BufferSeguro): A chave das versões do principal
+            senhas (dict): Papel ("principal" ou "heranca") → senha
+            perfil (PerfilKDF): Perfil da derivação
+            cursor (optional): Cursor de uma transação aberta; sem ele, grava numa conexão própria
+        """
+        salt = secrets.token_bytes(16)
+        data_atual = datetime.datetime.now().isoformat()
+        for papel, senha in senhas.items():
+            registro = MotorAutenticacao.criar_registro(senha, papel, chave_versoes, perfil, salt)
+            self._gravar(
+                cursor,
+                "INSERT OR REPLACE INTO protecao_versoes (compartimento, papel, chave_cifrada, data_criacao) VALUES ('principal', ?, ?, ?)",
+                (papel, registro, data_atual)
+            )
+
+    def registros_senhas(self):
+        """
+        Registros que protegem a chave das versões do principal, no formato de MotorAutenticacao.verificar.
+
+        Eles também conferem as senhas, com o mesmo perfil e salt para os dois papéis: o login
+        usa esses registros e obtém a chave da mesma derivação que autentica.
+
+        Returns:
+            dict: Papel → (registro, None), ou None se algum papel ainda não protege a chave
+        """
+        conn = self.conectar()
+        try:
+            linhas = conn.execute(
+                "SELECT papel, chave_cifrada FROM protecao_versoes WHERE compartimento = 'principal'"
+            ).fetchall()
+        finally:
+            conn.close()
+
+        registros = {papel: (registro, None) for papel, registro in linhas if papel in PAPEIS_PRINCIPAL}
+        return registros if len(registros) == len(PAPEIS_PRINCIPAL) else None
+
+    def proteger_compartimento(self, compartimento, chave_versoes, chave_versoes_principal, cursor=None):
+        """Guarda a chave das versões de um compartimento cifrada com a do principal, para o desbloqueio pelo nome."""
+        chave_cifrada = CryptoUtils.criptografar_bytes(
+            chave_versoes, chave_versoes_principal, _dados_associados_protecao(compartimento)
+        )
+        self._gravar(
+            cursor,
+            "INSERT OR REPLACE INTO protecao_versoes (compartimento, papel, chave_cifrada, data_criacao) VALUES (?, 'principal', ?, ?)",
+            (compartimento, base64.b64encode(chave_cifrada).decode(), datetime.datetime.now().isoformat())
+        )
+
+    def abrir_compartimento(self, compartimento, chave_versoes_principal):
+        """
+        Decifra a chave das versões de um compartimento com a do principal.
+
+        Returns:
+            BufferSeguro: A chave, ou None se o compartimento ainda não foi protegido
+        """
+        if chave_versoes_principal is None:
+            return None
+        conn = self.conectar()
+        try:
+            linha = conn.execute(
+                "SELECT chave_cifrada FROM protecao_versoes WHERE compartimento = ? AND papel = 'principal'", (compartimento,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if linha is None:
+            return None
+        return CryptoUtils.descriptografar_bytes_seguro(
+            base64.b64decode(linha[0]), chave_versoes_principal, _dados_associados_protecao(compartimento)
+        )
+
+    def protegido(self, compartimento):
+        """
+        Indica se a chave das versões do compartimento está guardada para todos os que o abrem.
+
+        No principal, pelas duas senhas (senão o herdeiro não leria as versões novas);
+        nos outros, cifrada com a do principal.
+        """
+        conn = self.conectar()
+        try:
+            papeis = {linha[0] for linha in conn.execute(
+                "SELECT papel FROM protecao_versoes WHERE compartimento = ?", (compartimento,)
+            )}
+        finally:
+            conn.close()
+        if compartimento == "principal":
+            return papeis.issuperset(PAPEIS_PRINCIPAL)
+        return "principal" in papeis
+
+    # === Versões de chave ===
+
+    def carregar_versoes(self, contexto):
+        """Decifra as versões ativas do compartimento no contexto e passa a gravar com a mais recente."""
+        compartimento = contexto.compartimento
+        conn = self.conectar()
+        try:
+            linhas = conn.execute(
+                "SELECT versao, chave_cifrada, estado FROM versoes_chave WHERE compartimento = ? ORDER BY versao",
+                (compartimento,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        if any(versao == 0 and estado == ESTADO_APOSENTADA for versao, _, estado in linhas):
+            contexto.remover_chave(0)
+
+        ativas = [(versao, chave_cifrada) for versao, chave_cifrada, estado in linhas if versao and estado == ESTADO_ATIVA]
+        if not ativas:
+            return
+        if contexto.chave_versoes is None:
+            self._log("erro", f"Versões de chave do compartimento '{compartimento}' indisponíveis nesta sessão")
+            return
+
+        for versao, chave_cifrada in ativas:
+            if versao not in contexto.versoes_chave():
+                contexto.adicionar_chave(versao, CryptoUtils.descriptografar_bytes_seguro(
+                    base64.b64decode(chave_cifrada), contexto.chave_versoes, _dados_associados(compartimento, versao)
+                ))
+            contexto.versao_chave = versao
+
+    def iniciar_rotacao(self, contexto):
+        """
+        Cria uma nova versão de chave para o compartimento do contexto e agenda a recriptografia.
+
+        Os registros novos passam a usar a nova versão imediatamente.
+
+        Returns:
+            int: A nova versão
+        """
+        compartimento = contexto.compartimento
+        if contexto.chave_versoes is None:
+            raise ValueError(f"A chave das versões do compartimento '{compartimento}' não está disponível nesta sessão")
+        if not self.protegido(compartimento):
+            raise ValueError(f"A chave das versões do compartimento '{compartimento}' ainda não foi protegida")
+
+        chave = BufferSeguro(secrets.token_bytes(32))
+        tabelas = list(TABELAS_ROTACAO) + (["blocos"] if self.armazem_blocos is not None else [])
+
+        conn = self.conectar()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COALESCE(MAX(versao), 0) FROM versoes_chave WHERE compartimento = ?", (compartimento,))
+            versao = cursor.fetchone()[0] + 1
+
+            chave_cifrada = CryptoUtils.criptografar_bytes(chave, contexto.chave_versoes, _dados_associados(compartimento, versao))
+            cursor.execute(
+                "INSERT INTO versoes_chave (compartimento, versao, chave_cifrada, estado, data_criacao) VALUES (?, ?, ?, ?, ?)",
+                (compartimento, versao, base64.b64encode(chave_cifrada).decode(), ESTADO_ATIVA,
+                 datetime.datetime.now().isoformat())
+            )
+
+            # Uma rotação anterior ainda em curso é substituída: a varredura recomeça para a nova versão
+            cursor.execute("DELETE FROM rotacoes_chave WHERE compartimento = ?", (compartimento,))
+            cursor.executemany(
+                "INSERT INTO rotacoes_chave (compartimento, tabela, versao) VALUES (?, ?, ?)",
+                [(compartimento, tabela, versao) for tabela in tabelas]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        contexto.adicionar_chave(versao, chave)
+        contexto.versao_chave = versao
+        self._falhas.pop(compartimento, None)
+        self._avisados.pop(compartimento, None)
+        self._espera.pop(compartimento, None)
+        self._log("sistema", f"Rotação de chave iniciada no compartimento '{compartimento}' (versão {versao})")
+        self._acordar.set()
+        return versao
+
+    def pendentes(self):
+        """Compartimentos com rotação em curso."""
+        conn = self.conectar()
+        try:
+            return [linha[0] for linha in conn.execute("SELECT DISTINCT compartimento FROM rotacoes_chave ORDER BY compartimento")]
+        finally:
+            conn.close()
+
+    def devidas(self):
+        """Compartimentos protegidos, sem rotação em curso, cuja versão mais recente passou do intervalo de rotação."""
+        if not self.intervalo_rotacao_dias:
+            return []
+        limite = (datetime.datetime.now() - datetime.timedelta(days=self.intervalo_rotacao_dias)).isoformat()
+
+        conn = self.conectar()
+        try:
+            # Sem versões rotacionadas, a idade conta a partir da proteção da chave das versões
+            linhas = conn.execute(
+                "SELECT p.compartimento, COALESCE("
+                "(SELECT MAX(v.data_criacao) FROM versoes_chave v WHERE v.compartimento = p.compartimento AND v.versao > 0), "
+                "MIN(p.data_criacao)) "
+                "FROM protecao_versoes p "
+                "WHERE p.compartimento NOT IN (SELECT compartimento FROM rotacoes_chave) "
+                "GROUP BY p.compartimento"
+            ).fetchall()
+        finally:
+            conn.close()
+
+        return [compartimento for compartimento, referencia in linhas if referencia < limite and self.protegido(compartimento)]
+
+    def progresso(self, compartimento):
+        """
+        Situação da rotação de um compartimento.
+
+        Returns:
+            dict: versao (a mais recente, ou 0), em_andamento e, por versão, os registros e blocos que ainda a usam
+        """
+        conn = self.conectar()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT COALESCE(MAX(versao), 0) FROM versoes_chave WHERE compartimento = ? AND estado = ?",
+                (compartimento, ESTADO_ATIVA)
+            )
+            versao = cursor.fetchone()[0]
+            cursor.execute("SELECT 1 FROM rotacoes_chave WHERE compartimento = ? LIMIT 1", (compartimento,))
+            em_andamento = cursor.fetchone() is not None
+
+            registros = {}
+            for tabela, coluna in TABELAS_ROTACAO.items():
+                cursor.execute(f"SELECT iv FROM {tabela} WHERE compartimento = ? AND {coluna} != ''", (compartimento,))
+                for (iv,) in cursor.fetchall():
+                    versao_registro = versao_chave_do_iv(iv)
+                    registros[versao_registro] = registros.get(versao_registro, 0) + 1
+
+            cursor.execute(
+                "SELECT versao_chave, COUNT(*) FROM blocos WHERE compartimento = ? AND referencias > 0 GROUP BY versao_chave",
+                (compartimento,)
+            )
+            for versao_bloco, quantidade in cursor.fetchall():
+                registros[versao_bloco] = registros.get(versao_bloco, 0) + quantidade
+        finally:
+            conn.close()
+
+        return {"versao": versao, "em_andamento": em_andamento, "registros_por_versao": registros}
+
+    # === Recriptografia ===
+
+    def _lote_registros(self, cursor, contexto, tabela, versao, ultimo_id, falhas):
+        coluna = TABELAS_ROTACAO[tabela]
+        cursor.execute(
+            f"SELECT id, {coluna}, iv FROM {tabela} WHERE compartimento = ? AND id > ? AND {coluna} != '' ORDER BY id LIMIT ?",
+            (contexto.compartimento, ultimo_id, self.tamanho_lote)
+        )
+        lote = cursor.fetchall()
+        if not lote:
+            return None
+
+        regravados = 0
+        for id_registro, cifrado, iv in lote:
+            if versao_chave_do_iv(iv) == versao:
+                continue
+            try:
+                dados = contexto.decifrar(cifrado, iv, tabela, id_registro)
+            except Exception as e:
+                # Registro ilegível agora: fica como está e retém as versões antigas até ser lido
+                falhas[(tabela, id_registro)] = f"{tabela} {id_registro} não pôde ser decifrado ({str(e) or e.__class__.__name__})"
+                continue
+
+            novo_cifrado, novo_iv = contexto.cifrar(dados, tabela, id_registro)
+            # Só regrava se o registro não mudou desde a leitura
+            cursor.execute(
+                f"UPDATE {tabela} SET {coluna} = ?, iv = ? WHERE id = ? AND iv = ?",
+                (novo_cifrado, novo_iv, id_registro, iv)
+            )
+            regravados += cursor.rowcount
+        return regravados, lote[-1][0]
+
+    def _lote_blocos(self, cursor, contexto, versao, ultimo_id, falhas):
+        cursor.execute(
+            "SELECT rowid, id, versao_chave FROM blocos WHERE compartimento = ? AND rowid > ? AND referencias > 0 "
+            "ORDER BY rowid LIMIT ?",
+            (contexto.compartimento, ultimo_id, BLOCOS_POR_LOTE)
+        )
+        lote = cursor.fetchall()
+        if not lote:
+            return None
+
+        chave = contexto.chave_da_versao(versao)
+        regravados = 0
+        arquivos = set()
+        for linha, bloco_id, versao_bloco in lote:
+            if versao_bloco == versao:
+                continue
+            try:
+                # O antigo fica sem referências (a coleta de lixo o apaga) em vez de ser removido enquanto ainda pode ser lido
+                novo_id, afetados = self.armazem_blocos.recifrar_bloco(
+                    cursor, bloco_id, contexto.chave_da_versao(versao_bloco), chave, versao
+                )
+            except Exception as e:
+                falhas[("blocos", linha)] = f"bloco {bloco_id} não pôde ser decifrado ({str(e) or e.__class__.__name__})"
+                continue
+            if novo_id is not None:
+                arquivos.update(afetados)
+                regravados += 1
+
+        self.armazem_blocos.renomear_arquivos(cursor, arquivos)
+        return regravados, lote[-1][0]
+
+    def processar_lote(self, contexto):
+        """
+        Recriptografa o próximo lote de registros ou blocos do compartimento do contexto.
+
+        Returns:
+            tuple: (registros regravados, True se a rotação terminou e as versões antigas foram aposentadas);
+                   com itens ilegíveis, a rotação continua pendente e a thread só volta a ela depois de intervalo_ocioso
+        """
+        compartimento = contexto.compartimento
+        falhas = self._falhas.setdefault(compartimento, {})
+
+        conn = self.conectar()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT tabela, versao, ultimo_id FROM rotacoes_chave WHERE compartimento = ? ORDER BY tabela",
+                (compartimento,)
+            )
+            rotacoes = cursor.fetchall()
+            if not rotacoes:
+                return 0, True
+
+            for tabela, versao, ultimo_id in rotacoes:
+                if tabela == "blocos":
+                    if self.armazem_blocos is None:
+                        continue
+                    resultado = self._lote_blocos(cursor, contexto, versao, ultimo_id, falhas)
+                else:
+                    resultado = self._lote_registros(cursor, contexto, tabela, versao, ultimo_id, falhas)
+                if resultado is None:
+                    continue
+
+                regravados, ultimo = resultado
+                cursor.execute(
+                    "UPDATE rotacoes_chave SET ultimo_id = ? WHERE compartimento = ? AND tabela = ?",
+                    (ultimo, compartimento, tabela)
+                )
+                conn.commit()
+                return regravados, False
+
+            # Varredura concluída: conferir tudo antes de aposentar
+            return 0, self._concluir(conn, contexto, rotacoes[0][1], falhas)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+            # Fora da transação, porque o log usa outra conexão; cada item é avisado uma vez por rotação
+            avisados = self._avisados.setdefault(compartimento, set())
+            for item, mensagem in list(falhas.items()):
+                if item not in avisados:
+                    avisados.add(item)
+                    self._log("erro", f"Rotação de chave: {mensagem}")
+
+    def _restantes(self, cursor, compartimento, tabela, versao):
+        """IDs (rowid, nos blocos) que ainda usam outra versão."""
+        if tabela == "blocos":
+            cursor.execute(
+                "SELECT rowid FROM blocos WHERE compartimento = ? AND referencias > 0 AND versao_chave != ? ORDER BY rowid",
+                (compartimento, versao)
+            )
+            return [linha for (linha,) in cursor.fetchall()]
+
+        coluna = TABELAS_ROTACAO[tabela]
+        cursor.execute(f"SELECT id, iv FROM {tabela} WHERE compartimento = ? AND {coluna} != '' ORDER BY id", (compartimento,))
+        return [id_registro for id_registro, iv in cursor.fetchall() if versao_chave_do_iv(iv) != versao]
+
+    def _concluir(self, conn, contexto, versao, falhas):
+        compartimento = contexto.compartimento
+        cursor = conn.cursor()
+
+        # Itens gravados com uma versão antiga durante a varredura (ex.: por outra instância) reabrem a tabela;
+        # os que não puderam ser decifrados também, mas só são tentados de novo depois de uma espera
+        cursor.execute("SELECT tabela FROM rotacoes_chave WHERE compartimento = ?", (compartimento,))
+        reabertas = False
+        ilegiveis = 0
+        for (tabela,) in cursor.fetchall():
+            restantes = self._restantes(cursor, compartimento, tabela, versao)
+            if not restantes:
+                continue
+            cursor.execute(
+                "UPDATE rotacoes_chave SET ultimo_id = ? WHERE compartimento = ? AND tabela = ?",
+                (restantes[0] - 1, compartimento, tabela)
+            )
+            novos = [item for item in restantes if (tabela, item) not in falhas]
+            reabertas = reabertas or bool(novos)
+            ilegiveis += len(restantes) - len(novos)
+        if reabertas:
+            conn.commit()
+            return False
+
+        if ilegiveis:
+            # Uma versão só é aposentada quando nada mais depende dela: a rotação fica pendente
+            conn.commit()
+            falhas.clear()
+            self._espera[compartimento] = time.monotonic() + self.intervalo_ocioso
+            self._log(
+                "erro",
+                f"Rotação de chave pendente no compartimento '{compartimento}': {ilegiveis} itens não puderam ser "
+                f"decifrados; as versões anteriores continuam ativas"
+            )
+            return False
+
+        # A versão 0 (a chave do compartimento) também é aposentada: nenhum dado depende mais dela
+        data_atual = datetime.datetime.now().isoformat()
+        cursor.execute(
+            "INSERT OR IGNORE INTO versoes_chave (compartimento, versao, chave_cifrada, estado, data_criacao) VALUES (?, 0, NULL, ?, ?)",
+            (compartimento, ESTADO_ATIVA, data_atual)
+        )
+        cursor.execute(
+            "SELECT versao FROM versoes_chave WHERE compartimento = ? AND versao < ? AND estado = ?",
+            (compartimento, versao, ESTADO_ATIVA)
+        )
+        aposentadas = [linha[0] for linha in cursor.fetchall()]
+        cursor.executemany(
+            "UPDATE versoes_chave SET estado = ?, chave_cifrada = NULL, data_aposentadoria = ? WHERE compartimento = ? AND versao = ?",
+            [(ESTADO_APOSENTADA, data_atual, compartimento, v) for v in aposentadas]
+        )
+        cursor.execute("DELETE FROM rotacoes_chave WHERE compartimento = ?", (compartimento,))
+        conn.commit()
+
+        for versao_antiga in aposentadas:
+            contexto.remover_chave(versao_antiga)
+        self._falhas.pop(compartimento, None)
+        self._avisados.pop(compartimento, None)
+        self._log("sistema", f"Rotação de chave concluída no compartimento '{compartimento}' (versão {versao})")
+
+        # Os blocos cifrados com as versões aposentadas ficaram sem referências; se a coleta
+        # falhar agora, eles são apagados na próxima
+        if self.armazem_blocos is not None:
+            try:
+                self.armazem_blocos.coletar_lixo(conn)
+            except Exception as e:
+                self._log("erro", f"Erro na coleta de lixo após a rotação de chave: {str(e)}")
+        return True
+
+    # === Segundo plano ===
+
+    def iniciar(self):
+        """Inicia a thread de segundo plano que conduz as rotações pendentes."""
+        if self.em_execucao:
+            return False
+
+        self._parar.clear()
+        self._thread = threading.Thread(target=self.executar, daemon=True)
+        self._thread.start()
+        return True
+
+    def parar(self, aguardar=False):
+        """Solicita a interrupção ao fim do lote atual (e, com aguardar, espera a thread terminar)."""
+        self._parar.set()
+        self._acordar.set()
+        if aguardar and self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    @staticmethod
+    def _reduzir_prioridade():
+        """Reduz a prioridade da thread atual, onde o sistema permitir (no Linux cada thread tem a sua)."""
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+
+    def _iniciar_devidas(self):
+        """Inicia as rotações vencidas dos compartimentos desbloqueados com a chave das versões."""
+        iniciou = False
+        for compartimento in self.devidas():
+            contexto = self.contextos(compartimento)
+            if contexto is None or contexto.chave_versoes is None or self._parar.is_set():
+                continue
+            try:
+                self.iniciar_rotacao(contexto)
+                iniciou = True
+            except Exception as e:
+                self._log("erro", f"Erro ao iniciar a rotação de chave do compartimento '{compartimento}': {str(e)}")
+        return iniciou
+
+    def executar(self):
+        """Conduz as rotações pendentes (e inicia as vencidas) dos compartimentos desbloqueados até ser interrompida."""
+        self.em_execucao = True
+        self._reduzir_prioridade()
+        try:
+            while not self._parar.is_set():
+                trabalhou = False
+                for compartimento in self.pendentes():
+                    if self._espera.get(compartimento, 0) > time.monotonic():
+                        continue
+                    contexto = self.contextos(compartimento)
+                    if contexto is None or self._parar.is_set():
+                        continue
+                    try:
+                        _, concluida = self.processar_lote(contexto)
+                        trabalhou = trabalhou or not concluida
+                    except Exception as e:
+                        self._log("erro", f"Erro na rotação de chave do compartimento '{compartimento}': {str(e)}")
+
+                if not trabalhou:
+                    try:
+                        trabalhou = self._iniciar_devidas()
+                    except Exception as e:
+                        self._log("erro", f"Erro ao verificar rotações vencidas: {str(e)}")
+
+                self._acordar.wait(self.pausa if trabalhou else self.intervalo_ocioso)
+                self._acordar.clear()
+        finally:
+            self.em_execucao = False
@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+
+
+# Páginas copiadas por passo da API de backup do SQLite
+PAGINAS_POR_PASSO = 256
+
+# Pausa entre passos, em segundos, para liberar o banco a outras conexões
+PAUSA_ENTRE_PASSOS = 0.005
+
+# Reinícios tolerados antes de concluir a cópia com o banco bloqueado para escrita
+MAX_REINICIOS = 3
+
+
+class _CopiaReiniciada(Exception):
+    """Interrompe uma cópia incremental que reiniciou vezes demais."""
+
+
+class SnapshotBanco:
+    """
+    Cópia consistente do banco de dados em uso, feita com sqlite3.Connection.backup.
+
+    A cópia avança em passos de poucas páginas, com uma pausa entre eles, para
+    que a thread do verificador e a gravação de logs não fiquem bloqueadas. Se
+    outra conexão alterar o banco no meio da cópia, o SQLite reinicia a cópia
+    automaticamente, então o resultado corresponde sempre a um único estado
+    confirmado do banco, nunca a uma mistura de páginas antigas e novas.
+
+    Sob escrita contínua a cópia poderia reiniciar indefinidamente; depois de
+    MAX_REINICIOS reinícios ela é concluída dentro de uma transação de
+    leitura, que adia as escritas das outras conexões só até o fim da cópia.
+    """
+
+    def __init__(self, conectar, paginas_por_passo=PAGINAS_POR_PASSO, pausa=PAUSA_ENTRE_PASSOS,
+                 max_reinicios=MAX_REINICIOS):
+        """
+        Inicializa o componente.
+
+        Args:
+            conectar (callable): Função que abre uma conexão com o banco de origem
+            paginas_por_passo (int): Páginas copiadas por passo
+            pausa (float): Pausa entre passos, em segundos
+            max_reinicios (int): Reinícios tolerados antes de bloquear as escritas durante a cópia
+        """
+        self.conectar = conectar
+        self.paginas_por_passo = paginas_por_passo
+        self.pausa = pausa
+        self.max_reinicios = max_reinicios
+
+    def criar(self, destino, progresso=None):
+        """
+        Grava um snapshot do banco em um arquivo.
+
+        O arquivo de destino só aparece quando a cópia termina com sucesso.
+
+        Args:
+            destino (str): Caminho do arquivo de snapshot
+            progresso (callable, optional): Chamada como progresso(copiadas, total) a cada passo
+
+        Returns:
+            str: O caminho do snapshot
+        """
+        caminho_temporario = destino + ".tmp"
+        if os.path.exists(caminho_temporario):
+            os.remove(caminho_temporario)
+
+        estado = {"restantes": None, "reinicios": 0}
+
+        def ao_avancar(status, restantes, total):
+            # Páginas restantes aumentando indicam que o SQLite reiniciou a cópia
+            if estado["restantes"] is not None and restantes > estado["restantes"]:
+                estado["reinicios"] += 1
+                if estado["reinicios"] > self.max_reinicios:
+                    raise _CopiaReiniciada()
+            estado["restantes"] = restantes
+            if progresso is not None:
+                progresso(total - restantes, total)
+
+        origem = self.conectar()
+        try:
+            copia = sqlite3.connect(caminho_temporario)
+            try:
+                try:
+                    origem.backup(copia, pages=self.paginas_por_passo, progress=ao_avancar, sleep=self.pausa)
+                except _CopiaReiniciada:
+                    # Manter uma transação de leitura na origem impede novas alterações até o fim
+                    origem.execute("BEGIN")
+                    origem.execute("SELECT count(*) FROM sqlite_master").fetchall()
+                    try:
+                        origem.backup(copia, pages=-1, progress=ao_avancar)
+                    finally:
+                        origem.rollback()
+            finally:
+                copia.close()
+        except Exception:
+            if os.path.exists(caminho_temporario):
+                os.remove(caminho_temporario)
+            raise
+        finally:
+            origem.close()
+
+        os.replace(caminho_temporario, destino)
+        return destino
+
+    @contextmanager
+    def temporario(self, diretorio=None, progresso=None):
+        """
+        Cria um snapshot em um arquivo temporário, removido ao sair do bloco.
+
+        Args:
+            diretorio (str, optional): Diretório do arquivo temporário
+            progresso (callable, optional): Ver criar()
+
+        Yields:
+            str: Caminho do snapshot
+        """
+        descritor, caminho = tempfile.mkstemp(prefix="snapshot_", suffix=".db", dir=diretorio)
+        os.close(descritor)
+        try:
+            yield self.criar(caminho, progresso)
+        finally:
+            if os.path.exists(caminho):
+                os.remove(caminho)
+
+    def criar_em_segundo_plano(self, destino, ao_concluir=None, progresso=None):
+        """
+        Cria um snapshot em uma thread separada.
+
+        Args:
+            destino (str): Caminho do arquivo de snapshot
+            ao_concluir (callable, optional): Chamada como ao_concluir(sucesso, caminho_ou_erro)
+            progresso (callable, optional): Ver criar()
+
+        Returns:
+            threading.Thread: A thread iniciada
+        """
+        def executar():
+            try:
+                resultado = (True, self.criar(destino, progresso))
+            except Exception as e:
+                resultado = (False, str(e))
+            if ao_concluir is not None:
+                ao_concluir(*resultado)
+
+        thread = threading.Thread(target=executar, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,389 @@
+import os
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Tipos transferíveis: tabela, coluna cifrada, coluna de título e coluna de descrição (ou None)
+TIPOS = {
+    "senha": ("senhas", "dados_criptografados", "titulo", "descricao"),
+    "nota": ("notas", "conteudo_criptografado", "titulo", None),
+    "arquivo": ("arquivos", None, "nome_original", "descricao")
+}
+
+# Itens recriptografados e confirmados por transação
+TAMANHO_LOTE_PADRAO = 64
+
+# Estados de cada item no diário da transferência
+ESTADO_PENDENTE = "pendente"
+ESTADO_CONCLUIDO = "concluido"
+ESTADO_FALHA = "falha"
+
+
+class TransferenciaCompartimentos:
+    """
+    Move ou copia senhas, notas e arquivos entre compartimentos, recriptografando com a chave do destino.
+
+    A seleção (por IDs, categoria ou filtro) é gravada primeiro em um diário
+    (transferencias e transferencia_itens). Os itens são processados em lotes:
+    a recriptografia roda em um pool de threads e a gravação de cada lote,
+    junto com a marcação dos itens no diário, é confirmada em uma única
+    transação. Uma transferência interrompida continua de onde parou com
+    executar(), sem duplicar cópias.
+
+    Senhas e notas são decifradas e cifradas de novo sem descomprimir (o
+    conteúdo comprimido das notas passa intacto), com os contextos de cifra
+    dos dois compartimentos. Como o ID da linha faz parte dos dados
+    associados, uma cópia só é cifrada na gravação, depois que a nova linha
+    recebe o seu ID. Arquivos em blocos são
+    transferidos bloco a bloco, então nunca ficam inteiros em memória; os
+    blocos do destino são deduplicados como em ArmazemBlocos.armazenar().
+    """
+
+    def __init__(self, conectar, armazem_blocos, tamanho_lote=TAMANHO_LOTE_PADRAO, trabalhadores=None):
+        """
+        Inicializa a transferência.
+
+        Args:
+            conectar (callable): Função que abre uma conexão com o banco de dados
+            armazem_blocos (ArmazemBlocos): Armazém dos arquivos em blocos
+            tamanho_lote (int): Itens confirmados por transação
+            trabalhadores (int, optional): Threads de recriptografia; por padrão, uma por núcleo
+        """
+        self.conectar = conectar
+        self.armazem_blocos = armazem_blocos
+        self.tamanho_lote = tamanho_lote
+        self.trabalhadores = trabalhadores or os.cpu_count() or 1
+
+    @staticmethod
+    def criar_estrutura(cursor):
+        """Cria as tabelas do diário de transferências."""
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS transferencias (
+            id INTEGER PRIMARY KEY,
+            tipo TEXT NOT NULL,
+            origem TEXT NOT NULL,
+            destino TEXT NOT NULL,
+            copiar INTEGER NOT NULL,
+            data_criacao TEXT NOT NULL,
+            concluida INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS transferencia_itens (
+            transferencia_id INTEGER NOT NULL,
+            item_id INTEGER NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'pendente',
+            novo_id INTEGER,
+            erro TEXT,
+            PRIMARY KEY (transferencia_id, item_id),
+            FOREIGN KEY (transferencia_id) REFERENCES transferencias (id)
+        )
+        """)
+
+    # === Seleção ===
+
+    @staticmethod
+    def selecionar(cursor, tipo, compartimento, ids=None, categoria_id=None, filtro=None):
+        """
+        Seleciona os itens de um compartimento por IDs, categoria e/ou filtro de texto.
+
+        Returns:
+            list: IDs dos itens selecionados, em ordem crescente
+        """
+        tabela, _, coluna_titulo, coluna_descricao = TIPOS[tipo]
+        sql = f"SELECT id FROM {tabela} WHERE compartimento = ?"
+        parametros = [compartimento]
+
+        if ids is not None:
+            ids = list(ids)
+            if not ids:
+                return []
+            sql += f" AND id IN ({', '.join('?' for _ in ids)})"
+            parametros.extend(ids)
+
+        if categoria_id is not None:
+            sql += " AND categoria_id = ?"
+            parametros.append(categoria_id)
+
+        if filtro:
+            if coluna_descricao:
+                sql += f" AND ({coluna_titulo} LIKE ? OR {coluna_descricao} LIKE ?)"
+                parametros.extend([f"%{filtro}%", f"%{filtro}%"])
+            else:
+                sql += f" AND {coluna_titulo} LIKE ?"
+                parametros.append(f"%{filtro}%")
+
+        cursor.execute(sql + " ORDER BY id", parametros)
+        return [linha[0] for linha in cursor.fetchall()]
+
+    def iniciar(self, tipo, origem, destino, copiar=False, ids=None, categoria_id=None, filtro=None):
+        """
+        Registra uma transferência e os itens selecionados no diário.
+
+        Returns:
+            tuple: (ID da transferência, quantidade de itens)
+        """
+        if tipo not in TIPOS:
+            raise ValueError(f"Tipo de item inválido: {tipo}")
+        if origem == destino:
+            raise ValueError("Origem e destino são o mesmo compartimento")
+
+        conn = self.conectar()
+        cursor = conn.cursor()
+        try:
+            itens = self.selecionar(cursor, tipo, origem, ids, categoria_id, filtro)
+            cursor.execute(
+                "INSERT INTO transferencias (tipo, origem, destino, copiar, data_criacao) VALUES (?, ?, ?, ?, ?)",
+                (tipo, origem, destino, int(copiar), datetime.datetime.now().isoformat())
+            )
+            transferencia_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO transferencia_itens (transferencia_id, item_id) VALUES (?, ?)",
+                [(transferencia_id, item_id) for item_id in itens]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        return transferencia_id, len(itens)
+
+    def pendentes(self):
+        """
+        Lista as transferências interrompidas.
+
+        Returns:
+            list: Dicionários com id, tipo, origem, destino, copiar e itens_pendentes
+        """
+        conn = self.conectar()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT t.id, t.tipo, t.origem, t.destino, t.copiar, "
+            "(SELECT COUNT(*) FROM transferencia_itens i WHERE i.transferencia_id = t.id AND i.estado != ?) "
+            "FROM transferencias t WHERE t.concluida = 0 ORDER BY t.id",
+            (ESTADO_CONCLUIDO,)
+        )
+        transferencias = [
+            {"id": id_t, "tipo": tipo, "origem": origem, "destino": destino, "copiar": bool(copiar), "itens_pendentes": n}
+            for id_t, tipo, origem, destino, copiar, n in cursor.fetchall()
+        ]
+        conn.close()
+        return transferencias
+
+    # === Recriptografia (executada no pool) ===
+
+    def _recifrar_linha(self, item, transferencia, origem, destino):
+        item_id, cifrado, iv = item
+        tabela = TIPOS[transferencia["tipo"]][0]
+        try:
+            # Sem descomprimir: o conteúdo (comprimido ou não) é cifrado de novo como está
+            dados = origem.decifrar(cifrado, iv, tabela, item_id)
+            if transferencia["copiar"]:
+                # A cópia é cifrada na gravação, com o ID da nova linha
+                return item_id, dados, None
+            return item_id, destino.cifrar(dados, tabela, item_id), None
+        except Exception as e:
+            return item_id, None, str(e) or e.__class__.__name__
+
+    def _recifrar_arquivo(self, item, transferencia, origem, destino):
+        item_id, blocos_origem = item
+        versao_destino = destino.versao_chave
+        try:
+            chave_destino = destino.chave_da_versao(versao_destino)
+            blocos = []
+            for bloco_id, versao_origem in blocos_origem:
+                # Um bloco por vez: o arquivo nunca é carregado inteiro
+                dados = self.armazem_blocos._ler_bloco(bloco_id, origem.chave_da_versao(versao_origem))
+                novo_id = self.armazem_blocos.identificar_bloco(dados, chave_destino)
+                if not self.armazem_blocos.armazenamento.existe(novo_id):
+                    self.armazem_blocos._gravar_bloco(novo_id, dados, chave_destino)
+                blocos.append((novo_id, len(dados), versao_destino))
+            return item_id, blocos, None
+        except Exception as e:
+            return item_id, None, str(e) or e.__class__.__name__
+
+    # === Gravação (thread de quem chama) ===
+
+    @staticmethod
+    def _copiar_linha(cursor, tabela, item_id, substituicoes):
+        cursor.execute(f"SELECT * FROM {tabela} WHERE id = ?", (item_id,))
+        linha = cursor.fetchone()
+        colunas = [coluna[0] for coluna in cursor.description]
+        valores = dict(zip(colunas, linha))
+        del valores["id"]
+        valores.update(substituicoes)
+
+        cursor.execute(
+            f"INSERT INTO {tabela} ({', '.join(valores)}) VALUES ({', '.join('?' for _ in valores)})",
+            list(valores.values())
+        )
+        return cursor.lastrowid
+
+    def _gravar_linha(self, cursor, transferencia, item_id, resultado, destino):
+        tabela, coluna_cifrada, _, _ = TIPOS[transferencia["tipo"]]
+
+        if transferencia["copiar"]:
+            novo_id = self._copiar_linha(cursor, tabela, item_id, {"compartimento": transferencia["destino"]})
+            novo_cifrado, novo_iv = destino.cifrar(resultado, tabela, novo_id)
+            cursor.execute(
+                f"UPDATE {tabela} SET {coluna_cifrada} = ?, iv = ? WHERE id = ?", (novo_cifrado, novo_iv, novo_id)
+            )
+            return novo_id
+
+        novo_cifrado, novo_iv = resultado
+        cursor.execute(
+            f"UPDATE {tabela} SET {coluna_cifrada} = ?, iv = ?, compartimento = ? WHERE id = ? AND compartimento = ?",
+            (novo_cifrado, novo_iv, transferencia["destino"], item_id, transferencia["origem"])
+        )
+        return item_id if cursor.rowcount else None
+
+    def _gravar_arquivo(self, cursor, transferencia, item_id, blocos, destino):
+        data_atual = datetime.datetime.now().isoformat()
+        cursor.executemany(
+            "INSERT INTO blocos (id, compartimento, tamanho, referencias, versao_chave, data_criacao) VALUES (?, ?, ?, 1, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET referencias = referencias + 1",
+            [(bloco_id, transferencia["destino"], tamanho, versao, data_atual) for bloco_id, tamanho, versao in blocos]
+        )
+        ids_blocos = [bloco_id for bloco_id, _, _ in blocos]
+        valores = {
+            "compartimento": transferencia["destino"],
+            "nome_criptografado": self.armazem_blocos.identificar_conteudo(ids_blocos)
+        }
+
+        if transferencia["copiar"]:
+            novo_id = self._copiar_linha(cursor, "arquivos", item_id, valores)
+        else:
+            # Os blocos da origem perdem a referência e são removidos pela coleta de lixo
+            self.armazem_blocos.liberar(cursor, item_id)
+            cursor.execute(
+                "UPDATE arquivos SET compartimento = ?, nome_criptografado = ? WHERE id = ?",
+                (valores["compartimento"], valores["nome_criptografado"], item_id)
+            )
+            novo_id = item_id
+
+        self.armazem_blocos.vincular(cursor, novo_id, ids_blocos)
+        return novo_id
+
+    def _carregar_lote(self, cursor, transferencia, ultimo_id):
+        """Lê o próximo lote de itens pendentes e o que a recriptografia precisa de cada um."""
+        cursor.execute(
+            "SELECT item_id FROM transferencia_itens WHERE transferencia_id = ? AND estado != ? AND item_id > ? "
+            "ORDER BY item_id LIMIT ?",
+            (transferencia["id"], ESTADO_CONCLUIDO, ultimo_id, self.tamanho_lote)
+        )
+        ids = [linha[0] for linha in cursor.fetchall()]
+        if not ids:
+            return ids, [], []
+
+        tabela, coluna_cifrada, _, _ = TIPOS[transferencia["tipo"]]
+        marcadores = ", ".join("?" for _ in ids)
+
+        if coluna_cifrada:
+            cursor.execute(
+                f"SELECT id, {coluna_cifrada}, iv FROM {tabela} WHERE compartimento = ? AND id IN ({marcadores})",
+                [transferencia["origem"]] + ids
+            )
+            return ids, cursor.fetchall(), []
+
+        cursor.execute(
+            f"SELECT id, armazenamento FROM arquivos WHERE compartimento = ? AND id IN ({marcadores})",
+            [transferencia["origem"]] + ids
+        )
+        itens, recusados = [], []
+        for item_id, armazenamento in cursor.fetchall():
+            if armazenamento == "blocos":
+                itens.append((item_id, self.armazem_blocos.blocos_com_versao(cursor, item_id)))
+            else:
+                recusados.append((item_id, "Arquivo em formato legado não pode ser recriptografado"))
+        return ids, itens, recusados
+
+    def executar(self, transferencia_id, origem, destino, progresso=None):
+        """
+        Processa os itens pendentes de uma transferência.
+
+        Args:
+            transferencia_id (int): ID retornado por iniciar()
+            origem (ContextoCifra): Contexto de cifra do compartimento de origem
+            destino (ContextoCifra): Contexto de cifra do compartimento de destino
+            progresso (callable, optional): Chamado com (itens_processados, total) após cada lote
+
+        Returns:
+            dict: transferidos, falhas (lista de (item_id, erro)) e concluida
+        """
+        conn = self.conectar()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, tipo, origem, destino, copiar FROM transferencias WHERE id = ?",
+            (transferencia_id,)
+        )
+        linha = cursor.fetchone()
+        if linha is None:
+            conn.close()
+            raise ValueError(f"Transferência {transferencia_id} não encontrada")
+
+        transferencia = dict(zip(("id", "tipo", "origem", "destino", "copiar"), linha))
+        transferencia["copiar"] = bool(transferencia["copiar"])
+        arquivo = transferencia["tipo"] == "arquivo"
+        recifrar = self._recifrar_arquivo if arquivo else self._recifrar_linha
+        gravar = self._gravar_arquivo if arquivo else self._gravar_linha
+
+        cursor.execute(
+            "SELECT COUNT(*) FROM transferencia_itens WHERE transferencia_id = ? AND estado != ?",
+            (transferencia_id, ESTADO_CONCLUIDO)
+        )
+        total = cursor.fetchone()[0]
+        processados = 0
+        transferidos = 0
+        falhas = []
+        ultimo_id = -1
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.trabalhadores) as executor:
+                while True:
+                    ids, itens, recusados = self._carregar_lote(cursor, transferencia, ultimo_id)
+                    if not ids:
+                        break
+                    ultimo_id = ids[-1]
+
+                    resultados = executor.map(lambda item: recifrar(item, transferencia, origem, destino), itens)
+
+                    # Itens que sumiram da origem (excluídos ou já movidos) ficam concluídos sem novo ID
+                    estados = {item_id: (ESTADO_CONCLUIDO, None, None) for item_id in ids}
+                    for item_id, erro in recusados:
+                        estados[item_id] = (ESTADO_FALHA, None, erro)
+
+                    for item_id, resultado, erro in resultados:
+                        if erro is not None:
+                            estados[item_id] = (ESTADO_FALHA, None, erro)
+                            continue
+                        estados[item_id] = (ESTADO_CONCLUIDO, gravar(cursor, transferencia, item_id, resultado, destino), None)
+                        transferidos += 1
+
+                    cursor.executemany(
+                        "UPDATE transferencia_itens SET estado = ?, novo_id = ?, erro = ? "
+                        "WHERE transferencia_id = ? AND item_id = ?",
+                        [(estado, novo_id, erro, transferencia_id, item_id)
+                         for item_id, (estado, novo_id, erro) in estados.items()]
+                    )
+                    # Dados do lote e diário confirmados juntos
+                    conn.commit()
+
+                    falhas.extend((item_id, erro) for item_id, (estado, _, erro) in estados.items() if estado == ESTADO_FALHA)
+                    processados += len(ids)
+                    if progresso:
+                        progresso(processados, total)
+
+            concluida = not falhas
+            if concluida:
+                cursor.execute("UPDATE transferencias SET concluida = 1 WHERE id = ?", (transferencia_id,))
+                conn.commit()
+
+            if arquivo and not transferencia["copiar"]:
+                self.armazem_blocos.coletar_lixo(conn)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        return {"transferidos": transferidos, "falhas": falhas, "concluida": concluida}
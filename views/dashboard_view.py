@@ -1,5 +1,5 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, simpledialog
 import time
 import threading
 from views.styles import *
@@ -212,6 +212,40 @@ class DashboardView(tk.Frame):
         )
         self.btn_renovar.place(relx=0.5, rely=0.5, anchor=tk.CENTER)  # Posicionamento absoluto
         
+        # Frame do backup automático
+        backup_frame = tk.LabelFrame(content_frame, text="Backup automático", **FRAME_STYLE)
+        backup_frame.pack(fill=tk.X, pady=PADDING_MEDIUM)
+        
+        backup_content = tk.Frame(backup_frame, **FRAME_STYLE)
+        backup_content.pack(fill=tk.X, padx=PADDING_MEDIUM, pady=PADDING_SMALL)
+        
+        self.label_backup = tk.Label(
+            backup_content,
+            text="Carregando...",
+            fg=TEXT_COLOR,
+            bg=BG_COLOR,
+            anchor=tk.W,
+            justify=tk.LEFT
+        )
+        self.label_backup.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        self.btn_pausar_backup = tk.Button(
+            backup_content,
+            text="Pausar",
+            command=self._alternar_pausa_backup,
+            width=10,
+            **BUTTON_STYLE
+        )
+        self.btn_pausar_backup.pack(side=tk.RIGHT, padx=PADDING_SMALL)
+        
+        tk.Button(
+            backup_content,
+            text="Fazer Agora",
+            command=self._fazer_backup,
+            width=12,
+            **BUTTON_STYLE
+        ).pack(side=tk.RIGHT, padx=PADDING_SMALL)
+        
         # Adicionar espaço extra no final da interface
         footer_space = tk.Frame(content_frame, height=50, **FRAME_STYLE)
         footer_space.pack(fill=tk.X, pady=PADDING_MEDIUM)
@@ -325,6 +359,7 @@ class DashboardView(tk.Frame):
         def timer_loop():
             while self.timer_ativo:
                 self._atualizar_timer()
+                self._atualizar_status_backup()
                 time.sleep(1)  # Atualizar a cada segundo
         
         # Iniciar thread do timer
@@ -374,6 +409,32 @@ class DashboardView(tk.Frame):
                     fg=cor
                 )
     
+    def _atualizar_status_backup(self):
+        """Atualiza o estado do backup automático exibido."""
+        if not self.timer_ativo:
+            return
+        
+        status = self.controller.obter_status_backup()
+        estado = status["estado"]
+        
+        if estado == "executando":
+            texto = f"Backup em andamento ({status['bytes_lidos'] // (1024 * 1024)} MB lidos)"
+        elif estado == "pausado":
+            texto = "Backup pausado"
+        elif estado == "agendado" and status["proximo_backup"]:
+            texto = f"Próximo backup: {status['proximo_backup'].strftime('%d/%m/%Y %H:%M')}"
+        else:
+            texto = "Backup automático desativado"
+        
+        if status["ultimo_backup"]:
+            texto += f"\nÚltimo backup: {status['ultimo_backup'].strftime('%d/%m/%Y %H:%M')}"
+        elif status["mensagem"]:
+            texto += f"\n{status['mensagem']}"
+        
+        cor = ERROR_COLOR if status["mensagem"] and status["mensagem"].startswith("Erro") else TEXT_COLOR
+        self.label_backup.config(text=texto, fg=cor)
+        self.btn_pausar_backup.config(text="Retomar" if estado == "pausado" else "Pausar")
+    
     def atualizar_compartimento(self, compartimento_id):
         """Atualiza o compartimento ativo exibido."""
         self.label_compartimento.config(text=compartimento_id)
@@ -592,7 +653,7 @@ class DashboardView(tk.Frame):
         lista_frame.pack(fill=tk.BOTH, expand=True, padx=PADDING_LARGE, pady=PADDING_MEDIUM)
         
         # Criar Treeview
-        colunas = ("Nome", "ID", "Descrição", "Criação")
+        colunas = ("Nome", "ID", "Descrição", "Criação", "Estado")
         tree = ttk.Treeview(lista_frame, columns=colunas, show="headings", height=8)
         
         # Definir cabeçalhos
@@ -600,12 +661,14 @@ class DashboardView(tk.Frame):
         tree.heading("ID", text="ID")
         tree.heading("Descrição", text="Descrição")
         tree.heading("Criação", text="Data de Criação")
+        tree.heading("Estado", text="Estado")
         
         # Definir larguras
-        tree.column("Nome", width=120)
-        tree.column("ID", width=100)
-        tree.column("Descrição", width=150)
-        tree.column("Criação", width=120)
+        tree.column("Nome", width=110)
+        tree.column("ID", width=90)
+        tree.column("Descrição", width=130)
+        tree.column("Criação", width=100)
+        tree.column("Estado", width=90)
         
         # Preencher dados
         for comp in compartimentos:
@@ -617,7 +680,8 @@ class DashboardView(tk.Frame):
                 comp.get("nome"),
                 comp.get("compartimento_id"),
                 descricao,
-                comp.get("data_criacao", "").split("T")[0]
+                comp.get("data_criacao", "").split("T")[0],
+                "Desbloqueado" if self.controller.compartimento_desbloqueado(comp.get("compartimento_id")) else "Bloqueado"
             ))
         
         # Adicionar scrollbar
@@ -653,11 +717,11 @@ class DashboardView(tk.Frame):
             
             # Obter ID do compartimento selecionado
             item = tree.item(selecao[0])
-            compartimento_id = item["values"][1]
+            compartimento_id = str(item["values"][1])
             
-            # Obter senha
+            # Obter senha (dispensada para compartimentos já desbloqueados na sessão)
             senha = entrada_senha.get()
-            if not senha:
+            if not senha and not self.controller.compartimento_desbloqueado(compartimento_id):
                 messagebox.showerror("Erro", "Digite a senha", parent=dialog)
                 return
             
@@ -671,6 +735,22 @@ class DashboardView(tk.Frame):
             else:
                 messagebox.showerror("Erro", mensagem, parent=dialog)
         
+        # Função para bloquear o compartimento selecionado
+        def bloquear():
+            selecao = tree.selection()
+            if not selecao:
+                messagebox.showerror("Erro", "Selecione um compartimento", parent=dialog)
+                return
+            
+            compartimento_id = str(tree.item(selecao[0])["values"][1])
+            sucesso, mensagem = self.controller.bloquear_compartimento(compartimento_id)
+            
+            if sucesso:
+                tree.set(selecao[0], "Estado", "Bloqueado")
+                self._atualizar_estatisticas()
+            else:
+                messagebox.showerror("Erro", mensagem, parent=dialog)
+        
         # Botões
         tk.Button(
             botoes_frame,
@@ -679,6 +759,13 @@ class DashboardView(tk.Frame):
             **BUTTON_PRIMARY_STYLE
         ).pack(side=tk.LEFT, padx=PADDING_SMALL)
         
+        tk.Button(
+            botoes_frame,
+            text="Bloquear",
+            command=bloquear,
+            **BUTTON_STYLE
+        ).pack(side=tk.LEFT, padx=PADDING_SMALL)
+        
         tk.Button(
             botoes_frame,
             text="Cancelar",
@@ -731,18 +818,41 @@ class DashboardView(tk.Frame):
         )
     
     def _fazer_backup(self):
-        """Realiza backup do sistema."""
-        messagebox.showinfo(
-            "Em desenvolvimento",
-            "A funcionalidade de backup será implementada em uma versão futura."
-        )
+        """Inicia um backup incremental em segundo plano."""
+        sucesso, mensagem = self.controller.fazer_backup_agora()
+        
+        if sucesso:
+            messagebox.showinfo("Backup", mensagem)
+        else:
+            messagebox.showerror("Backup", mensagem)
+    
+    def _alternar_pausa_backup(self):
+        """Pausa ou retoma o backup automático."""
+        if self.controller.obter_status_backup()["estado"] == "pausado":
+            self.controller.resumir_backup()
+        else:
+            self.controller.pausar_backup()
+        
+        self._atualizar_status_backup()
     
     def _restaurar(self):
-        """Restaura backup do sistema."""
-        messagebox.showinfo(
-            "Em desenvolvimento",
-            "A funcionalidade de restauração de backup será implementada em uma versão futura."
-        )
+        """Restaura a geração mais recente do backup incremental."""
+        if not messagebox.askyesno(
+            "Restaurar",
+            "Os dados atuais serão substituídos pelos do último backup. Deseja continuar?"
+        ):
+            return
+        
+        senha = simpledialog.askstring("Restaurar", "Digite a senha do cofre:", show="*", parent=self.master)
+        if not senha:
+            return
+        
+        sucesso, mensagem = self.controller.restaurar_backup(senha)
+        
+        if sucesso:
+            messagebox.showinfo("Restaurar", mensagem)
+        else:
+            messagebox.showerror("Restaurar", mensagem)
     
     def _abrir_preferencias(self):
         """Abre a tela de preferências."""
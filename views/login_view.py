@@ -162,7 +162,7 @@ class LoginView(tk.Frame):
         """Mostra o diálogo para autenticação por frase."""
         dialog = tk.Toplevel(self.master)
         dialog.title("Recuperar Acesso")
-        dialog.geometry("600x300")
+        dialog.geometry("600x340")
         dialog.transient(self.master)
         dialog.grab_set()
         dialog.configure(bg=BG_COLOR)
@@ -203,6 +203,38 @@ class LoginView(tk.Frame):
         frase_text.pack(fill=tk.X)
         frase_text.focus_set()
         
+        # Sugestões para a palavra em digitação (Tab completa com a primeira)
+        sugestoes_label = tk.Label(
+            frase_frame,
+            text="",
+            anchor=tk.W,
+            fg=TEXT_COLOR,
+            bg=BG_COLOR,
+            font=FONT_SMALL
+        )
+        sugestoes_label.pack(fill=tk.X, pady=(PADDING_SMALL, 0))
+        
+        def palavra_atual():
+            texto = frase_text.get("1.0", tk.INSERT)
+            if not texto or texto[-1].isspace():
+                return ""
+            return texto.split()[-1]
+        
+        def atualizar_sugestoes(event=None):
+            sugestoes = self.controller.completar_palavra_bip39(palavra_atual())
+            sugestoes_label.config(text="  ".join(sugestoes))
+        
+        def completar_palavra(event):
+            prefixo = palavra_atual()
+            sugestoes = self.controller.completar_palavra_bip39(prefixo, 1)
+            if sugestoes:
+                frase_text.insert(tk.INSERT, sugestoes[0][len(prefixo):] + " ")
+                atualizar_sugestoes()
+            return "break"
+        
+        frase_text.bind("<KeyRelease>", atualizar_sugestoes)
+        frase_text.bind("<Tab>", completar_palavra)
+        
         # Frame para botões
         botoes_frame = tk.Frame(main_frame, bg=BG_COLOR)
         botoes_frame.pack(pady=PADDING_MEDIUM)
@@ -215,16 +247,26 @@ class LoginView(tk.Frame):
                 messagebox.showerror("Erro", "Digite a frase de recuperação", parent=dialog)
                 return
             
-            # Chamar o controller para autenticar
-            sucesso, mensagem, modo_heranca = self.controller.autenticar_por_frase(frase)
+            # A seed é derivada em segundo plano; o diálogo mostra um indicador enquanto espera
+            botao_recuperar.config(state=tk.DISABLED)
             
-            if not sucesso:
-                messagebox.showerror("Erro de autenticação", mensagem, parent=dialog)
-            else:
-                dialog.destroy()
+            def aguardando(quadro):
+                sugestoes_label.config(text=f"{quadro} Verificando a frase...")
+            
+            def concluido(sucesso, mensagem, modo_heranca):
+                if not sucesso:
+                    botao_recuperar.config(state=tk.NORMAL)
+                    sugestoes_label.config(text="")
+                    messagebox.showerror("Erro de autenticação", mensagem, parent=dialog)
+                else:
+                    dialog.destroy()
+            
+            self.controller.autenticar_por_frase_async(
+                frase, dialog.after, concluido, aguardando, ativo=lambda: dialog.winfo_exists()
+            )
         
         # Botões
-        tk.Button(
+        botao_recuperar = tk.Button(
             botoes_frame,
             text="Recuperar Acesso",
             command=autenticar_com_frase,
@@ -233,7 +275,8 @@ class LoginView(tk.Frame):
             font=FONT_BOLD,
             padx=15,
             pady=5
-        ).pack(side=tk.LEFT, padx=PADDING_SMALL)
+        )
+        botao_recuperar.pack(side=tk.LEFT, padx=PADDING_SMALL)
         
         tk.Button(
             botoes_frame,
@@ -1,6 +1,7 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from views.styles import *
+from models.memoria_segura import copiar_para_area_transferencia, TEMPO_AREA_TRANSFERENCIA_S
 
 class PasswordView(tk.Frame):
     """View para gerenciamento de senhas."""
@@ -340,10 +341,15 @@ class PasswordView(tk.Frame):
             acoes_frame = tk.Frame(self.detalhes_frame, **FRAME_STYLE)
             acoes_frame.pack(pady=PADDING_MEDIUM)
             
-            # Botão para mostrar senha
+            # A senha (BufferSeguro) é zerada quando os detalhes forem substituídos ou fechados
+            segredo = senha.get('senha')
+            if segredo is not None:
+                acoes_frame.bind("<Destroy>", lambda event: segredo.zerar())
+            
+            # Botão para mostrar senha: o texto só é materializado enquanto a mensagem está aberta
             def mostrar_senha():
-                if 'senha' in senha:
-                    messagebox.showinfo("Senha", f"Senha: {senha['senha']}", parent=self.master)
+                if segredo:
+                    messagebox.showinfo("Senha", "Senha: " + segredo.texto(), parent=self.master)
                 else:
                     messagebox.showinfo("Senha", "Senha não disponível ou criptografada", parent=self.master)
             
@@ -354,6 +360,25 @@ class PasswordView(tk.Frame):
                 **BUTTON_STYLE
             ).pack(side=tk.LEFT, padx=PADDING_SMALL)
             
+            # Botão para copiar senha: a área de transferência é limpa depois de alguns segundos
+            def copiar_senha():
+                if not segredo:
+                    messagebox.showinfo("Senha", "Senha não disponível ou criptografada", parent=self.master)
+                    return
+                copiar_para_area_transferencia(self.master, segredo)
+                messagebox.showinfo(
+                    "Senha",
+                    f"Senha copiada. A área de transferência será limpa em {TEMPO_AREA_TRANSFERENCIA_S} segundos.",
+                    parent=self.master
+                )
+            
+            tk.Button(
+                acoes_frame,
+                text="Copiar Senha",
+                command=copiar_senha,
+                **BUTTON_STYLE
+            ).pack(side=tk.LEFT, padx=PADDING_SMALL)
+            
             # Botão para editar
             def editar_senha():
                 # Implementar edição